@@ -0,0 +1,34 @@
+from django.contrib import admin
+from .models import CacheVersion, DocumentSequence, SearchDocument
+from .search import matching_ids
+
+
+@admin.register(DocumentSequence)
+class DocumentSequenceAdmin(admin.ModelAdmin):
+    list_display = ['doc_type', 'period', 'next_value', 'updated_at']
+    list_filter = ['doc_type']
+    search_fields = ['doc_type', 'period']
+    readonly_fields = ['updated_at']
+
+
+@admin.register(CacheVersion)
+class CacheVersionAdmin(admin.ModelAdmin):
+    list_display = ['key', 'version']
+    search_fields = ['key']
+
+
+class SearchIndexAdminMixin:
+    """Answers the changelist search box from the search index instead of icontains over search_fields"""
+    search_doc_type = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(pk__in=matching_ids(search_term, self.search_doc_type)), False
+
+
+@admin.register(SearchDocument)
+class SearchDocumentAdmin(admin.ModelAdmin):
+    list_display = ['title', 'doc_type', 'object_id', 'subtitle', 'updated_at']
+    list_filter = ['doc_type']
+    readonly_fields = ['updated_at']
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.search import SOURCES, rebuild_index, rebuild_text_index
+
+
+class Command(BaseCommand):
+    help = 'Recreate the global search index from materials, products, partners and documents'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', action='append', choices=sorted(SOURCES), dest='doc_types',
+                            help='Only rebuild documents of this kind (repeatable)')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        counts = rebuild_index(options['doc_types'])
+        for doc_type, count in counts.items():
+            self.stdout.write(f'{doc_type}: {count} document(s)')
+        if not options['doc_types']:
+            rebuild_text_index()
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {sum(counts.values())} document(s) in {time.monotonic() - started:.1f}s'
+        ))
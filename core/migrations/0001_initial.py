@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_type', models.CharField(help_text='Document type (e.g., invoice, sales_order)', max_length=50)),
+                ('period', models.CharField(blank=True, help_text='Period key, empty for sequences that never reset', max_length=20)),
+                ('next_value', models.PositiveBigIntegerField(default=1, help_text='Next number to hand out')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Document Sequence',
+                'verbose_name_plural': 'Document Sequences',
+                'ordering': ['doc_type', '-period'],
+                'unique_together': {('doc_type', 'period')},
+            },
+        ),
+    ]
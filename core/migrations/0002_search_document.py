@@ -0,0 +1,83 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:54
+
+from django.db import migrations, models
+
+
+SQLITE_INDEX = [
+    """CREATE VIRTUAL TABLE core_searchdocument_fts USING fts5(
+        title, body, content='core_searchdocument', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3 4'
+    )""",
+    "INSERT INTO core_searchdocument_fts(core_searchdocument_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+    """CREATE TRIGGER core_searchdocument_fts_insert AFTER INSERT ON core_searchdocument BEGIN
+        INSERT INTO core_searchdocument_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+    """CREATE TRIGGER core_searchdocument_fts_delete AFTER DELETE ON core_searchdocument BEGIN
+        INSERT INTO core_searchdocument_fts(core_searchdocument_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END""",
+    """CREATE TRIGGER core_searchdocument_fts_update AFTER UPDATE ON core_searchdocument BEGIN
+        INSERT INTO core_searchdocument_fts(core_searchdocument_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO core_searchdocument_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+]
+
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS core_searchdocument_fts_update',
+    'DROP TRIGGER IF EXISTS core_searchdocument_fts_delete',
+    'DROP TRIGGER IF EXISTS core_searchdocument_fts_insert',
+    'DROP TABLE IF EXISTS core_searchdocument_fts',
+]
+
+POSTGRESQL_INDEX = [
+    """CREATE INDEX core_searchdocument_tsv ON core_searchdocument USING gin ((
+        setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B')
+    ))""",
+]
+
+POSTGRESQL_DROP = [
+    'DROP INDEX IF EXISTS core_searchdocument_tsv',
+]
+
+
+def create_text_index(apps, schema_editor):
+    # Other databases search with icontains and need no index
+    statements = {'sqlite': SQLITE_INDEX, 'postgresql': POSTGRESQL_INDEX}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_text_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_DROP, 'postgresql': POSTGRESQL_DROP}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_type', models.CharField(help_text='Search source the object belongs to', max_length=30)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('title', models.CharField(help_text='Number, code or name shown as the result heading', max_length=255)),
+                ('subtitle', models.CharField(blank=True, max_length=255)),
+                ('body', models.TextField(blank=True, help_text='Other searchable text')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Search Document',
+                'verbose_name_plural': 'Search Documents',
+                'ordering': ['doc_type', 'title'],
+                'unique_together': {('doc_type', 'object_id')},
+            },
+        ),
+        migrations.RunPython(create_text_index, drop_text_index),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_search_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Cache Version',
+                'verbose_name_plural': 'Cache Versions',
+            },
+        ),
+    ]
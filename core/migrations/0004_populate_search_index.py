@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def populate_search_index(apps, schema_editor):
+    # Index what is already there; later changes are indexed by signals.
+    # Inserts go through the text index triggers, so it fills in as well
+    from core.search import rebuild_index
+    rebuild_index(registry=apps)
+
+
+def clear_search_index(apps, schema_editor):
+    apps.get_model('core', 'SearchDocument').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_cache_versions'),
+        ('inventory', '0009_inventory_analysis'),
+        ('manufacturing', '0005_lot_consumption'),
+        ('purchase', '0004_goods_receipt_warehouse'),
+        ('sales', '0004_sales_daily_fact'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_search_index, clear_search_index),
+    ]
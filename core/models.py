@@ -0,0 +1,50 @@
+from django.db import models
+
+
+class DocumentSequence(models.Model):
+    """Counter used to number one document type within one period"""
+    doc_type = models.CharField(max_length=50, help_text="Document type (e.g., invoice, sales_order)")
+    period = models.CharField(max_length=20, blank=True, help_text="Period key, empty for sequences that never reset")
+    next_value = models.PositiveBigIntegerField(default=1, help_text="Next number to hand out")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['doc_type', '-period']
+        unique_together = ['doc_type', 'period']
+        verbose_name = 'Document Sequence'
+        verbose_name_plural = 'Document Sequences'
+
+    def __str__(self):
+        return f"{self.doc_type} {self.period} (next {self.next_value})"
+
+
+class SearchDocument(models.Model):
+    """One object in the global search index (see core.search)"""
+    doc_type = models.CharField(max_length=30, help_text="Search source the object belongs to")
+    object_id = models.PositiveBigIntegerField()
+    title = models.CharField(max_length=255, help_text="Number, code or name shown as the result heading")
+    subtitle = models.CharField(max_length=255, blank=True)
+    body = models.TextField(blank=True, help_text="Other searchable text")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['doc_type', 'title']
+        unique_together = ['doc_type', 'object_id']
+        verbose_name = 'Search Document'
+        verbose_name_plural = 'Search Documents'
+
+    def __str__(self):
+        return f"{self.doc_type}: {self.title}"
+
+
+class CacheVersion(models.Model):
+    """Version of data cached in process memory, shared by all workers (see core.versions)"""
+    key = models.CharField(max_length=100, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Cache Version'
+        verbose_name_plural = 'Cache Versions'
+
+    def __str__(self):
+        return f"{self.key} v{self.version}"
@@ -0,0 +1,200 @@
+"""
+Document numbering.
+
+Numbers come from DocumentSequence rows, one per document type and period.
+A counter is advanced with a single ``UPDATE ... SET next_value = next_value + n``
+inside the caller's transaction, so two workers can never receive the same
+number and a document that is rolled back gives its number back.
+
+Document types with a ``block_size`` above 1 reserve a block of numbers at a
+time and hand the rest out from memory, so busy document types do not queue
+on their counter row. Leftovers of a block become available to other callers
+only after the transaction that reserved them commits. Numbers still cached
+when the process exits are never used, so blocks are meant for document
+types that tolerate gaps; the defaults keep sales orders, invoices and work
+orders gap-free.
+
+Formats can be overridden per document type with the DOCUMENT_NUMBERING
+setting.
+"""
+import threading
+from collections import defaultdict, deque
+from datetime import datetime
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Length
+from django.utils import timezone
+
+from .models import DocumentSequence
+
+
+# ``format`` is a str.format template with {period} and {number}; ``period``
+# is a strftime pattern selecting when the counter restarts (empty: never).
+# ``model``/``field`` point at existing numbers a new counter continues after.
+DEFAULT_FORMATS = {
+    'sales_order': {
+        'format': 'SO-{period}-{number:04d}',
+        'period': '%Y%m%d',
+        'model': 'sales.SalesOrder',
+        'field': 'order_number',
+    },
+    'invoice': {
+        'format': 'INV-{period}-{number:04d}',
+        'period': '%Y%m%d',
+        'model': 'sales.Invoice',
+        'field': 'invoice_number',
+    },
+    'work_order': {
+        'format': 'WO-{period}-{number:04d}',
+        'period': '%Y%m%d',
+        'model': 'manufacturing.WorkOrder',
+        'field': 'wo_number',
+    },
+    'stock_adjustment': {
+        'format': 'ADJ-{period}-{number:05d}',
+        'period': '%Y%m%d',
+        'block_size': 50,
+        'model': 'inventory.InventoryTransaction',
+        'field': 'reference_number',
+    },
+    'material_lot': {
+        'format': 'LOT-{period}-{number:04d}',
+        'period': '%Y%m%d',
+        'block_size': 50,
+        'model': 'inventory.MaterialLot',
+        'field': 'lot_number',
+    },
+    'cycle_count': {
+        'format': 'CC-{period}-{number:04d}',
+        'period': '%Y%m',
+        'model': 'inventory.CycleCount',
+        'field': 'count_number',
+    },
+    'account_transfer': {
+        'format': 'TRF-{period}-{number:04d}',
+        'period': '%Y%m%d',
+        'model': 'finance.Transaction',
+        'field': 'reference_number',
+    },
+}
+
+
+def get_format(doc_type):
+    """Numbering configuration of a document type, with settings applied"""
+    config = dict(DEFAULT_FORMATS.get(doc_type, {}))
+    config.update(getattr(settings, 'DOCUMENT_NUMBERING', {}).get(doc_type, {}))
+    if 'format' not in config:
+        raise ImproperlyConfigured(f"No document number format for '{doc_type}'")
+    config.setdefault('period', '')
+    config.setdefault('block_size', 1)
+    return config
+
+
+def _seed_value(config, period):
+    """First number of a new counter, continuing after numbers already stored"""
+    if not config.get('model'):
+        return 1
+
+    model = apps.get_model(config['model'])
+    field = config['field']
+    prefix = config['format'].split('{number')[0].format(period=period)
+    latest = model.objects.filter(
+        **{f'{field}__startswith': prefix}
+    ).order_by(Length(field).desc(), f'-{field}').values_list(field, flat=True).first()
+
+    if latest:
+        digits = ''
+        for char in latest[len(prefix):]:
+            if not char.isdigit():
+                break
+            digits += char
+        if digits:
+            return int(digits) + 1
+    return 1
+
+
+def _advance(doc_type, period, count, config):
+    """Move a counter forward by count and return the first reserved value"""
+    with transaction.atomic():
+        sequences = DocumentSequence.objects.filter(doc_type=doc_type, period=period)
+        if not sequences.update(next_value=F('next_value') + count):
+            try:
+                with transaction.atomic():
+                    start = _seed_value(config, period)
+                    DocumentSequence.objects.create(
+                        doc_type=doc_type, period=period, next_value=start + count
+                    )
+                return start
+            except IntegrityError:
+                # Another worker created the counter first
+                sequences.update(next_value=F('next_value') + count)
+        return sequences.values_list('next_value', flat=True).get() - count
+
+
+class SequenceAllocator:
+    """Hands out document numbers, caching reserved blocks per process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._blocks = defaultdict(deque)   # (doc_type, period) -> [(start, end), ...]
+
+    def _take_cached(self, key, count):
+        numbers = []
+        with self._lock:
+            blocks = self._blocks[key]
+            while blocks and len(numbers) < count:
+                start, end = blocks[0]
+                take = min(end - start, count - len(numbers))
+                numbers.extend(range(start, start + take))
+                if start + take == end:
+                    blocks.popleft()
+                else:
+                    blocks[0] = (start + take, end)
+        return numbers
+
+    def _release(self, key, start, end):
+        with self._lock:
+            self._blocks[key].append((start, end))
+
+    def reset(self):
+        """Forget all cached blocks"""
+        with self._lock:
+            self._blocks.clear()
+
+    def allocate(self, doc_type, count=1, on_date=None):
+        """Return ``count`` formatted numbers for a document type"""
+        config = get_format(doc_type)
+        on_date = on_date or timezone.localdate()
+        if isinstance(on_date, datetime) and timezone.is_aware(on_date):
+            on_date = timezone.localtime(on_date)
+        period = on_date.strftime(config['period']) if config['period'] else ''
+        key = (doc_type, period)
+
+        numbers = self._take_cached(key, count) if config['block_size'] > 1 else []
+        missing = count - len(numbers)
+        if missing > 0:
+            reserve = max(missing, config['block_size'])
+            start = _advance(doc_type, period, reserve, config)
+            numbers.extend(range(start, start + missing))
+            if reserve > missing:
+                leftover = (start + missing, start + reserve)
+                transaction.on_commit(lambda: self._release(key, *leftover))
+
+        return [config['format'].format(period=period, number=number) for number in numbers]
+
+
+sequence_allocator = SequenceAllocator()
+
+
+def next_numbers(doc_type, count, on_date=None):
+    """Allocate ``count`` document numbers, see SequenceAllocator.allocate"""
+    return sequence_allocator.allocate(doc_type, count, on_date)
+
+
+def next_number(doc_type, on_date=None):
+    """Allocate a single document number"""
+    return sequence_allocator.allocate(doc_type, 1, on_date)[0]
@@ -0,0 +1,531 @@
+"""
+Global full-text search.
+
+Materials, products, customers, vendors, purchase, sales, production and
+work orders and invoices are indexed as SearchDocument rows: a title (the
+number, code or name), a subtitle and a body of other searchable text. The
+database maintains the text index over title and body itself:
+
+* SQLite: an external-content FTS5 table kept in step by triggers, ranked
+  with bm25 weighting titles ten to one;
+* PostgreSQL: a GIN index on the weighted tsvector, ranked with ts_rank;
+* other databases fall back to ``icontains``.
+
+Every term of a query must match; a term matches as a phrase whose last
+word may be a prefix, so "so-2024 acme" finds Acme's sales orders numbered
+SO-2024... Queries matching more than MAX_RESULTS documents are ranked by
+recency instead of relevance, which keeps broad queries as fast as narrow
+ones.
+
+Documents follow their objects through signals: saving or deleting an
+indexed object queues it, and the queue is flushed when the transaction
+commits, reading each source back with one query per batch and writing
+with bulk inserts and updates. A source also names the related models its
+text is drawn from (an order shows its customer's name), so renaming a
+customer refreshes the customer's orders and invoices. ``rebuild_index``
+recreates the index from scratch, which the ``rebuild_search_index``
+command runs; migration 0004 runs it once against the historical models so
+existing data is searchable as soon as the index exists.
+"""
+import re
+import threading
+from collections import defaultdict
+
+from django.apps import apps
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.urls import reverse
+
+from .models import SearchDocument
+
+
+# Objects read and written per batch when indexing
+INDEX_BATCH_SIZE = 2000
+
+# Results reachable for one query; broader queries are listed newest first
+MAX_RESULTS = 1000
+
+_WORDS = re.compile(r'\w+')
+
+_pending = threading.local()
+
+
+def _join(*parts):
+    return ' '.join(str(part) for part in parts if part)
+
+
+class SearchSource:
+    """
+    One kind of object in the index.
+
+    Subclasses name the model (``app_label.ModelName``), the fields read
+    with ``values()``, how a row becomes a document and the detail page a
+    result links to. ``related`` maps models the text is drawn from to the
+    lookup leading to them.
+    """
+    doc_type = None
+    label = None
+    model = None
+    fields = ()
+    url_name = None
+    related = {}
+
+    def get_model(self, registry=apps):
+        return registry.get_model(self.model)
+
+    def queryset(self, registry=apps):
+        return self.get_model(registry).objects.all()
+
+    def document(self, row):
+        """``(title, subtitle, body)`` of a row"""
+        raise NotImplementedError
+
+    def url(self, object_id):
+        return reverse(self.url_name, args=[object_id])
+
+    def display(self, field, value):
+        """Display value of a choice field"""
+        return dict(self.get_model()._meta.get_field(field).flatchoices).get(value, value)
+
+
+class MaterialSource(SearchSource):
+    doc_type = 'material'
+    label = 'Raw Material'
+    model = 'inventory.RawMaterial'
+    fields = ('code', 'name', 'category__name', 'description')
+    url_name = 'raw_material_update'
+    related = {'inventory.MaterialCategory': 'category'}
+
+    def document(self, row):
+        return _join(row['code'], row['name']), row['category__name'], row['description']
+
+
+class ProductSource(SearchSource):
+    doc_type = 'product'
+    label = 'Finished Product'
+    model = 'inventory.FinishedProduct'
+    fields = ('code', 'name', 'category__name', 'size', 'color', 'description')
+    url_name = 'finished_product_update'
+    related = {'inventory.ProductCategory': 'category'}
+
+    def document(self, row):
+        subtitle = _join(row['category__name'], f"size {row['size']}", self.display('color', row['color']))
+        return _join(row['code'], row['name']), subtitle, _join(subtitle, row['description'])
+
+
+class CustomerSource(SearchSource):
+    doc_type = 'customer'
+    label = 'Customer'
+    model = 'sales.Customer'
+    fields = ('name', 'email', 'phone', 'city', 'country')
+    url_name = 'customer_detail'
+
+    def document(self, row):
+        return row['name'], row['email'], _join(row['email'], row['phone'], row['city'], row['country'])
+
+
+class VendorSource(SearchSource):
+    doc_type = 'vendor'
+    label = 'Vendor'
+    model = 'purchase.Vendor'
+    fields = ('code', 'name', 'contact_person', 'email', 'phone')
+    url_name = 'vendor_detail'
+
+    def document(self, row):
+        return (
+            _join(row['code'], row['name']),
+            row['contact_person'],
+            _join(row['contact_person'], row['email'], row['phone']),
+        )
+
+
+class PurchaseOrderSource(SearchSource):
+    doc_type = 'purchase_order'
+    label = 'Purchase Order'
+    model = 'purchase.PurchaseOrder'
+    fields = ('po_number', 'vendor__code', 'vendor__name', 'status')
+    url_name = 'purchase_order_detail'
+    related = {'purchase.Vendor': 'vendor'}
+
+    def document(self, row):
+        subtitle = _join(row['vendor__name'], '-', self.display('status', row['status']))
+        return row['po_number'], subtitle, _join(row['vendor__code'], row['vendor__name'])
+
+
+class SalesOrderSource(SearchSource):
+    doc_type = 'sales_order'
+    label = 'Sales Order'
+    model = 'sales.SalesOrder'
+    fields = ('order_number', 'customer__name', 'status')
+    url_name = 'sales_order_detail'
+    related = {'sales.Customer': 'customer'}
+
+    def document(self, row):
+        subtitle = _join(row['customer__name'], '-', self.display('status', row['status']))
+        return row['order_number'], subtitle, row['customer__name']
+
+
+class ProductionOrderSource(SearchSource):
+    doc_type = 'production_order'
+    label = 'Production Order'
+    model = 'manufacturing.ProductionOrder'
+    fields = ('po_number', 'product__code', 'product__name', 'created_by__username', 'status')
+    url_name = 'production_order_detail'
+    related = {'inventory.FinishedProduct': 'product'}
+
+    def document(self, row):
+        subtitle = _join(row['product__name'], '-', self.display('status', row['status']))
+        return row['po_number'], subtitle, _join(row['product__code'], row['product__name'], row['created_by__username'])
+
+
+class WorkOrderSource(SearchSource):
+    doc_type = 'work_order'
+    label = 'Work Order'
+    model = 'manufacturing.WorkOrder'
+    fields = ('wo_number', 'production_order__po_number', 'production_order__product__name', 'status')
+    url_name = 'work_order_detail'
+    related = {
+        'manufacturing.ProductionOrder': 'production_order',
+        'inventory.FinishedProduct': 'production_order__product',
+    }
+
+    def document(self, row):
+        subtitle = _join(row['production_order__product__name'], '-', self.display('status', row['status']))
+        return row['wo_number'], subtitle, _join(row['production_order__po_number'], row['production_order__product__name'])
+
+
+class InvoiceSource(SearchSource):
+    doc_type = 'invoice'
+    label = 'Invoice'
+    model = 'sales.Invoice'
+    fields = ('invoice_number', 'invoice_date', 'sales_order__order_number', 'sales_order__customer__name')
+    url_name = 'invoice_detail'
+    related = {
+        'sales.SalesOrder': 'sales_order',
+        'sales.Customer': 'sales_order__customer',
+    }
+
+    def document(self, row):
+        # Payment status is left out: payments and aging set it with UPDATE
+        subtitle = _join(row['sales_order__customer__name'], '-', row['invoice_date'].strftime('%b %d, %Y'))
+        return (
+            row['invoice_number'],
+            subtitle,
+            _join(row['sales_order__order_number'], row['sales_order__customer__name']),
+        )
+
+
+SOURCES = {source.doc_type: source for source in [
+    MaterialSource(), ProductSource(), CustomerSource(), VendorSource(), PurchaseOrderSource(),
+    SalesOrderSource(), ProductionOrderSource(), WorkOrderSource(), InvoiceSource(),
+]}
+
+
+def watched_models():
+    """Models whose changes affect the index"""
+    labels = set()
+    for source in SOURCES.values():
+        labels.add(source.model)
+        labels.update(source.related)
+    return [apps.get_model(label) for label in sorted(labels)]
+
+
+# Indexing
+
+def index_objects(source, ids):
+    """Bring the documents of the given objects of one source up to date"""
+    ids = sorted(set(ids))
+    for start in range(0, len(ids), INDEX_BATCH_SIZE):
+        chunk = ids[start:start + INDEX_BATCH_SIZE]
+        rows = source.queryset().filter(pk__in=chunk).values('pk', *source.fields)
+        documents = {row['pk']: source.document(row) for row in rows}
+        existing = {
+            document.object_id: document
+            for document in SearchDocument.objects.filter(doc_type=source.doc_type, object_id__in=chunk)
+        }
+
+        changed, created = [], []
+        for object_id, (title, subtitle, body) in documents.items():
+            title, subtitle = title[:255], (subtitle or '')[:255]
+            document = existing.get(object_id)
+            if document is None:
+                created.append(SearchDocument(
+                    doc_type=source.doc_type, object_id=object_id, title=title, subtitle=subtitle, body=body or '',
+                ))
+            elif (document.title, document.subtitle, document.body) != (title, subtitle, body or ''):
+                document.title, document.subtitle, document.body = title, subtitle, body or ''
+                changed.append(document)
+
+        with transaction.atomic():
+            SearchDocument.objects.filter(
+                doc_type=source.doc_type, object_id__in=[pk for pk in chunk if pk not in documents]
+            ).delete()
+            SearchDocument.objects.bulk_update(changed, ['title', 'subtitle', 'body'], batch_size=500)
+            SearchDocument.objects.bulk_create(created, batch_size=500)
+
+
+def rebuild_index(doc_types=None, registry=apps):
+    """
+    Recreate the documents of the given sources (all by default).
+
+    Models are read from ``registry``; data migrations pass their
+    historical app registry. Returns ``{doc_type: number of documents}``.
+    """
+    document_model = registry.get_model('core', 'SearchDocument')
+    counts = {}
+    for doc_type in doc_types or SOURCES:
+        source = SOURCES[doc_type]
+        with transaction.atomic():
+            document_model.objects.filter(doc_type=doc_type).delete()
+            rows = source.queryset(registry).order_by('pk').values('pk', *source.fields)
+            counts[doc_type] = 0
+            batch = []
+            for row in rows.iterator(chunk_size=INDEX_BATCH_SIZE):
+                title, subtitle, body = source.document(row)
+                batch.append(document_model(
+                    doc_type=doc_type, object_id=row['pk'],
+                    title=title[:255], subtitle=(subtitle or '')[:255], body=body or '',
+                ))
+                if len(batch) >= INDEX_BATCH_SIZE:
+                    document_model.objects.bulk_create(batch, batch_size=500)
+                    counts[doc_type] += len(batch)
+                    batch = []
+            document_model.objects.bulk_create(batch, batch_size=500)
+            counts[doc_type] += len(batch)
+    return counts
+
+
+def queue(model, ids):
+    """Queue changed objects for reindexing once the transaction commits"""
+    if not hasattr(_pending, 'objects'):
+        _pending.objects = defaultdict(set)
+    _pending.objects[model._meta.label].update(ids)
+    transaction.on_commit(flush)
+
+
+def flush():
+    """Reindex every queued object and the documents drawing text from it"""
+    objects = getattr(_pending, 'objects', None)
+    if not objects:
+        return
+    _pending.objects = defaultdict(set)
+    for source in SOURCES.values():
+        ids = set(objects.get(source.model, ()))
+        for label, lookup in source.related.items():
+            if objects.get(label):
+                ids.update(source.queryset().filter(
+                    **{f'{lookup}__in': objects[label]}
+                ).values_list('pk', flat=True))
+        if ids:
+            index_objects(source, ids)
+
+
+# Querying
+
+def _terms(query):
+    """Whitespace-separated terms of a query, each as its list of words"""
+    return [words for words in (_WORDS.findall(term) for term in query.split()) if words]
+
+
+class SQLiteBackend:
+    table = 'core_searchdocument_fts'
+
+    def match(self, query):
+        # Each term a quoted phrase matching its last word as a prefix, so
+        # "SO-2025" matches "so" followed by "2025..." and punctuation is
+        # never read as FTS5 syntax
+        terms = _terms(query)
+        return ' '.join('"{}"*'.format(' '.join(words)) for words in terms) if terms else None
+
+    def _from(self, query, doc_types):
+        sql = (
+            f'FROM {self.table} JOIN core_searchdocument d ON d.id = {self.table}.rowid '
+            f'WHERE {self.table} MATCH %s'
+        )
+        params = [self.match(query)]
+        if doc_types:
+            sql += f" AND d.doc_type IN ({', '.join(['%s'] * len(doc_types))})"
+            params += list(doc_types)
+        return sql, params
+
+    def count(self, query, doc_types, limit):
+        sql, params = self._from(query, doc_types)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM (SELECT 1 {sql} LIMIT %s)', params + [limit])
+            return cursor.fetchone()[0]
+
+    def ranked(self, query, doc_types, offset, limit, by_rank):
+        sql, params = self._from(query, doc_types)
+        if by_rank:
+            columns, order = f'd.id, -{self.table}.rank', f'{self.table}.rank'
+        else:
+            # bm25 scans every match to weigh the terms, so broad queries skip it
+            columns, order = 'd.id, NULL', f'{self.table}.rowid DESC'
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT {columns} {sql} ORDER BY {order} LIMIT %s OFFSET %s', params + [limit, offset])
+            return cursor.fetchall()
+
+    def object_ids(self, query, doc_type):
+        sql, params = self._from(query, [doc_type])
+        return RawSQL(f'SELECT d.object_id {sql}', params)
+
+
+class PostgreSQLBackend:
+    vector = "setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B')"
+
+    def match(self, query):
+        # Each term a phrase (<->) of its words, the last one as a prefix
+        terms = _terms(query.lower())
+        if not terms:
+            return None
+        return ' & '.join(
+            '({})'.format(' <-> '.join(words[:-1] + [f'{words[-1]}:*']))
+            for words in terms
+        )
+
+    def _from(self, query, doc_types):
+        sql = f"FROM core_searchdocument WHERE ({self.vector}) @@ to_tsquery('simple', %s)"
+        params = [self.match(query)]
+        if doc_types:
+            sql += ' AND doc_type = ANY(%s)'
+            params.append(list(doc_types))
+        return sql, params
+
+    def count(self, query, doc_types, limit):
+        sql, params = self._from(query, doc_types)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM (SELECT 1 {sql} LIMIT %s) matches', params + [limit])
+            return cursor.fetchone()[0]
+
+    def ranked(self, query, doc_types, offset, limit, by_rank):
+        sql, params = self._from(query, doc_types)
+        with connection.cursor() as cursor:
+            if by_rank:
+                cursor.execute(
+                    f"SELECT id, ts_rank(({self.vector}), to_tsquery('simple', %s)) AS score {sql} "
+                    f'ORDER BY score DESC, id LIMIT %s OFFSET %s',
+                    [self.match(query)] + params + [limit, offset],
+                )
+            else:
+                cursor.execute(f'SELECT id, NULL {sql} ORDER BY id DESC LIMIT %s OFFSET %s', params + [limit, offset])
+            return cursor.fetchall()
+
+    def object_ids(self, query, doc_type):
+        sql, params = self._from(query, [doc_type])
+        return RawSQL(f'SELECT object_id {sql}', params)
+
+
+class FallbackBackend:
+    def match(self, query):
+        return _terms(query) or None
+
+    def _documents(self, query, doc_types):
+        documents = SearchDocument.objects.all()
+        for words in _terms(query):
+            term = ' '.join(words)
+            documents = documents.filter(Q(title__icontains=term) | Q(body__icontains=term))
+        if doc_types:
+            documents = documents.filter(doc_type__in=doc_types)
+        return documents
+
+    def count(self, query, doc_types, limit):
+        return len(self._documents(query, doc_types).values_list('pk', flat=True)[:limit])
+
+    def ranked(self, query, doc_types, offset, limit, by_rank):
+        documents = self._documents(query, doc_types).order_by('-pk')
+        return [(pk, None) for pk in documents.values_list('pk', flat=True)[offset:offset + limit]]
+
+    def object_ids(self, query, doc_type):
+        return self._documents(query, [doc_type]).values('object_id')
+
+
+BACKENDS = {
+    'sqlite': SQLiteBackend(),
+    'postgresql': PostgreSQLBackend(),
+}
+
+
+def backend():
+    return BACKENDS.get(connection.vendor, FallbackBackend())
+
+
+class SearchResults:
+    """
+    Results of a query, fetched a page at a time.
+
+    Paginator slices it, so only the requested page is read. At most
+    MAX_RESULTS results are reachable; queries matching more than that are
+    too broad to rank usefully and list the newest documents first instead.
+    Results come back as SearchDocuments carrying ``rank``, ``label`` and
+    ``url``.
+    """
+
+    def __init__(self, query, doc_types=None):
+        self.query = query
+        self.doc_types = list(doc_types or [])
+        self._backend = backend()
+        self._matches = None
+
+    def _match_count(self):
+        # Counting stops one past the cap, which is all it takes to know the
+        # query is broad
+        if self._matches is None:
+            if self._backend.match(self.query) is None:
+                self._matches = 0
+            else:
+                self._matches = self._backend.count(self.query, self.doc_types, MAX_RESULTS + 1)
+        return self._matches
+
+    @property
+    def is_broad(self):
+        """True if the query matches more than MAX_RESULTS documents"""
+        return self._match_count() > MAX_RESULTS
+
+    def count(self):
+        return min(self._match_count(), MAX_RESULTS)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        offset = key.start or 0
+        stop = min(key.stop if key.stop is not None else MAX_RESULTS, self.count())
+        if stop <= offset:
+            return []
+        hits = self._backend.ranked(self.query, self.doc_types, offset, stop - offset, not self.is_broad)
+        documents = SearchDocument.objects.in_bulk([pk for pk, _rank in hits])
+        results = []
+        for pk, rank in hits:
+            document = documents[pk]
+            source = SOURCES.get(document.doc_type)
+            document.rank = rank
+            document.label = source.label if source else document.doc_type
+            document.url = source.url(document.object_id) if source else ''
+            results.append(document)
+        return results
+
+
+def search(query, doc_types=None):
+    """SearchResults for a query, optionally limited to some sources"""
+    return SearchResults(query, doc_types)
+
+
+def matching_ids(query, doc_type):
+    """
+    Subquery of the object ids of one source matching a query, for use as
+    ``queryset.filter(pk__in=matching_ids(query, doc_type))``.
+    """
+    search_backend = backend()
+    if search_backend.match(query) is None:
+        return SearchDocument.objects.none().values('object_id')
+    return search_backend.object_ids(query, doc_type)
+
+
+def rebuild_text_index():
+    """Rebuild the database's text index from the documents (SQLite only)"""
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {SQLiteBackend.table}({SQLiteBackend.table}) VALUES ('rebuild')")
@@ -0,0 +1,16 @@
+from django.db.models.signals import post_delete, post_save
+
+from . import search
+
+
+def queue_search_document(sender, instance, **kwargs):
+    search.queue(sender, [instance.pk])
+
+
+def connect_search_signals():
+    for model in search.watched_models():
+        post_save.connect(queue_search_document, sender=model, dispatch_uid=f'search_save_{model._meta.label}')
+        post_delete.connect(queue_search_document, sender=model, dispatch_uid=f'search_delete_{model._meta.label}')
+
+
+connect_search_signals()
@@ -0,0 +1,106 @@
+import threading
+from collections import Counter
+from importlib import import_module
+
+from django.apps import apps
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase
+
+from inventory.models import MaterialCategory, RawMaterial
+
+from .models import DocumentSequence, SearchDocument
+from .numbering import get_format, next_numbers, sequence_allocator
+from .search import matching_ids
+
+
+class NumberingConcurrencyTests(TransactionTestCase):
+    """Numbers handed out by many threads at once are never duplicated"""
+
+    THREADS = 8
+    ROUNDS = 40
+
+    def setUp(self):
+        sequence_allocator.reset()
+
+    def tearDown(self):
+        sequence_allocator.reset()
+
+    def allocate_concurrently(self, doc_type, count=1, rollback_every=0):
+        issued, errors = [], []
+        lock = threading.Lock()
+        start = threading.Barrier(self.THREADS)
+
+        def worker(worker_id):
+            try:
+                start.wait()
+                for round_number in range(self.ROUNDS):
+                    rolled_back = rollback_every and round_number % rollback_every == worker_id % rollback_every
+                    while True:
+                        try:
+                            with transaction.atomic():
+                                numbers = next_numbers(doc_type, count)
+                                if rolled_back:
+                                    transaction.set_rollback(True)
+                            break
+                        except OperationalError as e:
+                            # SQLite lets one writer in at a time; retry like a busy timeout would
+                            if 'locked' not in str(e):
+                                raise
+                    if not rolled_back:
+                        with lock:
+                            issued.extend(numbers)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return issued
+
+    def assertUnique(self, numbers):
+        duplicates = [number for number, times in Counter(numbers).items() if times > 1]
+        self.assertEqual(duplicates, [])
+
+    def test_gap_free_numbers_are_unique(self):
+        numbers = self.allocate_concurrently('invoice')
+        self.assertEqual(len(numbers), self.THREADS * self.ROUNDS)
+        self.assertUnique(numbers)
+        # Gap-free types hand out exactly 1..n
+        self.assertEqual(
+            sorted(int(number.rsplit('-', 1)[1]) for number in numbers),
+            list(range(1, len(numbers) + 1)),
+        )
+
+    def test_block_numbers_are_unique(self):
+        self.assertGreater(get_format('stock_adjustment')['block_size'], 1)
+        numbers = self.allocate_concurrently('stock_adjustment', count=3)
+        self.assertEqual(len(numbers), self.THREADS * self.ROUNDS * 3)
+        self.assertUnique(numbers)
+
+    def test_rolled_back_blocks_are_not_reused(self):
+        # Numbers of rolled back transactions go back to the counter, never
+        # to the leftover cache, so the next block cannot overlap them
+        numbers = self.allocate_concurrently('stock_adjustment', count=7, rollback_every=3)
+        self.assertUnique(numbers)
+        highest = max(int(number.rsplit('-', 1)[1]) for number in numbers)
+        sequence = DocumentSequence.objects.get(doc_type='stock_adjustment')
+        self.assertGreater(sequence.next_value, highest)
+
+
+class SearchIndexMigrationTests(TestCase):
+
+    def test_migration_indexes_existing_objects(self):
+        category = MaterialCategory.objects.create(name='Leather')
+        material = RawMaterial.objects.create(code='LTR-01', name='Nappa Leather', category=category, unit='m')
+        # As if the material predated the index
+        SearchDocument.objects.all().delete()
+        self.assertFalse(RawMaterial.objects.filter(pk__in=matching_ids('nappa', 'material')).exists())
+
+        import_module('core.migrations.0004_populate_search_index').populate_search_index(apps, None)
+
+        self.assertEqual(list(RawMaterial.objects.filter(pk__in=matching_ids('nappa', 'material'))), [material])
@@ -0,0 +1,45 @@
+"""
+Shared versions of in-process caches.
+
+Indexes kept in process memory (ATP, tax rates) cannot rely on signals to
+stay fresh: a signal only reaches the process that saved the row, and every
+other worker would keep serving stale data. Each cached item is keyed on a
+CacheVersion row instead. Writers ``bump`` the version inside the same
+transaction as the change, so other workers see the new version exactly
+when they can see the new data; readers compare the versions they loaded
+with ``current`` (one query) and reload only what moved.
+
+Read the versions before the data they guard: data loaded after a newer
+version was read is at worst reloaded once more, never kept stale.
+"""
+from django.db.models import F
+
+from .models import CacheVersion
+
+
+# Keys read per query
+BATCH_SIZE = 900
+
+
+def current(keys):
+    """``{key: version}`` for the given keys; keys never bumped are at 0"""
+    keys = list(keys)
+    versions = dict.fromkeys(keys, 0)
+    for start in range(0, len(keys), BATCH_SIZE):
+        versions.update(
+            CacheVersion.objects.filter(key__in=keys[start:start + BATCH_SIZE]).values_list('key', 'version')
+        )
+    return versions
+
+
+def bump(keys):
+    """Move the given keys to a new version, inside the caller's transaction"""
+    keys = sorted(set(keys))
+    for start in range(0, len(keys), BATCH_SIZE):
+        chunk = keys[start:start + BATCH_SIZE]
+        if CacheVersion.objects.filter(key__in=chunk).update(version=F('version') + 1) == len(chunk):
+            continue
+        # Create the keys seen for the first time and bump again; keys bumped
+        # twice, or created meanwhile by another worker, still end up changed
+        CacheVersion.objects.bulk_create([CacheVersion(key=key) for key in chunk], ignore_conflicts=True)
+        CacheVersion.objects.filter(key__in=chunk).update(version=F('version') + 1)
@@ -0,0 +1,30 @@
+from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.shortcuts import render
+
+from .search import SOURCES, search as search_documents
+
+
+@login_required
+def search(request):
+    """Ranked search across materials, products, partners and documents"""
+    query = request.GET.get('q', '').strip()
+    doc_type = request.GET.get('type', '')
+    if doc_type not in SOURCES:
+        doc_type = ''
+
+    results = page_obj = None
+    if query:
+        results = search_documents(query, [doc_type] if doc_type else None)
+        paginator = Paginator(results, 15)
+        page_obj = paginator.get_page(request.GET.get('page'))
+
+    context = {
+        'page_obj': page_obj,
+        'results': results,
+        'query': query,
+        'doc_type': doc_type,
+        'doc_types': [(source.doc_type, source.label) for source in SOURCES.values()],
+        'title': 'Search'
+    }
+    return render(request, 'core/search.html', context)
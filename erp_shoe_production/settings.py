@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'manufacturing',
     'sales',
     'finance',
+    'core',
 ]
 
 MIDDLEWARE = [
@@ -54,6 +55,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'finance.autopost.AutoPostingMiddleware',
 ]
 
 ROOT_URLCONF = 'erp_shoe_production.urls'
@@ -127,3 +129,15 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Document numbering
+# Per document type overrides of core.numbering.DEFAULT_FORMATS, e.g.
+# {'invoice': {'format': 'INV/{period}/{number:05d}', 'period': '%Y%m'}}
+
+DOCUMENT_NUMBERING = {}
+
+# Ledger accounts used for automatic postings
+# Role -> account code overrides of finance.ledger.DEFAULT_LEDGER_ACCOUNTS
+
+LEDGER_ACCOUNTS = {}
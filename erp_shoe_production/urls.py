@@ -34,4 +34,5 @@ urlpatterns = [
     path('manufacturing/', include('manufacturing.urls')),
     path('sales/', include('sales.urls')),
     path('finance/', include('finance.urls')),
+    path('', include('core.urls')),
 ]
@@ -1,14 +1,19 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from .models import (
     Account, Transaction, JournalEntry, JournalEntryLine,
-    Budget, BudgetLine, TaxRate, FinancialPeriod
+    Budget, BudgetLine, TaxRate, FinancialPeriod, AccountPeriodBalance, ClosedPeriodError
 )
+from .budgets import refresh_budget_actuals
+from .forms import AccountForm
+from .periods import PeriodCloseError, close_period, reopen_period
+from .posting import post_entries
 
 
 @admin.register(Account)
 class AccountAdmin(admin.ModelAdmin):
-    list_display = ['code', 'name', 'account_type', 'balance', 'is_active', 'parent_account']
-    list_filter = ['account_type', 'is_active', 'parent_account']
+    form = AccountForm
+    list_display = ['code', 'name', 'account_type', 'balance', 'is_active', 'parent_account', 'cash_flow_category', 'is_cash']
+    list_filter = ['account_type', 'is_active', 'parent_account', 'cash_flow_category', 'is_cash']
     search_fields = ['code', 'name']
     readonly_fields = ['balance', 'last_updated']
     fieldsets = (
@@ -18,6 +23,9 @@ class AccountAdmin(admin.ModelAdmin):
         ('Hierarchy', {
             'fields': ('parent_account',)
         }),
+        ('Cash Flow', {
+            'fields': ('cash_flow_category', 'is_cash')
+        }),
         ('Status', {
             'fields': ('is_active',)
         }),
@@ -66,10 +74,11 @@ class JournalEntryLineInline(admin.TabularInline):
 @admin.register(JournalEntry)
 class JournalEntryAdmin(admin.ModelAdmin):
     list_display = ['reference_number', 'date', 'description', 'is_posted', 'total_debit', 'total_credit', 'is_balanced']
-    list_filter = ['is_posted', 'date']
+    list_filter = ['is_posted', 'source', 'date']
     search_fields = ['reference_number', 'description']
-    readonly_fields = ['is_balanced', 'total_debit', 'total_credit', 'posted_date']
+    readonly_fields = ['is_balanced', 'total_debit', 'total_credit', 'posted_date', 'source', 'source_id']
     inlines = [JournalEntryLineInline]
+    actions = ['post_selected_entries']
     fieldsets = (
         ('Journal Entry Information', {
             'fields': ('date', 'description', 'reference_number')
@@ -78,7 +87,7 @@ class JournalEntryAdmin(admin.ModelAdmin):
             'fields': ('is_posted', 'posted_date')
         }),
         ('Related Documents', {
-            'fields': ('sales_order', 'purchase_order'),
+            'fields': ('sales_order', 'purchase_order', 'source', 'source_id'),
             'classes': ('collapse',)
         }),
         ('Balance Check', {
@@ -87,6 +96,13 @@ class JournalEntryAdmin(admin.ModelAdmin):
         }),
     )
 
+    @admin.action(description='Post selected journal entries')
+    def post_selected_entries(self, request, queryset):
+        result = post_entries(queryset, user=request.user)
+        self.message_user(request, f'{len(result.posted)} journal entries posted.', messages.SUCCESS)
+        for reference_number, reason in result.skipped[:10]:
+            self.message_user(request, f'{reference_number}: {reason}', messages.WARNING)
+
 
 @admin.register(JournalEntryLine)
 class JournalEntryLineAdmin(admin.ModelAdmin):
@@ -98,6 +114,7 @@ class JournalEntryLineAdmin(admin.ModelAdmin):
 class BudgetLineInline(admin.TabularInline):
     model = BudgetLine
     extra = 1
+    readonly_fields = ['actual_amount']
 
 
 @admin.register(Budget)
@@ -117,6 +134,12 @@ class BudgetAdmin(admin.ModelAdmin):
             'fields': ('is_active', 'status')
         }),
     )
+    actions = ['refresh_actuals']
+
+    @admin.action(description='Refresh actuals from the ledger')
+    def refresh_actuals(self, request, queryset):
+        updated = refresh_budget_actuals(queryset)
+        self.message_user(request, f'{updated} budget line(s) updated.', messages.SUCCESS)
 
 
 @admin.register(BudgetLine)
@@ -124,7 +147,7 @@ class BudgetLineAdmin(admin.ModelAdmin):
     list_display = ['budget', 'account', 'budgeted_amount', 'actual_amount', 'variance']
     list_filter = ['budget__status', 'account__account_type']
     search_fields = ['budget__name', 'account__name']
-    readonly_fields = ['variance']
+    readonly_fields = ['actual_amount', 'variance']
 
 
 @admin.register(TaxRate)
@@ -154,7 +177,8 @@ class FinancialPeriodAdmin(admin.ModelAdmin):
     list_display = ['name', 'start_date', 'end_date', 'is_closed', 'is_current']
     list_filter = ['is_closed', 'start_date']
     search_fields = ['name']
-    readonly_fields = ['is_current', 'closed_date']
+    readonly_fields = ['is_current', 'is_closed', 'closed_date', 'closed_by']
+    actions = ['close_selected_periods', 'reopen_selected_periods']
     fieldsets = (
         ('Period Information', {
             'fields': ('name', 'start_date', 'end_date', 'is_current')
@@ -164,3 +188,30 @@ class FinancialPeriodAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+    @admin.action(description='Close selected periods')
+    def close_selected_periods(self, request, queryset):
+        for period in queryset.order_by('start_date'):
+            try:
+                close_period(period, user=request.user)
+            except (PeriodCloseError, ClosedPeriodError) as e:
+                self.message_user(request, str(e), messages.ERROR)
+                return
+            self.message_user(request, f'{period} closed.', messages.SUCCESS)
+
+    @admin.action(description='Reopen selected periods')
+    def reopen_selected_periods(self, request, queryset):
+        for period in queryset.order_by('-start_date'):
+            try:
+                reopen_period(period)
+            except PeriodCloseError as e:
+                self.message_user(request, str(e), messages.ERROR)
+                return
+            self.message_user(request, f'{period} reopened.', messages.SUCCESS)
+
+
+@admin.register(AccountPeriodBalance)
+class AccountPeriodBalanceAdmin(admin.ModelAdmin):
+    list_display = ['period', 'account', 'opening_balance', 'period_debit', 'period_credit', 'closing_balance']
+    list_filter = ['period', 'account__account_type']
+    search_fields = ['account__code', 'account__name']
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FinanceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'finance'
+
+    def ready(self):
+        import finance.signals  # Keeps the account closure table in step with the chart
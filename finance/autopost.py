@@ -0,0 +1,522 @@
+"""
+Automatic posting of operational documents.
+
+Each posting rule turns one kind of document into a balanced journal entry:
+
+* invoice: debit accounts receivable, credit sales revenue and tax payable
+* payment: debit cash or bank (by payment method), credit accounts receivable
+* goods receipt: debit inventory, credit accounts payable
+* material consumption: debit work in progress, credit inventory
+
+Accounts are looked up by ledger role (see ledger.DEFAULT_LEDGER_ACCOUNTS).
+Entries record the rule and document they came from in ``source`` and
+``source_id``. Each document has at most one standing entry, so a document
+is never posted twice and re-posting is always safe.
+
+A document edited after it was posted is reposted when it is queued again:
+if its date or lines no longer match the standing entry, that entry is
+marked reversed, a reversal (``reversal_of``, sides swapped, same date) is
+booked and the document is posted afresh under a numbered reference
+(AUTO-INV-1001-2). Entries in a closed period are never reversed.
+
+Saving a document queues it. AutoPostingMiddleware runs each request that
+may write (any method but GET, HEAD, OPTIONS and TRACE) in a transaction
+and flushes the queue at the end of it, before it commits: a request that
+fails keeps neither its documents nor their postings, and a posting that
+fails fails the request. Outside such a request the queue is flushed when
+the surrounding transaction commits. A flush reads the queued documents
+back with one query per rule, so it posts their final amounts, and writes
+the entries, lines and ledger transactions with bulk_create. Documents a
+flush skips are logged, and shown to the user as warnings when the flush
+ran at the end of a request.
+``post_documents`` does the same for a list of ids directly, which is what
+payment application and the ``autopost_documents`` catch-up command use.
+"""
+import logging
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+from decimal import Decimal
+
+from django.contrib import messages
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef
+from django.utils import timezone
+
+from manufacturing.models import MaterialConsumption
+from purchase.models import GoodsReceipt
+from sales.models import Invoice, Payment
+
+from .ledger import ledger_accounts, post_transactions
+from .models import FinancialPeriod, JournalEntry, JournalEntryLine, Transaction
+
+
+# Documents posted per transaction by post_documents
+DOCUMENT_BATCH_SIZE = 1000
+
+ZERO = Decimal('0.00')
+
+# Requests that run without a transaction of their own; anything they
+# queue is posted when it commits, as outside a request
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+# Skipped postings shown to the user after a request
+SKIPPED_MESSAGE_LIMIT = 10
+
+logger = logging.getLogger(__name__)
+
+_pending = threading.local()
+
+
+def current_entries(source):
+    """Standing entries of a rule's documents: neither reversed nor reversals"""
+    return JournalEntry.objects.filter(
+        source=source, source_id__isnull=False, is_reversed=False, reversal_of__isnull=True
+    )
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value)
+        return value.date()
+    return value
+
+
+class PostingRule:
+    """
+    Maps one kind of document to a journal entry template.
+
+    Subclasses name the ledger roles they post to, the document fields they
+    read and how a document row becomes entry fields and (role, side,
+    amount) lines.
+    """
+    source = None
+    model = None
+    roles = ()
+    fields = ()
+
+    def documents(self):
+        return self.model.objects.all()
+
+    def rows(self, ids, posted=False):
+        """Unposted (or with ``posted``, posted) documents among ``ids`` as dicts of ``fields``"""
+        entries = current_entries(self.source).filter(source_id=OuterRef('pk'))
+        return self.documents().filter(pk__in=ids).alias(
+            _posted=Exists(entries)
+        ).filter(_posted=posted).values('pk', *self.fields).order_by('pk')
+
+    def entry(self, row):
+        """Keyword arguments of the JournalEntry for a document row"""
+        raise NotImplementedError
+
+    def lines(self, row):
+        """``[(role, 'debit' or 'credit', amount), ...]`` for a document row"""
+        raise NotImplementedError
+
+
+class InvoiceRule(PostingRule):
+    source = 'invoice'
+    model = Invoice
+    roles = ('accounts_receivable', 'sales_revenue', 'tax_payable')
+    fields = ('invoice_number', 'invoice_date', 'total_amount', 'tax_amount', 'sales_order_id', 'created_by_id')
+
+    def entry(self, row):
+        return {
+            'date': row['invoice_date'],
+            'description': f"Invoice {row['invoice_number']}",
+            'reference_number': f"AUTO-INV-{row['invoice_number']}",
+            'sales_order_id': row['sales_order_id'],
+            'invoice_id': row['pk'],
+            'created_by_id': row['created_by_id'],
+        }
+
+    def lines(self, row):
+        return [
+            ('accounts_receivable', 'debit', row['total_amount']),
+            ('sales_revenue', 'credit', row['total_amount'] - row['tax_amount']),
+            ('tax_payable', 'credit', row['tax_amount']),
+        ]
+
+
+class PaymentRule(PostingRule):
+    source = 'payment'
+    model = Payment
+    roles = ('accounts_receivable', 'cash', 'bank')
+    fields = (
+        'payment_date', 'amount', 'payment_method', 'reference_number', 'invoice_id',
+        'invoice__invoice_number', 'invoice__sales_order_id', 'created_by_id',
+    )
+
+    # Ledger role debited for each payment method
+    method_roles = {
+        'cash': 'cash',
+        'bank_transfer': 'bank',
+        'credit_card': 'bank',
+        'check': 'bank',
+    }
+
+    def documents(self):
+        # Payments applied before posting rules existed were posted straight
+        # to the ledger without a journal entry
+        legacy = Transaction.objects.filter(
+            journal_entry__isnull=True,
+            invoice_id=OuterRef('invoice_id'),
+            date=OuterRef('payment_date'),
+            amount=OuterRef('amount'),
+            transaction_type='credit',
+        )
+        return Payment.objects.alias(_legacy=Exists(legacy)).filter(_legacy=False)
+
+    def entry(self, row):
+        return {
+            'date': row['payment_date'],
+            'description': f"Payment received for {row['invoice__invoice_number']}",
+            'reference_number': f"AUTO-PAY-{row['pk']}",
+            'sales_order_id': row['invoice__sales_order_id'],
+            'invoice_id': row['invoice_id'],
+            'created_by_id': row['created_by_id'],
+        }
+
+    def lines(self, row):
+        return [
+            (self.method_roles.get(row['payment_method'], 'bank'), 'debit', row['amount']),
+            ('accounts_receivable', 'credit', row['amount']),
+        ]
+
+
+class GoodsReceiptRule(PostingRule):
+    source = 'goods_receipt'
+    model = GoodsReceipt
+    roles = ('inventory', 'accounts_payable')
+    fields = ('gr_number', 'receipt_date', 'total_received_value', 'purchase_order_id',
+              'purchase_order__po_number', 'received_by_id')
+
+    def entry(self, row):
+        return {
+            'date': row['receipt_date'],
+            'description': f"Goods receipt {row['gr_number']} for PO {row['purchase_order__po_number']}",
+            'reference_number': f"AUTO-GR-{row['gr_number']}",
+            'purchase_order_id': row['purchase_order_id'],
+            'created_by_id': row['received_by_id'],
+        }
+
+    def lines(self, row):
+        return [
+            ('inventory', 'debit', row['total_received_value']),
+            ('accounts_payable', 'credit', row['total_received_value']),
+        ]
+
+
+class MaterialConsumptionRule(PostingRule):
+    source = 'material_consumption'
+    model = MaterialConsumption
+    roles = ('work_in_progress', 'inventory')
+    fields = ('consumption_date', 'cost', 'material__name', 'work_order__wo_number', 'recorded_by_id')
+
+    def entry(self, row):
+        return {
+            'date': _as_date(row['consumption_date']),
+            'description': f"{row['material__name']} consumed by {row['work_order__wo_number']}",
+            'reference_number': f"AUTO-MC-{row['pk']}",
+            'created_by_id': row['recorded_by_id'],
+        }
+
+    def lines(self, row):
+        # Costed from the cost layers when consumed, like the inventory valuation
+        return [
+            ('work_in_progress', 'debit', row['cost']),
+            ('inventory', 'credit', row['cost']),
+        ]
+
+
+RULES = {rule.source: rule for rule in [InvoiceRule(), PaymentRule(), GoodsReceiptRule(), MaterialConsumptionRule()]}
+
+
+class AutoPostResult:
+    """Outcome of posting documents"""
+
+    def __init__(self):
+        self.posted = []        # (source, document id)
+        self.reversed = []      # (source, document id)
+        self.skipped = []       # (reference, reason)
+        self.transactions = []
+
+
+def _build(rule, rows, accounts, result, revisions=None):
+    """Unsaved journal entries and their (account, side, amount) lines"""
+    closed = FinancialPeriod.closed_periods_for(rule.entry(row)['date'] for row in rows)
+    revisions = revisions or {}
+    built = []
+    for row in rows:
+        fields = rule.entry(row)
+        if revisions.get(row['pk']):
+            # Reposted after an edit; the earlier references are taken
+            fields['reference_number'] += f"-{revisions[row['pk']] + 1}"
+        reference = fields['reference_number']
+        period = next((period for period in closed if period.contains(fields['date'])), None)
+        if period:
+            result.skipped.append((reference, f'Financial period {period} is closed'))
+            continue
+        lines = [(role, side, amount) for role, side, amount in rule.lines(row) if amount]
+        missing = sorted({role for role, _side, _amount in lines if accounts.get(role) is None})
+        if missing:
+            result.skipped.append((reference, f"No ledger account for {', '.join(missing)}"))
+            continue
+        lines = [(accounts[role], side, amount) for role, side, amount in lines]
+        if not lines:
+            result.skipped.append((reference, 'Nothing to post'))
+            continue
+        debit = sum((amount for _account, side, amount in lines if side == 'debit'), ZERO)
+        credit = sum((amount for _account, side, amount in lines if side == 'credit'), ZERO)
+        if debit != credit:
+            result.skipped.append((reference, f'Unbalanced entry (debit {debit}, credit {credit})'))
+            continue
+        built.append((row['pk'], fields, lines))
+    return built
+
+
+def _save(rule, built, result):
+    """Insert entries, lines and ledger transactions for built documents"""
+    now = timezone.now()
+    entries = JournalEntry.objects.bulk_create([
+        JournalEntry(
+            date=fields['date'],
+            description=fields['description'],
+            reference_number=fields['reference_number'],
+            sales_order_id=fields.get('sales_order_id'),
+            purchase_order_id=fields.get('purchase_order_id'),
+            source=rule.source,
+            source_id=document_id,
+            is_posted=True,
+            posted_date=now,
+            created_by_id=fields['created_by_id'],
+        )
+        for document_id, fields, _lines in built
+    ])
+    if any(entry.pk is None for entry in entries):
+        # Backends that cannot return ids from bulk inserts
+        ids = dict(JournalEntry.objects.filter(
+            source=rule.source, source_id__in=[document_id for document_id, _fields, _lines in built]
+        ).values_list('source_id', 'pk'))
+        for entry in entries:
+            entry.pk = ids[entry.source_id]
+
+    entry_lines = []
+    transactions = []
+    for entry, (document_id, fields, lines) in zip(entries, built):
+        for account, side, amount in lines:
+            entry_lines.append(JournalEntryLine(
+                journal_entry_id=entry.pk, account=account, transaction_type=side, amount=amount,
+            ))
+            transactions.append(Transaction(
+                date=fields['date'],
+                description=fields['description'][:500],
+                reference_number=fields['reference_number'],
+                account=account,
+                transaction_type=side,
+                amount=amount,
+                sales_order_id=fields.get('sales_order_id'),
+                purchase_order_id=fields.get('purchase_order_id'),
+                invoice_id=fields.get('invoice_id'),
+                journal_entry_id=entry.pk,
+                created_by_id=fields['created_by_id'],
+            ))
+        result.posted.append((rule.source, document_id))
+    JournalEntryLine.objects.bulk_create(entry_lines, batch_size=DOCUMENT_BATCH_SIZE)
+    result.transactions.extend(post_transactions(transactions))
+
+
+def _changed_entries(rule, ids, accounts):
+    """Standing entries among the documents ``ids`` whose date or lines no longer match the document"""
+    rows = {row['pk']: row for row in rule.rows(ids, posted=True)}
+    if not rows:
+        return []
+    entries = {}
+    posted = defaultdict(Counter)
+    lines = JournalEntryLine.objects.filter(
+        journal_entry__in=current_entries(rule.source).filter(source_id__in=rows)
+    ).values_list('journal_entry_id', 'journal_entry__source_id', 'journal_entry__date',
+                  'account_id', 'transaction_type', 'amount')
+    for entry_id, document_id, day, account_id, side, amount in lines:
+        entries[document_id] = (entry_id, day)
+        posted[document_id][(account_id, side, amount)] += 1
+
+    changed = []
+    for document_id, (entry_id, day) in entries.items():
+        row = rows[document_id]
+        wanted = Counter(
+            (accounts[role].pk if accounts.get(role) else None, side, amount)
+            for role, side, amount in rule.lines(row) if amount
+        )
+        if rule.entry(row)['date'] != day or wanted != posted[document_id]:
+            changed.append(entry_id)
+    return changed
+
+
+def _reverse(rule, entry_ids, result):
+    """Book reversals of standing entries and mark them reversed, so their documents post again"""
+    entries = list(JournalEntry.objects.filter(pk__in=entry_ids).select_for_update().order_by('pk'))
+    closed = FinancialPeriod.closed_periods_for(entry.date for entry in entries)
+    reversing = []
+    for entry in entries:
+        period = next((period for period in closed if period.contains(entry.date)), None)
+        if period:
+            result.skipped.append((entry.reference_number, f'Financial period {period} is closed'))
+        else:
+            reversing.append(entry)
+    if not reversing:
+        return
+
+    JournalEntry.objects.filter(pk__in=[entry.pk for entry in reversing]).update(is_reversed=True)
+    now = timezone.now()
+    reversals = JournalEntry.objects.bulk_create([
+        JournalEntry(
+            date=entry.date,
+            description=f"Reversal of {entry.description}",
+            reference_number=f"REV-{entry.reference_number}",
+            sales_order_id=entry.sales_order_id,
+            purchase_order_id=entry.purchase_order_id,
+            source=entry.source,
+            source_id=entry.source_id,
+            reversal_of=entry,
+            is_posted=True,
+            posted_date=now,
+            created_by_id=entry.created_by_id,
+        )
+        for entry in reversing
+    ])
+    if any(reversal.pk is None for reversal in reversals):
+        # Backends that cannot return ids from bulk inserts
+        ids = dict(JournalEntry.objects.filter(reversal_of__in=reversing).values_list('reversal_of_id', 'pk'))
+        for reversal in reversals:
+            reversal.pk = ids[reversal.reversal_of_id]
+
+    reversal_ids = {reversal.reversal_of_id: reversal.pk for reversal in reversals}
+    opposite = {'debit': 'credit', 'credit': 'debit'}
+    JournalEntryLine.objects.bulk_create([
+        JournalEntryLine(
+            journal_entry_id=reversal_ids[line.journal_entry_id], account_id=line.account_id,
+            transaction_type=opposite[line.transaction_type], amount=line.amount, description=line.description,
+        )
+        for line in JournalEntryLine.objects.filter(journal_entry_id__in=reversal_ids)
+    ], batch_size=DOCUMENT_BATCH_SIZE)
+    result.transactions.extend(post_transactions([
+        Transaction(
+            date=entry.date,
+            description=f"Reversal of {entry.description}"[:500],
+            reference_number=f"REV-{entry.reference_number}"[:100],
+            account_id=entry.account_id,
+            transaction_type=opposite[entry.transaction_type],
+            amount=entry.amount,
+            sales_order_id=entry.sales_order_id,
+            purchase_order_id=entry.purchase_order_id,
+            invoice_id=entry.invoice_id,
+            journal_entry_id=reversal_ids[entry.journal_entry_id],
+            created_by_id=entry.created_by_id,
+        )
+        for entry in Transaction.objects.filter(journal_entry_id__in=reversal_ids)
+    ]))
+    result.reversed.extend((rule.source, entry.source_id) for entry in reversing)
+
+
+def post_documents(source, ids, batch_size=DOCUMENT_BATCH_SIZE, result=None, repost=False):
+    """
+    Post the documents of one rule that have not been posted yet.
+
+    With ``repost``, documents posted already whose date or amounts have
+    changed since are reversed and posted again. Documents dated in a closed
+    period, posting to a ledger role with no account, with nothing to post
+    or whose lines do not balance are skipped and reported. Each chunk of
+    batch_size documents is posted in its own transaction.
+    """
+    rule = RULES[source]
+    result = result or AutoPostResult()
+    ids = sorted(set(ids))
+    accounts = ledger_accounts(*rule.roles)
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+        with transaction.atomic():
+            if repost:
+                changed = _changed_entries(rule, chunk, accounts)
+                if changed:
+                    _reverse(rule, changed, result)
+            rows = list(rule.rows(chunk).select_for_update(of=('self',)))
+            revisions = dict(
+                JournalEntry.objects.filter(
+                    source=source, source_id__in=[row['pk'] for row in rows], is_reversed=True
+                ).order_by().values('source_id').annotate(count=Count('pk')).values_list('source_id', 'count')
+            ) if rows else {}
+            built = _build(rule, rows, accounts, result, revisions)
+            if built:
+                _save(rule, built, result)
+    return result
+
+
+def queue(source, ids):
+    """Queue documents for posting (again, if edited) at the end of the request or transaction"""
+    if not hasattr(_pending, 'documents'):
+        _pending.documents = defaultdict(set)
+    _pending.documents[source].update(ids)
+    if not getattr(_pending, 'in_request', False):
+        transaction.on_commit(flush)
+
+
+def flush():
+    """Post every queued document, reposting the edited ones"""
+    documents = getattr(_pending, 'documents', None)
+    if not documents:
+        return
+    _pending.documents = defaultdict(set)
+    result = AutoPostResult()
+    with transaction.atomic():
+        for source, ids in documents.items():
+            post_documents(source, ids, result=result, repost=True)
+    for reference, reason in result.skipped:
+        logger.warning("Not posted to the ledger: %s: %s", reference, reason)
+    return result
+
+
+class AutoPostingMiddleware:
+    """
+    Runs each request that may write in a transaction and posts the
+    documents it queued before committing, so documents and their entries
+    are kept together or not at all. Errors while posting are not caught:
+    they fail the request. Documents that were skipped are reported to the
+    user with the messages framework.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method in SAFE_METHODS:
+            return self.get_response(request)
+        _pending.in_request = True
+        result = None
+        try:
+            with transaction.atomic():
+                response = self.get_response(request)
+                if not transaction.get_rollback():
+                    result = flush()
+        finally:
+            _pending.in_request = False
+            # Whatever a failed request queued was rolled back with it
+            _pending.documents = defaultdict(set)
+        if result and result.skipped:
+            self.report_skipped(request, result.skipped)
+        return response
+
+    def process_exception(self, request, exception):
+        # The view raised; Django turns that into an error response, so
+        # roll the request back here rather than commit half of it
+        if request.method not in SAFE_METHODS:
+            transaction.set_rollback(True)
+
+    def report_skipped(self, request, skipped):
+        for reference, reason in skipped[:SKIPPED_MESSAGE_LIMIT]:
+            messages.warning(request, f'{reference} was not posted to the ledger: {reason}', fail_silently=True)
+        if len(skipped) > SKIPPED_MESSAGE_LIMIT:
+            messages.warning(
+                request, f'... and {len(skipped) - SKIPPED_MESSAGE_LIMIT} more documents not posted.', fail_silently=True
+            )
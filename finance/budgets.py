@@ -0,0 +1,228 @@
+"""
+Budget actuals.
+
+BudgetLine.actual_amount is filled from the ledger instead of by hand. A
+line's actual is the movement of its account and all its sub-accounts (see
+hierarchy) in the account's normal direction, so expense lines count debits
+and revenue lines count credits:
+
+* over the month of ``period`` for monthly lines,
+* over the calendar months the budget spans otherwise.
+
+``refresh_budget_actuals`` recomputes a budget from one query grouped by
+budgeted account and month, joining the transactions to the closure table.
+Saving a budget or one of its lines refreshes what it affects (see
+signals), so lines added or edited anywhere start from the right actual.
+``apply_to_budgets`` keeps actuals current as transactions post: it works
+out which lines each new transaction belongs to and moves them by the
+transaction's amount with a single ``UPDATE``. Closing entries are left
+out so closing a period does not wipe revenue and expense actuals.
+"""
+from calendar import monthrange
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, Q, Sum, Value, When
+from django.db.models.functions import TruncMonth
+
+from .ledger import DEBIT_NORMAL_TYPES, balance_change
+from .models import Account, AccountClosure, Budget, BudgetLine, Transaction
+
+
+ZERO = Decimal('0.00')
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def month_end(day):
+    return day.replace(day=monthrange(day.year, day.month)[1])
+
+
+def budget_months(budget):
+    """First day of every month the budget covers"""
+    months = []
+    month = month_start(budget.start_date)
+    while month <= budget.end_date:
+        months.append(month)
+        month = month_end(month) + timedelta(days=1)
+    return months
+
+
+def natural_amount(prefix=''):
+    """Transaction amount signed in its account's normal direction, as an expression"""
+    debit_normal = Q(**{f'{prefix}account__account_type__in': DEBIT_NORMAL_TYPES})
+    is_debit = Q(**{f'{prefix}transaction_type': 'debit'})
+    return Case(
+        When(debit_normal & is_debit, then=F(f'{prefix}amount')),
+        When(~debit_normal & ~is_debit, then=F(f'{prefix}amount')),
+        default=-F(f'{prefix}amount'),
+        output_field=DecimalField(max_digits=15, decimal_places=2),
+    )
+
+
+def _date_range(budget, lines):
+    """Dates the lines of a budget can draw actuals from"""
+    periods = [line.period for line in lines if line.period]
+    start = min([month_start(budget.start_date)] + [month_start(period) for period in periods])
+    end = max([month_end(budget.end_date)] + [month_end(period) for period in periods])
+    return start, end
+
+
+def monthly_actuals(account_ids, start_date, end_date):
+    """
+    ``{(account_id, month): amount}`` for each account including its
+    sub-accounts, from one query grouped by account and month.
+    """
+    rows = AccountClosure.objects.filter(
+        ancestor_id__in=account_ids,
+        descendant__transactions__date__range=(start_date, end_date),
+        descendant__transactions__is_closing=False,
+    ).values('ancestor_id', month=TruncMonth('descendant__transactions__date')).annotate(
+        amount=Sum(natural_amount('descendant__transactions__'))
+    ).order_by()
+    return {(row['ancestor_id'], row['month']): row['amount'] for row in rows}
+
+
+def line_actual(line, budget, monthly):
+    """Actual amount of a budget line from monthly_actuals"""
+    if line.period:
+        return monthly.get((line.account_id, month_start(line.period)), ZERO)
+    return sum(
+        (monthly.get((line.account_id, month), ZERO) for month in budget_months(budget)),
+        ZERO,
+    )
+
+
+def _refresh_lines(budget, lines):
+    monthly = monthly_actuals({line.account_id for line in lines}, *_date_range(budget, lines))
+    changed = []
+    for line in lines:
+        actual = line_actual(line, budget, monthly)
+        if actual != line.actual_amount:
+            line.actual_amount = actual
+            changed.append(line)
+    BudgetLine.objects.bulk_update(changed, ['actual_amount'], batch_size=1000)
+    return len(changed)
+
+
+def refresh_budget_actuals(budgets=None):
+    """
+    Recompute the actuals of the given budgets (all budgets by default).
+
+    Returns the number of lines whose actual changed.
+    """
+    if budgets is None:
+        budgets = Budget.objects.all()
+    updated = 0
+    for budget in budgets:
+        lines = list(budget.lines.only('pk', 'budget_id', 'account_id', 'period', 'actual_amount'))
+        if lines:
+            updated += _refresh_lines(budget, lines)
+    return updated
+
+
+def refresh_line_actual(line):
+    """Recompute one budget line's actual, e.g. after it was added or its account or month changed"""
+    return _refresh_lines(line.budget, [line])
+
+
+def apply_to_budgets(transactions, sign=1):
+    """
+    Add newly posted transactions to the actuals of the budget lines they
+    fall in. Pass ``sign=-1`` to take removed transactions back out.
+    """
+    entries = [entry for entry in transactions if not entry.is_closing]
+    if not entries:
+        return
+
+    types = dict(Account.objects.filter(
+        pk__in={entry.account_id for entry in entries}
+    ).values_list('pk', 'account_type'))
+    amounts = defaultdict(Decimal)     # (account_id, date) -> amount
+    for entry in entries:
+        amounts[(entry.account_id, entry.date)] += sign * balance_change(
+            types[entry.account_id], entry.transaction_type, entry.amount
+        )
+
+    ancestors = defaultdict(list)
+    for descendant_id, ancestor_id in AccountClosure.objects.filter(
+        descendant_id__in=types
+    ).values_list('descendant_id', 'ancestor_id'):
+        ancestors[descendant_id].append(ancestor_id)
+    by_account = defaultdict(list)     # budgeted account -> [(date, amount)]
+    for (account_id, day), amount in amounts.items():
+        for ancestor_id in ancestors.get(account_id, [account_id]):
+            by_account[ancestor_id].append((day, amount))
+
+    first = min(day for _account, day in amounts)
+    last = max(day for _account, day in amounts)
+    lines = BudgetLine.objects.filter(account_id__in=by_account).filter(
+        Q(period__isnull=True, budget__start_date__lte=month_end(last), budget__end_date__gte=month_start(first))
+        | Q(period__gte=month_start(first), period__lte=month_end(last))
+    ).values('pk', 'account_id', 'period', 'budget__start_date', 'budget__end_date')
+
+    deltas = {}
+    for line in lines:
+        if line['period']:
+            month = month_start(line['period'])
+            delta = sum((amount for day, amount in by_account[line['account_id']] if month_start(day) == month), ZERO)
+        else:
+            start, end = month_start(line['budget__start_date']), month_end(line['budget__end_date'])
+            delta = sum((amount for day, amount in by_account[line['account_id']] if start <= day <= end), ZERO)
+        if delta:
+            deltas[line['pk']] = delta
+
+    if deltas:
+        BudgetLine.objects.filter(pk__in=deltas).update(actual_amount=Case(
+            *[When(pk=pk, then=F('actual_amount') + Value(delta)) for pk, delta in deltas.items()],
+            default=F('actual_amount'),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ))
+
+
+def budget_breakdown(budget):
+    """
+    Budgeted and actual amounts per account and month for a budget.
+
+    Returns ``(months, rows)``; each row holds the account, a list of
+    ``{'month', 'budgeted', 'actual'}`` cells in month order and the
+    account's totals. Lines without a period are budgeted for the whole
+    budget and only count towards the totals.
+    """
+    lines = list(budget.lines.select_related('account').order_by('account__code'))
+    months = budget_months(budget)
+    monthly = monthly_actuals(
+        {line.account_id for line in lines}, month_start(budget.start_date), month_end(budget.end_date)
+    )
+
+    budgeted = defaultdict(Decimal)
+    totals = defaultdict(Decimal)
+    accounts = {}
+    for line in lines:
+        accounts[line.account_id] = line.account
+        totals[line.account_id] += line.budgeted_amount
+        if line.period:
+            budgeted[(line.account_id, month_start(line.period))] += line.budgeted_amount
+
+    rows = []
+    for account_id, account in accounts.items():
+        cells = [
+            {
+                'month': month,
+                'budgeted': budgeted.get((account_id, month), ZERO),
+                'actual': monthly.get((account_id, month), ZERO),
+            }
+            for month in months
+        ]
+        actual = sum((cell['actual'] for cell in cells), ZERO)
+        rows.append({
+            'account': account,
+            'months': cells,
+            'budgeted': totals[account_id],
+            'actual': actual,
+            'variance': actual - totals[account_id],
+        })
+    return months, rows
@@ -0,0 +1,146 @@
+"""
+Cash flow statement.
+
+Accounts are tagged with the cash flow section their movements belong to
+(operating, investing, financing) and whether they hold cash. The statement
+is built two ways from the same ledger:
+
+* direct: cash received and paid per counterpart account. A non-cash line
+  counts when its document also touches a cash account; documents are
+  journal entries, or else lines sharing a date and reference number.
+  Credits to the counterpart are receipts, debits are payments.
+* indirect: net income plus the change of every other non-cash account,
+  each placed in its account's section.
+
+Both are grouped aggregates. Closed periods inside the range are read from
+their AccountPeriodBalance rows (see periods), so only the days not covered
+by a closed period are scanned.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Exists, OuterRef, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Account, AccountPeriodBalance, Transaction
+from .periods import balances_as_of, period_activity, split_range
+
+
+SECTIONS = [category for category, _label in Account.CASH_FLOW_CATEGORIES]
+
+ZERO = Decimal('0.00')
+
+
+def cash_counterpart_lines(transactions):
+    """Non-cash lines of the given transactions whose document touches a cash account"""
+    cash_lines = Transaction.objects.filter(account__is_cash=True)
+    same_entry = cash_lines.filter(journal_entry_id=OuterRef('journal_entry_id'))
+    same_reference = cash_lines.filter(
+        journal_entry__isnull=True,
+        date=OuterRef('date'),
+        reference_number=OuterRef('reference_number'),
+    )
+    return transactions.filter(account__is_cash=False).alias(
+        _in_cash_entry=Exists(same_entry),
+        _in_cash_reference=Exists(same_reference),
+    ).filter(
+        Q(journal_entry__isnull=False, _in_cash_entry=True)
+        | (Q(journal_entry__isnull=True, _in_cash_reference=True) & ~Q(reference_number=''))
+    )
+
+
+def counterpart_flows(transactions):
+    """``{account_id: (cash_in, cash_out)}`` received and paid against each non-cash account"""
+    rows = cash_counterpart_lines(transactions).values('account_id').annotate(
+        cash_in=Coalesce(Sum('amount', filter=Q(transaction_type='credit')), Value(ZERO)),
+        cash_out=Coalesce(Sum('amount', filter=Q(transaction_type='debit')), Value(ZERO)),
+    ).order_by()
+    return {row['account_id']: (row['cash_in'], row['cash_out']) for row in rows}
+
+
+def cash_flow_activity(start_date=None, end_date=None):
+    """Counterpart cash flows between two dates, from snapshots plus uncovered days"""
+    periods, gap_condition = split_range(start_date, end_date)
+    flows = defaultdict(lambda: [ZERO, ZERO])
+
+    for row in AccountPeriodBalance.objects.filter(period__in=periods).values('account_id').annotate(
+        cash_in=Sum('cash_inflow'), cash_out=Sum('cash_outflow')
+    ).order_by():
+        flows[row['account_id']][0] += row['cash_in']
+        flows[row['account_id']][1] += row['cash_out']
+
+    if gap_condition is not None:
+        transactions = Transaction.objects.filter(gap_condition, is_closing=False)
+        for account_id, (cash_in, cash_out) in counterpart_flows(transactions).items():
+            flows[account_id][0] += cash_in
+            flows[account_id][1] += cash_out
+
+    return {account_id: tuple(totals) for account_id, totals in flows.items()}
+
+
+def _section():
+    return {'direct': [], 'indirect': [], 'inflow': ZERO, 'outflow': ZERO, 'net': ZERO, 'indirect_net': ZERO}
+
+
+def cash_flow_statement(start_date=None, end_date=None):
+    """
+    Direct and indirect cash flow for a date range.
+
+    Returns a dict with one entry per section (lines, inflow, outflow and
+    net for the direct method; lines and net for the indirect method),
+    the cash accounts reported, net income, the cash balance at both ends
+    of the range and its change. With no account marked as cash the direct
+    method and the cash balances come out empty.
+    """
+    accounts = {account.pk: account for account in Account.objects.all()}
+    sections = {section: _section() for section in SECTIONS}
+
+    for account_id, (cash_in, cash_out) in sorted(
+        cash_flow_activity(start_date, end_date).items(), key=lambda item: accounts[item[0]].code
+    ):
+        if not cash_in and not cash_out:
+            continue
+        account = accounts[account_id]
+        section = sections[account.cash_flow_category]
+        section['direct'].append({
+            'account': account, 'inflow': cash_in, 'outflow': cash_out, 'net': cash_in - cash_out,
+        })
+        section['inflow'] += cash_in
+        section['outflow'] += cash_out
+        section['net'] += cash_in - cash_out
+
+    # Indirect: every non-cash account's movement is cash in the other direction
+    net_income = ZERO
+    for account_id, (debit, credit) in sorted(
+        period_activity(start_date, end_date).items(), key=lambda item: accounts[item[0]].code
+    ):
+        account = accounts[account_id]
+        if account.is_cash or debit == credit:
+            continue
+        effect = credit - debit
+        section = sections[account.cash_flow_category]
+        section['indirect_net'] += effect
+        if account.account_type in ['revenue', 'expense'] and account.cash_flow_category == 'operating':
+            net_income += effect
+        else:
+            section['indirect'].append({'account': account, 'amount': effect})
+
+    opening_cash = closing_cash = ZERO
+    cash_ids = [pk for pk, account in accounts.items() if account.is_cash]
+    if cash_ids:
+        closing = balances_as_of(end_date or timezone.now().date())
+        closing_cash = sum((closing.get(pk, ZERO) for pk in cash_ids), ZERO)
+        if start_date:
+            opening = balances_as_of(start_date - timedelta(days=1))
+            opening_cash = sum((opening.get(pk, ZERO) for pk in cash_ids), ZERO)
+
+    return {
+        'sections': sections,
+        'cash_accounts': [accounts[pk] for pk in cash_ids],
+        'net_income': net_income,
+        'opening_cash': opening_cash,
+        'closing_cash': closing_cash,
+        'net_change': closing_cash - opening_cash,
+    }
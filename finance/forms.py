@@ -1,19 +1,34 @@
 from django import forms
 from django.forms import inlineformset_factory
+from .hierarchy import would_create_cycle
 from .models import Account, Transaction, JournalEntry, JournalEntryLine, Budget, BudgetLine, TaxRate, FinancialPeriod
 
 
+def validate_open_period(value):
+    """Reject dates that fall inside a closed financial period"""
+    closed = FinancialPeriod.closed_periods_for([value])
+    if closed:
+        raise forms.ValidationError(f"Financial period {closed[0]} is closed.")
+    return value
+
+
 class AccountForm(forms.ModelForm):
     class Meta:
         model = Account
         fields = [
             'code', 'name', 'account_type', 'description', 'is_active',
-            'parent_account'
+            'parent_account', 'cash_flow_category', 'is_cash'
         ]
         widgets = {
             'description': forms.Textarea(attrs={'rows': 3}),
         }
 
+    def clean_parent_account(self):
+        parent = self.cleaned_data.get('parent_account')
+        if would_create_cycle(self.instance, parent):
+            raise forms.ValidationError("An account cannot be placed under itself or one of its sub-accounts.")
+        return parent
+
 
 class TransactionForm(forms.ModelForm):
     class Meta:
@@ -28,6 +43,9 @@ class TransactionForm(forms.ModelForm):
             'amount': forms.NumberInput(attrs={'step': '0.01'}),
         }
 
+    def clean_date(self):
+        return validate_open_period(self.cleaned_data['date'])
+
 
 class JournalEntryForm(forms.ModelForm):
     class Meta:
@@ -40,6 +58,9 @@ class JournalEntryForm(forms.ModelForm):
             'description': forms.Textarea(attrs={'rows': 3}),
         }
 
+    def clean_date(self):
+        return validate_open_period(self.cleaned_data['date'])
+
 
 class JournalEntryLineForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,173 @@
+"""
+Chart of accounts hierarchy.
+
+AccountClosure holds one row for every (ancestor, descendant) pair in the
+account tree, including each account paired with itself at depth 0. With it
+a subtree at any depth is a single join: summing descendant balances grouped
+by ancestor rolls up the whole chart in one query.
+
+The table is maintained by signal handlers when an account is created,
+moved to another parent or deleted; ``rebuild_closure`` recreates it from
+``parent_account`` for repairs and the initial migration.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import Account, AccountClosure
+
+
+ZERO = Decimal('0.00')
+
+
+def ancestor_ids(account_id):
+    """Ids of the account's ancestors, the account itself first"""
+    return list(
+        AccountClosure.objects.filter(descendant_id=account_id).order_by('depth').values_list('ancestor_id', flat=True)
+    )
+
+
+def descendant_ids(account_id):
+    """Ids of the account's subtree, the account itself included"""
+    return list(AccountClosure.objects.filter(ancestor_id=account_id).values_list('descendant_id', flat=True))
+
+
+def would_create_cycle(account, parent):
+    """True if making ``parent`` the parent of ``account`` would loop the tree"""
+    if parent is None or account.pk is None:
+        return False
+    return parent.pk == account.pk or AccountClosure.objects.filter(
+        ancestor_id=account.pk, descendant_id=parent.pk
+    ).exists()
+
+
+def add_account(account):
+    """Insert the closure rows of a new account"""
+    links = [AccountClosure(ancestor_id=account.pk, descendant_id=account.pk, depth=0)]
+    if account.parent_account_id:
+        links += [
+            AccountClosure(ancestor_id=ancestor_id, descendant_id=account.pk, depth=depth + 1)
+            for ancestor_id, depth in AccountClosure.objects.filter(
+                descendant_id=account.parent_account_id
+            ).values_list('ancestor_id', 'depth')
+        ]
+    AccountClosure.objects.bulk_create(links, ignore_conflicts=True)
+
+
+def detach_subtree(account_id):
+    """Remove the links between the account's subtree and the account's ancestors"""
+    subtree = descendant_ids(account_id)
+    above = [pk for pk in ancestor_ids(account_id) if pk != account_id]
+    AccountClosure.objects.filter(descendant_id__in=subtree, ancestor_id__in=above).delete()
+
+
+def move_account(account):
+    """Re-link an account and its subtree under its current parent"""
+    with transaction.atomic():
+        detach_subtree(account.pk)
+        if not account.parent_account_id:
+            return
+        subtree = AccountClosure.objects.filter(ancestor_id=account.pk).values_list('descendant_id', 'depth')
+        above = AccountClosure.objects.filter(
+            descendant_id=account.parent_account_id
+        ).values_list('ancestor_id', 'depth')
+        AccountClosure.objects.bulk_create([
+            AccountClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=up + down + 1)
+            for ancestor_id, up in above
+            for descendant_id, down in subtree
+        ], batch_size=1000)
+
+
+def remove_account(account_id):
+    """Detach the children of an account that is about to be deleted"""
+    subtree = [pk for pk in descendant_ids(account_id) if pk != account_id]
+    AccountClosure.objects.filter(descendant_id__in=subtree, ancestor_id__in=ancestor_ids(account_id)).delete()
+
+
+def rebuild_closure():
+    """Recreate the whole closure table from parent_account"""
+    parents = dict(Account.objects.values_list('pk', 'parent_account_id'))
+    links = []
+    for account_id in parents:
+        seen = set()
+        ancestor, depth = account_id, 0
+        while ancestor is not None and ancestor not in seen:
+            seen.add(ancestor)
+            links.append(AccountClosure(ancestor_id=ancestor, descendant_id=account_id, depth=depth))
+            ancestor, depth = parents.get(ancestor), depth + 1
+    with transaction.atomic():
+        AccountClosure.objects.all().delete()
+        AccountClosure.objects.bulk_create(links, batch_size=1000)
+    return len(links)
+
+
+def subtree_balances(accounts=None):
+    """``{account_id: balance of the account and all its descendants}`` in one query"""
+    links = AccountClosure.objects.all()
+    if accounts is not None:
+        links = links.filter(ancestor__in=accounts)
+    return {
+        row['ancestor_id']: row['total'] or ZERO
+        for row in links.values('ancestor_id').annotate(total=Sum('descendant__balance')).order_by()
+    }
+
+
+def rollup(amounts, account_ids=None):
+    """
+    Roll ``{account_id: amount}`` up the tree: every ancestor carries the
+    total of its subtree. ``account_ids`` limits the ancestors returned.
+    """
+    links = AccountClosure.objects.filter(descendant_id__in=amounts)
+    if account_ids is not None:
+        links = links.filter(ancestor_id__in=account_ids)
+
+    totals = defaultdict(Decimal)
+    for ancestor_id, descendant_id in links.values_list('ancestor_id', 'descendant_id'):
+        totals[ancestor_id] += amounts[descendant_id]
+    return dict(totals)
+
+
+def tree_rows(accounts, amounts):
+    """
+    Accounts in tree order with their own amount and subtree subtotal.
+
+    Each row is a dict with ``account``, ``depth`` (within the given
+    accounts), ``own``, ``amount`` (the subtotal) and ``has_children``.
+    Accounts with no amount of their own and no rows below them are left
+    out.
+    """
+    accounts = sorted(accounts, key=lambda account: account.code)
+    by_id = {account.pk: account for account in accounts}
+    children = defaultdict(list)
+    roots = []
+    for account in accounts:
+        if account.parent_account_id in by_id:
+            children[account.parent_account_id].append(account)
+        else:
+            roots.append(account)
+
+    totals = rollup({pk: amount for pk, amount in amounts.items() if pk in by_id}, list(by_id))
+
+    rows = []
+
+    def visit(account, depth):
+        index = len(rows)
+        own = amounts.get(account.pk, ZERO)
+        rows.append({
+            'account': account,
+            'depth': depth,
+            'own': own,
+            'amount': totals.get(account.pk, ZERO),
+            'has_children': False,
+        })
+        for child in children[account.pk]:
+            visit(child, depth + 1)
+        rows[index]['has_children'] = len(rows) > index + 1
+        if not own and not rows[index]['has_children']:
+            rows.pop()
+
+    for root in roots:
+        visit(root, 0)
+    return rows
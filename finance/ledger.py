@@ -0,0 +1,116 @@
+"""
+Bulk ledger posting.
+
+Account balances only ever move by deltas, with a single
+``UPDATE ... SET balance = balance + delta`` per account
+(``apply_balance_changes``), so concurrent postings never overwrite each
+other. ``Transaction.save`` does this for one transaction;
+``post_transactions`` inserts many transactions with one bulk_create and
+moves each touched account once. Budget actuals move the same way (see
+budgets.apply_to_budgets).
+
+Accounts that other modules post to automatically are looked up by role
+through the LEDGER_ACCOUNTS setting (role -> account code).
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Account, ClosedPeriodError, FinancialPeriod, Transaction
+
+
+# Account code used for each posting role unless LEDGER_ACCOUNTS overrides it
+DEFAULT_LEDGER_ACCOUNTS = {
+    'cash': '1000',
+    'bank': '1010',
+    'accounts_receivable': '1200',
+    'inventory': '1300',
+    'work_in_progress': '1400',
+    'accounts_payable': '2000',
+    'tax_payable': '2200',
+    'retained_earnings': '3100',
+    'sales_revenue': '4000',
+}
+
+# Posting roles whose accounts hold cash (Account.is_cash)
+CASH_ROLES = ['cash', 'bank']
+
+# Account types whose balance grows with debits
+DEBIT_NORMAL_TYPES = ['asset', 'expense']
+
+POSTING_BATCH_SIZE = 1000
+
+
+def ledger_account_code(role):
+    """Account code configured for a posting role"""
+    codes = dict(DEFAULT_LEDGER_ACCOUNTS)
+    codes.update(getattr(settings, 'LEDGER_ACCOUNTS', {}))
+    return codes.get(role)
+
+
+def ledger_accounts(*roles):
+    """Map each role to its active Account, or None if it does not exist"""
+    codes = {role: ledger_account_code(role) for role in roles}
+    accounts = {
+        account.code: account
+        for account in Account.objects.filter(code__in=codes.values(), is_active=True)
+    }
+    return {role: accounts.get(code) for role, code in codes.items()}
+
+
+def balance_change(account_type, transaction_type, amount):
+    """Signed change to an account balance: debits raise debit-normal accounts, credits the others"""
+    if (transaction_type == 'debit') == (account_type in DEBIT_NORMAL_TYPES):
+        return amount
+    return -amount
+
+
+def apply_balance_changes(changes):
+    """Apply ``{account_id: delta}`` with one UPDATE per account"""
+    now = timezone.now()
+    for account_id, delta in changes.items():
+        if delta:
+            Account.objects.filter(pk=account_id).update(
+                balance=F('balance') + delta, last_updated=now
+            )
+
+
+def post_transactions(transactions, batch_size=POSTING_BATCH_SIZE):
+    """
+    Insert unsaved Transaction instances and update account balances.
+
+    Returns the created transactions. Runs in one database transaction so
+    the rows and the balances always agree. Raises ClosedPeriodError if any
+    transaction is dated inside a closed period.
+    """
+    transactions = list(transactions)
+    if not transactions:
+        return []
+
+    closed = FinancialPeriod.closed_periods_for(entry.date for entry in transactions)
+    if closed:
+        raise ClosedPeriodError(closed[0])
+
+    with transaction.atomic():
+        created = Transaction.objects.bulk_create(transactions, batch_size=batch_size)
+
+        account_types = dict(
+            Account.objects.filter(
+                pk__in={entry.account_id for entry in created}
+            ).values_list('pk', 'account_type')
+        )
+        changes = defaultdict(Decimal)
+        for entry in created:
+            changes[entry.account_id] += balance_change(
+                account_types[entry.account_id], entry.transaction_type, entry.amount
+            )
+        apply_balance_changes(changes)
+
+        from .budgets import apply_to_budgets
+        apply_to_budgets(created)
+
+    return created
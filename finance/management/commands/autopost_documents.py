@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.autopost import DOCUMENT_BATCH_SIZE, RULES, AutoPostResult, current_entries, post_documents
+
+
+class Command(BaseCommand):
+    help = 'Post invoices, payments, goods receipts and material consumptions that have no journal entry yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', action='append', choices=sorted(RULES),
+                            help='Only post documents of this kind (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=DOCUMENT_BATCH_SIZE,
+                            help='Documents posted per transaction')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        result = AutoPostResult()
+        started = time.monotonic()
+        for source in options['source'] or RULES:
+            rule = RULES[source]
+            posted = current_entries(source).values('source_id')
+            ids = list(rule.documents().exclude(pk__in=posted).order_by('pk').values_list('pk', flat=True))
+            before = len(result.posted)
+            post_documents(source, ids, batch_size=options['batch_size'], result=result)
+            self.stdout.write(f'{source}: {len(result.posted) - before} of {len(ids)} posted')
+
+        for reference, reason in result.skipped[:10]:
+            self.stdout.write(self.style.WARNING(f'Skipped {reference}: {reason}'))
+        if len(result.skipped) > 10:
+            self.stdout.write(self.style.WARNING(f'... and {len(result.skipped) - 10} more skipped'))
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Posted {len(result.posted)} document(s) with {len(result.transactions)} ledger transaction(s) '
+            f'in {elapsed:.1f}s'
+        ))
@@ -0,0 +1,108 @@
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from finance.cashflow import cash_flow_statement
+from finance.ledger import ledger_account_code
+from finance.models import Account, FinancialPeriod, Transaction
+from finance.periods import PeriodCloseError, close_period
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the cash flow statement over a generated ledger, with no closed periods and with all '
+        'but the last month closed. Everything is written in one transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pairs', type=int, default=1_000_000,
+                            help='Cash receipts and payments to generate, two transactions each')
+        parser.add_argument('--months', type=int, default=24, help='Months the ledger spans')
+        parser.add_argument('--start', type=date.fromisoformat, default=date(2000, 1, 1),
+                            help='First day of the generated ledger (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        start, months = options['start'].replace(day=1), options['months']
+        month_starts = [start]
+        for _ in range(months):
+            month_starts.append((month_starts[-1] + timedelta(days=32)).replace(day=1))
+        end = month_starts[-1] - timedelta(days=1)
+
+        with transaction.atomic():
+            try:
+                self.run(options['pairs'], month_starts, start, end)
+            except PeriodCloseError as e:
+                raise CommandError(str(e))
+            finally:
+                transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS('Benchmark data rolled back'))
+
+    def timed(self, label, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        self.stdout.write(f'{label}: {time.perf_counter() - started:.2f}s')
+        return result
+
+    def run(self, pairs, month_starts, start, end):
+        user = User.objects.create(username='cash-flow-benchmark')
+
+        def account(code, account_type, category='operating'):
+            return Account.objects.create(
+                code=code, name=f'Benchmark {code}', account_type=account_type, cash_flow_category=category,
+            )
+
+        cash = account('BM-1000', 'asset')
+        cash.is_cash = True
+        cash.save(update_fields=['is_cash'])
+        counterparts = [
+            account('BM-1200', 'asset'),
+            account('BM-1500', 'asset', 'investing'),
+            account('BM-2500', 'liability', 'financing'),
+            account('BM-4000', 'revenue'),
+            account('BM-5000', 'expense'),
+        ]
+        if not Account.objects.filter(code=ledger_account_code('retained_earnings')).exists():
+            account(ledger_account_code('retained_earnings'), 'equity', 'financing')
+
+        def generate():
+            days = (end - start).days + 1
+            rows = []
+            for i in range(pairs):
+                day = start + timedelta(days=i % days)
+                other = counterparts[i % len(counterparts)]
+                amount = Decimal(i % 500 + 1)
+                reference = f'BM{i}'
+                # Two of three are receipts, the rest payments
+                cash_side, other_side = ('debit', 'credit') if i % 3 else ('credit', 'debit')
+                rows.append(Transaction(date=day, description='Benchmark', account=cash, transaction_type=cash_side,
+                                        amount=amount, reference_number=reference))
+                rows.append(Transaction(date=day, description='Benchmark', account=other, transaction_type=other_side,
+                                        amount=amount, reference_number=reference))
+                if len(rows) >= 100_000:
+                    Transaction.objects.bulk_create(rows, batch_size=5000)
+                    rows = []
+            Transaction.objects.bulk_create(rows, batch_size=5000)
+
+        self.timed(f'Generated {pairs * 2} transactions', generate)
+        unclosed = self.timed('Statement, no closed periods', cash_flow_statement, start, end)
+
+        def close_months():
+            for first, following in zip(month_starts[:-2], month_starts[1:-1]):
+                period = FinancialPeriod.objects.create(
+                    name=f'Benchmark {first:%Y-%m}', start_date=first, end_date=following - timedelta(days=1),
+                )
+                close_period(period, user)
+
+        self.timed(f'Closed {len(month_starts) - 2} months', close_months)
+        closed = self.timed('Statement, closed periods from snapshots', cash_flow_statement, start, end)
+
+        def figures(statement):
+            return [statement['sections'][section]['net'] for section in statement['sections']] + [statement['net_change']]
+
+        if figures(unclosed) != figures(closed):
+            raise CommandError(f'Statements differ: {figures(unclosed)} != {figures(closed)}')
+        self.stdout.write('Both statements agree')
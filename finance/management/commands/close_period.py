@@ -0,0 +1,39 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.models import FinancialPeriod
+from finance.periods import PeriodCloseError, close_period, reopen_period
+
+
+class Command(BaseCommand):
+    help = 'Close a financial period, storing account balances and rolling income into retained earnings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('period', help='Name of the financial period')
+        parser.add_argument('--user', help='Username recorded as closing the period')
+        parser.add_argument('--reopen', action='store_true', help='Reopen the period instead of closing it')
+
+    def handle(self, *args, **options):
+        period = FinancialPeriod.objects.filter(name=options['period']).order_by('start_date').first()
+        if period is None:
+            raise CommandError(f"Unknown financial period: {options['period']}")
+
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"Unknown user: {options['user']}")
+
+        try:
+            if options['reopen']:
+                reopen_period(period)
+                self.stdout.write(self.style.SUCCESS(f'Reopened {period}'))
+                return
+            net_income = close_period(period, user=user)
+        except PeriodCloseError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Closed {period}; net income of {net_income} moved to retained earnings')
+        )
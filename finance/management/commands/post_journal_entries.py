@@ -0,0 +1,42 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from finance.models import JournalEntry
+from finance.posting import post_entries
+
+
+class Command(BaseCommand):
+    help = 'Post every unposted journal entry dated on or before a date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--through', help='Last entry date to post (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--user', help='Username recorded as creator of the transactions')
+
+    def handle(self, *args, **options):
+        through = timezone.now().date()
+        if options['through']:
+            try:
+                through = date.fromisoformat(options['through'])
+            except ValueError:
+                raise CommandError(f"Invalid date: {options['through']}")
+
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"Unknown user: {options['user']}")
+
+        entries = JournalEntry.objects.filter(is_posted=False, date__lte=through)
+        result = post_entries(entries, user=user)
+
+        for reference_number, reason in result.skipped:
+            self.stdout.write(self.style.WARNING(f'{reference_number}: {reason}'))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Posted {len(result.posted)} journal entries ({result.transactions} transactions) through {through}'
+            )
+        )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from finance.hierarchy import rebuild_closure
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the chart of accounts closure table from each account\'s parent'
+
+    def handle(self, *args, **options):
+        links = rebuild_closure()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt account hierarchy with {links} ancestor links'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from finance.budgets import refresh_budget_actuals
+from finance.models import Budget
+
+
+class Command(BaseCommand):
+    help = 'Recompute budget line actuals from the ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget', type=int, action='append', help='Only refresh the budget with this id')
+
+    def handle(self, *args, **options):
+        budgets = Budget.objects.all()
+        if options['budget']:
+            budgets = budgets.filter(pk__in=options['budget'])
+        updated = refresh_budget_actuals(budgets)
+        self.stdout.write(self.style.SUCCESS(f'Updated the actuals of {updated} budget line(s)'))
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0002_transaction_journal_entry'),
+        ('purchase', '0001_initial'),
+        ('sales', '0004_sales_daily_fact'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountPeriodBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('opening_balance', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('period_debit', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('period_credit', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('closing_balance', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+            ],
+            options={
+                'verbose_name': 'Account Period Balance',
+                'verbose_name_plural': 'Account Period Balances',
+                'ordering': ['period__start_date', 'account__code'],
+            },
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='is_closing',
+            field=models.BooleanField(default=False, help_text='Closing entry generated when a period is closed'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['date', 'account'], name='finance_tra_date_edf0f3_idx'),
+        ),
+        migrations.AddField(
+            model_name='accountperiodbalance',
+            name='account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='period_balances', to='finance.account'),
+        ),
+        migrations.AddField(
+            model_name='accountperiodbalance',
+            name='period',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='account_balances', to='finance.financialperiod'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='accountperiodbalance',
+            unique_together={('period', 'account')},
+        ),
+    ]
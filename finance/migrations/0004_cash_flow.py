@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def classify_accounts(apps, schema_editor):
+    Account = apps.get_model('finance', 'Account')
+    Account.objects.filter(account_type='equity').update(cash_flow_category='financing')
+
+    codes = {'cash': '1000', 'bank': '1010'}
+    codes.update(getattr(settings, 'LEDGER_ACCOUNTS', {}))
+    Account.objects.filter(code__in=[codes['cash'], codes['bank']]).update(is_cash=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0003_period_close'),
+        ('purchase', '0001_initial'),
+        ('sales', '0004_sales_daily_fact'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='cash_flow_category',
+            field=models.CharField(choices=[('operating', 'Operating'), ('investing', 'Investing'), ('financing', 'Financing')], default='operating', help_text='Cash flow statement section for movements on this account', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='is_cash',
+            field=models.BooleanField(default=False, help_text='Cash or bank account reported by the cash flow statement'),
+        ),
+        migrations.AddField(
+            model_name='accountperiodbalance',
+            name='cash_inflow',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15),
+        ),
+        migrations.AddField(
+            model_name='accountperiodbalance',
+            name='cash_outflow',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['reference_number', 'date'], name='finance_tra_referen_faea74_idx'),
+        ),
+        migrations.RunPython(classify_accounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_closure(apps, schema_editor):
+    Account = apps.get_model('finance', 'Account')
+    AccountClosure = apps.get_model('finance', 'AccountClosure')
+    parents = dict(Account.objects.values_list('pk', 'parent_account_id'))
+    links = []
+    for account_id in parents:
+        seen = set()
+        ancestor, depth = account_id, 0
+        while ancestor is not None and ancestor not in seen:
+            seen.add(ancestor)
+            links.append(AccountClosure(ancestor_id=ancestor, descendant_id=account_id, depth=depth))
+            ancestor, depth = parents.get(ancestor), depth + 1
+    AccountClosure.objects.bulk_create(links, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0004_cash_flow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField(help_text='Levels between ancestor and descendant (0 for the account itself)')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='finance.account')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='finance.account')),
+            ],
+            options={
+                'verbose_name': 'Account Closure',
+                'verbose_name_plural': 'Account Closures',
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='finance_acc_descend_20d60e_idx')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(populate_closure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0005_account_closure'),
+        ('purchase', '0002_purchase_order_tax'),
+        ('sales', '0004_sales_daily_fact'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='journalentry',
+            name='source',
+            field=models.CharField(blank=True, help_text='Posting rule that created this entry', max_length=30),
+        ),
+        migrations.AddField(
+            model_name='journalentry',
+            name='source_id',
+            field=models.PositiveBigIntegerField(blank=True, help_text='Primary key of the source document', null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='journalentry',
+            constraint=models.UniqueConstraint(condition=models.Q(('source_id__isnull', False)), fields=('source', 'source_id'), name='unique_journal_entry_source'),
+        ),
+    ]
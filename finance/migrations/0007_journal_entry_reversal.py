@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-19 03:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0006_journal_entry_source'),
+        ('purchase', '0004_goods_receipt_warehouse'),
+        ('sales', '0004_sales_daily_fact'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='journalentry',
+            name='unique_journal_entry_source',
+        ),
+        migrations.AddField(
+            model_name='journalentry',
+            name='is_reversed',
+            field=models.BooleanField(default=False, help_text='Reversed after its source document changed'),
+        ),
+        migrations.AddField(
+            model_name='journalentry',
+            name='reversal_of',
+            field=models.ForeignKey(blank=True, help_text='Entry this entry reverses', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reversals', to='finance.journalentry'),
+        ),
+        migrations.AddConstraint(
+            model_name='journalentry',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_reversed', False), ('reversal_of__isnull', True), ('source_id__isnull', False)), fields=('source', 'source_id'), name='unique_journal_entry_source'),
+        ),
+    ]
@@ -1,9 +1,20 @@
-from django.db import models
+from datetime import datetime
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from decimal import Decimal
 
 
+class ClosedPeriodError(Exception):
+    """Raised when writing ledger transactions dated inside a closed period"""
+
+    def __init__(self, period):
+        self.period = period
+        super().__init__(f"Financial period {period} is closed")
+
+
 class Account(models.Model):
     """Chart of accounts for financial tracking"""
     ACCOUNT_TYPES = [
@@ -14,6 +25,12 @@ class Account(models.Model):
         ('expense', 'Expense'),
     ]
 
+    CASH_FLOW_CATEGORIES = [
+        ('operating', 'Operating'),
+        ('investing', 'Investing'),
+        ('financing', 'Financing'),
+    ]
+
     code = models.CharField(max_length=20, unique=True, help_text="Account code (e.g., 1000, 2000)")
     name = models.CharField(max_length=200, help_text="Account name")
     account_type = models.CharField(max_length=20, choices=ACCOUNT_TYPES)
@@ -21,6 +38,13 @@ class Account(models.Model):
     is_active = models.BooleanField(default=True)
     parent_account = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='sub_accounts')
 
+    # Cash flow statement
+    cash_flow_category = models.CharField(
+        max_length=20, choices=CASH_FLOW_CATEGORIES, default='operating',
+        help_text="Cash flow statement section for movements on this account"
+    )
+    is_cash = models.BooleanField(default=False, help_text="Cash or bank account reported by the cash flow statement")
+
     # Balance tracking
     balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     last_updated = models.DateTimeField(auto_now=True)
@@ -39,9 +63,28 @@ class Account(models.Model):
     @property
     def full_name(self):
         """Return full hierarchical account name"""
-        if self.parent_account:
-            return f"{self.parent_account.name} > {self.name}"
-        return self.name
+        names = AccountClosure.objects.filter(descendant=self).order_by('-depth').values_list(
+            'ancestor__name', flat=True
+        )
+        return ' > '.join(names) or self.name
+
+
+class AccountClosure(models.Model):
+    """Ancestor/descendant pairs of the chart of accounts, including each account with itself"""
+    ancestor = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField(help_text="Levels between ancestor and descendant (0 for the account itself)")
+
+    class Meta:
+        unique_together = ['ancestor', 'descendant']
+        indexes = [
+            models.Index(fields=['descendant', 'depth']),
+        ]
+        verbose_name = 'Account Closure'
+        verbose_name_plural = 'Account Closures'
+
+    def __str__(self):
+        return f"{self.ancestor.code} > {self.descendant.code} ({self.depth})"
 
 
 class Transaction(models.Model):
@@ -64,6 +107,10 @@ class Transaction(models.Model):
     sales_order = models.ForeignKey('sales.SalesOrder', on_delete=models.SET_NULL, null=True, blank=True)
     purchase_order = models.ForeignKey('purchase.PurchaseOrder', on_delete=models.SET_NULL, null=True, blank=True)
     invoice = models.ForeignKey('sales.Invoice', on_delete=models.SET_NULL, null=True, blank=True)
+    journal_entry = models.ForeignKey(
+        'JournalEntry', on_delete=models.SET_NULL, null=True, blank=True, related_name='transactions'
+    )
+    is_closing = models.BooleanField(default=False, help_text="Closing entry generated when a period is closed")
 
     # Metadata
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='created_transactions')
@@ -74,33 +121,55 @@ class Transaction(models.Model):
         ordering = ['-date', '-created_at']
         verbose_name = 'Transaction'
         verbose_name_plural = 'Transactions'
+        indexes = [
+            models.Index(fields=['date', 'account']),
+            models.Index(fields=['reference_number', 'date']),
+        ]
 
     def __str__(self):
         return f"{self.transaction_type.title()} - {self.account.name} - ${self.amount}"
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        # Update account balance
-        self.update_account_balance()
-
-    def update_account_balance(self):
-        """Update the account balance based on transaction type"""
-        if self.transaction_type == 'debit':
-            # For assets and expenses: debit increases balance
-            if self.account.account_type in ['asset', 'expense']:
-                self.account.balance += self.amount
-            # For liabilities, equity, revenue: debit decreases balance
-            else:
-                self.account.balance -= self.amount
-        else:  # credit
-            # For assets and expenses: credit decreases balance
-            if self.account.account_type in ['asset', 'expense']:
-                self.account.balance -= self.amount
-            # For liabilities, equity, revenue: credit increases balance
-            else:
-                self.account.balance += self.amount
-
-        self.account.save()
+        with transaction.atomic():
+            # An edited transaction takes its stored amount back out first
+            self._replaced = None
+            if self.pk and not self._state.adding:
+                self._replaced = Transaction.objects.filter(pk=self.pk).first()
+            # Moving a transaction out of a closed period changes it as well
+            closed = FinancialPeriod.closed_periods_for(
+                [self.date, self._replaced.date if self._replaced is not None else None]
+            )
+            if closed:
+                raise ClosedPeriodError(closed[0])
+            super().save(*args, **kwargs)
+            if self._replaced is not None:
+                self._replaced.update_account_balance(sign=-1)
+            self.update_account_balance()
+
+    def delete(self, *args, **kwargs):
+        closed = FinancialPeriod.closed_periods_for([self.date])
+        if closed:
+            raise ClosedPeriodError(closed[0])
+        with transaction.atomic():
+            self.update_account_balance(sign=-1)
+            return super().delete(*args, **kwargs)
+
+    def update_account_balance(self, sign=1):
+        """
+        Move the account balance by this transaction.
+
+        Debits increase asset and expense accounts and decrease the others,
+        credits the opposite (see ledger.balance_change). The balance moves
+        with one ``UPDATE ... SET balance = balance + delta``, like
+        ledger.post_transactions, so concurrent postings never overwrite
+        each other.
+        """
+        from .ledger import apply_balance_changes, balance_change
+
+        account_type = Account.objects.filter(pk=self.account_id).values_list('account_type', flat=True).get()
+        apply_balance_changes({
+            self.account_id: sign * balance_change(account_type, self.transaction_type, self.amount)
+        })
 
 
 class JournalEntry(models.Model):
@@ -117,6 +186,15 @@ class JournalEntry(models.Model):
     sales_order = models.ForeignKey('sales.SalesOrder', on_delete=models.SET_NULL, null=True, blank=True)
     purchase_order = models.ForeignKey('purchase.PurchaseOrder', on_delete=models.SET_NULL, null=True, blank=True)
 
+    # Operational document the entry was posted from automatically
+    source = models.CharField(max_length=30, blank=True, help_text="Posting rule that created this entry")
+    source_id = models.PositiveBigIntegerField(null=True, blank=True, help_text="Primary key of the source document")
+    is_reversed = models.BooleanField(default=False, help_text="Reversed after its source document changed")
+    reversal_of = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='reversals',
+        help_text="Entry this entry reverses",
+    )
+
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='created_journal_entries')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -125,25 +203,39 @@ class JournalEntry(models.Model):
         ordering = ['-date', '-created_at']
         verbose_name = 'Journal Entry'
         verbose_name_plural = 'Journal Entries'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['source', 'source_id'],
+                # One standing entry per document; reversed entries and
+                # their reversals are kept alongside it
+                condition=models.Q(source_id__isnull=False, is_reversed=False, reversal_of__isnull=True),
+                name='unique_journal_entry_source',
+            ),
+        ]
 
     def __str__(self):
         return f"JE-{self.reference_number} - {self.description[:50]}"
 
+    def line_totals(self):
+        """Debit and credit totals of the lines in one conditional aggregate"""
+        zero = models.Value(Decimal('0.00'))
+        return self.lines.aggregate(
+            debit=Coalesce(models.Sum('amount', filter=models.Q(transaction_type='debit')), zero),
+            credit=Coalesce(models.Sum('amount', filter=models.Q(transaction_type='credit')), zero),
+        )
+
     @property
     def total_debit(self):
-        return self.lines.filter(transaction_type='debit').aggregate(
-            total=models.Sum('amount')
-        )['total'] or Decimal('0.00')
+        return self.line_totals()['debit']
 
     @property
     def total_credit(self):
-        return self.lines.filter(transaction_type='credit').aggregate(
-            total=models.Sum('amount')
-        )['total'] or Decimal('0.00')
+        return self.line_totals()['credit']
 
     @property
     def is_balanced(self):
-        return self.total_debit == self.total_credit
+        totals = self.line_totals()
+        return totals['debit'] == totals['credit']
 
 
 class JournalEntryLine(models.Model):
@@ -288,3 +380,41 @@ class FinancialPeriod(models.Model):
     def is_current(self):
         today = timezone.now().date()
         return self.start_date <= today <= self.end_date
+
+    def contains(self, day):
+        return self.start_date <= day <= self.end_date
+
+    @classmethod
+    def closed_periods_for(cls, dates):
+        """Closed periods containing any of the given dates, in one query"""
+        dates = {day.date() if isinstance(day, datetime) else day for day in dates if day}
+        if not dates:
+            return []
+        periods = cls.objects.filter(is_closed=True, start_date__lte=max(dates), end_date__gte=min(dates))
+        return [period for period in periods if any(period.contains(day) for day in dates)]
+
+
+class AccountPeriodBalance(models.Model):
+    """Account balances stored when a financial period is closed"""
+    period = models.ForeignKey(FinancialPeriod, on_delete=models.CASCADE, related_name='account_balances')
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='period_balances')
+
+    # Balances in the account's normal direction; debits and credits
+    # exclude the closing entries
+    opening_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    period_debit = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    period_credit = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    closing_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+
+    # Cash received (credits) and paid (debits) against this account
+    cash_inflow = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    cash_outflow = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['period__start_date', 'account__code']
+        unique_together = ['period', 'account']
+        verbose_name = 'Account Period Balance'
+        verbose_name_plural = 'Account Period Balances'
+
+    def __str__(self):
+        return f"{self.period.name} - {self.account.name}"
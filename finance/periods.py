@@ -0,0 +1,278 @@
+"""
+Financial period close.
+
+Closing a period freezes it: Transaction.save, Transaction.delete and
+ledger.post_transactions reject anything dated inside a closed period, and
+saving a transaction cannot move it out of one either. The close itself
+
+* computes every account's opening balance, period debits and credits and
+  closing balance with one grouped query over the period's transactions and
+  stores them as AccountPeriodBalance rows,
+* stores the cash received and paid against each account (see cashflow),
+* rolls revenue and expense into the retained earnings account with closing
+  transactions (``is_closing=True``) dated on the period's last day.
+
+Periods close in date order, so a period opens with the previous period's
+closing balances plus any activity dated between the two. Reports read the
+snapshots instead of the whole ledger: the balance of an account on a date
+is the latest snapshot plus the transactions since, and activity over a
+date range is the stored totals of the closed periods inside it plus the
+transactions on the remaining days.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .ledger import DEBIT_NORMAL_TYPES, apply_balance_changes, balance_change, ledger_accounts, post_transactions
+from .models import Account, AccountPeriodBalance, FinancialPeriod, Transaction
+
+
+# Account types closed into retained earnings at period end
+INCOME_STATEMENT_TYPES = ['revenue', 'expense']
+
+ZERO = Decimal('0.00')
+
+
+class PeriodCloseError(Exception):
+    """Raised when a financial period cannot be closed or reopened"""
+
+
+def natural_balance(account_type, debit, credit):
+    """Net of debits and credits in the account's normal direction"""
+    if account_type in DEBIT_NORMAL_TYPES:
+        return debit - credit
+    return credit - debit
+
+
+def ledger_activity(transactions):
+    """``{account_id: (debit, credit)}`` for the given transactions in one grouped query"""
+    rows = transactions.values('account_id').annotate(
+        debit=Coalesce(Sum('amount', filter=Q(transaction_type='debit')), Value(ZERO)),
+        credit=Coalesce(Sum('amount', filter=Q(transaction_type='credit')), Value(ZERO)),
+    ).order_by()
+    return {row['account_id']: (row['debit'], row['credit']) for row in rows}
+
+
+def _account_types():
+    return dict(Account.objects.values_list('pk', 'account_type'))
+
+
+def last_closed_period(on_or_before):
+    """Latest closed period ending on or before the given date"""
+    return FinancialPeriod.objects.filter(
+        is_closed=True, end_date__lte=on_or_before
+    ).order_by('-end_date').first()
+
+
+def balances_as_of(as_of):
+    """
+    ``{account_id: balance}`` at the end of the given date.
+
+    Starts from the latest closed period's closing balances and adds the
+    transactions dated after it.
+    """
+    types = _account_types()
+    balances = defaultdict(Decimal)
+    transactions = Transaction.objects.filter(date__lte=as_of)
+
+    period = last_closed_period(as_of)
+    if period:
+        for account_id, closing in period.account_balances.values_list('account_id', 'closing_balance'):
+            balances[account_id] += closing
+        transactions = transactions.filter(date__gt=period.end_date)
+
+    for account_id, (debit, credit) in ledger_activity(transactions).items():
+        balances[account_id] += natural_balance(types[account_id], debit, credit)
+    return dict(balances)
+
+
+def split_range(start_date=None, end_date=None):
+    """
+    Split a date range into closed periods lying entirely inside it and the
+    remaining gaps.
+
+    Returns ``(periods, gap_condition)`` where gap_condition is a Q on
+    Transaction.date matching the uncovered days, or None if there are none.
+    """
+    start_date = start_date or date.min
+    end_date = end_date or timezone.now().date()
+    periods = list(FinancialPeriod.objects.filter(
+        is_closed=True, start_date__gte=start_date, end_date__lte=end_date
+    ).order_by('start_date'))
+
+    gaps = []
+    cursor = start_date
+    for period in periods:
+        if period.start_date > cursor:
+            gaps.append((cursor, period.start_date - timedelta(days=1)))
+        cursor = max(cursor, period.end_date + timedelta(days=1))
+    if cursor <= end_date:
+        gaps.append((cursor, end_date))
+
+    gap_condition = reduce(or_, (Q(date__range=gap) for gap in gaps)) if gaps else None
+    return periods, gap_condition
+
+
+def period_activity(start_date=None, end_date=None):
+    """
+    ``{account_id: (debit, credit)}`` posted between two dates, without
+    closing entries.
+
+    Closed periods lying entirely inside the range contribute their stored
+    totals; only the remaining days are read from the ledger.
+    """
+    periods, gap_condition = split_range(start_date, end_date)
+    activity = defaultdict(lambda: [ZERO, ZERO])
+
+    for row in AccountPeriodBalance.objects.filter(period__in=periods).values('account_id').annotate(
+        debit=Sum('period_debit'), credit=Sum('period_credit')
+    ).order_by():
+        activity[row['account_id']][0] += row['debit']
+        activity[row['account_id']][1] += row['credit']
+
+    if gap_condition is not None:
+        transactions = Transaction.objects.filter(gap_condition, is_closing=False)
+        for account_id, (debit, credit) in ledger_activity(transactions).items():
+            activity[account_id][0] += debit
+            activity[account_id][1] += credit
+
+    return {account_id: tuple(totals) for account_id, totals in activity.items()}
+
+
+def _closing_entries(period, closing, types, retained_earnings, user):
+    """Transactions moving revenue and expense balances into retained earnings"""
+    entries = []
+    net_income = ZERO
+    common = {
+        'date': period.end_date,
+        'reference_number': f"CLOSE-{period.name}"[:100],
+        'is_closing': True,
+        'created_by': user,
+    }
+    for account_id, balance in closing.items():
+        account_type = types[account_id]
+        if account_type not in INCOME_STATEMENT_TYPES or not balance:
+            continue
+        # Post the opposite of the account's normal side to bring it to zero
+        normal_side = 'debit' if account_type in DEBIT_NORMAL_TYPES else 'credit'
+        opposite_side = 'credit' if normal_side == 'debit' else 'debit'
+        entries.append(Transaction(
+            account_id=account_id,
+            transaction_type=opposite_side if balance > 0 else normal_side,
+            amount=abs(balance),
+            description=f"Close {period.name} to retained earnings",
+            **common,
+        ))
+        net_income += balance if account_type == 'revenue' else -balance
+
+    if net_income:
+        entries.append(Transaction(
+            account=retained_earnings,
+            transaction_type='credit' if net_income > 0 else 'debit',
+            amount=abs(net_income),
+            description=f"Net income for {period.name}",
+            **common,
+        ))
+    return entries, net_income
+
+
+def close_period(period, user=None):
+    """
+    Close a financial period.
+
+    Stores the account snapshots, posts the closing entries and marks the
+    period closed. Earlier periods must be closed first.
+    """
+    from .cashflow import counterpart_flows
+
+    with transaction.atomic():
+        period = FinancialPeriod.objects.select_for_update().get(pk=period.pk)
+        if period.is_closed:
+            raise PeriodCloseError(f"{period} is already closed")
+        earlier = FinancialPeriod.objects.filter(
+            is_closed=False, start_date__lt=period.start_date
+        ).order_by('start_date').first()
+        if earlier:
+            raise PeriodCloseError(f"Close {earlier} before {period}")
+        retained_earnings = ledger_accounts('retained_earnings')['retained_earnings']
+        if retained_earnings is None:
+            raise PeriodCloseError("The retained earnings account does not exist")
+
+        types = _account_types()
+        opening = balances_as_of(period.start_date - timedelta(days=1))
+        in_period = Transaction.objects.filter(
+            date__range=(period.start_date, period.end_date), is_closing=False
+        )
+        activity = ledger_activity(in_period)
+        cash_flows = counterpart_flows(in_period)
+
+        closing = {}
+        for account_id in set(opening) | set(activity) | set(cash_flows):
+            debit, credit = activity.get(account_id, (ZERO, ZERO))
+            closing[account_id] = opening.get(account_id, ZERO) + natural_balance(types[account_id], debit, credit)
+
+        entries, net_income = _closing_entries(period, closing, types, retained_earnings, user)
+        post_transactions(entries)
+        for entry in entries:
+            closing[entry.account_id] = closing.get(entry.account_id, ZERO) + balance_change(
+                types[entry.account_id], entry.transaction_type, entry.amount
+            )
+
+        AccountPeriodBalance.objects.filter(period=period).delete()
+        AccountPeriodBalance.objects.bulk_create([
+            AccountPeriodBalance(
+                period=period,
+                account_id=account_id,
+                opening_balance=opening.get(account_id, ZERO),
+                period_debit=activity.get(account_id, (ZERO, ZERO))[0],
+                period_credit=activity.get(account_id, (ZERO, ZERO))[1],
+                closing_balance=closing[account_id],
+                cash_inflow=cash_flows.get(account_id, (ZERO, ZERO))[0],
+                cash_outflow=cash_flows.get(account_id, (ZERO, ZERO))[1],
+            )
+            for account_id in sorted(closing)
+        ], batch_size=1000)
+
+        period.is_closed = True
+        period.closed_date = timezone.now()
+        period.closed_by = user
+        period.save()
+
+    return net_income
+
+
+def reopen_period(period):
+    """Reopen the most recently closed period, removing its snapshots and closing entries"""
+    with transaction.atomic():
+        period = FinancialPeriod.objects.select_for_update().get(pk=period.pk)
+        if not period.is_closed:
+            raise PeriodCloseError(f"{period} is not closed")
+        later = FinancialPeriod.objects.filter(
+            is_closed=True, start_date__gt=period.start_date
+        ).order_by('start_date').first()
+        if later:
+            raise PeriodCloseError(f"Reopen {later} before {period}")
+
+        closing_entries = Transaction.objects.filter(
+            is_closing=True, date__range=(period.start_date, period.end_date)
+        ).select_related('account')
+        changes = defaultdict(Decimal)
+        for entry in closing_entries:
+            changes[entry.account_id] -= balance_change(
+                entry.account.account_type, entry.transaction_type, entry.amount
+            )
+        apply_balance_changes(changes)
+        closing_entries.delete()
+        period.account_balances.all().delete()
+
+        period.is_closed = False
+        period.closed_date = None
+        period.closed_by = None
+        period.save()
@@ -0,0 +1,146 @@
+"""
+Journal entry posting.
+
+Posting turns each journal entry line into a ledger Transaction. Entries
+are posted in chunks: the balance of every entry in the chunk is checked
+with one conditional aggregate, the transactions of all balanced entries
+are inserted with bulk_create and account balances move by the net change
+per account (see ledger.post_transactions). Unbalanced or empty entries
+and entries in closed periods are skipped and reported, so a month-end batch of thousands of entries posts in
+a handful of queries per chunk.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .ledger import post_transactions
+from .models import FinancialPeriod, JournalEntry, JournalEntryLine, Transaction
+
+
+# Journal entries posted per transaction
+ENTRY_BATCH_SIZE = 500
+
+
+class PostingError(Exception):
+    """Raised when a journal entry cannot be posted"""
+
+
+class PostingResult:
+    """Outcome of posting one or more journal entries"""
+
+    def __init__(self):
+        self.posted = []        # ids of the entries posted
+        self.skipped = []       # (reference_number, reason)
+        self.transactions = 0
+
+
+def entry_totals(entry_ids):
+    """``{entry_id: (debit, credit, line_count)}`` from one conditional aggregate"""
+    zero = Value(Decimal('0.00'))
+    rows = JournalEntryLine.objects.filter(journal_entry_id__in=entry_ids).values(
+        'journal_entry_id'
+    ).annotate(
+        debit=Coalesce(Sum('amount', filter=Q(transaction_type='debit')), zero),
+        credit=Coalesce(Sum('amount', filter=Q(transaction_type='credit')), zero),
+        line_count=Count('pk'),
+    ).order_by()
+    return {
+        row['journal_entry_id']: (row['debit'], row['credit'], row['line_count'])
+        for row in rows
+    }
+
+
+def _entry_ids(entries):
+    if hasattr(entries, 'values_list'):
+        return list(entries.order_by('date', 'pk').values_list('pk', flat=True))
+    return [getattr(entry, 'pk', entry) for entry in entries]
+
+
+def _transactions(entries, user):
+    lines = JournalEntryLine.objects.filter(
+        journal_entry_id__in=entries
+    ).values('journal_entry_id', 'account_id', 'transaction_type', 'amount').order_by('journal_entry_id', 'pk')
+    created = []
+    for line in lines:
+        entry = entries[line['journal_entry_id']]
+        created.append(Transaction(
+            date=entry.date,
+            description=f"JE-{entry.reference_number}: {entry.description}"[:500],
+            reference_number=entry.reference_number,
+            account_id=line['account_id'],
+            transaction_type=line['transaction_type'],
+            amount=line['amount'],
+            sales_order_id=entry.sales_order_id,
+            purchase_order_id=entry.purchase_order_id,
+            journal_entry_id=line['journal_entry_id'],
+            created_by=user,
+        ))
+    return created
+
+
+def post_entries(entries, user=None, batch_size=ENTRY_BATCH_SIZE):
+    """
+    Post many journal entries.
+
+    ``entries`` is a queryset or an iterable of entries or primary keys.
+    Entries already posted, unbalanced, without lines or dated in a closed
+    period are skipped and reported in ``result.skipped``. Each chunk of
+    batch_size entries is posted in its own transaction.
+    """
+    entry_ids = _entry_ids(entries)
+    result = PostingResult()
+
+    for start in range(0, len(entry_ids), batch_size):
+        chunk = entry_ids[start:start + batch_size]
+        with transaction.atomic():
+            locked = {
+                entry.pk: entry
+                for entry in JournalEntry.objects.select_for_update().filter(pk__in=chunk).only(
+                    'pk', 'date', 'description', 'reference_number', 'is_posted',
+                    'sales_order_id', 'purchase_order_id',
+                )
+            }
+            totals = entry_totals(list(locked))
+            closed = FinancialPeriod.closed_periods_for(entry.date for entry in locked.values())
+
+            postable = {}
+            for entry_id in chunk:
+                entry = locked.get(entry_id)
+                if entry is None:
+                    continue
+                debit, credit, line_count = totals.get(entry_id, (Decimal('0.00'), Decimal('0.00'), 0))
+                period = next((period for period in closed if period.contains(entry.date)), None)
+                if entry.is_posted:
+                    result.skipped.append((entry.reference_number, 'Journal entry is already posted'))
+                elif period:
+                    result.skipped.append((entry.reference_number, f'Financial period {period} is closed'))
+                elif not line_count:
+                    result.skipped.append((entry.reference_number, 'Journal entry has no lines'))
+                elif debit != credit:
+                    result.skipped.append((
+                        entry.reference_number,
+                        f'Journal entry is unbalanced (debit {debit}, credit {credit})',
+                    ))
+                else:
+                    postable[entry_id] = entry
+
+            if postable:
+                result.transactions += len(post_transactions(_transactions(postable, user)))
+                JournalEntry.objects.filter(pk__in=postable).update(
+                    is_posted=True, posted_date=timezone.now()
+                )
+                result.posted.extend(postable)
+
+    return result
+
+
+def post_entry(entry, user=None):
+    """Post one journal entry, raising PostingError if it cannot be posted"""
+    result = post_entries([entry.pk], user=user)
+    if result.skipped:
+        raise PostingError(result.skipped[0][1])
+    entry.refresh_from_db()
+    return result
@@ -0,0 +1,98 @@
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from manufacturing.models import MaterialConsumption
+from purchase.models import GoodsReceipt
+from sales.models import Invoice
+
+from .autopost import queue
+from .budgets import apply_to_budgets, refresh_budget_actuals, refresh_line_actual
+from .hierarchy import add_account, move_account, remove_account
+from .ledger import CASH_ROLES, ledger_account_code
+from .models import Account, Budget, BudgetLine, TaxRate, Transaction
+from .tax import tax_index
+
+
+POSTING_SOURCES = {
+    Invoice: 'invoice',
+    GoodsReceipt: 'goods_receipt',
+    MaterialConsumption: 'material_consumption',
+}
+
+
+@receiver(pre_save, sender=Account)
+def mark_cash_account(sender, instance, raw=False, **kwargs):
+    # New accounts set up as the ledger's cash or bank account hold cash
+    if instance._state.adding and not raw:
+        if instance.code in {ledger_account_code(role) for role in CASH_ROLES}:
+            instance.is_cash = True
+
+
+@receiver(post_init, sender=Account)
+def remember_parent_account(sender, instance, **kwargs):
+    # Lets post_save tell when an account moved to another parent. Read
+    # through __dict__ so deferred fields are not loaded (which would recurse)
+    instance._loaded_parent_id = instance.__dict__.get('parent_account_id')
+
+
+@receiver(post_save, sender=Account)
+def maintain_account_closure(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        add_account(instance)
+    elif instance.parent_account_id != instance._loaded_parent_id:
+        move_account(instance)
+    instance._loaded_parent_id = instance.parent_account_id
+
+
+@receiver(pre_delete, sender=Account)
+def detach_account_children(sender, instance, **kwargs):
+    # Children are set to no parent by the delete; drop their links to the
+    # deleted account and its ancestors so they become roots of their own
+    remove_account(instance.pk)
+
+
+@receiver(post_save, sender=Transaction)
+def add_transaction_to_budgets(sender, instance, created, raw=False, **kwargs):
+    # Bulk posting goes through ledger.post_transactions, which does the same
+    if raw:
+        return
+    replaced = getattr(instance, '_replaced', None)
+    if replaced is not None:
+        apply_to_budgets([replaced], sign=-1)
+    apply_to_budgets([instance])
+
+
+@receiver(post_delete, sender=Transaction)
+def remove_transaction_from_budgets(sender, instance, **kwargs):
+    apply_to_budgets([instance], sign=-1)
+
+
+@receiver(post_save, sender=BudgetLine)
+def refresh_budget_line_actual(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_line_actual(instance)
+
+
+@receiver(post_save, sender=Budget)
+def refresh_budget_actual_amounts(sender, instance, created, raw=False, **kwargs):
+    # Lines without a month draw on the whole budget range, which may have moved
+    if not created and not raw:
+        refresh_budget_actuals([instance])
+
+
+@receiver(post_save, sender=TaxRate)
+@receiver(post_delete, sender=TaxRate)
+def invalidate_tax_rates(sender, instance, **kwargs):
+    tax_index.invalidate()
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_save, sender=GoodsReceipt)
+@receiver(post_save, sender=MaterialConsumption)
+def queue_document_posting(sender, instance, raw=False, **kwargs):
+    # Documents already posted are skipped when the queue is flushed, so
+    # queueing on every save is safe and picks up totals filled in later
+    if not raw:
+        queue(POSTING_SOURCES[sender], [instance.pk])
@@ -0,0 +1,114 @@
+"""
+Effective-dated tax rates.
+
+Active TaxRate rows are loaded once into an in-memory interval index per
+scope (sales or purchases): the dates on which the applicable set of rates
+changes, sorted, with the combined rate in force from each date on. The
+rate on a given day is one bisect. Rates that overlap add up, so a VAT and
+a local tax in force together give their sum.
+
+The index is process-wide and rebuilt lazily when its shared version
+(core.versions, key ``tax_rates``) has moved. Saving or deleting a TaxRate
+bumps the version in the same transaction (see signals), so every worker
+picks up the new rates, not only the one that saved them; each lookup
+costs one version query. ``segments`` hands out the date ranges with a
+constant rate, so callers can tax whole batches of orders with one UPDATE
+per range instead of one per order.
+"""
+import threading
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import Q
+
+from core import versions
+
+from .models import TaxRate
+
+
+SCOPES = {
+    'sales': 'applicable_to_sales',
+    'purchases': 'applicable_to_purchases',
+}
+
+ZERO = Decimal('0.00')
+
+VERSION_KEY = 'tax_rates'
+
+
+class TaxIndex:
+    """Process-wide index of combined tax rates by date"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._starts = None     # scope -> [date the combined rate changes, ...]
+        self._rates = None      # scope -> [combined rate from that date, ...]
+        self._version = None    # shared version loaded
+
+    def invalidate(self):
+        """Mark the rates changed for every process, in the current transaction"""
+        versions.bump([VERSION_KEY])
+
+    def _load(self):
+        rates = list(TaxRate.objects.filter(is_active=True).values(
+            'rate', 'effective_from', 'effective_to', *SCOPES.values()
+        ))
+        starts, combined = {}, {}
+        for scope, flag in SCOPES.items():
+            applicable = [rate for rate in rates if rate[flag]]
+            changes = {date.min}
+            for rate in applicable:
+                changes.add(rate['effective_from'])
+                if rate['effective_to'] and rate['effective_to'] < date.max:
+                    changes.add(rate['effective_to'] + timedelta(days=1))
+            starts[scope], combined[scope] = [], []
+            for day in sorted(changes):
+                total = sum((
+                    rate['rate'] for rate in applicable
+                    if rate['effective_from'] <= day and (rate['effective_to'] is None or day <= rate['effective_to'])
+                ), ZERO)
+                # Keep only the dates where the combined rate actually changes
+                if not combined[scope] or combined[scope][-1] != total:
+                    starts[scope].append(day)
+                    combined[scope].append(total)
+        self._starts, self._rates = starts, combined
+
+    def _index(self):
+        # Version first: rates loaded after it are never older than it says
+        version = versions.current([VERSION_KEY])[VERSION_KEY]
+        with self._lock:
+            if self._starts is None or self._version != version:
+                self._load()
+                self._version = version
+            return self._starts, self._rates
+
+    def rate_on(self, day, scope='sales'):
+        """Combined tax rate percentage in force on the given day"""
+        if isinstance(day, datetime):
+            # Unsaved DateFields defaulting to timezone.now hold a datetime
+            day = day.date()
+        starts, rates = self._index()
+        return rates[scope][bisect_right(starts[scope], day) - 1]
+
+    def tax_for(self, amount, day, scope='sales'):
+        """Tax on an amount on the given day, rounded to cents"""
+        rate = self.rate_on(day, scope)
+        return (Decimal(amount) * rate / 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+    def segments(self, scope='sales'):
+        """``(start, end, rate)`` ranges with a constant rate; end is exclusive and None for the last"""
+        starts, rates = self._index()
+        bounds = starts[scope][1:] + [None]
+        return list(zip(starts[scope], bounds, rates[scope]))
+
+
+def in_segment(date_field, start, end):
+    """Q matching ``date_field`` inside a segment returned by TaxIndex.segments"""
+    condition = Q(**{f'{date_field}__gte': start})
+    if end is not None:
+        condition &= Q(**{f'{date_field}__lt': end})
+    return condition
+
+
+tax_index = TaxIndex()
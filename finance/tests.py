@@ -1,3 +1,484 @@
-from django.test import TestCase
+from datetime import date
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseServerError
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from inventory.models import CostLayer, FinishedProduct, MaterialCategory, ProductCategory, RawMaterial
+from manufacturing.models import MaterialConsumption, ProductionOrder, WorkOrder
+from sales.models import Customer, Invoice, SalesOrder
+
+from .autopost import AutoPostingMiddleware, current_entries
+
+from .budgets import refresh_budget_actuals
+from .cashflow import cash_flow_statement
+from .forms import AccountForm
+from .hierarchy import rebuild_closure, subtree_balances, would_create_cycle
+from .ledger import post_transactions
+from .models import Account, AccountClosure, Budget, BudgetLine, ClosedPeriodError, FinancialPeriod, JournalEntry, TaxRate, Transaction
+from .periods import PeriodCloseError, balances_as_of, close_period, reopen_period
+from .tax import TaxIndex
+
+
+class FinanceTestData:
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('finance', password='finance')
+        cls.cash = Account.objects.create(code='1000', name='Cash', account_type='asset')
+        cls.revenue = Account.objects.create(code='4000', name='Sales Revenue', account_type='revenue')
+
+    def entry(self, account, transaction_type, amount, day=None):
+        return Transaction(
+            date=day or date.today(), description='Test', account=account,
+            transaction_type=transaction_type, amount=Decimal(amount), created_by=self.user,
+        )
+
+    def balance(self, account):
+        return Account.objects.get(pk=account.pk).balance
+
+
+class LedgerBalanceTests(FinanceTestData, TestCase):
+
+    def test_balances_move_in_normal_direction(self):
+        post_transactions([self.entry(self.cash, 'debit', '100'), self.entry(self.revenue, 'credit', '100')])
+        self.entry(self.cash, 'credit', '30').save()
+
+        self.assertEqual(self.balance(self.cash), Decimal('70.00'))
+        self.assertEqual(self.balance(self.revenue), Decimal('100.00'))
+
+    def test_save_does_not_overwrite_concurrent_postings(self):
+        # The entry holds the account as loaded before the bulk posting ran
+        late = self.entry(Account.objects.get(pk=self.cash.pk), 'debit', '500')
+        late.account.balance
+        post_transactions([self.entry(self.cash, 'debit', '100')])
+
+        late.save()
+
+        self.assertEqual(self.balance(self.cash), Decimal('600.00'))
+
+    def test_edit_and_delete_move_balance_back(self):
+        entry = self.entry(self.cash, 'debit', '100')
+        entry.save()
+
+        entry.amount = Decimal('40')
+        entry.save()
+        self.assertEqual(self.balance(self.cash), Decimal('40.00'))
+
+        entry.transaction_type = 'credit'
+        entry.save()
+        self.assertEqual(self.balance(self.cash), Decimal('-40.00'))
+
+        entry.delete()
+        self.assertEqual(self.balance(self.cash), Decimal('0.00'))
+
+
+class PeriodCloseTests(FinanceTestData, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.retained = Account.objects.create(code='3100', name='Retained Earnings', account_type='equity')
+
+    def setUp(self):
+        self.january = FinancialPeriod.objects.create(name='January 2024', start_date=date(2024, 1, 1), end_date=date(2024, 1, 31))
+        self.february = FinancialPeriod.objects.create(name='February 2024', start_date=date(2024, 2, 1), end_date=date(2024, 2, 29))
+        post_transactions([
+            self.entry(self.cash, 'debit', '100', day=date(2024, 1, 10)),
+            self.entry(self.revenue, 'credit', '100', day=date(2024, 1, 10)),
+        ])
+        self.sale = Transaction.objects.get(account=self.cash, date=date(2024, 1, 10))
+
+    def test_close_rolls_income_into_retained_earnings(self):
+        net_income = close_period(self.january, user=self.user)
+
+        self.assertEqual(net_income, Decimal('100.00'))
+        self.assertEqual(
+            (self.balance(self.cash), self.balance(self.revenue), self.balance(self.retained)),
+            (Decimal('100.00'), Decimal('0.00'), Decimal('100.00')),
+        )
+        snapshot = self.january.account_balances.get(account=self.revenue)
+        self.assertEqual((snapshot.period_credit, snapshot.closing_balance), (Decimal('100.00'), Decimal('0.00')))
+        self.assertTrue(FinancialPeriod.objects.get(pk=self.january.pk).is_closed)
+
+    def test_periods_close_in_date_order(self):
+        with self.assertRaisesMessage(PeriodCloseError, 'Close January 2024 before February 2024'):
+            close_period(self.february)
+
+        close_period(self.january)
+        with self.assertRaisesMessage(PeriodCloseError, 'already closed'):
+            close_period(self.january)
+
+    def test_closed_period_rejects_saves_moves_and_deletes(self):
+        close_period(self.january)
+
+        with self.assertRaises(ClosedPeriodError):
+            self.entry(self.cash, 'debit', '5', day=date(2024, 1, 20)).save()
+        self.sale.date = date(2024, 2, 5)
+        with self.assertRaises(ClosedPeriodError):
+            self.sale.save()
+        self.sale.date = date(2024, 1, 10)
+        with self.assertRaises(ClosedPeriodError):
+            self.sale.delete()
+        self.assertTrue(Transaction.objects.filter(pk=self.sale.pk, date=date(2024, 1, 10)).exists())
+        self.assertEqual(self.balance(self.cash), Decimal('100.00'))
+
+    def test_reopen_removes_closing_entries_and_snapshots(self):
+        close_period(self.january)
+        close_period(self.february)
+        with self.assertRaisesMessage(PeriodCloseError, 'Reopen February 2024 before January 2024'):
+            reopen_period(self.january)
+
+        reopen_period(self.february)
+        reopen_period(self.january)
+
+        self.assertFalse(Transaction.objects.filter(is_closing=True).exists())
+        self.assertFalse(self.january.account_balances.exists())
+        self.assertEqual((self.balance(self.revenue), self.balance(self.retained)), (Decimal('100.00'), Decimal('0.00')))
+        self.sale.delete()
+        self.assertEqual(self.balance(self.cash), Decimal('0.00'))
+
+    def test_balances_as_of_start_from_the_closed_snapshot(self):
+        close_period(self.january)
+        post_transactions([
+            self.entry(self.cash, 'debit', '50', day=date(2024, 2, 5)),
+            self.entry(self.revenue, 'credit', '50', day=date(2024, 2, 5)),
+        ])
+        # Rows the ledger would read, were the snapshot ignored
+        Transaction.objects.filter(pk=self.sale.pk).update(amount=Decimal('999'))
+
+        self.assertEqual(balances_as_of(date(2024, 1, 31)), {
+            self.cash.pk: Decimal('100.00'), self.revenue.pk: Decimal('0.00'), self.retained.pk: Decimal('100.00'),
+        })
+        self.assertEqual(balances_as_of(date(2024, 2, 29)), {
+            self.cash.pk: Decimal('150.00'), self.revenue.pk: Decimal('50.00'), self.retained.pk: Decimal('100.00'),
+        })
+        self.assertEqual(balances_as_of(date(2024, 1, 9)), {})
+
+
+class AccountHierarchyTests(FinanceTestData, TestCase):
+
+    def setUp(self):
+        self.assets = Account.objects.create(code='1', name='Assets', account_type='asset')
+        self.current = Account.objects.create(code='11', name='Current Assets', account_type='asset', parent_account=self.assets)
+        self.bank = Account.objects.create(code='1110', name='Bank', account_type='asset', parent_account=self.current)
+        self.other = Account.objects.create(code='19', name='Other Assets', account_type='asset')
+
+    def ancestors(self, account):
+        return set(AccountClosure.objects.filter(descendant=account).values_list('ancestor_id', 'depth'))
+
+    def test_new_account_is_linked_to_every_ancestor(self):
+        self.assertEqual(self.ancestors(self.bank), {(self.bank.pk, 0), (self.current.pk, 1), (self.assets.pk, 2)})
+        self.assertEqual(self.ancestors(self.assets), {(self.assets.pk, 0)})
+
+    def test_moved_account_takes_its_subtree_along(self):
+        self.current.parent_account = self.other
+        self.current.save()
+
+        self.assertEqual(self.ancestors(self.bank), {(self.bank.pk, 0), (self.current.pk, 1), (self.other.pk, 2)})
+        self.assertEqual(self.ancestors(self.current), {(self.current.pk, 0), (self.other.pk, 1)})
+        self.assertFalse(AccountClosure.objects.filter(ancestor=self.assets).exclude(descendant=self.assets).exists())
+
+    def test_removed_account_leaves_its_children_as_roots(self):
+        self.current.delete()
+
+        self.assertEqual(self.ancestors(self.bank), {(self.bank.pk, 0)})
+        self.assertEqual(set(AccountClosure.objects.filter(ancestor=self.assets).values_list('descendant_id', flat=True)), {self.assets.pk})
+
+    def test_incremental_links_match_a_rebuild(self):
+        self.current.parent_account = self.other
+        self.current.save()
+        links = set(AccountClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+        rebuild_closure()
+
+        self.assertEqual(set(AccountClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth')), links)
+
+    def test_subtree_balances_roll_up_descendants(self):
+        self.entry(self.bank, 'debit', '70').save()
+        self.entry(self.current, 'debit', '30').save()
+
+        balances = subtree_balances([self.assets, self.current, self.bank])
+
+        self.assertEqual(balances, {self.assets.pk: Decimal('100.00'), self.current.pk: Decimal('100.00'), self.bank.pk: Decimal('70.00')})
+
+    def test_account_cannot_move_under_itself_or_a_descendant(self):
+        self.assertTrue(would_create_cycle(self.assets, self.bank))
+        self.assertTrue(would_create_cycle(self.current, self.current))
+        self.assertFalse(would_create_cycle(self.bank, self.other))
+        self.assertFalse(would_create_cycle(Account(code='12'), self.bank))
+
+        form = AccountForm(instance=self.assets, data={
+            'code': '1', 'name': 'Assets', 'account_type': 'asset', 'is_active': True,
+            'parent_account': self.bank.pk, 'cash_flow_category': 'operating',
+        })
+        self.assertFalse(form.is_valid())
+        self.assertEqual(list(form.errors), ['parent_account'])
+
+
+class CashFlowTests(FinanceTestData, TestCase):
+
+    def test_ledger_cash_accounts_are_marked_when_created(self):
+        bank = Account.objects.create(code='1010', name='Bank', account_type='asset')
+        other = Account.objects.create(code='1200', name='Accounts Receivable', account_type='asset')
+
+        self.assertTrue(self.cash.is_cash)
+        self.assertTrue(bank.is_cash)
+        self.assertFalse(other.is_cash)
+
+    def test_direct_method_reports_cash_received(self):
+        post_transactions([
+            Transaction(date=date.today(), description='Cash sale', account=self.cash, transaction_type='debit',
+                        amount=Decimal('250'), reference_number='RCPT-1'),
+            Transaction(date=date.today(), description='Cash sale', account=self.revenue, transaction_type='credit',
+                        amount=Decimal('250'), reference_number='RCPT-1'),
+        ])
+
+        statement = cash_flow_statement()
+
+        self.assertEqual(statement['cash_accounts'], [self.cash])
+        self.assertEqual(statement['sections']['operating']['inflow'], Decimal('250.00'))
+        self.assertEqual(statement['net_change'], Decimal('250.00'))
+
+    def test_statement_lists_no_cash_accounts_when_none_are_marked(self):
+        Account.objects.filter(pk=self.cash.pk).update(is_cash=False)
+
+        self.assertEqual(cash_flow_statement()['cash_accounts'], [])
+
+
+class BudgetActualTests(FinanceTestData, TestCase):
+
+    def setUp(self):
+        self.expense = Account.objects.create(code='5000', name='Materials', account_type='expense')
+        self.budget = Budget.objects.create(name='2026', start_date=date(2026, 1, 1), end_date=date(2026, 12, 31))
+
+    def actual(self, line):
+        return BudgetLine.objects.get(pk=line.pk).actual_amount
+
+    def test_posting_mid_month_moves_monthly_line(self):
+        # The line is dated later in the month than the posting
+        line = BudgetLine.objects.create(
+            budget=self.budget, account=self.expense, budgeted_amount=500, period=date(2026, 3, 20),
+        )
+        yearly = BudgetLine.objects.create(budget=self.budget, account=self.expense, budgeted_amount=6000)
+
+        post_transactions([self.entry(self.expense, 'debit', '100', day=date(2026, 3, 10))])
+        self.entry(self.expense, 'debit', '40', day=date(2026, 3, 31)).save()
+        self.entry(self.expense, 'debit', '999', day=date(2026, 4, 1)).save()
+
+        self.assertEqual(self.actual(line), Decimal('140.00'))
+        self.assertEqual(self.actual(yearly), Decimal('1139.00'))
+        refresh_budget_actuals([self.budget])
+        self.assertEqual(self.actual(line), Decimal('140.00'))
+
+    def test_lines_added_or_edited_start_from_ledger(self):
+        self.entry(self.expense, 'debit', '100', day=date(2026, 3, 10)).save()
+        self.entry(self.expense, 'debit', '70', day=date(2026, 4, 10)).save()
+
+        line = BudgetLine.objects.create(
+            budget=self.budget, account=self.expense, budgeted_amount=500, period=date(2026, 3, 1),
+        )
+        self.assertEqual(self.actual(line), Decimal('100.00'))
+
+        line.period = date(2026, 4, 1)
+        line.save()
+        self.assertEqual(self.actual(line), Decimal('70.00'))
+
+    def test_budget_detail_page(self):
+        BudgetLine.objects.create(budget=self.budget, account=self.expense, budgeted_amount=500, period=date(2026, 3, 1))
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('budget_detail', args=[self.budget.pk]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Monthly Breakdown')
+
+
+class TaxIndexTests(FinanceTestData, TestCase):
+
+    def test_rate_change_is_seen_by_other_workers(self):
+        vat = TaxRate.objects.create(name='VAT', code='VAT', rate=Decimal('10'), effective_from=date(2024, 1, 1))
+        # Two indexes stand for the caches of two worker processes
+        worker_a, worker_b = TaxIndex(), TaxIndex()
+        self.assertEqual(worker_a.tax_for(Decimal('100'), date(2024, 6, 1)), Decimal('10.00'))
+        self.assertEqual(worker_b.tax_for(Decimal('100'), date(2024, 6, 1)), Decimal('10.00'))
+
+        vat.rate = Decimal('11')
+        vat.save()
+
+        self.assertEqual(worker_a.tax_for(Decimal('100'), date(2024, 6, 1)), Decimal('11.00'))
+        self.assertEqual(worker_b.tax_for(Decimal('100'), date(2024, 6, 1)), Decimal('11.00'))
+
+    def test_unchanged_rates_are_not_reloaded(self):
+        TaxRate.objects.create(name='VAT', code='VAT', rate=Decimal('10'), effective_from=date(2024, 1, 1))
+        index = TaxIndex()
+        index.rate_on(date(2024, 6, 1))
+        # Only the version lookup runs
+        with self.assertNumQueries(1):
+            self.assertEqual(index.rate_on(date(2024, 6, 1)), Decimal('10'))
+
+
+class AutoPostingTests(FinanceTestData, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.receivable = Account.objects.create(code='1200', name='Accounts Receivable', account_type='asset')
+        cls.tax_payable = Account.objects.create(code='2200', name='Tax Payable', account_type='liability')
+        cls.customer = Customer.objects.create(name='Toko Sepatu', email='toko@example.com')
+
+    def make_invoice(self, total, tax):
+        order = SalesOrder.objects.create(
+            customer=self.customer, required_date=date(2024, 6, 30), created_by=self.user,
+        )
+        return Invoice.objects.create(
+            invoice_number=f'INV-{order.pk}', sales_order=order, invoice_date=date(2024, 6, 1),
+            due_date=date(2024, 7, 1), subtotal=total - tax, tax_amount=tax, discount_amount=0,
+            shipping_cost=0, total_amount=total, created_by=self.user,
+        )
+
+    def test_invoice_is_posted_when_the_transaction_commits(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            invoice = self.make_invoice(Decimal('110'), Decimal('10'))
+
+        entry = current_entries('invoice').get(source_id=invoice.pk)
+        self.assertEqual(entry.reference_number, f'AUTO-INV-{invoice.invoice_number}')
+        self.assertEqual(self.balance(self.receivable), Decimal('110'))
+        self.assertEqual(self.balance(self.revenue), Decimal('100'))
+        self.assertEqual(self.balance(self.tax_payable), Decimal('10'))
+
+    def test_edited_invoice_is_reversed_and_reposted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            invoice = self.make_invoice(Decimal('110'), Decimal('10'))
+        original = current_entries('invoice').get(source_id=invoice.pk)
+
+        invoice.subtotal, invoice.tax_amount, invoice.total_amount = Decimal('200'), Decimal('20'), Decimal('220')
+        with self.captureOnCommitCallbacks(execute=True):
+            invoice.save()
+
+        original.refresh_from_db()
+        self.assertTrue(original.is_reversed)
+        reversal = original.reversals.get()
+        self.assertEqual(reversal.line_totals(), {'debit': Decimal('110'), 'credit': Decimal('110')})
+        self.assertEqual(
+            set(reversal.lines.values_list('account__code', 'transaction_type')),
+            {('1200', 'credit'), ('4000', 'debit'), ('2200', 'debit')},
+        )
+        reposted = current_entries('invoice').get(source_id=invoice.pk)
+        self.assertEqual(reposted.reference_number, f'AUTO-INV-{invoice.invoice_number}-2')
+        self.assertEqual(self.balance(self.receivable), Decimal('220'))
+        self.assertEqual(self.balance(self.revenue), Decimal('200'))
+        self.assertEqual(self.balance(self.tax_payable), Decimal('20'))
+
+    def test_unchanged_invoice_is_not_reposted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            invoice = self.make_invoice(Decimal('110'), Decimal('10'))
+        with self.captureOnCommitCallbacks(execute=True):
+            invoice.save()
+
+        self.assertEqual(JournalEntry.objects.filter(source='invoice', source_id=invoice.pk).count(), 1)
+        self.assertEqual(self.balance(self.receivable), Decimal('110'))
+
+    def test_middleware_posts_before_the_request_commits(self):
+        created = []
+
+        def view(request):
+            created.append(self.make_invoice(Decimal('110'), Decimal('10')))
+            return HttpResponse()
+
+        AutoPostingMiddleware(view)(RequestFactory().post('/'))
+
+        self.assertTrue(current_entries('invoice').filter(source_id=created[0].pk).exists())
+
+    def test_failed_request_keeps_nothing(self):
+        middleware = AutoPostingMiddleware(None)
+
+        def view(request):
+            self.make_invoice(Decimal('110'), Decimal('10'))
+            # What Django does when the view raises
+            middleware.process_exception(request, RuntimeError())
+            return HttpResponseServerError()
+
+        middleware.get_response = view
+        middleware(RequestFactory().post('/'))
+
+        self.assertFalse(Invoice.objects.exists())
+        self.assertFalse(JournalEntry.objects.exists())
+        self.assertEqual(self.balance(self.receivable), Decimal('0'))
+
+    def test_safe_requests_run_without_a_transaction(self):
+        middleware = AutoPostingMiddleware(None)
+        depths = {}
+
+        def view(request):
+            depths[request.method] = len(transaction.get_connection().atomic_blocks)
+            middleware.process_exception(request, RuntimeError())
+            return HttpResponseServerError()
+
+        middleware.get_response = view
+        outside = len(transaction.get_connection().atomic_blocks)
+        middleware(RequestFactory().get('/'))
+        middleware(RequestFactory().head('/'))
+
+        self.assertEqual(depths, {'GET': outside, 'HEAD': outside})
+        self.assertFalse(transaction.get_rollback())
+
+    def test_skipped_postings_are_logged_and_shown(self):
+        FinancialPeriod.objects.create(name='June 2024', start_date=date(2024, 6, 1), end_date=date(2024, 6, 30), is_closed=True)
+        request = RequestFactory().post('/')
+        request._messages = CookieStorage(request)
+
+        def view(request):
+            self.make_invoice(Decimal('110'), Decimal('10'))
+            return HttpResponse()
+
+        with self.assertLogs('finance.autopost', 'WARNING') as logs:
+            AutoPostingMiddleware(view)(request)
+
+        self.assertIn('Financial period June 2024 is closed', logs.output[0])
+        self.assertEqual(
+            [str(message) for message in get_messages(request)],
+            [f'AUTO-INV-{Invoice.objects.get().invoice_number} was not posted to the ledger: Financial period June 2024 is closed'],
+        )
+        self.assertFalse(JournalEntry.objects.exists())
+
+    def test_material_consumption_is_posted_at_its_layer_cost(self):
+        inventory = Account.objects.create(code='1300', name='Inventory', account_type='asset')
+        work_in_progress = Account.objects.create(code='1400', name='Work in Progress', account_type='asset')
+        material = RawMaterial.objects.create(
+            code='LTR-01', name='Leather', category=MaterialCategory.objects.create(name='Leather'), unit='m',
+            unit_price=Decimal('10'), current_stock=10,
+        )
+        CostLayer.objects.filter(material_type='raw', material_id=material.pk).update(quantity=4, unit_cost=8)
+        CostLayer.objects.create(material_type='raw', material_id=material.pk, quantity=6, unit_cost=12)
+        product = FinishedProduct.objects.create(
+            code='SNK-01', name='Sneaker 40 Black', category=ProductCategory.objects.create(name='Sneakers'),
+            size='40', color='black', unit_price=100,
+        )
+        production_order = ProductionOrder.objects.create(
+            po_number='PRD-1', product=product, quantity=10, planned_start_date=date(2024, 6, 1),
+            planned_end_date=date(2024, 6, 30), created_by=self.user,
+        )
+        work_order = WorkOrder.objects.create(
+            wo_number='WO-1', production_order=production_order, stage='gurat', quantity=10,
+            planned_start_date=date(2024, 6, 1), planned_end_date=date(2024, 6, 30),
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            consumption = MaterialConsumption.objects.create(
+                work_order=work_order, material=material, planned_quantity=5, actual_quantity=5, recorded_by=self.user,
+            )
+
+        # 4 at 8 and 1 at 12, not 5 at the unit price of 10
+        self.assertEqual(consumption.cost, Decimal('44'))
+        entry = current_entries('material_consumption').get(source_id=consumption.pk)
+        self.assertEqual(entry.line_totals(), {'debit': Decimal('44'), 'credit': Decimal('44')})
+        self.assertEqual((self.balance(work_in_progress), self.balance(inventory)), (Decimal('44'), Decimal('-44')))
+        material.refresh_from_db()
+        self.assertEqual(material.current_stock, Decimal('5'))
+        self.assertEqual(list(CostLayer.objects.filter(material_id=material.pk).values_list('quantity', 'unit_cost')), [(5, 12)])
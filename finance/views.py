@@ -18,6 +18,12 @@ from .forms import (
     BudgetForm, BudgetLineFormSet, TaxRateForm, FinancialPeriodForm,
     FinancialReportForm, AccountTransferForm
 )
+from core.numbering import next_number
+from .budgets import budget_breakdown
+from .cashflow import cash_flow_statement
+from .hierarchy import subtree_balances, tree_rows
+from .periods import balances_as_of, ledger_activity, natural_balance, period_activity
+from .posting import PostingError, post_entry
 
 
 @login_required
@@ -61,11 +67,18 @@ def finance_dashboard(request):
 # Account Views
 @login_required
 def account_list(request):
-    accounts = Account.objects.all().order_by('code')
+    accounts = Account.objects.select_related('parent_account').annotate(
+        sub_account_count=Count('sub_accounts')
+    ).order_by('code')
     paginator = Paginator(accounts, 15)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
+    # Balance of each parent account including all its sub-accounts
+    totals = subtree_balances([account for account in page_obj if account.sub_account_count])
+    for account in page_obj:
+        account.subtree_balance = totals.get(account.pk)
+
     context = {
         'page_obj': page_obj,
         'title': 'Chart of Accounts'
@@ -222,30 +235,12 @@ def journal_entry_detail(request, pk):
 def journal_entry_post(request, pk):
     entry = get_object_or_404(JournalEntry, pk=pk)
 
-    if entry.is_posted:
-        messages.error(request, 'Journal entry is already posted.')
-        return redirect('journal_entry_detail', pk=entry.pk)
-
-    if not entry.is_balanced:
-        messages.error(request, 'Cannot post unbalanced journal entry.')
+    try:
+        post_entry(entry, user=request.user)
+    except PostingError as e:
+        messages.error(request, f'Cannot post journal entry: {e}.')
         return redirect('journal_entry_detail', pk=entry.pk)
 
-    with transaction.atomic():
-        # Create transactions for each journal entry line
-        for line in entry.lines.all():
-            Transaction.objects.create(
-                date=entry.date,
-                description=f"JE-{entry.reference_number}: {entry.description}",
-                account=line.account,
-                transaction_type=line.transaction_type,
-                amount=line.amount,
-                created_by=request.user
-            )
-
-        entry.is_posted = True
-        entry.posted_date = timezone.now()
-        entry.save()
-
     messages.success(request, f'Journal entry {entry.reference_number} posted successfully.')
     return redirect('journal_entry_detail', pk=entry.pk)
 
@@ -297,11 +292,20 @@ def budget_create(request):
 @login_required
 def budget_detail(request, pk):
     budget = get_object_or_404(Budget, pk=pk)
-    lines = budget.lines.select_related('account').all()
+    lines = budget.lines.select_related('account').order_by('account__code', 'period')
+    months, monthly_rows = budget_breakdown(budget)
+    totals = lines.aggregate(budgeted=Sum('budgeted_amount'), actual=Sum('actual_amount'))
+    total_budgeted = totals['budgeted'] or Decimal('0.00')
+    total_actual = totals['actual'] or Decimal('0.00')
 
     context = {
         'budget': budget,
         'lines': lines,
+        'months': months,
+        'monthly_rows': monthly_rows,
+        'total_budgeted': total_budgeted,
+        'total_actual': total_actual,
+        'total_variance': total_actual - total_budgeted,
         'title': f'Budget: {budget.name}'
     }
     return render(request, 'finance/budget_detail.html', context)
@@ -373,6 +377,12 @@ def financial_reports(request):
     return render(request, 'finance/reports.html', context)
 
 
+def _debit_credit(net):
+    """Split a debit-minus-credit net into debit and credit columns"""
+    zero = Decimal('0.00')
+    return (net, zero) if net > 0 else (zero, -net)
+
+
 def generate_trial_balance(request, start_date=None, end_date=None, account_filter=None):
     """Generate trial balance report"""
     accounts = Account.objects.filter(is_active=True)
@@ -380,37 +390,22 @@ def generate_trial_balance(request, start_date=None, end_date=None, account_filt
     if account_filter:
         accounts = accounts.filter(pk__in=account_filter)
 
-    trial_balance_data = []
-    total_debit = Decimal('0.00')
-    total_credit = Decimal('0.00')
-
-    for account in accounts:
-        # Calculate balance for the period
-        transactions = account.transactions.all()
-        if start_date:
-            transactions = transactions.filter(date__gte=start_date)
-        if end_date:
-            transactions = transactions.filter(date__lte=end_date)
-
-        debit_total = transactions.filter(transaction_type='debit').aggregate(
-            total=Sum('amount')
-        )['total'] or Decimal('0.00')
-
-        credit_total = transactions.filter(transaction_type='credit').aggregate(
-            total=Sum('amount')
-        )['total'] or Decimal('0.00')
-
-        balance = debit_total - credit_total
-
-        if balance != 0:
-            trial_balance_data.append({
-                'account': account,
-                'debit': balance if balance > 0 else Decimal('0.00'),
-                'credit': abs(balance) if balance < 0 else Decimal('0.00')
-            })
-
-            total_debit += balance if balance > 0 else Decimal('0.00')
-            total_credit += abs(balance) if balance < 0 else Decimal('0.00')
+    transactions = Transaction.objects.filter(account__in=accounts)
+    if start_date:
+        transactions = transactions.filter(date__gte=start_date)
+    if end_date:
+        transactions = transactions.filter(date__lte=end_date)
+    net = {account_id: debit - credit for account_id, (debit, credit) in ledger_activity(transactions).items()}
+
+    # Accounts are listed as a tree; parents carry the subtotal of their
+    # sub-accounts and the totals add up each account's own balance once
+    trial_balance_data = tree_rows(accounts, net)
+    total_debit = total_credit = Decimal('0.00')
+    for row in trial_balance_data:
+        row['debit'], row['credit'] = _debit_credit(row['own'])
+        row['subtotal_debit'], row['subtotal_credit'] = _debit_credit(row['amount'])
+        total_debit += row['debit']
+        total_credit += row['credit']
 
     context = {
         'trial_balance_data': trial_balance_data,
@@ -423,27 +418,50 @@ def generate_trial_balance(request, start_date=None, end_date=None, account_filt
     return render(request, 'finance/trial_balance.html', context)
 
 
+def _statement_lines(accounts, amounts):
+    """Report lines for accounts with a non-zero amount, and their total"""
+    lines = []
+    total = Decimal('0.00')
+    for account in accounts:
+        amount = amounts.get(account.pk, Decimal('0.00'))
+        if amount != 0:
+            lines.append({'account': account, 'amount': amount})
+            total += amount
+    return lines, total
+
+
+def _statement_tree(accounts, amounts):
+    """Report rows for accounts as a tree with subtotals, and their total"""
+    rows = tree_rows(accounts, amounts)
+    return rows, sum((row['own'] for row in rows), Decimal('0.00'))
+
+
 def generate_balance_sheet(request, start_date=None, end_date=None):
     """Generate balance sheet report"""
-    # Assets
-    assets = Account.objects.filter(account_type='asset', is_active=True)
-    total_assets = assets.aggregate(total=Sum('balance'))['total'] or Decimal('0.00')
+    as_of = end_date or timezone.now().date()
+    balances = balances_as_of(as_of)
+    accounts = Account.objects.filter(is_active=True)
 
-    # Liabilities
-    liabilities = Account.objects.filter(account_type='liability', is_active=True)
-    total_liabilities = liabilities.aggregate(total=Sum('balance'))['total'] or Decimal('0.00')
+    assets, total_assets = _statement_tree(accounts.filter(account_type='asset'), balances)
+    liabilities, total_liabilities = _statement_tree(accounts.filter(account_type='liability'), balances)
+    equity, total_equity = _statement_tree(accounts.filter(account_type='equity'), balances)
 
-    # Equity
-    equity = Account.objects.filter(account_type='equity', is_active=True)
-    total_equity = equity.aggregate(total=Sum('balance'))['total'] or Decimal('0.00')
+    # Revenue less expense not yet closed into retained earnings
+    _revenue, total_revenue = _statement_lines(accounts.filter(account_type='revenue'), balances)
+    _expenses, total_expenses = _statement_lines(accounts.filter(account_type='expense'), balances)
+    current_earnings = total_revenue - total_expenses
+    total_equity += current_earnings
 
     context = {
         'assets': assets,
         'liabilities': liabilities,
         'equity': equity,
+        'current_earnings': current_earnings,
         'total_assets': total_assets,
         'total_liabilities': total_liabilities,
         'total_equity': total_equity,
+        'total_liabilities_and_equity': total_liabilities + total_equity,
+        'as_of': as_of,
         'start_date': start_date,
         'end_date': end_date,
         'title': 'Balance Sheet'
@@ -453,27 +471,23 @@ def generate_balance_sheet(request, start_date=None, end_date=None):
 
 def generate_income_statement(request, start_date=None, end_date=None):
     """Generate income statement report"""
-    # Revenue accounts
-    revenue_accounts = Account.objects.filter(account_type='revenue', is_active=True)
-    total_revenue = Decimal('0.00')
-    revenue_data = []
+    activity = period_activity(start_date, end_date)
+    amounts = {
+        account_id: natural_balance(account_type, *activity[account_id])
+        for account_id, account_type in Account.objects.filter(
+            pk__in=activity, account_type__in=['revenue', 'expense']
+        ).values_list('pk', 'account_type')
+    }
 
-    for account in revenue_accounts:
-        balance = account.balance
-        if balance != 0:
-            revenue_data.append({'account': account, 'amount': balance})
-            total_revenue += balance
+    # Revenue accounts
+    revenue_data, total_revenue = _statement_lines(
+        Account.objects.filter(account_type='revenue', is_active=True), amounts
+    )
 
     # Expense accounts
-    expense_accounts = Account.objects.filter(account_type='expense', is_active=True)
-    total_expenses = Decimal('0.00')
-    expense_data = []
-
-    for account in expense_accounts:
-        balance = account.balance
-        if balance != 0:
-            expense_data.append({'account': account, 'amount': balance})
-            total_expenses += balance
+    expense_data, total_expenses = _statement_lines(
+        Account.objects.filter(account_type='expense', is_active=True), amounts
+    )
 
     net_income = total_revenue - total_expenses
 
@@ -492,25 +506,35 @@ def generate_income_statement(request, start_date=None, end_date=None):
 
 def generate_cash_flow(request, start_date=None, end_date=None):
     """Generate cash flow statement report"""
-    # This is a simplified cash flow statement
-    # In a real implementation, this would be more complex
-
-    # Operating activities (simplified)
-    operating_cash_flow = Decimal('0.00')
-
-    # Investing activities (simplified)
-    investing_cash_flow = Decimal('0.00')
-
-    # Financing activities (simplified)
-    financing_cash_flow = Decimal('0.00')
-
+    statement = cash_flow_statement(start_date, end_date)
+    sections = statement['sections']
+    if not statement['cash_accounts']:
+        messages.warning(
+            request,
+            'No account is marked as a cash account, so no cash receipts or payments can be reported. '
+            'Mark your cash and bank accounts as cash accounts.'
+        )
+
+    operating_cash_flow = sections['operating']['net']
+    investing_cash_flow = sections['investing']['net']
+    financing_cash_flow = sections['financing']['net']
     net_cash_flow = operating_cash_flow + investing_cash_flow + financing_cash_flow
 
     context = {
+        'sections': [
+            (label, sections[category]) for category, label in Account.CASH_FLOW_CATEGORIES
+        ],
+        'operating': sections['operating'],
+        'investing': sections['investing'],
+        'financing': sections['financing'],
         'operating_cash_flow': operating_cash_flow,
         'investing_cash_flow': investing_cash_flow,
         'financing_cash_flow': financing_cash_flow,
         'net_cash_flow': net_cash_flow,
+        'net_income': statement['net_income'],
+        'opening_cash': statement['opening_cash'],
+        'closing_cash': statement['closing_cash'],
+        'net_change': statement['net_change'],
         'start_date': start_date,
         'end_date': end_date,
         'title': 'Cash Flow Statement'
@@ -557,10 +581,14 @@ def account_transfer(request):
             transfer_date = form.cleaned_data['transfer_date']
 
             with transaction.atomic():
+                # Both sides share a reference so reports can pair them
+                reference_number = next_number('account_transfer', transfer_date)
+
                 # Debit from source account
                 Transaction.objects.create(
                     date=transfer_date,
                     description=f"Transfer to {to_account.name}: {description}",
+                    reference_number=reference_number,
                     account=from_account,
                     transaction_type='debit',
                     amount=amount,
@@ -571,6 +599,7 @@ def account_transfer(request):
                 Transaction.objects.create(
                     date=transfer_date,
                     description=f"Transfer from {from_account.name}: {description}",
+                    reference_number=reference_number,
                     account=to_account,
                     transaction_type='credit',
                     amount=amount,
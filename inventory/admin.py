@@ -1,7 +1,9 @@
 from django.contrib import admin
+from core.admin import SearchIndexAdminMixin
 from .models import (
     Warehouse, MaterialCategory, ProductCategory,
-    RawMaterial, FinishedProduct, InventoryTransaction, StockAlert
+    RawMaterial, FinishedProduct, InventoryTransaction, StockAlert, CostLayer, MaterialLot,
+    StockSnapshot, CycleCount, CycleCountLine
 )
 
 
@@ -25,10 +27,11 @@ class ProductCategoryAdmin(admin.ModelAdmin):
 
 
 @admin.register(RawMaterial)
-class RawMaterialAdmin(admin.ModelAdmin):
+class RawMaterialAdmin(SearchIndexAdminMixin, admin.ModelAdmin):
     list_display = ['code', 'name', 'category', 'unit', 'current_stock', 'minimum_stock', 'stock_status', 'is_active']
-    list_filter = ['category', 'unit', 'is_active', 'created_at']
+    list_filter = ['category', 'unit', 'abc_class', 'xyz_class', 'is_active', 'created_at']
     search_fields = ['code', 'name']
+    search_doc_type = 'material'
     readonly_fields = ['created_at', 'updated_at']
 
     def stock_status(self, obj):
@@ -37,10 +40,11 @@ class RawMaterialAdmin(admin.ModelAdmin):
 
 
 @admin.register(FinishedProduct)
-class FinishedProductAdmin(admin.ModelAdmin):
-    list_display = ['code', 'name', 'category', 'size', 'color', 'current_stock', 'minimum_stock', 'stock_status', 'is_active']
-    list_filter = ['category', 'size', 'color', 'is_active', 'created_at']
+class FinishedProductAdmin(SearchIndexAdminMixin, admin.ModelAdmin):
+    list_display = ['code', 'name', 'category', 'size', 'color', 'current_stock', 'minimum_stock', 'stock_status', 'unit_price', 'standard_cost', 'is_active']
+    list_filter = ['category', 'size', 'color', 'abc_class', 'xyz_class', 'is_active', 'created_at']
     search_fields = ['code', 'name']
+    search_doc_type = 'product'
     readonly_fields = ['created_at', 'updated_at']
 
     def stock_status(self, obj):
@@ -56,6 +60,46 @@ class InventoryTransactionAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at', 'total_value']
 
 
+@admin.register(MaterialLot)
+class MaterialLotAdmin(admin.ModelAdmin):
+    list_display = ['lot_number', 'material', 'warehouse', 'receipt_date', 'expiry_date', 'grade', 'received_quantity', 'quantity']
+    list_filter = ['warehouse', 'grade', 'receipt_date', 'expiry_date']
+    search_fields = ['lot_number', 'material__code', 'material__name']
+    autocomplete_fields = ['material', 'parent']
+    raw_id_fields = ['receipt_line']
+    readonly_fields = ['created_at']
+
+
+@admin.register(CostLayer)
+class CostLayerAdmin(admin.ModelAdmin):
+    list_display = ['material_type', 'material_id', 'received_at', 'quantity', 'unit_cost', 'reference_number']
+    list_filter = ['material_type', 'received_at']
+    search_fields = ['reference_number']
+
+
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['date', 'material_type', 'material_id', 'warehouse', 'quantity']
+    list_filter = ['material_type', 'warehouse', 'date']
+    date_hierarchy = 'date'
+
+
+class CycleCountLineInline(admin.TabularInline):
+    model = CycleCountLine
+    extra = 0
+    fields = ['material_type', 'code', 'name', 'unit', 'system_quantity', 'counted_quantity']
+    readonly_fields = ['material_type', 'code', 'name', 'unit', 'system_quantity']
+
+
+@admin.register(CycleCount)
+class CycleCountAdmin(admin.ModelAdmin):
+    list_display = ['count_number', 'warehouse', 'material_type', 'abc_classes', 'status', 'created_by', 'created_at']
+    list_filter = ['status', 'warehouse', 'created_at']
+    search_fields = ['count_number']
+    readonly_fields = ['count_number', 'created_by', 'created_at', 'posted_by', 'posted_at']
+    inlines = [CycleCountLineInline]
+
+
 @admin.register(StockAlert)
 class StockAlertAdmin(admin.ModelAdmin):
     list_display = ['alert_type', 'material_name', 'current_stock', 'threshold', 'is_resolved', 'created_at']
@@ -0,0 +1,273 @@
+"""
+ABC/XYZ classification and slow-moving stock.
+
+Demand is read per source with one grouped query each: raw material usage
+from production consumptions, finished product demand from shipped and
+delivered sales orders by ship date. Each query returns the quantity per
+item and day over the analysis window (INVENTORY_ANALYSIS setting, see
+DEFAULT_POLICY); the rows are bucketed into an items x months NumPy array
+and every statistic after that is a vectorized operation over the whole
+catalogue. Grouping by day rather than month keeps date functions out of
+the query, which SQLite would run in Python for every row.
+
+* ABC by share of demand value (quantity x unit price): A items make up the
+  first 80% of the value, B the next 15%, C the rest and anything unused.
+* XYZ by coefficient of variation of monthly demand: X is steady, Y
+  variable, Z erratic or never used.
+* Last movement date, kept from earlier runs when an item has not moved
+  within the window, and days since then.
+
+Classes are written back in bulk, only for items whose class or last
+movement changed. They feed the other policies: cycle counts pick
+items due for counting by ABC class (``count_every_days``), and minimum
+stock can be set to cover ``safety_months`` of average demand by XYZ
+class. NumPy is only imported when an analysis runs.
+"""
+from datetime import date, timedelta
+from decimal import ROUND_CEILING, Decimal
+
+from django.conf import settings
+from django.db.models import Max, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import FinishedProduct, RawMaterial
+
+
+DEFAULT_POLICY = {
+    # Months of demand analysed, ending with the current month
+    'months': 24,
+    # Cumulative value share that ends class A and class B
+    'abc_shares': (0.80, 0.95),
+    # Coefficient of variation that ends class X and class Y
+    'xyz_cv': (0.5, 1.0),
+    # Stock not moved for this many days is slow moving
+    'slow_moving_days': 180,
+    # Days between counts of an item, by ABC class ('' not classified)
+    'count_every_days': {'A': 30, 'B': 90, 'C': 180, '': 365},
+    # Months of average demand kept as minimum stock, by XYZ class
+    'safety_months': {'X': 0.5, 'Y': 1.0, 'Z': 2.0},
+}
+
+MODELS = {
+    'raw': RawMaterial,
+    'finished': FinishedProduct,
+}
+
+# Items written per UPDATE
+UPDATE_BATCH_SIZE = 900
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def policy():
+    merged = dict(DEFAULT_POLICY)
+    merged.update(getattr(settings, 'INVENTORY_ANALYSIS', {}))
+    return merged
+
+
+def _demand_rows(material_type, since):
+    """(item id, date, quantity) per item and day since a date; one query"""
+    if material_type == 'raw':
+        from manufacturing.models import MaterialConsumption
+        rows = (
+            MaterialConsumption.objects.annotate(day=TruncDate('consumption_date'))
+            .filter(day__gte=since)
+            .values_list('material_id', 'day')
+            .annotate(quantity=Sum('actual_quantity'))
+        )
+    else:
+        from sales.models import SalesOrderItem
+        rows = (
+            SalesOrderItem.objects.filter(sales_order__status__in=['shipped', 'delivered'])
+            .annotate(day=Coalesce('sales_order__ship_date', 'sales_order__order_date'))
+            .filter(day__gte=since)
+            .values_list('product_id', 'day')
+            .annotate(quantity=Sum('quantity'))
+        )
+    return rows.order_by()
+
+
+def _days(dates, count):
+    """datetime64[D] array of dates, converted through their ordinals"""
+    import numpy as np
+    ordinals = np.fromiter((day.toordinal() for day in dates), dtype=np.int64, count=count)
+    return (ordinals - EPOCH_ORDINAL).astype('datetime64[D]')
+
+
+def analyze(material_type, today=None):
+    """
+    Classify every material or product of a type.
+
+    Returns a dict of NumPy arrays aligned on ``ids``: ``abc``, ``xyz``,
+    ``value`` (demand value over the window), ``share`` (of the total
+    value), ``cv``, ``monthly_mean``, ``last_movement`` (datetime64, NaT
+    when never moved), ``days_since`` (-1 when never moved) and
+    ``current_stock``, plus the stored ``old_*`` values.
+    """
+    import numpy as np
+
+    conf = policy()
+    today = today or timezone.localdate()
+    months = conf['months']
+    first_month = np.datetime64(today, 'M') - (months - 1)
+    since = first_month.astype('datetime64[D]').item()
+
+    items = list(
+        MODELS[material_type].objects.order_by('pk')
+        .values_list('pk', 'unit_price', 'current_stock', 'abc_class', 'xyz_class', 'last_movement_date')
+    )
+    count = len(items)
+    if items:
+        pks, prices, stock, old_abc, old_xyz, old_last = zip(*items)
+    else:
+        pks = prices = stock = old_abc = old_xyz = old_last = ()
+    ids = np.fromiter(pks, dtype=np.int64, count=count)
+    price = np.fromiter(prices, dtype=np.float64, count=count)
+    old_last = np.array(old_last, dtype='datetime64[D]')
+
+    demand = np.zeros((count, months))
+    last = np.full(count, np.datetime64('NaT'), dtype='datetime64[D]')
+    rows = list(_demand_rows(material_type, since))
+    if rows and count:
+        row_ids, row_days, quantities = zip(*rows)
+        row_ids = np.fromiter(row_ids, dtype=np.int64, count=len(rows))
+        row_days = _days(row_days, len(rows))
+        period = (row_days.astype('datetime64[M]') - first_month).astype(np.int64)
+        index = np.minimum(np.searchsorted(ids, row_ids), count - 1)
+        # Movements of deleted items or outside the window are dropped
+        keep = (ids[index] == row_ids) & (period >= 0) & (period < months)
+        np.add.at(demand, (index[keep], period[keep]), np.fromiter(quantities, dtype=np.float64, count=len(rows))[keep])
+        latest = np.full(count, np.iinfo(np.int64).min)
+        np.maximum.at(latest, index[keep], row_days.astype(np.int64)[keep])
+        moved = latest != np.iinfo(np.int64).min
+        last[moved] = latest[moved].astype('datetime64[D]')
+    # Keep the last movement found by earlier runs for items idle in the window
+    last = np.where(np.isnat(last) | (~np.isnat(old_last) & (old_last > last)), old_last, last)
+
+    value = demand.sum(axis=1) * price
+    total = value.sum()
+    order = np.argsort(-value, kind='stable')
+    share = value / total if total > 0 else np.zeros(count)
+    preceding = np.empty(count)
+    preceding[order] = np.cumsum(share[order]) - share[order]
+    a_share, b_share = conf['abc_shares']
+    abc = np.where(value <= 0, 'C', np.where(preceding < a_share, 'A', np.where(preceding < b_share, 'B', 'C')))
+
+    mean = demand.mean(axis=1)
+    cv = np.divide(demand.std(axis=1), mean, out=np.full(count, np.inf), where=mean > 0)
+    x_cv, y_cv = conf['xyz_cv']
+    xyz = np.where(cv <= x_cv, 'X', np.where(cv <= y_cv, 'Y', 'Z'))
+
+    days_since = np.where(
+        np.isnat(last), -1, (np.datetime64(today, 'D') - last).astype('timedelta64[D]').astype(np.int64)
+    )
+    return {
+        'ids': ids,
+        'abc': abc,
+        'xyz': xyz,
+        'value': value,
+        'share': share,
+        'cv': cv,
+        'monthly_mean': mean,
+        'last_movement': last,
+        'days_since': days_since,
+        'current_stock': np.fromiter(stock, dtype=np.float64, count=count),
+        'old_abc': np.array(old_abc, dtype='<U1'),
+        'old_xyz': np.array(old_xyz, dtype='<U1'),
+        'old_last': old_last,
+    }
+
+
+def minimum_stock(material_type, monthly_mean, xyz_class):
+    """Minimum stock covering the class's safety months of average demand"""
+    quantity = Decimal(str(monthly_mean * policy()['safety_months'][xyz_class]))
+    if material_type == 'finished':
+        return int(quantity.to_integral_value(rounding=ROUND_CEILING))
+    return quantity.quantize(Decimal('0.01'), rounding=ROUND_CEILING)
+
+
+def _grouped_update(model, ids, keys, values_for):
+    """Set ``values_for(key)`` on the items of each distinct key, one UPDATE per key and batch of ids"""
+    import numpy as np
+
+    if not len(ids):
+        return
+    unique, inverse = np.unique(keys, return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+    bounds = np.cumsum(np.bincount(inverse, minlength=len(unique)))[:-1]
+    for key, group in zip(unique, np.split(ids[order], bounds)):
+        values = values_for(key)
+        group = group.tolist()
+        for start in range(0, len(group), UPDATE_BATCH_SIZE):
+            model.objects.filter(pk__in=group[start:start + UPDATE_BATCH_SIZE]).update(**values)
+
+
+def apply(material_type, result, update_minimum_stock=False):
+    """
+    Write the classes of an ``analyze`` result back; returns how many items changed.
+
+    Items are updated in groups sharing a class pair or last movement date,
+    so a full reclassification is a few hundred UPDATEs rather than a CASE
+    per item. Minimum stock, when asked for, differs per item and is
+    written with ``bulk_update``.
+    """
+    import numpy as np
+
+    model = MODELS[material_type]
+    ids = result['ids']
+    classes = np.char.add(result['abc'], result['xyz'])
+    class_changed = classes != np.char.add(result['old_abc'], result['old_xyz'])
+    _grouped_update(model, ids[class_changed], classes[class_changed],
+                    lambda key: {'abc_class': str(key[0]), 'xyz_class': str(key[1])})
+
+    # NaT becomes the smallest int64, so never-moved items group together
+    last = result['last_movement'].astype(np.int64)
+    old_last = result['old_last'].astype(np.int64)
+    never = np.iinfo(np.int64).min
+    last_changed = last != old_last
+    _grouped_update(model, ids[last_changed], last[last_changed],
+                    lambda key: {'last_movement_date': None if key == never else np.datetime64(int(key), 'D').item()})
+
+    if update_minimum_stock:
+        model.objects.bulk_update([
+            model(pk=int(pk), minimum_stock=minimum_stock(material_type, float(mean), str(xyz)))
+            for pk, mean, xyz in zip(ids, result['monthly_mean'], result['xyz'])
+        ], ['minimum_stock'], batch_size=UPDATE_BATCH_SIZE)
+    return int(np.count_nonzero(class_changed | last_changed))
+
+
+def run(material_types=('raw', 'finished'), update_minimum_stock=False, today=None):
+    """
+    Analyse and classify each material type.
+
+    Returns ``{material_type: summary}`` with the items analysed and
+    updated, the count per ABC and XYZ class and the slow-moving items in
+    stock.
+    """
+    import numpy as np
+
+    slow_days = policy()['slow_moving_days']
+    summary = {}
+    for material_type in material_types:
+        result = analyze(material_type, today)
+        in_stock = result['current_stock'] > 0
+        slow = in_stock & ((result['days_since'] < 0) | (result['days_since'] >= slow_days))
+        summary[material_type] = {
+            'items': len(result['ids']),
+            'updated': apply(material_type, result, update_minimum_stock),
+            'abc': {label: int(np.count_nonzero(result['abc'] == label)) for label in 'ABC'},
+            'xyz': {label: int(np.count_nonzero(result['xyz'] == label)) for label in 'XYZ'},
+            'slow_moving': int(np.count_nonzero(slow)),
+        }
+    return summary
+
+
+def slow_moving(material_type, today=None):
+    """Items in stock not consumed or sold for ``slow_moving_days``, from the stored analysis"""
+    today = today or timezone.localdate()
+    cutoff = today - timedelta(days=policy()['slow_moving_days'])
+    return MODELS[material_type].objects.filter(
+        Q(last_movement_date__lt=cutoff) | Q(last_movement_date__isnull=True),
+        is_active=True, current_stock__gt=0,
+    )
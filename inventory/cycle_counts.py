@@ -0,0 +1,301 @@
+"""
+Cycle counting.
+
+A count sheet (CycleCount) lists the items to count in one warehouse,
+chosen by type and ABC class, optionally only those the books show in
+stock there or those due for counting: A items are counted more often than
+C items (``count_every_days`` in the inventory analysis policy). Each line keeps the item's book quantity in the warehouse when
+the sheet was made (``history.stock_by_warehouse``) and the quantity
+counted, entered on the sheet page or uploaded as the XLSX sheet filled in.
+Uploads are read in openpyxl's read-only mode, a row at a time, and written
+back with bulk updates.
+
+Posting a sheet books every difference in one transaction: stock on hand is
+moved by the variance with one UPDATE per few hundred items, the
+adjustments are written to the InventoryTransaction ledger (IN for stock
+found, ADJ for stock missing) and the cost layers in bulk. Raw material
+lots in the counted warehouse follow: missing stock is taken off the lots
+expiring first (the order lots are consumed in, see lots), read with one
+query and decremented together, and stock found is put in a new adjustment
+lot. Lines left uncounted are not adjusted. Variances are applied to the
+stock as it is when posting, so movements between making the sheet and
+posting it are kept.
+"""
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+import openpyxl
+from django.db import transaction
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, IntegerField, Max, Value, When
+from django.utils import timezone
+
+from core.numbering import next_number, next_numbers
+
+from . import analysis, details, history, lots, valuation
+from .models import CycleCount, CycleCountLine, FinishedProduct, InventoryTransaction, MaterialLot, RawMaterial
+
+
+# Lines written or updated per query
+LINE_BATCH_SIZE = 1000
+
+# Items whose stock is moved by one UPDATE when posting
+POST_BATCH_SIZE = 500
+
+SHEET_HEADERS = ['Type', 'Code', 'Name', 'Unit', 'Counted Quantity']
+
+MODELS = {
+    'raw': RawMaterial,
+    'finished': FinishedProduct,
+}
+
+VARIANCE = ExpressionWrapper(
+    F('counted_quantity') - F('system_quantity'), output_field=DecimalField(max_digits=12, decimal_places=2)
+)
+
+VARIANCE_VALUE = ExpressionWrapper(
+    (F('counted_quantity') - F('system_quantity')) * F('unit_price'),
+    output_field=DecimalField(max_digits=16, decimal_places=2),
+)
+
+
+def due_for_count(material_type, today=None):
+    """Ids of active items not counted within their ABC class's interval (``count_every_days``)"""
+    today = today or timezone.localdate()
+    intervals = analysis.policy()['count_every_days']
+    last_counted = dict(
+        CycleCountLine.objects.filter(
+            material_type=material_type, cycle_count__status='posted', counted_quantity__isnull=False
+        )
+        .order_by()
+        .values_list('material_id')
+        .annotate(last=Max('cycle_count__posted_at'))
+    )
+    due = set()
+    for pk, abc_class in MODELS[material_type].objects.filter(is_active=True).values_list('pk', 'abc_class').iterator():
+        counted = last_counted.get(pk)
+        if counted is None or (today - timezone.localdate(counted)).days >= intervals.get(abc_class, intervals['']):
+            due.add(pk)
+    return due
+
+
+@transaction.atomic
+def create_count(warehouse, user, material_type='', abc_classes='', stocked_only=False, due_only=False, notes=''):
+    """Make a count sheet for a warehouse; returns the CycleCount"""
+    on_hand = {
+        (row_type, material_id): quantity
+        for (row_type, material_id, warehouse_id), quantity
+        in history.stock_by_warehouse(material_type or None).items()
+        if warehouse_id == warehouse.pk
+    }
+
+    count = CycleCount.objects.create(
+        count_number=next_number('cycle_count'),
+        warehouse=warehouse,
+        material_type=material_type,
+        abc_classes=abc_classes,
+        notes=notes,
+        created_by=user,
+    )
+    lines = []
+    for row_type, model in MODELS.items():
+        if material_type and row_type != material_type:
+            continue
+        items = model.objects.filter(is_active=True)
+        if abc_classes:
+            items = items.filter(abc_class__in=list(abc_classes))
+        due = due_for_count(row_type) if due_only else None
+        fields = ['pk', 'code', 'name', valuation.COST_FIELDS[row_type]] + (['unit'] if row_type == 'raw' else [])
+        for pk, code, name, unit_price, *unit in items.order_by('code').values_list(*fields).iterator():
+            quantity = on_hand.get((row_type, pk), Decimal('0'))
+            if (stocked_only and not quantity) or (due is not None and pk not in due):
+                continue
+            lines.append(CycleCountLine(
+                cycle_count=count, material_type=row_type, material_id=pk, code=code, name=name,
+                unit=unit[0] if unit else 'pcs', unit_price=unit_price, system_quantity=quantity,
+            ))
+    CycleCountLine.objects.bulk_create(lines, batch_size=LINE_BATCH_SIZE)
+    return count
+
+
+def parse_quantity(value, material_type):
+    """Counted quantity from a form field or sheet cell; None when blank, ValueError when invalid"""
+    if value is None or str(value).strip() == '':
+        return None
+    try:
+        quantity = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"'{value}' is not a number")
+    if not quantity.is_finite() or quantity < 0:
+        raise ValueError(f"'{value}' is not a valid quantity")
+    if material_type == 'finished' and quantity != quantity.to_integral_value():
+        raise ValueError("Finished products are counted in whole units")
+    return quantity.quantize(Decimal('0.01'))
+
+
+def save_counts(lines):
+    """Write the counted quantity of CycleCountLine objects in bulk"""
+    CycleCountLine.objects.bulk_update(lines, ['counted_quantity'], batch_size=LINE_BATCH_SIZE)
+
+
+def write_sheet(count, stream):
+    """Write a count sheet as XLSX to a file-like object, without book quantities"""
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(count.count_number)
+    ws.append(SHEET_HEADERS)
+    rows = count.lines.values_list('material_type', 'code', 'name', 'unit', 'counted_quantity')
+    for material_type, code, name, unit, counted in rows.iterator():
+        ws.append([material_type, code, name, unit, counted])
+    wb.save(stream)
+
+
+def read_sheet(count, excel_file):
+    """
+    Take the counted quantities from an uploaded count sheet.
+
+    Rows are matched to lines by type and code; blank counts are skipped.
+    Returns (lines updated, error messages).
+    """
+    lines = {
+        (material_type, code): pk
+        for pk, material_type, code in count.lines.values_list('pk', 'material_type', 'code').iterator()
+    }
+    wb = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
+    counted, errors = [], []
+    try:
+        for row_num, row in enumerate(wb.active.iter_rows(min_row=2, values_only=True), start=2):
+            if not row or not any(row):
+                continue
+            material_type, code = (str(value or '').strip() for value in row[:2])
+            quantity = row[4] if len(row) > 4 else None
+            pk = lines.get((material_type, code))
+            if pk is None:
+                errors.append(f"Row {row_num}: {material_type} {code} is not on this count sheet")
+                continue
+            try:
+                quantity = parse_quantity(quantity, material_type)
+            except ValueError as e:
+                errors.append(f"Row {row_num}: {e}")
+                continue
+            if quantity is not None:
+                counted.append(CycleCountLine(pk=pk, counted_quantity=quantity))
+    finally:
+        wb.close()
+    save_counts(counted)
+    return len(counted), errors
+
+
+def variances(count):
+    """Counted lines that differ from the books, with the variance and its value"""
+    return (
+        count.lines.filter(counted_quantity__isnull=False)
+        .annotate(variance=VARIANCE, variance_value=VARIANCE_VALUE)
+        .exclude(variance=0)
+    )
+
+
+def _move_stock(material_type, changes):
+    """Add ``{material_id: quantity}`` to stock on hand, a few hundred items per UPDATE"""
+    model = MODELS[material_type]
+    output_field = IntegerField() if material_type == 'finished' else DecimalField(max_digits=10, decimal_places=2)
+    ids = sorted(changes)
+    now = timezone.now()
+    for start in range(0, len(ids), POST_BATCH_SIZE):
+        chunk = ids[start:start + POST_BATCH_SIZE]
+        model.objects.filter(pk__in=chunk).update(
+            current_stock=F('current_stock') + Case(
+                *[When(pk=pk, then=Value(changes[pk])) for pk in chunk],
+                default=Value(0),
+                output_field=output_field,
+            ),
+            updated_at=now,
+        )
+    details.invalidate(material_type, ids)
+
+
+def _adjust_lots(count, found, missing):
+    """
+    Move the raw material lots of the counted warehouse by the variances:
+    ``missing`` ``{material_id: quantity}`` comes off the lots expiring
+    first, ``found`` goes into one new lot per material.
+    """
+    taken = {}
+    remaining = dict(missing)
+    candidates = MaterialLot.objects.select_for_update().filter(
+        material_id__in=remaining, warehouse_id=count.warehouse_id, quantity__gt=0,
+    ).order_by('material_id', *lots.ALLOCATION_ORDER)
+    for pk, material_id, quantity in candidates.values_list('pk', 'material_id', 'quantity').iterator():
+        if remaining[material_id] > 0:
+            taken[pk] = min(remaining[material_id], quantity)
+            remaining[material_id] -= taken[pk]
+    ids = list(taken)
+    for start in range(0, len(ids), POST_BATCH_SIZE):
+        lots._decrement({pk: taken[pk] for pk in ids[start:start + POST_BATCH_SIZE]})
+
+    if found:
+        today = timezone.localdate()
+        MaterialLot.objects.bulk_create([
+            MaterialLot(
+                lot_number=lot_number, material_id=material_id, warehouse_id=count.warehouse_id,
+                receipt_date=today, received_quantity=quantity, quantity=quantity, unit_cost=unit_cost,
+            )
+            for lot_number, (material_id, (quantity, unit_cost)) in zip(
+                next_numbers('material_lot', len(found)), sorted(found.items())
+            )
+        ], batch_size=LINE_BATCH_SIZE)
+
+
+@transaction.atomic
+def post_count(count, user):
+    """
+    Book the variances of a count sheet; returns (lines adjusted, net value).
+
+    Raises ValueError when the sheet is not being counted any more.
+    """
+    count = CycleCount.objects.select_for_update().get(pk=count.pk)
+    if count.status != 'counting':
+        raise ValueError(f"{count.count_number} is {count.get_status_display().lower()}")
+
+    rows = list(variances(count).values_list('material_type', 'material_id', 'name', 'unit_price', 'variance'))
+    changes = defaultdict(dict)
+    receipts, issues, movements = [], [], []
+    found, missing = {}, {}     # raw material lots to adjust
+    net_value = Decimal('0')
+    for material_type, material_id, name, unit_price, variance in rows:
+        variance = Decimal(str(variance)).quantize(Decimal('0.01'))
+        changes[material_type][material_id] = int(variance) if material_type == 'finished' else variance
+        if variance > 0:
+            receipts.append((material_type, material_id, variance, unit_price, count.count_number))
+            if material_type == 'raw':
+                found[material_id] = (variance, unit_price)
+        else:
+            issues.append((material_type, material_id, -variance))
+            if material_type == 'raw':
+                missing[material_id] = -variance
+        quantity = abs(variance)
+        net_value += variance * unit_price
+        movements.append(InventoryTransaction(
+            transaction_type='IN' if variance > 0 else 'ADJ',
+            material_type=material_type,
+            material_id=material_id,
+            material_name=name,
+            quantity=quantity,
+            unit_price=unit_price,
+            total_value=quantity * unit_price,
+            reference_number=count.count_number,
+            notes=f"Cycle count {count.count_number}",
+            warehouse_id=count.warehouse_id,
+            created_by=user,
+        ))
+
+    for material_type, material_changes in changes.items():
+        _move_stock(material_type, material_changes)
+    valuation.receive(receipts)
+    valuation.issue(issues)
+    _adjust_lots(count, found, missing)
+    InventoryTransaction.objects.bulk_create(movements, batch_size=LINE_BATCH_SIZE)
+
+    count.status = 'posted'
+    count.posted_by = user
+    count.posted_at = timezone.now()
+    count.save(update_fields=['status', 'posted_by', 'posted_at'])
+    return len(rows), net_value.quantize(Decimal('0.01'))
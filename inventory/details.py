@@ -0,0 +1,104 @@
+"""
+Material and product details for the AJAX helpers of BOM and stock forms.
+
+Forms used to ask for one material per row. ``get_details`` answers for a
+whole batch of ids: each material's details are kept in the Django cache
+under its own key, so a batch is one ``get_many`` and a single query for
+whatever was not cached. Entries are dropped when the material is saved or
+deleted (see signals) and by bulk stock updates that bypass ``save()``.
+
+The views answer with an ETag and Last-Modified built from the
+``updated_at`` of the materials returned and mark the response for
+revalidation, so repeating a batch that has not changed costs the browser
+a 304 and the server a cache read.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+
+from .models import FinishedProduct, RawMaterial
+
+
+# Seconds a material's details stay cached without being invalidated
+CACHE_TIMEOUT = 600
+
+# Most ids answered by one batch request
+MAX_BATCH = 500
+
+MODELS = {
+    'raw': RawMaterial,
+    'finished': FinishedProduct,
+}
+
+
+def cache_key(material_type, pk):
+    return f'inventory:details:{material_type}:{pk}'
+
+
+def serialize(material):
+    return {
+        'id': material.pk,
+        'code': material.code,
+        'name': material.name,
+        'current_stock': str(material.current_stock),
+        'unit': getattr(material, 'unit', 'pcs'),
+        'unit_price': str(material.unit_price),
+        'updated_at': material.updated_at.isoformat(),
+    }
+
+
+def parse_ids(values):
+    """Unique ids from ``?ids=1,2&ids=3`` style values; ValueError on junk"""
+    ids = []
+    for value in values:
+        for part in value.split(','):
+            part = part.strip()
+            if part:
+                ids.append(int(part))
+    return list(dict.fromkeys(ids))
+
+
+def get_details(material_type, ids):
+    """``{id: details}`` for the ids that exist; at most one query"""
+    keys = {pk: cache_key(material_type, pk) for pk in ids}
+    cached = cache.get_many(keys.values())
+    details = {pk: cached[key] for pk, key in keys.items() if key in cached}
+    missing = [pk for pk in ids if pk not in details]
+    if missing:
+        loaded = {material.pk: serialize(material) for material in MODELS[material_type].objects.filter(pk__in=missing)}
+        cache.set_many({keys[pk]: data for pk, data in loaded.items()}, CACHE_TIMEOUT)
+        details.update(loaded)
+    return details
+
+
+def invalidate(material_type, ids):
+    """Drop cached details once the current transaction commits"""
+    keys = [cache_key(material_type, pk) for pk in ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def validators(details, requested):
+    """(etag, last_modified) for a response carrying ``details`` for ``requested`` ids"""
+    stamps = ','.join(f"{pk}:{details[pk]['updated_at'] if pk in details else '-'}" for pk in requested)
+    etag = '"%s"' % hashlib.md5(stamps.encode()).hexdigest()
+    last_modified = max((parse_datetime(data['updated_at']) for data in details.values()), default=None)
+    return etag, last_modified
+
+
+def conditional_json(request, payload, details, requested):
+    """JsonResponse of ``payload`` with validators, or a 304 if the client's copy is current"""
+    etag, last_modified = validators(details, requested)
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = JsonResponse(payload)
+    response['ETag'] = etag
+    if timestamp:
+        response['Last-Modified'] = http_date(timestamp)
+    # Always revalidate: the details carry stock levels
+    patch_cache_control(response, private=True, no_cache=True)
+    return get_conditional_response(request, etag=etag, last_modified=timestamp, response=response)
@@ -38,14 +38,14 @@ class RawMaterialForm(forms.ModelForm):
         decimal_places=2,
         required=False,
         widget=forms.NumberInput(attrs={'step': '0.01', 'readonly': True}),
-        help_text="Total value calculated as unit_price × current_stock"
+        help_text="Value of the stock on hand from its cost layers"
     )
 
     class Meta:
         model = RawMaterial
         fields = [
             'code', 'name', 'category', 'unit', 'description',
-            'minimum_stock', 'current_stock', 'unit_price', 'is_active'
+            'minimum_stock', 'current_stock', 'unit_price', 'abc_class', 'is_active'
         ]
         widgets = {
             'description': forms.Textarea(attrs={'rows': 3}),
@@ -63,7 +63,7 @@ class FinishedProductForm(forms.ModelForm):
         model = FinishedProduct
         fields = [
             'code', 'name', 'category', 'size', 'color', 'description',
-            'current_stock', 'minimum_stock', 'unit_price', 'is_active'
+            'current_stock', 'minimum_stock', 'unit_price', 'abc_class', 'is_active'
         ]
         widgets = {
             'description': forms.Textarea(attrs={'rows': 3}),
@@ -118,4 +118,36 @@ class StockAdjustmentForm(forms.Form):
     warehouse = forms.ModelChoiceField(
         queryset=Warehouse.objects.filter(is_active=True),
         widget=forms.Select(attrs={'class': 'form-control'})
-    )
\ No newline at end of file
+    )
+
+class CycleCountForm(forms.Form):
+    warehouse = forms.ModelChoiceField(
+        queryset=Warehouse.objects.filter(is_active=True),
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    material_type = forms.ChoiceField(
+        choices=[('', 'All Items'), ('raw', 'Raw Material'), ('finished', 'Finished Product')],
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    abc_classes = forms.MultipleChoiceField(
+        choices=RawMaterial.ABC_CLASSES,
+        required=False,
+        widget=forms.CheckboxSelectMultiple(),
+        help_text="Leave empty to count every class"
+    )
+    stocked_only = forms.BooleanField(
+        required=False,
+        label="Only items in stock in this warehouse",
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+    due_only = forms.BooleanField(
+        required=False,
+        label="Only items due for counting",
+        help_text="Items not counted within their ABC class's counting interval",
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+    notes = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 3})
+    )
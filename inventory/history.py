@@ -0,0 +1,240 @@
+"""
+Stock on hand at a point in time.
+
+current_stock only says what is on hand now. ``take_snapshot`` records the
+stock of every item in every warehouse at the end of a day as StockSnapshot
+rows, written in bulk and only for items in stock, plus a zero row for
+those that ran out since the previous snapshot, so a snapshot costs about
+one row per item actually in stock. It is meant to run daily (the
+``snapshot_stock`` command).
+
+Between snapshots stock moves through InventoryTransaction rows: IN adds
+stock, OUT and ADJ (a downward stock adjustment) take it out. A snapshot is
+the previous snapshot plus the movements since, per warehouse. The total of
+each item is then reconciled with current_stock less the movements after
+the day, and any difference (stock edited by hand, movements recorded
+elsewhere) is booked to the default warehouse, so errors never carry over
+from one snapshot to the next.
+
+``stock_as_of`` answers for any date with the nearest snapshot on or before
+it plus the movements after it. ``daily_stock`` reads a year of an item's
+history from its own snapshot rows with one grouped query, and
+``stock_movements`` lists its movements with a running balance computed by
+a window function.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Max, Subquery, Sum, Value, When, Window
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .lots import default_warehouse
+from .models import FinishedProduct, InventoryTransaction, RawMaterial, StockSnapshot
+
+
+# Transaction types that add stock; every other type takes it out
+INBOUND_TYPES = ['IN']
+
+SNAPSHOT_BATCH_SIZE = 2000
+
+ZERO = Decimal('0')
+CENT = Decimal('0.01')
+
+QUANTITY = DecimalField(max_digits=12, decimal_places=2)
+
+SIGNED_QUANTITY = Case(
+    When(transaction_type__in=INBOUND_TYPES, then=F('quantity')),
+    default=-F('quantity'),
+    output_field=QUANTITY,
+)
+
+MODELS = {
+    'raw': RawMaterial,
+    'finished': FinishedProduct,
+}
+
+
+def end_of_day(day):
+    """Start of the next day, as an aware datetime in the current time zone"""
+    return timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def _items(queryset, material_type=None, material_ids=None):
+    if material_type:
+        queryset = queryset.filter(material_type=material_type)
+    if material_ids is not None:
+        queryset = queryset.filter(material_id__in=material_ids)
+    return queryset
+
+
+def snapshot_date(on_or_before):
+    """Date of the latest snapshot taken on or before a day, or None"""
+    return StockSnapshot.objects.filter(date__lte=on_or_before).aggregate(date=Max('date'))['date']
+
+
+def _snapshot(day, material_type=None, material_ids=None):
+    rows = _items(StockSnapshot.objects.filter(date=day), material_type, material_ids)
+    return {
+        (row_type, material_id, warehouse_id): quantity
+        for row_type, material_id, warehouse_id, quantity
+        in rows.values_list('material_type', 'material_id', 'warehouse_id', 'quantity').iterator()
+    }
+
+
+def _movements(after=None, through=None, material_type=None, material_ids=None, by_warehouse=True):
+    """Net stock moved per item (and warehouse) after one day through another"""
+    movements = InventoryTransaction.objects.all()
+    if after is not None:
+        movements = movements.filter(created_at__gte=end_of_day(after))
+    if through is not None:
+        movements = movements.filter(created_at__lt=end_of_day(through))
+    keys = ['material_type', 'material_id'] + (['warehouse_id'] if by_warehouse else [])
+    rows = (
+        _items(movements, material_type, material_ids)
+        .order_by()
+        .values(*keys)
+        .annotate(change=Sum(SIGNED_QUANTITY))
+    )
+    return {tuple(row[key] for key in keys): row['change'] for row in rows}
+
+
+def stock_as_of(day, material_type=None, material_ids=None):
+    """
+    ``{(material_type, material_id, warehouse_id): quantity}`` on hand at the end of a day.
+
+    Starts from the nearest snapshot on or before the day and adds the
+    movements recorded after it. Items with nothing on hand are left out.
+    """
+    base_day = snapshot_date(day)
+    stock = defaultdict(Decimal)
+    if base_day is not None:
+        for key, quantity in _snapshot(base_day, material_type, material_ids).items():
+            stock[key] += quantity
+    for key, change in _movements(base_day, day, material_type, material_ids).items():
+        stock[key] += change
+    return {key: quantity for key, quantity in stock.items() if quantity}
+
+
+def _reconcile(stock, day, material_type=None):
+    """Book the difference between each item's total and current_stock less later movements to the default warehouse"""
+    totals = defaultdict(Decimal)
+    for (row_type, material_id, _warehouse_id), quantity in stock.items():
+        totals[row_type, material_id] += quantity
+    later = _movements(after=day, material_type=material_type, by_warehouse=False)
+    warehouse = default_warehouse()
+    if warehouse is None:
+        return
+    for row_type, model in MODELS.items():
+        if material_type and row_type != material_type:
+            continue
+        for pk, current in model.objects.values_list('pk', 'current_stock').iterator():
+            key = (row_type, pk)
+            difference = Decimal(current) - later.get(key, ZERO) - totals.get(key, ZERO)
+            if difference:
+                stock[row_type, pk, warehouse.pk] = stock.get((row_type, pk, warehouse.pk), ZERO) + difference
+
+
+def stock_by_warehouse(material_type=None):
+    """
+    ``{(material_type, material_id, warehouse_id): quantity}`` on hand now.
+
+    ``stock_as_of`` today, with each item's total reconciled with its
+    current_stock like a snapshot, so stock not yet in any snapshot or
+    movement is found in the default warehouse.
+    """
+    day = timezone.localdate()
+    stock = stock_as_of(day, material_type)
+    _reconcile(stock, day, material_type)
+    return {key: quantity for key, quantity in stock.items() if quantity}
+
+
+@transaction.atomic
+def take_snapshot(day=None):
+    """Record stock on hand per item and warehouse at the end of a day; returns rows written"""
+    day = day or timezone.localdate()
+    previous = StockSnapshot.objects.filter(date__lt=day).aggregate(date=Max('date'))['date']
+
+    # Roll the previous snapshot forward with the day's movements
+    previous_stock = _snapshot(previous) if previous is not None else {}
+    stock = defaultdict(Decimal, previous_stock)
+    for key, change in _movements(previous, day).items():
+        stock[key] += change
+
+    _reconcile(stock, day)
+
+    # Write what is in stock, and a zero row for what ran out since the previous snapshot
+    StockSnapshot.objects.filter(date=day).delete()
+    snapshots = [
+        StockSnapshot(date=day, material_type=material_type, material_id=material_id,
+                      warehouse_id=warehouse_id, quantity=quantity)
+        for (material_type, material_id, warehouse_id), quantity in stock.items()
+        if quantity or previous_stock.get((material_type, material_id, warehouse_id))
+    ]
+    StockSnapshot.objects.bulk_create(snapshots, batch_size=SNAPSHOT_BATCH_SIZE)
+    return len(snapshots)
+
+
+def daily_stock(material_type, material_id, start, end):
+    """
+    ``[(date, quantity), ...]`` for every day from start to end.
+
+    One query over the item's snapshot rows: the last snapshot on or before
+    start and every snapshot up to end, totalled over warehouses. Days
+    without a snapshot carry the previous total forward.
+    """
+    rows = StockSnapshot.objects.filter(material_type=material_type, material_id=material_id)
+    anchor = (
+        rows.filter(date__lte=start)
+        .order_by()
+        .values('material_id')
+        .annotate(date=Max('date'))
+        .values('date')
+    )
+    totals = (
+        rows.filter(date__gte=Coalesce(Subquery(anchor), Value(start)), date__lte=end)
+        .order_by('date')
+        .values('date')
+        .annotate(quantity=Sum('quantity'))
+    )
+    # SQLite sums decimals as floats
+    by_date = {row['date']: Decimal(str(row['quantity'])).quantize(CENT) for row in totals}
+
+    history, quantity = [], ZERO
+    for anchor_date in sorted(day for day in by_date if day < start)[-1:]:
+        quantity = by_date[anchor_date]
+    day = start
+    while day <= end:
+        quantity = by_date.get(day, quantity)
+        history.append((day, quantity))
+        day += timedelta(days=1)
+    return history
+
+
+def stock_movements(material_type, material_id, start, end):
+    """
+    An item's movements from start to end with the stock on hand after each.
+
+    The opening balance comes from ``stock_as_of`` the day before start
+    (before the first snapshot only the movements are known); the running
+    balance is a window SUM over the movements.
+    """
+    opening = sum(stock_as_of(start - timedelta(days=1), material_type, [material_id]).values(), ZERO)
+    movements = (
+        InventoryTransaction.objects.filter(
+            material_type=material_type, material_id=material_id,
+            created_at__gte=end_of_day(start - timedelta(days=1)), created_at__lt=end_of_day(end),
+        )
+        .annotate(
+            change=SIGNED_QUANTITY,
+            balance=Window(Sum(SIGNED_QUANTITY), order_by=[F('created_at').asc(), F('id').asc()]),
+        )
+        .order_by('created_at', 'id')
+        .values('created_at', 'transaction_type', 'reference_number', 'warehouse__name', 'change', 'balance')
+    )
+    rows = list(movements)
+    for row in rows:
+        row['balance'] += opening
+    return opening, rows
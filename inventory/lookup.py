@@ -0,0 +1,111 @@
+"""
+Typeahead lookups for raw materials and finished products.
+
+Forms used to render every active material or product into each row's
+<select>. Those fields now render only their current choice (LookupSelect)
+and fetch matches from a JSON endpoint as the user types.
+
+The endpoint answers from a process-wide prefix index per model: every
+word of each active item's code and name, sorted, so the items with a word
+starting with the typed text are one bisect away. A query of several words
+looks up the word with the fewest matches and checks the other words
+against those items only. Recent answers are kept in a small LRU. The
+index is rebuilt lazily after an item is saved or deleted (see signals).
+"""
+import re
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+
+from .models import FinishedProduct, RawMaterial
+
+
+# Matches returned by default and at most
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 50
+
+# Answers remembered per index
+CACHED_QUERIES = 512
+
+_WORDS = re.compile(r'\w+')
+
+
+def words(text):
+    return _WORDS.findall((text or '').lower())
+
+
+class LookupIndex:
+    """Process-wide prefix index over the active items of one model"""
+
+    def __init__(self, model, data_fields=None):
+        self.model = model
+        self.data_fields = data_fields or {}    # data key -> model field sent with each match
+        self._lock = threading.Lock()
+        self._items = None      # [{'id', 'text', 'data'}, ...] in code order
+        self._words = None      # [set of words of each item, ...]
+        self._keys = None       # sorted [(word, item position), ...]
+        self._answers = OrderedDict()
+
+    def invalidate(self):
+        """Drop the index; it is rebuilt on next access"""
+        with self._lock:
+            self._items = None
+            self._answers.clear()
+
+    def _load(self):
+        items, item_words, keys = [], [], []
+        for position, obj in enumerate(self.model.objects.filter(is_active=True).order_by('code').iterator()):
+            items.append({
+                'id': obj.pk,
+                'text': str(obj),
+                'data': {key: str(getattr(obj, field)) for key, field in self.data_fields.items()},
+            })
+            found = set(words(obj.code)) | set(words(obj.name))
+            item_words.append(found)
+            keys.extend((word, position) for word in found)
+        keys.sort()
+        self._items, self._words, self._keys = items, item_words, keys
+
+    def _prefix_range(self, prefix):
+        start = bisect_left(self._keys, (prefix,))
+        end = bisect_left(self._keys, (prefix + '\uffff',))
+        return start, end
+
+    def _find(self, terms, limit):
+        if not terms:
+            return self._items[:limit]
+        # Start from the word with the fewest matching keys
+        ranges = sorted(((self._prefix_range(term), term) for term in terms), key=lambda item: item[0][1] - item[0][0])
+        (start, end), _term = ranges[0]
+        positions = sorted({position for _word, position in self._keys[start:end]})
+        others = [term for _range, term in ranges[1:]]
+        matches = []
+        for position in positions:
+            item_words = self._words[position]
+            if all(any(word.startswith(term) for word in item_words) for term in others):
+                matches.append(self._items[position])
+                if len(matches) >= limit:
+                    break
+        return matches
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Up to ``limit`` active items with a word starting with every word of the query"""
+        terms = tuple(words(query))
+        key = (terms, limit)
+        with self._lock:
+            if self._items is None:
+                self._load()
+            if key in self._answers:
+                self._answers.move_to_end(key)
+                return self._answers[key]
+            matches = self._find(terms, limit)
+            self._answers[key] = matches
+            if len(self._answers) > CACHED_QUERIES:
+                self._answers.popitem(last=False)
+            return matches
+
+
+LOOKUPS = {
+    'materials': LookupIndex(RawMaterial, {'price': 'unit_price', 'unit': 'unit'}),
+    'products': LookupIndex(FinishedProduct, {'price': 'unit_price'}),
+}
@@ -0,0 +1,262 @@
+"""
+Lot tracking for raw materials.
+
+Hides and rubber batches differ from lot to lot, so stock of a raw material
+is also held as MaterialLot rows: one per goods receipt line and warehouse,
+with its receipt date, expiry date and grade. RawMaterial.current_stock
+stays the total on hand.
+
+Consumption takes stock from the lots that expire first, then the oldest
+(FEFO, then FIFO); expired lots are never allocated. Candidates are read
+in allocation order through a partial index over lots with stock left, a
+few at a time until the quantity is covered, and decremented together in
+one UPDATE.
+
+Receipts and consumptions are also recorded as InventoryTransaction rows
+in the lots' warehouses, which the stock history is built from.
+
+Lots moved to another warehouse become child lots of the lot they came
+from, so ``genealogy`` can walk from the lots a production order consumed
+back to the supplier receipts with one recursive query.
+"""
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Case, DecimalField, F, Q, Value, When
+from django.utils import timezone
+
+from core.numbering import next_number
+
+from . import details, valuation
+from .models import InventoryTransaction, MaterialLot, RawMaterial, Warehouse
+
+
+# Lots read per query while allocating
+ALLOCATION_BATCH_SIZE = 20
+
+ALLOCATION_ORDER = [F('expiry_date').asc(nulls_last=True), 'receipt_date', 'id']
+
+
+def default_warehouse():
+    """Warehouse goods are received into when none is given"""
+    return Warehouse.objects.filter(is_active=True).order_by('pk').first()
+
+
+def allocatable_lots(material_id, on_date=None):
+    """Lots of a material that can be consumed on a date, in allocation order"""
+    on_date = on_date or timezone.localdate()
+    return MaterialLot.objects.filter(
+        Q(expiry_date__isnull=True) | Q(expiry_date__gte=on_date),
+        material_id=material_id, quantity__gt=0,
+    ).order_by(*ALLOCATION_ORDER)
+
+
+def _decrement(taken):
+    """Take ``{lot_id: quantity}`` off the lots in one UPDATE"""
+    if taken:
+        MaterialLot.objects.filter(pk__in=taken).update(quantity=Case(
+            *[When(pk=pk, then=F('quantity') - Value(quantity)) for pk, quantity in taken.items()],
+            default=F('quantity'),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        ))
+
+
+@transaction.atomic
+def allocate(material_id, quantity, on_date=None):
+    """
+    Take ``quantity`` of a material from its lots, expiring first.
+
+    Returns [(lot, quantity taken), ...]. When the lots cannot cover the
+    whole quantity the rest is left unallocated.
+    """
+    remaining = Decimal(str(quantity))
+    lots = allocatable_lots(material_id, on_date).select_for_update()
+    allocations = []
+    start = 0
+    while remaining > 0:
+        batch = list(lots[start:start + ALLOCATION_BATCH_SIZE])
+        for lot in batch:
+            taken = min(remaining, lot.quantity)
+            allocations.append((lot, taken))
+            remaining -= taken
+            if remaining <= 0:
+                break
+        if len(batch) < ALLOCATION_BATCH_SIZE:
+            break
+        start += ALLOCATION_BATCH_SIZE
+    _decrement({lot.pk: taken for lot, taken in allocations})
+    for lot, taken in allocations:
+        lot.quantity -= taken
+    return allocations
+
+
+@transaction.atomic
+def consume(material, quantity, reference_number, user, notes=''):
+    """
+    Take a consumed quantity of a material from its lots; returns the allocations.
+
+    Records the stock going out of each lot's warehouse; whatever the lots
+    could not cover goes out of the default warehouse.
+    """
+    quantity = Decimal(str(quantity))
+    allocations = allocate(material.pk, quantity)
+    by_warehouse = defaultdict(Decimal)
+    for lot, taken in allocations:
+        by_warehouse[lot.warehouse_id] += taken
+    unallocated = quantity - sum(by_warehouse.values(), Decimal('0'))
+    if unallocated > 0:
+        warehouse = default_warehouse()
+        if warehouse is not None:
+            by_warehouse[warehouse.pk] += unallocated
+    InventoryTransaction.objects.bulk_create([
+        InventoryTransaction(
+            transaction_type='OUT',
+            material_type='raw',
+            material_id=material.pk,
+            material_name=material.name,
+            quantity=taken,
+            unit_price=material.unit_price,
+            total_value=taken * material.unit_price,
+            reference_number=reference_number,
+            notes=notes,
+            warehouse_id=warehouse_id,
+            created_by=user,
+        )
+        for warehouse_id, taken in by_warehouse.items()
+    ])
+    return allocations
+
+
+@transaction.atomic
+def receive_goods(receipt_line):
+    """
+    Put an accepted goods receipt line into stock as a new lot.
+
+    Adds the quantity to the material's stock and cost layers at the
+    receipt's unit price. Lines of purchase items not linked to a raw
+    material are skipped; returns the lot or None.
+    """
+    material_id = receipt_line.purchase_order_item.material_id
+    if not material_id or receipt_line.received_quantity <= 0:
+        return None
+    receipt = receipt_line.goods_receipt
+    warehouse = receipt.warehouse or default_warehouse()
+    lot = MaterialLot.objects.create(
+        lot_number=next_number('material_lot'),
+        material_id=material_id,
+        warehouse=warehouse,
+        receipt_line=receipt_line,
+        receipt_date=receipt.receipt_date,
+        received_quantity=receipt_line.received_quantity,
+        quantity=receipt_line.received_quantity,
+        unit_cost=receipt_line.unit_price,
+    )
+    RawMaterial.objects.filter(pk=material_id).update(
+        current_stock=F('current_stock') + receipt_line.received_quantity,
+        updated_at=timezone.now(),
+    )
+    valuation.receive([('raw', material_id, receipt_line.received_quantity, receipt_line.unit_price, receipt.gr_number)])
+    InventoryTransaction.objects.create(
+        transaction_type='IN',
+        material_type='raw',
+        material_id=material_id,
+        material_name=receipt_line.purchase_order_item.material_name,
+        quantity=receipt_line.received_quantity,
+        unit_price=receipt_line.unit_price,
+        reference_number=receipt.gr_number,
+        notes=f"Received in lot {lot.lot_number}",
+        warehouse=warehouse,
+        created_by=receipt.received_by,
+    )
+    details.invalidate('raw', [material_id])
+    return lot
+
+
+@transaction.atomic
+def transfer(lot, warehouse, quantity):
+    """Move part of a lot to another warehouse; returns the lot it lands in"""
+    quantity = Decimal(str(quantity))
+    lot = MaterialLot.objects.select_for_update().get(pk=lot.pk)
+    if quantity <= 0 or quantity > lot.quantity:
+        raise ValueError(f"Lot {lot.lot_number} has {lot.quantity} on hand")
+    child, _created = MaterialLot.objects.get_or_create(
+        material_id=lot.material_id, warehouse=warehouse, lot_number=lot.lot_number,
+        defaults={
+            'parent': lot,
+            'receipt_date': lot.receipt_date,
+            'expiry_date': lot.expiry_date,
+            'grade': lot.grade,
+            'received_quantity': 0,
+            'quantity': 0,
+            'unit_cost': lot.unit_cost,
+        },
+    )
+    _decrement({lot.pk: quantity})
+    MaterialLot.objects.filter(pk=child.pk).update(
+        quantity=F('quantity') + quantity,
+        received_quantity=F('received_quantity') + quantity,
+    )
+    child.refresh_from_db()
+    return child
+
+
+GENEALOGY_SQL = """
+WITH RECURSIVE consumed(lot_id, quantity) AS (
+    SELECT lc.lot_id, SUM(lc.quantity)
+    FROM manufacturing_lotconsumption lc
+    JOIN manufacturing_materialconsumption mc ON mc.id = lc.consumption_id
+    JOIN manufacturing_workorder wo ON wo.id = mc.work_order_id
+    WHERE wo.production_order_id = %s
+    GROUP BY lc.lot_id
+),
+lineage(consumed_lot_id, lot_id, parent_id, depth) AS (
+    SELECT lot.id, lot.id, lot.parent_id, 0
+    FROM consumed JOIN inventory_materiallot lot ON lot.id = consumed.lot_id
+    UNION ALL
+    SELECT lineage.consumed_lot_id, lot.id, lot.parent_id, lineage.depth + 1
+    FROM lineage JOIN inventory_materiallot lot ON lot.id = lineage.parent_id
+)
+SELECT lineage.consumed_lot_id, consumed.quantity, lineage.depth,
+       lot.id, lot.lot_number, material.code, material.name, warehouse.name,
+       lot.receipt_date, lot.expiry_date, lot.grade,
+       receipt.gr_number, purchase_order.po_number, vendor.name
+FROM lineage
+JOIN consumed ON consumed.lot_id = lineage.consumed_lot_id
+JOIN inventory_materiallot lot ON lot.id = lineage.lot_id
+JOIN inventory_rawmaterial material ON material.id = lot.material_id
+JOIN inventory_warehouse warehouse ON warehouse.id = lot.warehouse_id
+LEFT JOIN purchase_goodsreceiptlineitem receipt_line ON receipt_line.id = lot.receipt_line_id
+LEFT JOIN purchase_goodsreceipt receipt ON receipt.id = receipt_line.goods_receipt_id
+LEFT JOIN purchase_purchaseorder purchase_order ON purchase_order.id = receipt.purchase_order_id
+LEFT JOIN purchase_vendor vendor ON vendor.id = purchase_order.vendor_id
+ORDER BY material.code, lineage.consumed_lot_id, lineage.depth
+"""
+
+GENEALOGY_COLUMNS = [
+    'consumed_lot_id', 'consumed_quantity', 'depth',
+    'lot_id', 'lot_number', 'material_code', 'material_name', 'warehouse',
+    'receipt_date', 'expiry_date', 'grade',
+    'gr_number', 'po_number', 'vendor',
+]
+
+
+def genealogy(production_order_id):
+    """
+    Lots consumed by a production order and the lots they came from.
+
+    One row per lot on each path, starting at the consumed lot (depth 0)
+    and ending at the lot received from the supplier, with its goods
+    receipt, purchase order and vendor.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(GENEALOGY_SQL, [production_order_id])
+        rows = [dict(zip(GENEALOGY_COLUMNS, row)) for row in cursor.fetchall()]
+    # Raw queries return SQLite dates as text and sums as floats
+    for row in rows:
+        row['consumed_quantity'] = Decimal(str(row['consumed_quantity'])).quantize(Decimal('0.01'))
+        for field in ('receipt_date', 'expiry_date'):
+            if isinstance(row[field], str):
+                row[field] = date.fromisoformat(row[field])
+    return rows
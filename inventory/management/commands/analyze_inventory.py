@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.analysis import run
+
+
+class Command(BaseCommand):
+    help = 'Classify materials and products by ABC value and XYZ demand variability and flag slow-moving stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', choices=['raw', 'finished'], action='append', dest='material_types',
+                            help='Only analyse this material type (repeatable)')
+        parser.add_argument('--update-minimum-stock', action='store_true',
+                            help='Set minimum stock to the safety months of average demand for each XYZ class')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            summary = run(options['material_types'] or ('raw', 'finished'), options['update_minimum_stock'])
+        except ImportError:
+            raise CommandError('numpy library is required for inventory analysis. Please install it.')
+
+        for material_type, totals in summary.items():
+            abc = ' '.join(f'{label}={count}' for label, count in totals['abc'].items())
+            xyz = ' '.join(f'{label}={count}' for label, count in totals['xyz'].items())
+            self.stdout.write(
+                f"{material_type}: {totals['items']} item(s), {totals['updated']} updated; "
+                f"{abc}; {xyz}; {totals['slow_moving']} slow moving"
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'Analysis finished in {time.monotonic() - started:.1f}s'))
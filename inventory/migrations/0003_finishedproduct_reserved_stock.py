@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_alter_finishedproduct_color'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='finishedproduct',
+            name='reserved_stock',
+            field=models.IntegerField(default=0, help_text='Quantity reserved by confirmed sales orders'),
+        ),
+    ]
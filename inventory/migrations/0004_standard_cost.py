@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_finishedproduct_reserved_stock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='finishedproduct',
+            name='standard_cost',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, help_text='Material, labor and overhead cost per unit from the active BOM', max_digits=12),
+        ),
+    ]
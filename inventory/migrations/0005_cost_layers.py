@@ -0,0 +1,46 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:18
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def open_layers(apps, schema_editor):
+    # Stock already on hand opens one layer per item at its current unit price
+    CostLayer = apps.get_model('inventory', 'CostLayer')
+    for material_type, model_name in (('raw', 'RawMaterial'), ('finished', 'FinishedProduct')):
+        items = apps.get_model('inventory', model_name).objects.filter(current_stock__gt=0)
+        CostLayer.objects.bulk_create(
+            (
+                CostLayer(material_type=material_type, material_id=pk, quantity=stock,
+                          unit_cost=unit_price, reference_number='OPENING')
+                for pk, stock, unit_price in items.values_list('pk', 'current_stock', 'unit_price').iterator()
+            ),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_standard_cost'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CostLayer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('material_type', models.CharField(choices=[('raw', 'Raw Material'), ('finished', 'Finished Product')], max_length=10)),
+                ('material_id', models.IntegerField()),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('quantity', models.DecimalField(decimal_places=2, help_text='Quantity still on hand', max_digits=12)),
+                ('unit_cost', models.DecimalField(decimal_places=4, max_digits=12)),
+                ('reference_number', models.CharField(blank=True, max_length=50)),
+            ],
+            options={
+                'ordering': ['material_type', 'material_id', 'received_at', 'id'],
+                'indexes': [models.Index(fields=['material_type', 'material_id', 'received_at'], name='costlayer_item_idx')],
+            },
+        ),
+        migrations.RunPython(open_layers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:23
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def open_lots(apps, schema_editor):
+    # Stock already on hand becomes one lot per material in the first active warehouse
+    Warehouse = apps.get_model('inventory', 'Warehouse')
+    warehouse = Warehouse.objects.filter(is_active=True).order_by('pk').first()
+    if warehouse is None:
+        return
+    MaterialLot = apps.get_model('inventory', 'MaterialLot')
+    materials = apps.get_model('inventory', 'RawMaterial').objects.filter(current_stock__gt=0)
+    MaterialLot.objects.bulk_create(
+        (
+            MaterialLot(lot_number='OPENING', material_id=pk, warehouse=warehouse,
+                        received_quantity=stock, quantity=stock, unit_cost=unit_price)
+            for pk, stock, unit_price in materials.values_list('pk', 'current_stock', 'unit_price').iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_cost_layers'),
+        ('purchase', '0003_purchase_line_material'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterialLot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lot_number', models.CharField(max_length=50)),
+                ('receipt_date', models.DateField(default=django.utils.timezone.now)),
+                ('expiry_date', models.DateField(blank=True, null=True)),
+                ('grade', models.CharField(blank=True, help_text='Quality grade of the hide or batch', max_length=20)),
+                ('received_quantity', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('quantity', models.DecimalField(decimal_places=2, help_text='Quantity still on hand', max_digits=10)),
+                ('unit_cost', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lots', to='inventory.rawmaterial')),
+                ('parent', models.ForeignKey(blank=True, help_text='Lot this one was split or transferred from', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='children', to='inventory.materiallot')),
+                ('receipt_line', models.ForeignKey(blank=True, help_text='Goods receipt line the lot arrived on', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lots', to='purchase.goodsreceiptlineitem')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lots', to='inventory.warehouse')),
+            ],
+            options={
+                'verbose_name': 'Material Lot',
+                'verbose_name_plural': 'Material Lots',
+                'ordering': ['material', 'receipt_date', 'id'],
+                'indexes': [models.Index(condition=models.Q(('quantity__gt', 0)), fields=['material', 'expiry_date', 'receipt_date', 'id'], name='materiallot_fefo_idx')],
+                'unique_together': {('material', 'warehouse', 'lot_number')},
+            },
+        ),
+        migrations.RunPython(open_lots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_material_lots'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('material_type', models.CharField(choices=[('raw', 'Raw Material'), ('finished', 'Finished Product')], max_length=10)),
+                ('material_id', models.IntegerField()),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=12)),
+            ],
+            options={
+                'verbose_name': 'Stock Snapshot',
+                'verbose_name_plural': 'Stock Snapshots',
+                'ordering': ['-date', 'material_type', 'material_id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='inventorytransaction',
+            index=models.Index(fields=['material_type', 'material_id', 'created_at'], name='invtx_item_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorytransaction',
+            index=models.Index(fields=['created_at'], name='invtx_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='stocksnapshot',
+            name='warehouse',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='inventory.warehouse'),
+        ),
+        migrations.AddIndex(
+            model_name='stocksnapshot',
+            index=models.Index(fields=['material_type', 'material_id', 'date'], name='stocksnapshot_item_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='stocksnapshot',
+            unique_together={('date', 'material_type', 'material_id', 'warehouse')},
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_stock_snapshots'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='finishedproduct',
+            name='abc_class',
+            field=models.CharField(blank=True, choices=[('A', 'A - High value'), ('B', 'B - Medium value'), ('C', 'C - Low value')], help_text='Counting and replenishment class', max_length=1),
+        ),
+        migrations.AddField(
+            model_name='rawmaterial',
+            name='abc_class',
+            field=models.CharField(blank=True, choices=[('A', 'A - High value'), ('B', 'B - Medium value'), ('C', 'C - Low value')], help_text='Counting and replenishment class', max_length=1),
+        ),
+        migrations.CreateModel(
+            name='CycleCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count_number', models.CharField(max_length=20, unique=True)),
+                ('material_type', models.CharField(blank=True, choices=[('raw', 'Raw Material'), ('finished', 'Finished Product')], help_text='Blank: all items', max_length=10)),
+                ('abc_classes', models.CharField(blank=True, help_text='ABC classes counted, e.g. AB (blank: all)', max_length=3)),
+                ('status', models.CharField(choices=[('counting', 'Counting'), ('posted', 'Posted'), ('cancelled', 'Cancelled')], default='counting', max_length=10)),
+                ('notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('posted_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cycle_counts', to=settings.AUTH_USER_MODEL)),
+                ('posted_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='posted_cycle_counts', to=settings.AUTH_USER_MODEL)),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cycle_counts', to='inventory.warehouse')),
+            ],
+            options={
+                'verbose_name': 'Cycle Count',
+                'verbose_name_plural': 'Cycle Counts',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CycleCountLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('material_type', models.CharField(choices=[('raw', 'Raw Material'), ('finished', 'Finished Product')], max_length=10)),
+                ('material_id', models.IntegerField()),
+                ('code', models.CharField(max_length=20)),
+                ('name', models.CharField(max_length=200)),
+                ('unit', models.CharField(max_length=10)),
+                ('unit_price', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('system_quantity', models.DecimalField(decimal_places=2, help_text='Stock on the books when the sheet was made', max_digits=12)),
+                ('counted_quantity', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('cycle_count', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='inventory.cyclecount')),
+            ],
+            options={
+                'verbose_name': 'Cycle Count Line',
+                'verbose_name_plural': 'Cycle Count Lines',
+                'ordering': ['material_type', 'code'],
+                'unique_together': {('cycle_count', 'material_type', 'material_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_cycle_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='finishedproduct',
+            name='last_movement_date',
+            field=models.DateField(blank=True, editable=False, help_text='Last consumed or sold', null=True),
+        ),
+        migrations.AddField(
+            model_name='finishedproduct',
+            name='xyz_class',
+            field=models.CharField(blank=True, choices=[('X', 'X - Steady demand'), ('Y', 'Y - Variable demand'), ('Z', 'Z - Erratic demand')], editable=False, help_text='Demand variability class', max_length=1),
+        ),
+        migrations.AddField(
+            model_name='rawmaterial',
+            name='last_movement_date',
+            field=models.DateField(blank=True, editable=False, help_text='Last consumed or sold', null=True),
+        ),
+        migrations.AddField(
+            model_name='rawmaterial',
+            name='xyz_class',
+            field=models.CharField(blank=True, choices=[('X', 'X - Steady demand'), ('Y', 'Y - Variable demand'), ('Z', 'Z - Erratic demand')], editable=False, help_text='Demand variability class', max_length=1),
+        ),
+        migrations.AlterField(
+            model_name='finishedproduct',
+            name='abc_class',
+            field=models.CharField(blank=True, choices=[('A', 'A - High value'), ('B', 'B - Medium value'), ('C', 'C - Low value')], help_text='Value class, set by the inventory analysis; drives counting and replenishment', max_length=1),
+        ),
+        migrations.AlterField(
+            model_name='rawmaterial',
+            name='abc_class',
+            field=models.CharField(blank=True, choices=[('A', 'A - High value'), ('B', 'B - Medium value'), ('C', 'C - Low value')], help_text='Value class, set by the inventory analysis; drives counting and replenishment', max_length=1),
+        ),
+    ]
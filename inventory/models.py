@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 
 class Warehouse(models.Model):
@@ -32,6 +33,18 @@ class RawMaterial(models.Model):
         ('sheet', 'Sheet'),
     ]
 
+    ABC_CLASSES = [
+        ('A', 'A - High value'),
+        ('B', 'B - Medium value'),
+        ('C', 'C - Low value'),
+    ]
+
+    XYZ_CLASSES = [
+        ('X', 'X - Steady demand'),
+        ('Y', 'Y - Variable demand'),
+        ('Z', 'Z - Erratic demand'),
+    ]
+
     code = models.CharField(max_length=20, unique=True)
     name = models.CharField(max_length=200)
     category = models.ForeignKey(MaterialCategory, on_delete=models.CASCADE)
@@ -40,6 +53,9 @@ class RawMaterial(models.Model):
     minimum_stock = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     current_stock = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     unit_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    abc_class = models.CharField(max_length=1, choices=ABC_CLASSES, blank=True, help_text="Value class, set by the inventory analysis; drives counting and replenishment")
+    xyz_class = models.CharField(max_length=1, choices=XYZ_CLASSES, blank=True, editable=False, help_text="Demand variability class")
+    last_movement_date = models.DateField(null=True, blank=True, editable=False, help_text="Last consumed or sold")
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -58,7 +74,9 @@ class RawMaterial(models.Model):
 
     @property
     def total_value(self):
-        return self.unit_price * self.current_stock
+        """Value of the stock on hand from its cost layers"""
+        from .valuation import item_value
+        return item_value('raw', self.pk)
 
 
 class ProductCategory(models.Model):
@@ -99,6 +117,18 @@ class FinishedProduct(models.Model):
         ('sands', 'Sands'),
     ]
 
+    ABC_CLASSES = [
+        ('A', 'A - High value'),
+        ('B', 'B - Medium value'),
+        ('C', 'C - Low value'),
+    ]
+
+    XYZ_CLASSES = [
+        ('X', 'X - Steady demand'),
+        ('Y', 'Y - Variable demand'),
+        ('Z', 'Z - Erratic demand'),
+    ]
+
     code = models.CharField(max_length=20, unique=True)
     name = models.CharField(max_length=200)
     category = models.ForeignKey(ProductCategory, on_delete=models.CASCADE)
@@ -106,8 +136,16 @@ class FinishedProduct(models.Model):
     color = models.CharField(max_length=20, choices=COLOR_CHOICES)
     description = models.TextField(blank=True)
     current_stock = models.IntegerField(default=0)
+    reserved_stock = models.IntegerField(default=0, help_text="Quantity reserved by confirmed sales orders")
     minimum_stock = models.IntegerField(default=0)
     unit_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    standard_cost = models.DecimalField(
+        max_digits=12, decimal_places=2, default=0, editable=False,
+        help_text="Material, labor and overhead cost per unit from the active BOM"
+    )
+    abc_class = models.CharField(max_length=1, choices=ABC_CLASSES, blank=True, help_text="Value class, set by the inventory analysis; drives counting and replenishment")
+    xyz_class = models.CharField(max_length=1, choices=XYZ_CLASSES, blank=True, editable=False, help_text="Demand variability class")
+    last_movement_date = models.DateField(null=True, blank=True, editable=False, help_text="Last consumed or sold")
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -125,16 +163,14 @@ class FinishedProduct(models.Model):
             return 'In Stock'
 
     @property
-    def total_value(self):
-        return self.unit_price * self.current_stock
-
-    @property
-    def total_value(self):
-        return self.unit_price * self.current_stock
+    def available_stock(self):
+        return self.current_stock - self.reserved_stock
 
     @property
     def total_value(self):
-        return self.unit_price * self.current_stock
+        """Value of the stock on hand from its cost layers"""
+        from .valuation import item_value
+        return item_value('finished', self.pk)
 
 
 class InventoryTransaction(models.Model):
@@ -162,6 +198,13 @@ class InventoryTransaction(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Stock history of one item and movements since a snapshot
+            models.Index(fields=['material_type', 'material_id', 'created_at'], name='invtx_item_created_idx'),
+            models.Index(fields=['created_at'], name='invtx_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.transaction_type} - {self.material_name} ({self.quantity})"
 
@@ -170,6 +213,156 @@ class InventoryTransaction(models.Model):
         super().save(*args, **kwargs)
 
 
+class MaterialLot(models.Model):
+    """Stock of a raw material from one receipt (a hide, a rubber batch) held in one warehouse"""
+    lot_number = models.CharField(max_length=50)
+    material = models.ForeignKey(RawMaterial, on_delete=models.CASCADE, related_name='lots')
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='lots')
+    parent = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='children',
+        help_text="Lot this one was split or transferred from"
+    )
+    receipt_line = models.ForeignKey(
+        'purchase.GoodsReceiptLineItem', on_delete=models.SET_NULL, null=True, blank=True, related_name='lots',
+        help_text="Goods receipt line the lot arrived on"
+    )
+    receipt_date = models.DateField(default=timezone.now)
+    expiry_date = models.DateField(null=True, blank=True)
+    grade = models.CharField(max_length=20, blank=True, help_text="Quality grade of the hide or batch")
+    received_quantity = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.DecimalField(max_digits=10, decimal_places=2, help_text="Quantity still on hand")
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['material', 'receipt_date', 'id']
+        verbose_name = 'Material Lot'
+        verbose_name_plural = 'Material Lots'
+        unique_together = ['material', 'warehouse', 'lot_number']
+        indexes = [
+            # Allocation order (FEFO, then FIFO) over lots with stock left
+            models.Index(
+                fields=['material', 'expiry_date', 'receipt_date', 'id'],
+                condition=models.Q(quantity__gt=0), name='materiallot_fefo_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.lot_number} - {self.material.name} ({self.quantity})"
+
+
+class CostLayer(models.Model):
+    """Stock of a material or product still on hand from a receipt, at its unit cost"""
+    MATERIAL_TYPES = [
+        ('raw', 'Raw Material'),
+        ('finished', 'Finished Product'),
+    ]
+
+    material_type = models.CharField(max_length=10, choices=MATERIAL_TYPES)
+    material_id = models.IntegerField()  # ID of RawMaterial or FinishedProduct
+    received_at = models.DateTimeField(default=timezone.now)
+    quantity = models.DecimalField(max_digits=12, decimal_places=2, help_text="Quantity still on hand")
+    unit_cost = models.DecimalField(max_digits=12, decimal_places=4)
+    reference_number = models.CharField(max_length=50, blank=True)
+
+    class Meta:
+        ordering = ['material_type', 'material_id', 'received_at', 'id']
+        indexes = [
+            models.Index(fields=['material_type', 'material_id', 'received_at'], name='costlayer_item_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_material_type_display()} #{self.material_id}: {self.quantity} @ {self.unit_cost}"
+
+
+class StockSnapshot(models.Model):
+    """Stock of an item on hand in a warehouse at the end of a day"""
+    MATERIAL_TYPES = [
+        ('raw', 'Raw Material'),
+        ('finished', 'Finished Product'),
+    ]
+
+    date = models.DateField()
+    material_type = models.CharField(max_length=10, choices=MATERIAL_TYPES)
+    material_id = models.IntegerField()  # ID of RawMaterial or FinishedProduct
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='stock_snapshots')
+    quantity = models.DecimalField(max_digits=12, decimal_places=2)
+
+    class Meta:
+        ordering = ['-date', 'material_type', 'material_id']
+        verbose_name = 'Stock Snapshot'
+        verbose_name_plural = 'Stock Snapshots'
+        unique_together = ['date', 'material_type', 'material_id', 'warehouse']
+        indexes = [
+            models.Index(fields=['material_type', 'material_id', 'date'], name='stocksnapshot_item_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.get_material_type_display()} #{self.material_id}: {self.quantity}"
+
+
+class CycleCount(models.Model):
+    """A count sheet: items to count in a warehouse and the stock found"""
+    STATUS_CHOICES = [
+        ('counting', 'Counting'),
+        ('posted', 'Posted'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    MATERIAL_TYPES = [
+        ('raw', 'Raw Material'),
+        ('finished', 'Finished Product'),
+    ]
+
+    count_number = models.CharField(max_length=20, unique=True)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='cycle_counts')
+    material_type = models.CharField(max_length=10, choices=MATERIAL_TYPES, blank=True, help_text="Blank: all items")
+    abc_classes = models.CharField(max_length=3, blank=True, help_text="ABC classes counted, e.g. AB (blank: all)")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='counting')
+    notes = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cycle_counts')
+    created_at = models.DateTimeField(auto_now_add=True)
+    posted_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='posted_cycle_counts'
+    )
+    posted_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Cycle Count'
+        verbose_name_plural = 'Cycle Counts'
+
+    def __str__(self):
+        return f"{self.count_number} - {self.warehouse.name}"
+
+
+class CycleCountLine(models.Model):
+    """An item on a count sheet with its book and counted quantities"""
+    MATERIAL_TYPES = [
+        ('raw', 'Raw Material'),
+        ('finished', 'Finished Product'),
+    ]
+
+    cycle_count = models.ForeignKey(CycleCount, on_delete=models.CASCADE, related_name='lines')
+    material_type = models.CharField(max_length=10, choices=MATERIAL_TYPES)
+    material_id = models.IntegerField()  # ID of RawMaterial or FinishedProduct
+    code = models.CharField(max_length=20)
+    name = models.CharField(max_length=200)
+    unit = models.CharField(max_length=10)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    system_quantity = models.DecimalField(max_digits=12, decimal_places=2, help_text="Stock on the books when the sheet was made")
+    counted_quantity = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        ordering = ['material_type', 'code']
+        verbose_name = 'Cycle Count Line'
+        verbose_name_plural = 'Cycle Count Lines'
+        unique_together = ['cycle_count', 'material_type', 'material_id']
+
+    def __str__(self):
+        return f"{self.code} - {self.counted_quantity}"
+
+
 class StockAlert(models.Model):
     ALERT_TYPES = [
         ('low_stock', 'Low Stock Alert'),
@@ -0,0 +1,52 @@
+from decimal import Decimal
+
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import details, valuation
+from .lookup import LOOKUPS
+from .models import CostLayer, FinishedProduct, RawMaterial
+
+
+@receiver(post_save, sender=RawMaterial)
+@receiver(post_delete, sender=RawMaterial)
+def invalidate_material_lookup(sender, instance, **kwargs):
+    LOOKUPS['materials'].invalidate()
+    details.invalidate('raw', [instance.pk])
+
+
+@receiver(post_save, sender=FinishedProduct)
+@receiver(post_delete, sender=FinishedProduct)
+def invalidate_product_lookup(sender, instance, **kwargs):
+    LOOKUPS['products'].invalidate()
+    details.invalidate('finished', [instance.pk])
+
+
+@receiver(post_init, sender=RawMaterial)
+@receiver(post_init, sender=FinishedProduct)
+def remember_stock(sender, instance, **kwargs):
+    # Read through __dict__ so deferred fields are not loaded
+    instance._loaded_stock = instance.__dict__.get('current_stock')
+
+
+@receiver(post_save, sender=RawMaterial)
+@receiver(post_save, sender=FinishedProduct)
+def record_stock_change(sender, instance, created, **kwargs):
+    """Receive or issue the change in stock on hand through the cost layers"""
+    material_type = 'raw' if sender is RawMaterial else 'finished'
+    before = 0 if created else instance._loaded_stock
+    if before is not None and 'current_stock' in instance.__dict__:
+        change = Decimal(str(instance.current_stock)) - Decimal(str(before))
+        if change > 0:
+            unit_cost = getattr(instance, valuation.COST_FIELDS[material_type])
+            valuation.receive([(material_type, instance.pk, change, unit_cost, '')])
+        elif change < 0:
+            valuation.issue([(material_type, instance.pk, -change)])
+    instance._loaded_stock = instance.__dict__.get('current_stock')
+
+
+@receiver(post_delete, sender=RawMaterial)
+@receiver(post_delete, sender=FinishedProduct)
+def delete_cost_layers(sender, instance, **kwargs):
+    material_type = 'raw' if sender is RawMaterial else 'finished'
+    CostLayer.objects.filter(material_type=material_type, material_id=instance.pk).delete()
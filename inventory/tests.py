@@ -1,3 +1,358 @@
-from django.test import TestCase
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import cycle_counts, history, lots, valuation
+from .models import (
+    CostLayer, CycleCountLine, FinishedProduct, InventoryTransaction, MaterialCategory, MaterialLot,
+    ProductCategory, RawMaterial, StockSnapshot, Warehouse,
+)
+
+
+class InventoryTestData:
+    """A user, two warehouses and raw materials starting with no stock"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('inventory', password='inventory')
+        cls.warehouse = Warehouse.objects.create(name='Gudang Utama', location='Bandung')
+        cls.other_warehouse = Warehouse.objects.create(name='Gudang Produksi', location='Cimahi')
+        cls.category = MaterialCategory.objects.create(name='Leather')
+        cls.material = cls.make_material('LTR-01')
+
+    @classmethod
+    def make_material(cls, code, unit_price=10):
+        return RawMaterial.objects.create(code=code, name=f'Leather {code}', category=cls.category, unit='m', unit_price=unit_price)
+
+    def make_lot(self, lot_number, quantity, received_days_ago=0, expires_in_days=None, warehouse=None):
+        today = timezone.localdate()
+        return MaterialLot.objects.create(
+            lot_number=lot_number, material=self.material, warehouse=warehouse or self.warehouse,
+            receipt_date=today - timedelta(days=received_days_ago),
+            expiry_date=today + timedelta(days=expires_in_days) if expires_in_days is not None else None,
+            received_quantity=quantity, quantity=quantity, unit_cost=10,
+        )
+
+    def lot_quantities(self):
+        return dict(MaterialLot.objects.filter(material=self.material).values_list('lot_number', 'quantity'))
+
+    def layers(self, material=None):
+        return list(
+            CostLayer.objects.filter(material_type='raw', material_id=(material or self.material).pk)
+            .order_by('received_at', 'id').values_list('quantity', 'unit_cost')
+        )
+
+
+class ValuationTests(InventoryTestData, TestCase):
+
+    def test_fifo_issues_consume_the_oldest_layers_first(self):
+        valuation.receive([('raw', self.material.pk, 10, 5, 'GR-1'), ('raw', self.material.pk, 10, 7, 'GR-2')])
+
+        costs = valuation.issue([('raw', self.material.pk, 15)])
+
+        self.assertEqual(costs, [Decimal('85.00')])
+        # The first layer is used up and deleted
+        self.assertEqual(self.layers(), [(Decimal('5'), Decimal('7'))])
+        self.assertEqual(valuation.item_value('raw', self.material.pk), Decimal('35.00'))
+
+    def test_lines_for_one_item_are_costed_in_order(self):
+        valuation.receive([('raw', self.material.pk, 4, 5, 'GR-1'), ('raw', self.material.pk, 4, 7, 'GR-2')])
+
+        costs = valuation.issue([('raw', self.material.pk, 3), ('raw', self.material.pk, 3)])
+
+        self.assertEqual(costs, [Decimal('15.00'), Decimal('19.00')])
+        self.assertEqual(self.layers(), [(Decimal('2'), Decimal('7'))])
+
+    def test_issue_beyond_the_layers_uses_the_last_cost(self):
+        valuation.receive([('raw', self.material.pk, 2, 5, 'GR-1')])
+        other = self.make_material('LTR-02', unit_price=9)
+
+        costs = valuation.issue([('raw', self.material.pk, 3), ('raw', other.pk, 2)])
+
+        # The item without layers is costed at its unit price
+        self.assertEqual(costs, [Decimal('15.00'), Decimal('18.00')])
+        self.assertEqual(self.layers(), [])
+
+    @override_settings(INVENTORY_COSTING_METHODS={'raw': 'average'})
+    def test_average_keeps_one_layer_at_the_moving_average(self):
+        valuation.receive([('raw', self.material.pk, 10, 5, 'GR-1')])
+        valuation.receive([('raw', self.material.pk, 10, 7, 'GR-2')])
+        self.assertEqual(self.layers(), [(Decimal('20'), Decimal('6'))])
+
+        costs = valuation.issue([('raw', self.material.pk, 5)])
+
+        self.assertEqual(costs, [Decimal('30.00')])
+        self.assertEqual(self.layers(), [(Decimal('15'), Decimal('6'))])
+
+    def test_stock_saved_on_the_item_moves_its_layers(self):
+        self.material.current_stock = Decimal('8')
+        self.material.save()
+        self.material.current_stock = Decimal('5')
+        self.material.save()
+
+        self.assertEqual(self.layers(), [(Decimal('5'), Decimal('10'))])
+
+    def test_finished_products_are_costed_at_their_standard_cost(self):
+        product = FinishedProduct.objects.create(
+            code='SNK-01', name='Sneaker 40 Black', category=ProductCategory.objects.create(name='Sneakers'),
+            size='40', color='black', unit_price=250,
+        )
+        FinishedProduct.objects.filter(pk=product.pk).update(standard_cost=90)
+        product.refresh_from_db()
+
+        product.current_stock = 4
+        product.save()
+        costs = valuation.issue([('finished', product.pk, 6)])
+
+        # Stock received and issued beyond the layers, both at the standard
+        # cost rather than the selling price
+        self.assertEqual(costs, [Decimal('540.00')])
+        self.assertFalse(CostLayer.objects.filter(material_type='finished', material_id=product.pk).exists())
+
+    def test_issue_queries_do_not_grow_with_items(self):
+        def issue_queries(count):
+            materials = [self.make_material(f'Q{count}-{n}') for n in range(count)]
+            valuation.receive([('raw', material.pk, 5, 5, 'GR') for material in materials])
+            valuation.receive([('raw', material.pk, 5, 6, 'GR') for material in materials])
+            with CaptureQueriesContext(connection) as queries:
+                valuation.issue([('raw', material.pk, 7) for material in materials])
+            return len(queries)
+
+        self.assertEqual(issue_queries(2), issue_queries(20))
+
+
+class LotAllocationTests(InventoryTestData, TestCase):
+
+    def setUp(self):
+        self.make_lot('OLD', 5, received_days_ago=30)
+        self.make_lot('LATE', 5, received_days_ago=10, expires_in_days=60)
+        self.make_lot('SOON', 5, received_days_ago=5, expires_in_days=7)
+        self.make_lot('EXPIRED', 5, received_days_ago=40, expires_in_days=-1)
+
+    def test_lots_expiring_first_are_allocated_first(self):
+        allocations = lots.allocate(self.material.pk, 12)
+
+        self.assertEqual(
+            [(lot.lot_number, taken) for lot, taken in allocations],
+            [('SOON', 5), ('LATE', 5), ('OLD', 2)],
+        )
+        self.assertEqual(self.lot_quantities(), {'OLD': 3, 'LATE': 0, 'SOON': 0, 'EXPIRED': 5})
+
+    def test_expired_lots_are_never_allocated(self):
+        allocations = lots.allocate(self.material.pk, 20)
+
+        # What the lots in date cannot cover is left unallocated
+        self.assertEqual(sum(taken for _lot, taken in allocations), 15)
+        self.assertEqual(self.lot_quantities()['EXPIRED'], 5)
+
+    def test_allocation_reads_lots_in_batches(self):
+        with mock.patch.object(lots, 'ALLOCATION_BATCH_SIZE', 1):
+            allocations = lots.allocate(self.material.pk, 12)
+
+        self.assertEqual([lot.lot_number for lot, _taken in allocations], ['SOON', 'LATE', 'OLD'])
+        self.assertEqual(self.lot_quantities()['OLD'], 3)
+
+    def test_consume_records_stock_out_of_each_lot_warehouse(self):
+        self.make_lot('FAR', 5, received_days_ago=1, expires_in_days=3, warehouse=self.other_warehouse)
+
+        lots.consume(self.material, 25, 'WO-1', self.user)
+
+        out = dict(InventoryTransaction.objects.filter(
+            reference_number='WO-1', transaction_type='OUT'
+        ).values_list('warehouse_id', 'quantity'))
+        # 15 from the main warehouse's lots, 5 from the other's, 5 short of
+        # the lots goes out of the default (first) warehouse
+        self.assertEqual(out, {self.warehouse.pk: 20, self.other_warehouse.pk: 5})
+
+    def test_transfer_creates_a_child_lot(self):
+        lot = MaterialLot.objects.get(lot_number='LATE')
+
+        child = lots.transfer(lot, self.other_warehouse, 2)
+
+        self.assertEqual((child.parent_id, child.warehouse_id, child.quantity), (lot.pk, self.other_warehouse.pk, 2))
+        self.assertEqual(child.expiry_date, lot.expiry_date)
+        lot.refresh_from_db()
+        self.assertEqual(lot.quantity, 3)
+        with self.assertRaises(ValueError):
+            lots.transfer(lot, self.other_warehouse, 4)
+
+
+class StockHistoryTests(InventoryTestData, TestCase):
+
+    def setUp(self):
+        self.today = timezone.localdate()
+
+    def day(self, days_ago):
+        return self.today - timedelta(days=days_ago)
+
+    def move(self, transaction_type, quantity, days_ago, warehouse=None):
+        movement = InventoryTransaction.objects.create(
+            transaction_type=transaction_type, material_type='raw', material_id=self.material.pk,
+            material_name=self.material.name, quantity=quantity, warehouse=warehouse or self.warehouse,
+            created_by=self.user,
+        )
+        at = timezone.make_aware(datetime.combine(self.day(days_ago), time(12)))
+        InventoryTransaction.objects.filter(pk=movement.pk).update(created_at=at)
+
+    def set_stock(self, quantity):
+        # Without save(), so no cost layers are touched
+        RawMaterial.objects.filter(pk=self.material.pk).update(current_stock=quantity)
+
+    def stock(self, days_ago):
+        return history.stock_as_of(self.day(days_ago), 'raw', [self.material.pk])
+
+    def test_stock_as_of_adds_up_movements_per_warehouse(self):
+        self.move('IN', 10, days_ago=5)
+        self.move('IN', 4, days_ago=4, warehouse=self.other_warehouse)
+        self.move('OUT', 3, days_ago=3)
+        self.move('ADJ', 1, days_ago=2, warehouse=self.other_warehouse)
+
+        self.assertEqual(self.stock(6), {})
+        self.assertEqual(self.stock(5), {('raw', self.material.pk, self.warehouse.pk): 10})
+        self.assertEqual(self.stock(2), {
+            ('raw', self.material.pk, self.warehouse.pk): 7,
+            ('raw', self.material.pk, self.other_warehouse.pk): 3,
+        })
+
+    def test_stock_as_of_starts_from_the_nearest_snapshot(self):
+        self.move('IN', 10, days_ago=5)
+        self.move('OUT', 3, days_ago=2)
+        self.set_stock(7)
+        history.take_snapshot(self.day(4))
+        # Movements before the snapshot no longer count once it exists
+        InventoryTransaction.objects.filter(created_at__lt=history.end_of_day(self.day(4))).delete()
+
+        self.assertEqual(self.stock(4), {('raw', self.material.pk, self.warehouse.pk): 10})
+        self.assertEqual(self.stock(1), {('raw', self.material.pk, self.warehouse.pk): 7})
+
+    def test_snapshot_books_unrecorded_stock_to_the_default_warehouse(self):
+        self.move('IN', 10, days_ago=3, warehouse=self.other_warehouse)
+        # Two more edited by hand, never recorded as a movement
+        self.set_stock(12)
+
+        history.take_snapshot(self.day(1))
+
+        self.assertEqual(
+            dict(StockSnapshot.objects.filter(date=self.day(1)).values_list('warehouse_id', 'quantity')),
+            {self.other_warehouse.pk: 10, self.warehouse.pk: 2},
+        )
+
+    def test_snapshot_keeps_a_zero_row_for_stock_run_out(self):
+        self.move('IN', 5, days_ago=3)
+        self.set_stock(5)
+        history.take_snapshot(self.day(3))
+        self.move('OUT', 5, days_ago=2)
+        self.set_stock(0)
+
+        history.take_snapshot(self.day(2))
+        history.take_snapshot(self.day(1))
+
+        self.assertEqual(list(StockSnapshot.objects.filter(date=self.day(2)).values_list('quantity', flat=True)), [0])
+        self.assertFalse(StockSnapshot.objects.filter(date=self.day(1)).exists())
+
+    def test_daily_stock_carries_snapshots_forward(self):
+        self.move('IN', 10, days_ago=5)
+        self.set_stock(10)
+        history.take_snapshot(self.day(5))
+        self.move('OUT', 4, days_ago=3)
+        self.set_stock(6)
+        history.take_snapshot(self.day(3))
+
+        self.assertEqual(
+            history.daily_stock('raw', self.material.pk, self.day(4), self.day(2)),
+            [(self.day(4), 10), (self.day(3), 6), (self.day(2), 6)],
+        )
+
+    def test_stock_movements_carry_a_running_balance(self):
+        self.move('IN', 10, days_ago=5)
+        self.move('OUT', 3, days_ago=3)
+        self.move('IN', 2, days_ago=2)
+
+        opening, rows = history.stock_movements('raw', self.material.pk, self.day(3), self.day(2))
+
+        self.assertEqual(opening, 10)
+        self.assertEqual([(row['change'], row['balance']) for row in rows], [(-3, 7), (2, 9)])
+
+
+class CycleCountTests(InventoryTestData, TestCase):
+
+    def setUp(self):
+        # 10 on hand in the main warehouse in two lots, 5 in the other
+        self.material.current_stock = Decimal('15')
+        self.material.save()
+        for warehouse, quantity in [(self.warehouse, 10), (self.other_warehouse, 5)]:
+            InventoryTransaction.objects.create(
+                transaction_type='IN', material_type='raw', material_id=self.material.pk,
+                material_name=self.material.name, quantity=quantity, warehouse=warehouse, created_by=self.user,
+            )
+        self.make_lot('OLD', 6, received_days_ago=30)
+        self.make_lot('SOON', 4, received_days_ago=5, expires_in_days=7)
+        self.make_lot('AWAY', 5, received_days_ago=40, warehouse=self.other_warehouse)
+        self.count = cycle_counts.create_count(self.warehouse, self.user, material_type='raw')
+
+    def post(self, counted):
+        line = self.count.lines.get(material_id=self.material.pk)
+        line.counted_quantity = Decimal(counted)
+        cycle_counts.save_counts([line])
+        return cycle_counts.post_count(self.count, self.user)
+
+    def test_sheet_holds_the_book_quantity_of_the_warehouse(self):
+        self.assertEqual(self.count.lines.get(material_id=self.material.pk).system_quantity, 10)
+
+    def test_missing_stock_comes_off_the_lots_expiring_first(self):
+        adjusted, value = self.post('3')
+
+        self.assertEqual((adjusted, value), (1, Decimal('-70.00')))
+        self.assertEqual(self.lot_quantities(), {'OLD': 3, 'SOON': 0, 'AWAY': 5})
+        self.material.refresh_from_db()
+        self.assertEqual(self.material.current_stock, 8)
+        self.assertEqual(self.layers(), [(Decimal('8'), Decimal('10'))])
+        movement = InventoryTransaction.objects.get(reference_number=self.count.count_number)
+        self.assertEqual((movement.transaction_type, movement.quantity, movement.warehouse_id), ('ADJ', 7, self.warehouse.pk))
+
+    def test_stock_found_goes_into_an_adjustment_lot(self):
+        self.post('12.5')
+
+        lot = MaterialLot.objects.get(material=self.material, receipt_line__isnull=True, lot_number__startswith='LOT-')
+        self.assertEqual((lot.warehouse_id, lot.quantity, lot.received_quantity, lot.unit_cost),
+                         (self.warehouse.pk, Decimal('2.5'), Decimal('2.5'), 10))
+        self.assertEqual(self.lot_quantities()['OLD'], 6)
+        self.material.refresh_from_db()
+        self.assertEqual(self.material.current_stock, Decimal('17.5'))
+
+    def test_lots_and_stock_agree_after_posting(self):
+        self.post('7')
+
+        on_hand = sum(MaterialLot.objects.filter(material=self.material).values_list('quantity', flat=True))
+        self.material.refresh_from_db()
+        self.assertEqual(on_hand, self.material.current_stock)
+
+    def test_uncounted_lines_and_finished_products_without_lots(self):
+        product = FinishedProduct.objects.create(
+            code='SNK-01', name='Sneaker 40', category=ProductCategory.objects.create(name='Sneakers'),
+            size='40', color='black', unit_price=100,
+        )
+        FinishedProduct.objects.filter(pk=product.pk).update(standard_cost=60)
+        count = cycle_counts.create_count(self.warehouse, self.user)
+        lines = {line.material_type: line for line in count.lines.all()}
+        lines['finished'].counted_quantity = Decimal('2')
+        cycle_counts.save_counts([lines['finished']])
+
+        # Products are valued at their standard cost, not their selling price
+        self.assertEqual(cycle_counts.post_count(count, self.user), (1, Decimal('120.00')))
+        product.refresh_from_db()
+        self.assertEqual(product.current_stock, 2)
+        self.assertEqual(self.lot_quantities(), {'OLD': 6, 'SOON': 4, 'AWAY': 5})
+
+    def test_posted_sheet_cannot_be_posted_again(self):
+        self.post('9')
+
+        with self.assertRaises(ValueError):
+            cycle_counts.post_count(self.count, self.user)
+        self.assertEqual(CycleCountLine.objects.filter(cycle_count=self.count).count(), 1)
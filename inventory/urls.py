@@ -26,9 +26,27 @@ urlpatterns = [
     # Stock Management URLs
     path('stock-adjustment/', views.stock_adjustment, name='stock_adjustment'),
     path('get-material-details/', views.get_material_details, name='get_material_details'),
+    path('get-material-details/batch/', views.get_material_details_batch, name='get_material_details_batch'),
+
+    # Typeahead lookups
+    path('lookup/materials/', views.lookup, {'kind': 'materials'}, name='material_lookup'),
+    path('lookup/products/', views.lookup, {'kind': 'products'}, name='product_lookup'),
 
     # Transaction History URLs
     path('transactions/', views.transaction_list, name='transaction_list'),
+    path('stock-history/', views.stock_history, name='stock_history'),
+
+    # Valuation URLs
+    path('valuation/', views.inventory_valuation, name='inventory_valuation'),
+    path('analysis/', views.inventory_analysis, name='inventory_analysis'),
+
+    # Cycle Count URLs
+    path('cycle-counts/', views.cycle_count_list, name='cycle_count_list'),
+    path('cycle-counts/create/', views.cycle_count_create, name='cycle_count_create'),
+    path('cycle-counts/<int:pk>/', views.cycle_count_detail, name='cycle_count_detail'),
+    path('cycle-counts/<int:pk>/sheet/', views.cycle_count_sheet, name='cycle_count_sheet'),
+    path('cycle-counts/<int:pk>/upload/', views.cycle_count_upload, name='cycle_count_upload'),
+    path('cycle-counts/<int:pk>/post/', views.cycle_count_post, name='cycle_count_post'),
 
     # Stock Alert URLs
     path('stock-alerts/', views.stock_alert_list, name='stock_alert_list'),
@@ -0,0 +1,219 @@
+"""
+Inventory valuation from cost layers.
+
+Every unit on hand belongs to a CostLayer holding the quantity still left
+from a receipt and its unit cost. How a material or product is costed
+depends on its type (INVENTORY_COSTING_METHODS setting, see
+DEFAULT_COSTING_METHODS):
+
+* fifo: each receipt adds a layer and issues consume the oldest layers first
+* average: a single layer per item holds the moving average cost; receipts
+  re-average it and issues take from it at that cost
+
+Layers are kept compact: an exhausted layer is deleted, so the table only
+holds stock that is actually on hand, and the movement history stays in
+InventoryTransaction. ``issue`` reads the open layers of every item in a
+batch with one query, consumes them in memory and writes the result back
+with one DELETE and a bulk UPDATE, so the number of queries does not grow
+with the number of lines or layers.
+
+Stock changes made through ``save()`` are turned into receipts and issues
+by signals; code that moves stock with bulk UPDATEs calls ``issue`` or
+``receive`` itself. ``valuation`` totals every item with one grouped query.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+
+from .models import CostLayer, FinishedProduct, RawMaterial
+
+
+DEFAULT_COSTING_METHODS = {
+    'raw': 'fifo',
+    'finished': 'fifo',
+}
+
+MODELS = {
+    'raw': RawMaterial,
+    'finished': FinishedProduct,
+}
+
+# Cost of an item received or issued without layers to go by: the purchase
+# price of a material, the BOM standard cost of a product (never its
+# selling price)
+COST_FIELDS = {
+    'raw': 'unit_price',
+    'finished': 'standard_cost',
+}
+
+ZERO = Decimal('0')
+CENT = Decimal('0.01')
+
+LAYER_VALUE = ExpressionWrapper(F('quantity') * F('unit_cost'), output_field=DecimalField(max_digits=20, decimal_places=6))
+
+
+def costing_method(material_type):
+    methods = dict(DEFAULT_COSTING_METHODS)
+    methods.update(getattr(settings, 'INVENTORY_COSTING_METHODS', {}))
+    return methods[material_type]
+
+
+def _open_layers(keys):
+    """``{(material_type, material_id): [layer, ...]}`` oldest first, locked"""
+    by_type = defaultdict(set)
+    for material_type, material_id in keys:
+        by_type[material_type].add(material_id)
+    layers = defaultdict(list)
+    for material_type, ids in by_type.items():
+        rows = CostLayer.objects.select_for_update().filter(material_type=material_type, material_id__in=ids)
+        for layer in rows.order_by('material_id', 'received_at', 'id'):
+            layers[material_type, layer.material_id].append(layer)
+    return layers
+
+
+@transaction.atomic
+def receive(receipts):
+    """
+    Add stock to the cost layers.
+
+    ``receipts`` is an iterable of (material_type, material_id, quantity,
+    unit_cost, reference_number) tuples.
+    """
+    receipts = [receipt for receipt in receipts if receipt[2] > 0]
+    averaged = {(material_type, material_id) for material_type, material_id, *_rest in receipts
+                if costing_method(material_type) == 'average'}
+    averages = {key: layers[0] for key, layers in _open_layers(averaged).items()} if averaged else {}
+
+    created, changed = [], {}
+    for material_type, material_id, quantity, unit_cost, reference_number in receipts:
+        quantity, unit_cost = Decimal(str(quantity)), Decimal(str(unit_cost))
+        key = (material_type, material_id)
+        layer = averages.get(key)
+        if layer is not None:
+            total = layer.quantity + quantity
+            layer.unit_cost = ((layer.quantity * layer.unit_cost + quantity * unit_cost) / total).quantize(Decimal('0.0001'))
+            layer.quantity = total
+            if layer.pk is not None:
+                changed[layer.pk] = layer
+            continue
+        layer = CostLayer(
+            material_type=material_type, material_id=material_id,
+            quantity=quantity, unit_cost=unit_cost, reference_number=reference_number,
+        )
+        created.append(layer)
+        if key in averaged:
+            averages[key] = layer
+    CostLayer.objects.bulk_create(created)
+    if changed:
+        CostLayer.objects.bulk_update(changed.values(), ['quantity', 'unit_cost'])
+
+
+def _fallback_costs(keys):
+    """Unit costs (see COST_FIELDS) of items issued beyond their layers"""
+    by_type = defaultdict(set)
+    for material_type, material_id in keys:
+        by_type[material_type].add(material_id)
+    prices = {}
+    for material_type, ids in by_type.items():
+        items = MODELS[material_type].objects.filter(pk__in=ids)
+        for pk, unit_cost in items.values_list('pk', COST_FIELDS[material_type]):
+            prices[material_type, pk] = unit_cost
+    return prices
+
+
+@transaction.atomic
+def issue(issues):
+    """
+    Take stock out of the cost layers; returns the cost of each issue line.
+
+    ``issues`` is a list of (material_type, material_id, quantity) tuples.
+    Lines are consumed in order, so several lines for one item each get the
+    cost of the layers they used. Quantity beyond the layers on hand is
+    costed at the last layer's unit cost, or the item's unit cost (see
+    COST_FIELDS) when it had no layers.
+    """
+    issues = list(issues)
+    layers = _open_layers({(material_type, material_id) for material_type, material_id, _quantity in issues})
+    last_costs, short = {}, []
+    consumed, changed = set(), set()
+    costs = []
+    for material_type, material_id, quantity in issues:
+        key = (material_type, material_id)
+        remaining = Decimal(str(quantity))
+        cost = ZERO
+        open_layers = layers.get(key, [])
+        while remaining > 0 and open_layers:
+            layer = open_layers[0]
+            taken = min(remaining, layer.quantity)
+            cost += taken * layer.unit_cost
+            remaining -= taken
+            layer.quantity -= taken
+            last_costs[key] = layer.unit_cost
+            if layer.quantity <= 0:
+                consumed.add(layer.pk)
+                changed.discard(layer.pk)
+                open_layers.pop(0)
+            else:
+                changed.add(layer.pk)
+        if remaining > 0:
+            short.append((len(costs), key, remaining))
+        costs.append(cost)
+
+    if short:
+        prices = _fallback_costs({key for _index, key, _remaining in short if key not in last_costs})
+        for index, key, remaining in short:
+            costs[index] += remaining * last_costs.get(key, prices.get(key, ZERO))
+
+    if consumed:
+        CostLayer.objects.filter(pk__in=consumed).delete()
+    if changed:
+        by_pk = {layer.pk: layer for item_layers in layers.values() for layer in item_layers}
+        CostLayer.objects.bulk_update([by_pk[pk] for pk in changed], ['quantity'])
+    return [cost.quantize(CENT) for cost in costs]
+
+
+def item_value(material_type, material_id):
+    """Value of one item's stock on hand"""
+    value = CostLayer.objects.filter(
+        material_type=material_type, material_id=material_id
+    ).aggregate(value=Sum(LAYER_VALUE))['value']
+    return (value or ZERO).quantize(CENT)
+
+
+def valuation(material_type=None):
+    """
+    Stock on hand and its value per item, one row per material or product.
+
+    Returns a values queryset of material_type, material_id, on_hand,
+    value and layers, largest value first.
+    """
+    layers = CostLayer.objects.all()
+    if material_type:
+        layers = layers.filter(material_type=material_type)
+    return (
+        layers.order_by()
+        .values('material_type', 'material_id')
+        .annotate(value=Sum(LAYER_VALUE), on_hand=Sum('quantity'), layers=Count('id'))
+        .order_by('-value', 'material_type', 'material_id')
+    )
+
+
+def valuation_totals():
+    """``{material_type: {'items', 'on_hand', 'value'}}`` and the overall value, in one query"""
+    rows = (
+        CostLayer.objects.order_by()
+        .values('material_type')
+        .annotate(value=Sum(LAYER_VALUE), items=Count('material_id', distinct=True), on_hand=Sum('quantity'))
+    )
+    by_type = {
+        row['material_type']: {
+            'items': row['items'],
+            'on_hand': row['on_hand'],
+            'value': row['value'].quantize(CENT),
+        }
+        for row in rows
+    }
+    return by_type, sum((totals['value'] for totals in by_type.values()), ZERO)
@@ -21,10 +21,11 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db import transaction, models
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.core.paginator import Paginator
 from django.db.models import Q, Sum, F
 from django.utils import timezone
+from datetime import date, timedelta
 from .models import (
     Warehouse, MaterialCategory, ProductCategory,
     RawMaterial, FinishedProduct, InventoryTransaction, StockAlert
@@ -33,6 +34,14 @@ from .forms import (
     WarehouseForm, MaterialCategoryForm, ProductCategoryForm,
     RawMaterialForm, FinishedProductForm, InventoryTransactionForm, StockAdjustmentForm
 )
+from core.numbering import next_number
+from .details import MAX_BATCH, conditional_json, get_details, parse_ids
+from .history import daily_stock, stock_as_of, stock_movements
+from . import analysis, cycle_counts
+from .forms import CycleCountForm
+from .models import CycleCount
+from .lookup import DEFAULT_LIMIT, LOOKUPS, MAX_LIMIT
+from .valuation import costing_method, valuation, valuation_totals
 
 
 @login_required
@@ -342,7 +351,7 @@ def stock_adjustment(request):
                     material_name=material.name,
                     quantity=quantity,
                     unit_price=material.unit_price,
-                    reference_number=f"ADJ-{request.user.id}-{timezone.now().strftime('%Y%m%d%H%M%S')}",
+                    reference_number=next_number('stock_adjustment'),
                     notes=f"Stock adjustment: {reason}",
                     warehouse=warehouse,
                     created_by=request.user
@@ -363,20 +372,99 @@ def stock_adjustment(request):
 @login_required
 def get_material_details(request):
     """AJAX view to get material details for stock adjustment"""
-    material_type = request.GET.get('material_type')
-    material_id = request.GET.get('material_id')
+    material_type = 'raw' if request.GET.get('material_type') == 'raw' else 'finished'
+    try:
+        material_id = int(request.GET.get('material_id'))
+    except (TypeError, ValueError):
+        raise Http404('Invalid material id')
 
-    if material_type == 'raw':
-        material = get_object_or_404(RawMaterial, pk=material_id)
-    else:
-        material = get_object_or_404(FinishedProduct, pk=material_id)
+    details = get_details(material_type, [material_id])
+    if material_id not in details:
+        raise Http404('Material not found')
 
+    material = details[material_id]
     data = {
-        'name': material.name,
-        'current_stock': str(material.current_stock),
-        'unit': material.unit if hasattr(material, 'unit') else 'pcs'
+        'name': material['name'],
+        'current_stock': material['current_stock'],
+        'unit': material['unit'],
     }
-    return JsonResponse(data)
+    return conditional_json(request, data, details, [material_id])
+
+
+@login_required
+def get_material_details_batch(request):
+    """AJAX view to get the details of many materials in one request
+
+    Takes ``material_type`` and ``ids`` (comma separated or repeated) and
+    answers ``{'results': {id: details}, 'missing': [ids]}``.
+    """
+    material_type = 'raw' if request.GET.get('material_type') == 'raw' else 'finished'
+    try:
+        ids = parse_ids(request.GET.getlist('ids'))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid material id'}, status=400)
+    if len(ids) > MAX_BATCH:
+        return JsonResponse({'error': f'At most {MAX_BATCH} materials per request'}, status=400)
+
+    details = get_details(material_type, ids)
+    data = {
+        'results': {pk: details[pk] for pk in ids if pk in details},
+        'missing': [pk for pk in ids if pk not in details],
+    }
+    return conditional_json(request, data, details, ids)
+
+
+@login_required
+def stock_history(request):
+    """JSON stock history of one material or product
+
+    Takes ``material_type``, ``material_id`` and optional ``start`` / ``end``
+    dates (default: the year up to today) and answers the stock on hand at
+    the end of ``end`` per warehouse, the daily totals from the snapshots
+    and the movements of the last 31 days of the range with their running
+    balance.
+    """
+    material_type = 'raw' if request.GET.get('material_type') == 'raw' else 'finished'
+    try:
+        material_id = int(request.GET.get('material_id', ''))
+        end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else timezone.localdate()
+        start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else end - timedelta(days=365)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid material id or date'}, status=400)
+    if start > end:
+        return JsonResponse({'error': 'start must not be after end'}, status=400)
+
+    warehouses = dict(Warehouse.objects.values_list('pk', 'name'))
+    on_hand = stock_as_of(end, material_type, [material_id])
+    opening, movements = stock_movements(material_type, material_id, max(start, end - timedelta(days=30)), end)
+    return JsonResponse({
+        'as_of': end.isoformat(),
+        'on_hand': {warehouses.get(warehouse_id, warehouse_id): str(quantity)
+                    for (_type, _id, warehouse_id), quantity in on_hand.items()},
+        'daily': [[day.isoformat(), str(quantity)] for day, quantity in daily_stock(material_type, material_id, start, end)],
+        'opening': str(opening),
+        'movements': [{
+            'created_at': row['created_at'].isoformat(),
+            'type': row['transaction_type'],
+            'reference': row['reference_number'],
+            'warehouse': row['warehouse__name'],
+            'change': str(row['change']),
+            'balance': str(row['balance']),
+        } for row in movements],
+    })
+
+
+@login_required
+def lookup(request, kind):
+    """Typeahead JSON of active materials or products matching ``q``"""
+    index = LOOKUPS.get(kind)
+    if index is None:
+        raise Http404('Unknown lookup')
+    try:
+        limit = min(max(int(request.GET.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        limit = DEFAULT_LIMIT
+    return JsonResponse({'results': index.search(request.GET.get('q', ''), limit)})
 
 
 # Transaction History Views
@@ -696,6 +784,216 @@ def bulk_import_finished_products(request):
 
 
 # Stock Alert Views
+@login_required
+def inventory_valuation(request):
+    """Stock on hand valued from its cost layers, largest value first"""
+    material_type = request.GET.get('material_type', '')
+    if material_type not in ('raw', 'finished'):
+        material_type = ''
+
+    paginator = Paginator(valuation(material_type or None), 15)
+    page_obj = paginator.get_page(request.GET.get('page'))
+
+    # Names and codes for the rows on this page only
+    rows = list(page_obj)
+    items = {}
+    for row_type, model in (('raw', RawMaterial), ('finished', FinishedProduct)):
+        ids = [row['material_id'] for row in rows if row['material_type'] == row_type]
+        if ids:
+            items.update({(row_type, item.pk): item for item in model.objects.filter(pk__in=ids).only('code', 'name')})
+    for row in rows:
+        row['item'] = items.get((row['material_type'], row['material_id']))
+        row['unit_cost'] = row['value'] / row['on_hand'] if row['on_hand'] else 0
+
+    totals, total_value = valuation_totals()
+    context = {
+        'page_obj': page_obj,
+        'rows': rows,
+        'totals': totals,
+        'total_value': total_value,
+        'material_type': material_type,
+        'costing_methods': {key: costing_method(key) for key in ('raw', 'finished')},
+        'title': 'Inventory Valuation'
+    }
+    return render(request, 'inventory/valuation.html', context)
+
+
+@login_required
+def inventory_analysis(request):
+    """ABC/XYZ class matrix and slow-moving stock; POST re-runs the analysis"""
+    if request.method == 'POST':
+        try:
+            summary = analysis.run()
+        except ImportError:
+            messages.error(request, "numpy library is required for inventory analysis. Please install it.")
+        else:
+            updated = sum(totals['updated'] for totals in summary.values())
+            messages.success(request, f'Inventory analysed: {updated} items reclassified.')
+        return redirect('inventory_analysis')
+
+    material_type = 'raw' if request.GET.get('material_type') == 'raw' else 'finished'
+    model = RawMaterial if material_type == 'raw' else FinishedProduct
+    counts = {
+        (row['abc_class'], row['xyz_class']): row['items']
+        for row in model.objects.filter(is_active=True).order_by()
+        .values('abc_class', 'xyz_class').annotate(items=models.Count('id'))
+    }
+    matrix = [
+        (abc, [counts.get((abc, xyz), 0) for xyz in ('X', 'Y', 'Z')])
+        for abc in ('A', 'B', 'C')
+    ]
+    unclassified = sum(count for (abc, xyz), count in counts.items() if not abc or not xyz)
+
+    slow = analysis.slow_moving(material_type).order_by(F('last_movement_date').asc(nulls_first=True), 'code')
+    paginator = Paginator(slow, 15)
+    page_obj = paginator.get_page(request.GET.get('page'))
+
+    context = {
+        'material_type': material_type,
+        'matrix': matrix,
+        'unclassified': unclassified,
+        'page_obj': page_obj,
+        'slow_moving_days': analysis.policy()['slow_moving_days'],
+        'today': timezone.localdate(),
+        'title': 'Inventory Analysis'
+    }
+    return render(request, 'inventory/analysis.html', context)
+
+
+# Cycle Count Views
+@login_required
+def cycle_count_list(request):
+    counts = CycleCount.objects.select_related('warehouse', 'created_by').annotate(
+        line_count=models.Count('lines'),
+        counted_count=models.Count('lines__counted_quantity'),
+    ).order_by('-created_at')
+    status = request.GET.get('status', '')
+    if status:
+        counts = counts.filter(status=status)
+    paginator = Paginator(counts, 15)
+    page_obj = paginator.get_page(request.GET.get('page'))
+
+    context = {
+        'page_obj': page_obj,
+        'status': status,
+        'status_choices': CycleCount.STATUS_CHOICES,
+        'title': 'Cycle Counts'
+    }
+    return render(request, 'inventory/cycle_count_list.html', context)
+
+
+@login_required
+def cycle_count_create(request):
+    if request.method == 'POST':
+        form = CycleCountForm(request.POST)
+        if form.is_valid():
+            count = cycle_counts.create_count(
+                form.cleaned_data['warehouse'], request.user,
+                material_type=form.cleaned_data['material_type'],
+                abc_classes=''.join(sorted(form.cleaned_data['abc_classes'])),
+                stocked_only=form.cleaned_data['stocked_only'],
+                due_only=form.cleaned_data['due_only'],
+                notes=form.cleaned_data['notes'],
+            )
+            messages.success(request, f'Count sheet {count.count_number} created with {count.lines.count()} items.')
+            return redirect('cycle_count_detail', pk=count.pk)
+    else:
+        form = CycleCountForm()
+
+    context = {
+        'form': form,
+        'title': 'New Cycle Count'
+    }
+    return render(request, 'inventory/cycle_count_form.html', context)
+
+
+@login_required
+def cycle_count_detail(request, pk):
+    """Count sheet lines, a page at a time; POST saves the counts entered on the page"""
+    count = get_object_or_404(CycleCount.objects.select_related('warehouse'), pk=pk)
+    lines = count.lines.annotate(variance=cycle_counts.VARIANCE, variance_value=cycle_counts.VARIANCE_VALUE)
+    if request.GET.get('variances'):
+        lines = lines.filter(counted_quantity__isnull=False).exclude(variance=0)
+    paginator = Paginator(lines, 50)
+    page_obj = paginator.get_page(request.GET.get('page'))
+
+    if request.method == 'POST' and count.status == 'counting':
+        counted, errors = [], []
+        for line in page_obj:
+            try:
+                quantity = cycle_counts.parse_quantity(request.POST.get(f'counted_{line.pk}'), line.material_type)
+            except ValueError as e:
+                errors.append(f"{line.code}: {e}")
+                continue
+            if quantity != line.counted_quantity:
+                line.counted_quantity = quantity
+                counted.append(line)
+        cycle_counts.save_counts(counted)
+        for error in errors[:10]:
+            messages.warning(request, error)
+        messages.success(request, f'Saved {len(counted)} counts.')
+        return redirect(f"{request.path}?{request.GET.urlencode()}")
+
+    summary = count.lines.aggregate(
+        lines=models.Count('id'),
+        counted=models.Count('counted_quantity'),
+    )
+    summary.update(cycle_counts.variances(count).aggregate(
+        variances=models.Count('id'),
+        net_value=Sum(cycle_counts.VARIANCE_VALUE),
+    ))
+    context = {
+        'count': count,
+        'page_obj': page_obj,
+        'summary': summary,
+        'variances_only': bool(request.GET.get('variances')),
+        'title': f'Cycle Count {count.count_number}'
+    }
+    return render(request, 'inventory/cycle_count_detail.html', context)
+
+
+@login_required
+def cycle_count_sheet(request, pk):
+    """Download a count sheet as XLSX to fill in"""
+    count = get_object_or_404(CycleCount, pk=pk)
+    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    response['Content-Disposition'] = f'attachment; filename="{count.count_number}.xlsx"'
+    cycle_counts.write_sheet(count, response)
+    return response
+
+
+@login_required
+def cycle_count_upload(request, pk):
+    """Read the counts from a filled-in count sheet"""
+    count = get_object_or_404(CycleCount, pk=pk)
+    if request.method == 'POST' and request.FILES.get('excel_file') and count.status == 'counting':
+        try:
+            updated, errors = cycle_counts.read_sheet(count, request.FILES['excel_file'])
+        except Exception as e:
+            messages.error(request, f'Error processing file: {str(e)}')
+        else:
+            messages.success(request, f'Read {updated} counts from the sheet.')
+            for error in errors[:10]:
+                messages.warning(request, error)
+            if len(errors) > 10:
+                messages.warning(request, f'... and {len(errors) - 10} more errors.')
+    return redirect('cycle_count_detail', pk=pk)
+
+
+@login_required
+def cycle_count_post(request, pk):
+    """Book the variances of a count sheet"""
+    count = get_object_or_404(CycleCount, pk=pk)
+    if request.method == 'POST':
+        try:
+            adjusted, net_value = cycle_counts.post_count(count, request.user)
+        except ValueError as e:
+            messages.error(request, str(e))
+        else:
+            messages.success(request, f'{count.count_number} posted: {adjusted} items adjusted, net value {net_value}.')
+    return redirect('cycle_count_detail', pk=pk)
+
+
 @login_required
 def stock_alert_list(request):
     # Generate dynamic alerts from current stock levels
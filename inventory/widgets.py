@@ -0,0 +1,55 @@
+from django import forms
+from django.core.exceptions import ValidationError
+from django.urls import reverse
+
+
+class LookupSelect(forms.Select):
+    """
+    Select for a ModelChoiceField that renders only the empty and selected
+    choices. The typeahead script in base.html loads the other options from
+    ``lookup_url_name`` (see inventory.lookup) when the field is used.
+
+    ``option_data`` maps data attribute names to model fields rendered on
+    the selected option, matching the ``data`` of lookup results.
+    """
+
+    def __init__(self, lookup_url_name, attrs=None, option_data=None):
+        super().__init__(attrs)
+        self.lookup_url_name = lookup_url_name
+        self.option_data = option_data or {}
+        self._selected = {}
+
+    def __deepcopy__(self, memo):
+        obj = super().__deepcopy__(memo)
+        obj._selected = {}
+        return obj
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs']['data-lookup'] = reverse(self.lookup_url_name)
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        field = self.choices.field
+        selected = [pk for pk in value if pk]
+        try:
+            objects = list(self.choices.queryset.filter(pk__in=selected)) if selected else []
+        except (ValueError, TypeError, ValidationError):
+            objects = []
+        self._selected = {str(obj.pk): obj for obj in objects}
+
+        choices = [('', field.empty_label)] if field.empty_label is not None else []
+        choices += [(obj.pk, field.label_from_instance(obj)) for obj in objects]
+        full_choices, self.choices = self.choices, choices
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = full_choices
+
+    def create_option(self, name, value, label, selected, index, subindex=None, attrs=None):
+        option = super().create_option(name, value, label, selected, index, subindex, attrs)
+        obj = self._selected.get(str(value))
+        if obj is not None:
+            for key, field in self.option_data.items():
+                option['attrs'][f'data-{key}'] = str(getattr(obj, field))
+        return option
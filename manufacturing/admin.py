@@ -1,7 +1,8 @@
 from django.contrib import admin
+from core.admin import SearchIndexAdminMixin
 from .models import (
     ProductionOrder, BillOfMaterials, BOMItem, WorkOrder,
-    MaterialConsumption, ProductionProgress
+    MaterialConsumption, ProductionProgress, LotConsumption
 )
 
 
@@ -13,10 +14,10 @@ class BOMItemInline(admin.TabularInline):
 
 @admin.register(BillOfMaterials)
 class BillOfMaterialsAdmin(admin.ModelAdmin):
-    list_display = ['product', 'version', 'is_active', 'total_cost', 'created_by', 'created_at']
+    list_display = ['product', 'version', 'is_active', 'total_cost', 'standard_cost', 'created_by', 'created_at']
     list_filter = ['is_active', 'created_at', 'created_by']
     search_fields = ['product__name', 'product__code']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['standard_cost', 'created_at', 'updated_at']
     inlines = [BOMItemInline]
 
     fieldsets = (
@@ -24,7 +25,7 @@ class BillOfMaterialsAdmin(admin.ModelAdmin):
             'fields': ('product', 'version', 'is_active')
         }),
         ('Cost Information', {
-            'fields': ('total_cost', 'labor_cost', 'overhead_cost')
+            'fields': ('total_cost', 'labor_cost', 'overhead_cost', 'standard_cost')
         }),
         ('Metadata', {
             'fields': ('created_by', 'created_at', 'updated_at'),
@@ -49,10 +50,11 @@ class WorkOrderInline(admin.StackedInline):
 
 
 @admin.register(ProductionOrder)
-class ProductionOrderAdmin(admin.ModelAdmin):
+class ProductionOrderAdmin(SearchIndexAdminMixin, admin.ModelAdmin):
     list_display = ['po_number', 'product', 'quantity', 'status', 'priority', 'planned_start_date', 'progress_percentage', 'created_by']
     list_filter = ['status', 'priority', 'planned_start_date', 'created_by']
     search_fields = ['po_number', 'product__name', 'product__code']
+    search_doc_type = 'production_order'
     readonly_fields = ['created_at', 'updated_at', 'approved_at']
     inlines = [WorkOrderInline]
 
@@ -92,10 +94,11 @@ class ProductionProgressInline(admin.TabularInline):
 
 
 @admin.register(WorkOrder)
-class WorkOrderAdmin(admin.ModelAdmin):
+class WorkOrderAdmin(SearchIndexAdminMixin, admin.ModelAdmin):
     list_display = ['wo_number', 'production_order', 'stage', 'quantity', 'status', 'assigned_to', 'planned_start_date']
     list_filter = ['status', 'stage', 'planned_start_date', 'assigned_to']
     search_fields = ['wo_number', 'production_order__po_number', 'production_order__product__name']
+    search_doc_type = 'work_order'
     readonly_fields = ['created_at', 'updated_at']
     inlines = [MaterialConsumptionInline, ProductionProgressInline]
 
@@ -120,12 +123,21 @@ class WorkOrderAdmin(admin.ModelAdmin):
     )
 
 
+class LotConsumptionInline(admin.TabularInline):
+    model = LotConsumption
+    extra = 0
+    fields = ['lot', 'quantity']
+    readonly_fields = ['lot', 'quantity']
+    can_delete = False
+
+
 @admin.register(MaterialConsumption)
 class MaterialConsumptionAdmin(admin.ModelAdmin):
-    list_display = ['work_order', 'material', 'planned_quantity', 'actual_quantity', 'consumption_date', 'recorded_by']
+    list_display = ['work_order', 'material', 'planned_quantity', 'actual_quantity', 'cost', 'consumption_date', 'recorded_by']
     list_filter = ['consumption_date', 'recorded_by', 'material']
     search_fields = ['work_order__wo_number', 'material__name']
-    readonly_fields = ['created_at']
+    readonly_fields = ['cost', 'created_at']
+    inlines = [LotConsumptionInline]
 
 
 @admin.register(ProductionProgress)
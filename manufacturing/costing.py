@@ -0,0 +1,103 @@
+"""
+Standard costing of finished products from their bills of materials.
+
+A BOM's material cost is the sum of quantity * unit price over its items,
+and a product's standard cost is that material cost plus the BOM's labor
+and overhead. Both are stored: ``BillOfMaterials.total_cost`` and
+``FinishedProduct.standard_cost``, along with each item's ``unit_cost``.
+
+``recost_boms`` refreshes them for a batch of BOMs with three UPDATEs
+whatever the batch size: item unit costs from their materials, BOM totals
+from a grouped aggregate of their items, and product standard costs from
+their active BOM.
+
+When a material's unit price changes only the BOMs using it are re-costed.
+They are found through the (material, bom) index on BOM items, so a price
+change touches the BOMs that list the material and nothing else. Changes
+are queued by signals and re-costed once the transaction commits, so a
+bulk price import re-costs each affected BOM once.
+"""
+import threading
+
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+
+from inventory.models import FinishedProduct, RawMaterial
+
+from .models import BillOfMaterials, BOMItem
+
+
+# BOMs re-costed per transaction
+RECOST_BATCH_SIZE = 2000
+
+_pending = threading.local()
+
+
+def boms_using(material_ids):
+    """Ids of the BOMs with an item for any of the materials"""
+    return set(
+        BOMItem.objects.filter(material_id__in=material_ids).values_list('bom_id', flat=True).distinct()
+    )
+
+
+def _recost_chunk(bom_ids):
+    material_price = RawMaterial.objects.filter(pk=OuterRef('material_id')).values('unit_price')[:1]
+    BOMItem.objects.filter(bom_id__in=bom_ids).update(unit_cost=Subquery(material_price))
+
+    material_cost = (
+        BOMItem.objects.filter(bom_id=OuterRef('pk'))
+        .order_by()
+        .values('bom_id')
+        .annotate(total=Round(Sum(F('quantity') * F('unit_cost')), 2))
+        .values('total')
+    )
+    BillOfMaterials.objects.filter(pk__in=bom_ids).update(
+        total_cost=Coalesce(Subquery(material_cost), Value(0), output_field=DecimalField(max_digits=12, decimal_places=2))
+    )
+
+    bom_cost = (
+        BillOfMaterials.objects.filter(product_id=OuterRef('pk'))
+        .annotate(cost=F('total_cost') + F('labor_cost') + F('overhead_cost'))
+        .values('cost')[:1]
+    )
+    FinishedProduct.objects.filter(
+        bill_of_materials__pk__in=bom_ids, bill_of_materials__is_active=True
+    ).update(standard_cost=Subquery(bom_cost))
+
+
+def recost_boms(bom_ids=None, batch_size=RECOST_BATCH_SIZE):
+    """Re-cost the given BOMs, or every BOM; returns how many were re-costed"""
+    if bom_ids is None:
+        bom_ids = BillOfMaterials.objects.values_list('pk', flat=True)
+    bom_ids = sorted(set(bom_ids))
+    for start in range(0, len(bom_ids), batch_size):
+        with transaction.atomic():
+            _recost_chunk(bom_ids[start:start + batch_size])
+    return len(bom_ids)
+
+
+def recost_materials(material_ids, batch_size=RECOST_BATCH_SIZE):
+    """Re-cost the BOMs using any of the materials; returns how many were re-costed"""
+    return recost_boms(boms_using(material_ids), batch_size)
+
+
+def queue(material_ids=(), bom_ids=()):
+    """Queue materials whose price changed and BOMs that were edited for re-costing on commit"""
+    if not hasattr(_pending, 'materials'):
+        _pending.materials, _pending.boms = set(), set()
+    _pending.materials.update(material_ids)
+    _pending.boms.update(bom_ids)
+    transaction.on_commit(flush)
+
+
+def flush():
+    """Re-cost every queued BOM and the BOMs using every queued material"""
+    materials = getattr(_pending, 'materials', None)
+    boms = getattr(_pending, 'boms', None)
+    if not materials and not boms:
+        return 0
+    _pending.materials, _pending.boms = set(), set()
+    if materials:
+        boms |= boms_using(materials)
+    return recost_boms(boms)
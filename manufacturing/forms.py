@@ -5,6 +5,7 @@ from .models import (
     MaterialConsumption, ProductionProgress
 )
 from inventory.models import FinishedProduct, RawMaterial
+from inventory.widgets import LookupSelect
 
 
 class ProductionOrderForm(forms.ModelForm):
@@ -50,7 +51,8 @@ class BOMItemForm(forms.ModelForm):
         model = BOMItem
         fields = ['material', 'quantity', 'allocated_stages']
         widgets = {
-            'quantity': forms.NumberInput(attrs={'step': '0.01'}),
+            'material': LookupSelect('material_lookup', attrs={'class': 'material-select'}, option_data={'price': 'unit_price'}),
+            'quantity': forms.NumberInput(attrs={'step': '0.01', 'class': 'quantity-input'}),
         }
 
     def __init__(self, *args, **kwargs):
@@ -78,7 +80,7 @@ class WorkOrderForm(forms.ModelForm):
     class Meta:
         model = WorkOrder
         fields = [
-            'wo_number', 'production_order', 'stage', 'quantity',
+            'production_order', 'stage', 'quantity',
             'planned_start_date', 'planned_end_date', 'assigned_to',
             'supervisor', 'notes'
         ]
@@ -88,19 +90,13 @@ class WorkOrderForm(forms.ModelForm):
             'notes': forms.Textarea(attrs={'rows': 3}),
         }
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        # Generate WO number if creating new
-        if not self.instance.pk:
-            from django.utils import timezone
-            self.fields['wo_number'].initial = f"WO-{timezone.now().strftime('%Y%m%d')}-001"
-
 
 class MaterialConsumptionForm(forms.ModelForm):
     class Meta:
         model = MaterialConsumption
         fields = ['material', 'planned_quantity', 'actual_quantity', 'notes']
         widgets = {
+            'material': LookupSelect('material_lookup'),
             'planned_quantity': forms.NumberInput(attrs={'step': '0.01'}),
             'actual_quantity': forms.NumberInput(attrs={'step': '0.01'}),
             'notes': forms.Textarea(attrs={'rows': 2}),
@@ -119,7 +115,7 @@ class MaterialConsumptionForm(forms.ModelForm):
                     material_ids = bom.items.filter(
                         allocated_stages__contains=[work_order.stage]
                     ).values_list('material_id', flat=True)
-                    self.fields['material'].queryset = RawMaterial.objects.filter(id__in=material_ids)
+                    self._limit_materials(material_ids)
 
                     # Set initial planned quantity from existing consumption record if it exists
                     existing_consumption = work_order.material_consumptions.filter(
@@ -135,7 +131,7 @@ class MaterialConsumptionForm(forms.ModelForm):
                     material_ids = bom.items.filter(
                         allocated_stages__contains=[work_order.stage]
                     ).values_list('material_id', flat=True)
-                    self.fields['material'].queryset = RawMaterial.objects.filter(id__in=material_ids)
+                    self._limit_materials(material_ids)
 
                     # Set initial planned quantity from existing consumption record if it exists
                     existing_consumption = work_order.material_consumptions.filter(
@@ -144,6 +140,11 @@ class MaterialConsumptionForm(forms.ModelForm):
                     if existing_consumption:
                         self.fields['planned_quantity'].initial = existing_consumption.planned_quantity
 
+    def _limit_materials(self, material_ids):
+        # The stage's own materials are few enough to list in full
+        self.fields['material'].widget = forms.Select()
+        self.fields['material'].queryset = RawMaterial.objects.filter(id__in=material_ids)
+
 
 class ProductionProgressForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.models import RawMaterial
+from manufacturing.costing import RECOST_BATCH_SIZE, recost_boms, recost_materials
+
+
+class Command(BaseCommand):
+    help = 'Re-cost bills of materials from current material prices and roll up product standard costs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--material', action='append', default=[],
+                            help='Only re-cost the BOMs using this material code (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=RECOST_BATCH_SIZE,
+                            help='BOMs re-costed per transaction')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        started = time.monotonic()
+        if options['material']:
+            material_ids = list(RawMaterial.objects.filter(code__in=options['material']).values_list('pk', flat=True))
+            if len(material_ids) != len(set(options['material'])):
+                raise CommandError('Unknown material code')
+            count = recost_materials(material_ids, options['batch_size'])
+        else:
+            count = recost_boms(batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Re-costed {count} BOM(s) in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:14
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+
+
+def fill_standard_costs(apps, schema_editor):
+    # From the stored BOM totals; recost_boms refreshes them from current prices
+    BillOfMaterials = apps.get_model('manufacturing', 'BillOfMaterials')
+    FinishedProduct = apps.get_model('inventory', 'FinishedProduct')
+    bom_cost = (
+        BillOfMaterials.objects.filter(product_id=OuterRef('pk'))
+        .annotate(cost=F('total_cost') + F('labor_cost') + F('overhead_cost'))
+        .values('cost')[:1]
+    )
+    FinishedProduct.objects.filter(bill_of_materials__is_active=True).update(standard_cost=Subquery(bom_cost))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_standard_cost'),
+        ('manufacturing', '0003_alter_bomitem_unit_cost'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bomitem',
+            index=models.Index(fields=['material', 'bom'], name='bomitem_material_bom_idx'),
+        ),
+        migrations.RunPython(fill_standard_costs, migrations.RunPython.noop),
+    ]
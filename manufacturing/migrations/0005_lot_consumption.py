@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_material_lots'),
+        ('manufacturing', '0004_bomitem_material_bom_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LotConsumption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('consumption', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lot_consumptions', to='manufacturing.materialconsumption')),
+                ('lot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consumptions', to='inventory.materiallot')),
+            ],
+            options={
+                'verbose_name': 'Lot Consumption',
+                'verbose_name_plural': 'Lot Consumptions',
+            },
+        ),
+    ]
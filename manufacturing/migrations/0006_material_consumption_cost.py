@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 03:31
+
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery
+
+
+def cost_existing_consumptions(apps, schema_editor):
+    # Layers consumed before the cost was kept are gone; price the earlier
+    # consumptions at the material's unit price, as they were posted
+    MaterialConsumption = apps.get_model('manufacturing', 'MaterialConsumption')
+    RawMaterial = apps.get_model('inventory', 'RawMaterial')
+    unit_price = RawMaterial.objects.filter(pk=OuterRef('material_id')).values('unit_price')
+    MaterialConsumption.objects.update(cost=ExpressionWrapper(
+        F('actual_quantity') * Subquery(unit_price),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_material_lots'),
+        ('manufacturing', '0005_lot_consumption'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='materialconsumption',
+            name='cost',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, help_text="Cost of the quantity consumed, from the material's cost layers", max_digits=12),
+        ),
+        migrations.RunPython(cost_existing_consumptions, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
 from django.utils import timezone
-from decimal import Decimal
-from inventory.models import RawMaterial, FinishedProduct
+from inventory.models import RawMaterial, FinishedProduct, MaterialLot
+from core.numbering import next_number
 
 
 class ProductionOrder(models.Model):
@@ -95,14 +96,17 @@ class BillOfMaterials(models.Model):
     def __str__(self):
         return f"BOM for {self.product.name} v{self.version}"
 
+    @property
+    def standard_cost(self):
+        """Material, labor and overhead cost per unit"""
+        return self.total_cost + self.labor_cost + self.overhead_cost
+
     def calculate_total_cost(self):
         """Calculate total material cost from BOM items (quantity * unit_price)"""
-        total = self.items.aggregate(
-            total=models.Sum(models.F('quantity') * models.F('material__unit_price'))
-        )['total'] or Decimal('0')
-        self.total_cost = total
-        self.save(update_fields=['total_cost'])
-        return total
+        from .costing import recost_boms
+        recost_boms([self.pk])
+        self.refresh_from_db(fields=['total_cost'])
+        return self.total_cost
 
 
 class BOMItem(models.Model):
@@ -128,6 +132,10 @@ class BOMItem(models.Model):
         ordering = ['material__name']
         verbose_name = 'BOM Item'
         verbose_name_plural = 'BOM Items'
+        indexes = [
+            # Finds the BOMs using a material when its price changes
+            models.Index(fields=['material', 'bom'], name='bomitem_material_bom_idx'),
+        ]
 
     def __str__(self):
         stages = ', '.join([stage.title() for stage in self.allocated_stages]) if self.allocated_stages else 'No stages'
@@ -199,6 +207,15 @@ class WorkOrder(models.Model):
     def __str__(self):
         return f"WO-{self.wo_number} - {self.production_order.product.name} ({self.get_stage_display()})"
 
+    def save(self, *args, **kwargs):
+        # Auto-generate work order number if not provided
+        if not self.wo_number:
+            with transaction.atomic():
+                self.wo_number = next_number('work_order')
+                super().save(*args, **kwargs)
+            return
+        super().save(*args, **kwargs)
+
     @property
     def progress_percentage(self):
         """Calculate progress percentage from latest progress entry"""
@@ -217,6 +234,10 @@ class MaterialConsumption(models.Model):
 
     consumption_date = models.DateTimeField(default=timezone.now, help_text="Date of consumption")
     recorded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='material_consumptions')
+    cost = models.DecimalField(
+        max_digits=12, decimal_places=2, default=0, editable=False,
+        help_text="Cost of the quantity consumed, from the material's cost layers"
+    )
 
     notes = models.TextField(blank=True, help_text="Consumption notes")
     created_at = models.DateTimeField(auto_now_add=True)
@@ -231,10 +252,46 @@ class MaterialConsumption(models.Model):
 
     def save(self, *args, **kwargs):
         """Update inventory when material is consumed"""
-        super().save(*args, **kwargs)
-        # Reduce inventory stock
-        self.material.current_stock -= self.actual_quantity
-        self.material.save(update_fields=['current_stock'])
+        from inventory import details, valuation
+
+        adding = self._state.adding
+        with transaction.atomic():
+            # Reduce inventory stock. The stock moves with an F() update, so
+            # the issue is costed here and the cost kept for posting
+            RawMaterial.objects.filter(pk=self.material_id).update(
+                current_stock=F('current_stock') - self.actual_quantity, updated_at=timezone.now()
+            )
+            [cost] = valuation.issue([('raw', self.material_id, self.actual_quantity)])
+            details.invalidate('raw', [self.material_id])
+            self.material.current_stock -= self.actual_quantity
+            if adding:
+                self.cost = cost
+            super().save(*args, **kwargs)
+            if adding:
+                # Take the quantity from the material's lots, expiring first
+                from inventory.lots import consume
+                allocations = consume(
+                    self.material, self.actual_quantity, self.work_order.wo_number, self.recorded_by,
+                    notes=f"Consumed by work order {self.work_order.wo_number}",
+                )
+                LotConsumption.objects.bulk_create([
+                    LotConsumption(consumption=self, lot=lot, quantity=quantity)
+                    for lot, quantity in allocations
+                ])
+
+
+class LotConsumption(models.Model):
+    """Quantity of a material lot used by a consumption, for lot genealogy"""
+    consumption = models.ForeignKey(MaterialConsumption, on_delete=models.CASCADE, related_name='lot_consumptions')
+    lot = models.ForeignKey(MaterialLot, on_delete=models.CASCADE, related_name='consumptions')
+    quantity = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        verbose_name = 'Lot Consumption'
+        verbose_name_plural = 'Lot Consumptions'
+
+    def __str__(self):
+        return f"{self.lot.lot_number} - {self.quantity}"
 
 
 class ProductionProgress(models.Model):
@@ -0,0 +1,30 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from inventory.models import RawMaterial
+from . import costing
+from .models import BillOfMaterials, BOMItem
+
+
+@receiver(post_init, sender=RawMaterial)
+def remember_material_price(sender, instance, **kwargs):
+    # Read through __dict__ so deferred fields are not loaded
+    instance._loaded_unit_price = instance.__dict__.get('unit_price')
+
+
+@receiver(post_save, sender=RawMaterial)
+def recost_material_boms(sender, instance, created, **kwargs):
+    if not created and instance.unit_price != instance._loaded_unit_price:
+        costing.queue(material_ids=[instance.pk])
+    instance._loaded_unit_price = instance.unit_price
+
+
+@receiver(post_save, sender=BillOfMaterials)
+def recost_bom(sender, instance, **kwargs):
+    costing.queue(bom_ids=[instance.pk])
+
+
+@receiver(post_save, sender=BOMItem)
+@receiver(post_delete, sender=BOMItem)
+def recost_item_bom(sender, instance, **kwargs):
+    costing.queue(bom_ids=[instance.bom_id])
@@ -1,3 +1,95 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from inventory.models import FinishedProduct, MaterialCategory, ProductCategory, RawMaterial
+
+from . import costing
+from .models import BillOfMaterials, BOMItem
+
+
+class CostingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('production', password='production')
+        cls.category = MaterialCategory.objects.create(name='Leather')
+        cls.product_category = ProductCategory.objects.create(name='Sneakers')
+
+    def setUp(self):
+        self.leather = self.make_material('LTR-01', Decimal('10'))
+        self.sole = self.make_material('SOL-01', Decimal('5'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sneaker = self.make_bom('SNK-01', [(self.leather, 2), (self.sole, 1)], labor=10, overhead=5)
+            self.sandal = self.make_bom('SDL-01', [(self.sole, 2)])
+
+    def make_material(self, code, unit_price):
+        return RawMaterial.objects.create(code=code, name=code, category=self.category, unit='m', unit_price=unit_price)
+
+    def make_bom(self, code, items, labor=0, overhead=0, is_active=True):
+        product = FinishedProduct.objects.create(
+            code=code, name=code, category=self.product_category, size='40', color='black', unit_price=250,
+        )
+        bom = BillOfMaterials.objects.create(
+            product=product, labor_cost=labor, overhead_cost=overhead, is_active=is_active, created_by=self.user,
+        )
+        for material, quantity in items:
+            BOMItem.objects.create(bom=bom, material=material, quantity=quantity)
+        return bom
+
+    def costs(self, bom):
+        bom.refresh_from_db()
+        product = FinishedProduct.objects.get(pk=bom.product_id)
+        return bom.total_cost, product.standard_cost
+
+    def change_price(self, material, unit_price):
+        # Left queued, so the test flushes and counts the re-costing itself
+        with self.captureOnCommitCallbacks():
+            material.unit_price = unit_price
+            material.save()
+
+    def test_new_boms_are_costed_on_commit(self):
+        self.assertEqual(self.costs(self.sneaker), (Decimal('25.00'), Decimal('40.00')))
+        self.assertEqual(self.costs(self.sandal), (Decimal('10.00'), Decimal('10.00')))
+
+    def test_price_change_recosts_only_the_boms_using_the_material(self):
+        self.change_price(self.leather, Decimal('12'))
+
+        self.assertEqual(costing.flush(), 1)
+        self.assertEqual(set(BOMItem.objects.filter(material=self.leather).values_list('unit_cost', flat=True)), {Decimal('12.00')})
+        self.assertEqual(self.costs(self.sneaker), (Decimal('29.00'), Decimal('44.00')))
+        self.assertEqual(self.costs(self.sandal), (Decimal('10.00'), Decimal('10.00')))
+
+    def test_shared_material_recosts_every_bom_once(self):
+        self.change_price(self.sole, Decimal('6'))
+        self.change_price(self.sole, Decimal('7'))
+
+        self.assertEqual(costing.flush(), 2)
+        self.assertEqual(self.costs(self.sneaker), (Decimal('27.00'), Decimal('42.00')))
+        self.assertEqual(self.costs(self.sandal), (Decimal('14.00'), Decimal('14.00')))
+
+    def test_edits_that_keep_the_price_do_not_recost(self):
+        with self.captureOnCommitCallbacks():
+            self.leather.name = 'Full grain leather'
+            self.leather.save()
+
+        self.assertEqual(costing.flush(), 0)
+
+    def test_inactive_bom_does_not_set_the_standard_cost(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            draft = self.make_bom('SNK-02', [(self.leather, 1)], labor=3, is_active=False)
+
+        self.assertEqual(self.costs(draft), (Decimal('10.00'), Decimal('0.00')))
+
+    def test_recost_queries_do_not_grow_with_boms(self):
+        def queries(count):
+            with self.captureOnCommitCallbacks(execute=True):
+                boms = [self.make_bom(f'Q{count}-{n}', [(self.leather, 1), (self.sole, 1)]) for n in range(count)]
+            with CaptureQueriesContext(connection) as captured:
+                costing.recost_boms([bom.pk for bom in boms])
+            return len(captured)
 
-# Create your tests here.
+        self.assertEqual(queries(2), queries(10))
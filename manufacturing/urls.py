@@ -39,4 +39,5 @@ urlpatterns = [
 
     # API URLs
     path('api/material-price/<int:material_id>/', views.get_material_price, name='get_material_price'),
+    path('api/material-prices/', views.get_material_prices, name='get_material_prices'),
 ]
\ No newline at end of file
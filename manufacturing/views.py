@@ -17,20 +17,43 @@ from .forms import (
     WorkOrderForm, MaterialConsumptionForm, ProductionProgressForm,
     BulkWorkOrderGenerationForm, BOMBulkImportForm
 )
+from inventory.details import MAX_BATCH, conditional_json, get_details, parse_ids
+from inventory.lots import genealogy
 from inventory.models import FinishedProduct, RawMaterial
+from core.search import matching_ids
 
 
 @login_required
 def get_material_price(request, material_id):
     """API view to get material unit price"""
-    try:
-        material = RawMaterial.objects.get(id=material_id)
-        return JsonResponse({
-            'unit_price': float(material.unit_price),
-            'name': material.name
-        })
-    except RawMaterial.DoesNotExist:
+    details = get_details('raw', [material_id])
+    if material_id not in details:
         return JsonResponse({'error': 'Material not found'}, status=404)
+    material = details[material_id]
+    return conditional_json(request, {
+        'unit_price': float(material['unit_price']),
+        'name': material['name']
+    }, details, [material_id])
+
+
+@login_required
+def get_material_prices(request):
+    """API view to get the unit prices of many materials (``?ids=1,2,3``) in one request"""
+    try:
+        ids = parse_ids(request.GET.getlist('ids'))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid material id'}, status=400)
+    if len(ids) > MAX_BATCH:
+        return JsonResponse({'error': f'At most {MAX_BATCH} materials per request'}, status=400)
+
+    details = get_details('raw', ids)
+    return conditional_json(request, {
+        'results': {
+            pk: {'unit_price': float(details[pk]['unit_price']), 'name': details[pk]['name']}
+            for pk in ids if pk in details
+        },
+        'missing': [pk for pk in ids if pk not in details],
+    }, details, ids)
 
 
 @login_required
@@ -77,11 +100,7 @@ def production_order_list(request):
     priority_filter = request.GET.get('priority')
 
     if search_query:
-        production_orders = production_orders.filter(
-            Q(po_number__icontains=search_query) |
-            Q(product__name__icontains=search_query) |
-            Q(created_by__username__icontains=search_query)
-        )
+        production_orders = production_orders.filter(pk__in=matching_ids(search_query, 'production_order'))
 
     if status_filter:
         production_orders = production_orders.filter(status=status_filter)
@@ -148,6 +167,7 @@ def production_order_detail(request, pk):
     context = {
         'po': po,
         'work_orders': work_orders,
+        'material_lots': genealogy(po.pk),
         'title': f'Production Order: {po.po_number}'
     }
     return render(request, 'manufacturing/production_order_detail.html', context)
@@ -341,13 +361,9 @@ def bill_of_materials_create(request):
         form = BillOfMaterialsForm()
         formset = BOMItemFormSet()
 
-    # Get all active raw materials for the template
-    materials = RawMaterial.objects.filter(is_active=True).order_by('name').values('id', 'code', 'name', 'unit_price')
-
     context = {
         'form': form,
         'formset': formset,
-        'materials': list(materials),
         'title': 'Create Bill of Materials'
     }
     return render(request, 'manufacturing/bom_form.html', context)
@@ -399,14 +415,10 @@ def bill_of_materials_update(request, pk):
         form = BillOfMaterialsForm(instance=bom)
         formset = BOMItemFormSet(instance=bom)
 
-    # Get all active raw materials for the template
-    materials = RawMaterial.objects.filter(is_active=True).order_by('name').values('id', 'code', 'name', 'unit_price')
-
     context = {
         'form': form,
         'formset': formset,
         'bom': bom,
-        'materials': list(materials),
         'title': f'Update BOM: {bom.product.name} v{bom.version}'
     }
     return render(request, 'manufacturing/bom_form.html', context)
@@ -503,7 +515,6 @@ def generate_work_orders(request):
                         end_date = current_date + timedelta(days=duration_days - 1)
 
                         work_order = WorkOrder.objects.create(
-                            wo_number=f"WO-{po.po_number}-{stage.upper()[:3]}-{timezone.now().strftime('%H%M%S')}",
                             production_order=po,
                             stage=stage,
                             quantity=quantity,
@@ -1,12 +1,14 @@
 from django.contrib import admin
+from core.admin import SearchIndexAdminMixin
 from .models import Vendor, PurchaseOrder, PurchaseOrderLineItem, GoodsReceipt, GoodsReceiptLineItem
 
 
 @admin.register(Vendor)
-class VendorAdmin(admin.ModelAdmin):
+class VendorAdmin(SearchIndexAdminMixin, admin.ModelAdmin):
     list_display = ['code', 'name', 'contact_person', 'email', 'phone', 'is_active', 'on_time_delivery_rate', 'quality_rating']
     list_filter = ['is_active', 'created_at']
     search_fields = ['code', 'name', 'contact_person', 'email']
+    search_doc_type = 'vendor'
     readonly_fields = ['total_orders', 'on_time_deliveries', 'created_at', 'updated_at']
 
     fieldsets = (
@@ -34,14 +36,16 @@ class PurchaseOrderLineItemInline(admin.TabularInline):
     model = PurchaseOrderLineItem
     extra = 0
     readonly_fields = ['total_price']
-    fields = ['material_name', 'description', 'quantity', 'unit_price', 'received_quantity', 'total_price']
+    autocomplete_fields = ['material']
+    fields = ['material', 'material_name', 'description', 'quantity', 'unit_price', 'received_quantity', 'total_price']
 
 
 @admin.register(PurchaseOrder)
-class PurchaseOrderAdmin(admin.ModelAdmin):
+class PurchaseOrderAdmin(SearchIndexAdminMixin, admin.ModelAdmin):
     list_display = ['po_number', 'vendor', 'order_date', 'status', 'total_amount', 'expected_delivery_date', 'is_overdue', 'created_by']
     list_filter = ['status', 'order_date', 'expected_delivery_date', 'vendor', 'created_by']
     search_fields = ['po_number', 'vendor__name', 'vendor__code']
+    search_doc_type = 'purchase_order'
     readonly_fields = ['created_at', 'updated_at', 'approved_at']
     inlines = [PurchaseOrderLineItemInline]
 
@@ -53,7 +57,7 @@ class PurchaseOrderAdmin(admin.ModelAdmin):
             'fields': ('status', 'created_by', 'approved_by', 'approved_at')
         }),
         ('Financial', {
-            'fields': ('total_amount',)
+            'fields': ('tax_amount', 'total_amount')
         }),
         ('Additional Information', {
             'fields': ('notes',),
@@ -103,9 +107,10 @@ class GoodsReceiptAdmin(admin.ModelAdmin):
 
 @admin.register(PurchaseOrderLineItem)
 class PurchaseOrderLineItemAdmin(admin.ModelAdmin):
-    list_display = ['purchase_order', 'material_name', 'quantity', 'unit_price', 'received_quantity', 'remaining_quantity', 'is_fully_received']
-    list_filter = ['purchase_order__status', 'purchase_order__vendor']
-    search_fields = ['material_name', 'purchase_order__po_number']
+    list_display = ['purchase_order', 'material_name', 'material', 'quantity', 'unit_price', 'received_quantity', 'remaining_quantity', 'is_fully_received']
+    list_filter = ['purchase_order__status', 'purchase_order__vendor', ('material', admin.EmptyFieldListFilter)]
+    search_fields = ['material_name', 'material__code', 'purchase_order__po_number']
+    autocomplete_fields = ['material']
     readonly_fields = ['created_at', 'updated_at']
 
 
@@ -1,5 +1,8 @@
 from django import forms
 from django.forms import inlineformset_factory
+
+from inventory.widgets import LookupSelect
+
 from .models import Vendor, PurchaseOrder, PurchaseOrderLineItem, GoodsReceipt, GoodsReceiptLineItem
 
 
@@ -42,13 +45,29 @@ class PurchaseOrderForm(forms.ModelForm):
 class PurchaseOrderLineItemForm(forms.ModelForm):
     class Meta:
         model = PurchaseOrderLineItem
-        fields = ['material_name', 'description', 'quantity', 'unit_price']
+        fields = ['material', 'material_name', 'description', 'quantity', 'unit_price']
         widgets = {
+            # Renders only the selected material; the rest load by typeahead
+            'material': LookupSelect('material_lookup', attrs={'class': 'form-control'}, option_data={'price': 'unit_price'}),
             'description': forms.Textarea(attrs={'rows': 2}),
             'quantity': forms.NumberInput(attrs={'step': '0.01'}),
             'unit_price': forms.NumberInput(attrs={'step': '0.01'}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['material'].queryset = self.fields['material'].queryset.filter(is_active=True).order_by('code')
+        self.fields['material_name'].required = False
+
+    def clean(self):
+        cleaned_data = super().clean()
+        material = cleaned_data.get('material')
+        if material and not cleaned_data.get('material_name'):
+            cleaned_data['material_name'] = material.name
+        elif not material and not cleaned_data.get('material_name'):
+            raise forms.ValidationError('Select a material or enter a material name.')
+        return cleaned_data
+
 
 # Formset for PO line items
 PurchaseOrderLineItemFormSet = inlineformset_factory(
@@ -66,7 +85,7 @@ class GoodsReceiptForm(forms.ModelForm):
     class Meta:
         model = GoodsReceipt
         fields = [
-            'gr_number', 'purchase_order', 'receipt_date',
+            'gr_number', 'purchase_order', 'receipt_date', 'warehouse',
             'quality_check_passed', 'quality_notes'
         ]
         widgets = {
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from purchase.materials import DEFAULT_THRESHOLD, LINE_BATCH_SIZE, link_purchase_lines
+
+
+class Command(BaseCommand):
+    help = 'Link purchase order lines without a material to the raw material their name refers to'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=LINE_BATCH_SIZE,
+                            help='Lines read and updated per chunk')
+        parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                            help='Minimum name similarity (0-1) for a fuzzy match')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be linked without saving')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        if not 0 < options['threshold'] <= 1:
+            raise CommandError('--threshold must be between 0 and 1')
+
+        started = time.monotonic()
+        progress = None
+        for progress in link_purchase_lines(
+            batch_size=options['batch_size'], threshold=options['threshold'], dry_run=options['dry_run']
+        ):
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'{progress.processed}/{progress.total} lines, {progress.matched} matched '
+                f'({progress.processed / elapsed if elapsed else 0:.0f} lines/s)'
+            )
+
+        if progress is None:
+            self.stdout.write(self.style.SUCCESS('Every purchase line already has a material'))
+            return
+
+        for name, count in progress.unmatched.most_common(10):
+            self.stdout.write(self.style.WARNING(f'No material for "{name}" ({count} line(s))'))
+        if len(progress.unmatched) > 10:
+            self.stdout.write(self.style.WARNING(f'... and {len(progress.unmatched) - 10} more unmatched name(s)'))
+
+        verb = 'Would link' if options['dry_run'] else 'Linked'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {progress.matched} of {progress.processed} purchase line(s) '
+            f'in {time.monotonic() - started:.1f}s'
+        ))
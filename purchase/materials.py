@@ -0,0 +1,200 @@
+"""
+Matching purchase line names to raw materials.
+
+Purchase lines used to record only a typed ``material_name``. The material
+index keeps every raw material in memory under its normalized code and name
+(lowercase, punctuation folded to single spaces) together with an inverted
+index from character trigrams to materials. A name resolves to:
+
+1. the material whose code or name it is, or whose code appears in it as a
+   whole word ("RM-001 black leather"), otherwise
+2. the material whose name shares the most trigrams with it (Jaccard
+   similarity), if that scores at least the threshold and no other material
+   scores the same.
+
+Only materials sharing a trigram with the name are scored, and ``resolve``
+looks up each distinct spelling once, so matching a large history costs one
+lookup per spelling rather than per line. The index is process-wide and
+rebuilt lazily after a raw material is saved or deleted (see signals).
+
+``link_purchase_lines`` backfills the material of historical lines in
+primary key order, one chunk at a time, with one UPDATE per material found
+in each chunk.
+"""
+import re
+import threading
+from collections import Counter, defaultdict
+
+from django.db import transaction
+
+from inventory.models import RawMaterial
+
+from .models import PurchaseOrderLineItem
+
+
+# Minimum trigram similarity for a fuzzy match
+DEFAULT_THRESHOLD = 0.6
+
+# Purchase lines read per chunk by link_purchase_lines
+LINE_BATCH_SIZE = 5000
+
+_SEPARATORS = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text):
+    """Lowercase text with runs of punctuation and whitespace as single spaces"""
+    return ' '.join(_SEPARATORS.sub(' ', (text or '').lower()).split())
+
+
+def trigrams(text):
+    """Character trigrams of a normalized text, each word padded like pg_trgm"""
+    grams = set()
+    for word in text.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _add_unique(mapping, key, material_id):
+    # A key shared by two materials matches neither
+    if key:
+        mapping[key] = material_id if mapping.get(key, material_id) == material_id else None
+
+
+class MaterialIndex:
+    """Process-wide index of raw materials by normalized code, name and trigram"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._codes = None      # normalized code -> material_id (None if shared)
+        self._names = None      # normalized name -> material_id (None if shared)
+        self._grams = None      # trigram -> [material_id, ...]
+        self._sizes = None      # material_id -> number of trigrams in its name
+
+    def invalidate(self):
+        """Drop the index; it is rebuilt on next access"""
+        with self._lock:
+            self._codes = None
+
+    def _load(self):
+        codes, names = {}, {}
+        grams, sizes = defaultdict(list), {}
+        for material_id, code, name in RawMaterial.objects.values_list('pk', 'code', 'name').order_by('pk'):
+            _add_unique(codes, normalize(code), material_id)
+            key = normalize(name)
+            _add_unique(names, key, material_id)
+            name_grams = trigrams(key)
+            sizes[material_id] = len(name_grams)
+            for gram in name_grams:
+                grams[gram].append(material_id)
+        self._codes, self._names, self._grams, self._sizes = codes, names, dict(grams), sizes
+
+    def _index(self):
+        with self._lock:
+            if self._codes is None:
+                self._load()
+            return self._codes, self._names, self._grams, self._sizes
+
+    def _match(self, key, threshold, index):
+        codes, names, grams, sizes = index
+        if not key:
+            return None
+        for exact in (codes, names):
+            if key in exact:
+                return exact[key]
+
+        padded = f' {key} '
+        coded = {material_id for code, material_id in codes.items() if material_id and f' {code} ' in padded}
+        if len(coded) == 1:
+            return coded.pop()
+
+        key_grams = trigrams(key)
+        shared = Counter()
+        for gram in key_grams:
+            shared.update(grams.get(gram, ()))
+        scores = sorted(
+            ((count / (len(key_grams) + sizes[material_id] - count), material_id)
+             for material_id, count in shared.items()),
+            reverse=True,
+        )
+        if not scores or scores[0][0] < threshold:
+            return None
+        if len(scores) > 1 and scores[1][0] == scores[0][0]:
+            return None
+        return scores[0][1]
+
+    def match(self, name, threshold=DEFAULT_THRESHOLD):
+        """Id of the raw material a name refers to, or None"""
+        return self._match(normalize(name), threshold, self._index())
+
+    def resolve(self, names, threshold=DEFAULT_THRESHOLD, cache=None):
+        """
+        ``{name: material_id or None}`` for many names at once.
+
+        Each distinct normalized spelling is matched once; pass the same
+        ``cache`` dict across calls to keep those results between batches.
+        """
+        index = self._index()
+        cache = {} if cache is None else cache
+        resolved = {}
+        for name in set(names):
+            key = normalize(name)
+            if key not in cache:
+                cache[key] = self._match(key, threshold, index)
+            resolved[name] = cache[key]
+        return resolved
+
+
+material_index = MaterialIndex()
+
+
+class LinkProgress:
+    """Running totals of a purchase line backfill"""
+
+    def __init__(self, total):
+        self.total = total
+        self.processed = 0
+        self.matched = 0
+        self.unmatched = Counter()     # material_name -> lines left without a material
+
+
+def link_purchase_lines(lines=None, batch_size=LINE_BATCH_SIZE, threshold=DEFAULT_THRESHOLD, dry_run=False):
+    """
+    Set the material of purchase lines that have none from their name.
+
+    Walks ``lines`` (all lines without a material by default) in primary
+    key order, batch_size at a time, each chunk in its own transaction, and
+    yields a LinkProgress after every chunk. With ``dry_run`` nothing is
+    written.
+    """
+    if lines is None:
+        lines = PurchaseOrderLineItem.objects.all()
+    lines = lines.filter(material__isnull=True).order_by('pk')
+    progress = LinkProgress(lines.count())
+    cache = {}
+    last_pk = 0
+    while True:
+        chunk = list(lines.filter(pk__gt=last_pk).values_list('pk', 'material_name')[:batch_size])
+        if not chunk:
+            break
+        first_pk, last_pk = chunk[0][0], chunk[-1][0]
+        resolved = material_index.resolve([name for _pk, name in chunk], threshold, cache)
+
+        names_by_material = defaultdict(list)
+        for name, material_id in resolved.items():
+            if material_id:
+                names_by_material[material_id].append(name)
+        for _pk, name in chunk:
+            if resolved[name]:
+                progress.matched += 1
+            else:
+                progress.unmatched[name] += 1
+
+        if not dry_run:
+            with transaction.atomic():
+                for material_id, names in names_by_material.items():
+                    lines.filter(
+                        pk__gte=first_pk, pk__lte=last_pk, material_name__in=names
+                    ).update(material_id=material_id)
+        progress.processed += len(chunk)
+        yield progress
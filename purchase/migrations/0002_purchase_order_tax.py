@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaseorder',
+            name='tax_amount',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Purchase tax on the order date', max_digits=12),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_finishedproduct_reserved_stock'),
+        ('purchase', '0002_purchase_order_tax'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaseorderlineitem',
+            name='material',
+            field=models.ForeignKey(blank=True, help_text='Raw material being purchased', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='purchase_lines', to='inventory.rawmaterial'),
+        ),
+    ]
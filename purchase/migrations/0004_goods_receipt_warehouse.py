@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_material_lots'),
+        ('purchase', '0003_purchase_line_material'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='goodsreceipt',
+            name='warehouse',
+            field=models.ForeignKey(blank=True, help_text='Warehouse the goods are put away in (default: first active warehouse)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='goods_receipts', to='inventory.warehouse'),
+        ),
+    ]
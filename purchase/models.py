@@ -61,6 +61,7 @@ class PurchaseOrder(models.Model):
     actual_delivery_date = models.DateField(null=True, blank=True, help_text="Actual delivery date")
 
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft')
+    tax_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0, help_text="Purchase tax on the order date")
     total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0, help_text="Total PO amount")
 
     # Approval workflow
@@ -81,13 +82,16 @@ class PurchaseOrder(models.Model):
         return f"PO-{self.po_number} - {self.vendor.name}"
 
     def calculate_total(self):
-        """Calculate total amount from line items"""
-        total = self.line_items.aggregate(
+        """Calculate total amount from line items plus the purchase tax in force on the order date"""
+        from finance.tax import tax_index
+
+        subtotal = self.line_items.aggregate(
             total=models.Sum(models.F('quantity') * models.F('unit_price'))
         )['total'] or Decimal('0')
-        self.total_amount = total
-        self.save(update_fields=['total_amount'])
-        return total
+        self.tax_amount = tax_index.tax_for(subtotal, self.order_date, 'purchases')
+        self.total_amount = subtotal + self.tax_amount
+        self.save(update_fields=['tax_amount', 'total_amount'])
+        return self.total_amount
 
     @property
     def is_overdue(self):
@@ -100,6 +104,8 @@ class PurchaseOrder(models.Model):
 class PurchaseOrderLineItem(models.Model):
     """Line items for purchase orders"""
     purchase_order = models.ForeignKey(PurchaseOrder, on_delete=models.CASCADE, related_name='line_items')
+    material = models.ForeignKey('inventory.RawMaterial', on_delete=models.SET_NULL, null=True, blank=True,
+                                 related_name='purchase_lines', help_text="Raw material being purchased")
     material_name = models.CharField(max_length=200, help_text="Name of the material/item")
     description = models.TextField(blank=True, help_text="Item description")
     quantity = models.DecimalField(max_digits=10, decimal_places=2, help_text="Ordered quantity")
@@ -117,6 +123,18 @@ class PurchaseOrderLineItem(models.Model):
     def __str__(self):
         return f"{self.material_name} - {self.quantity} units"
 
+    def save(self, *args, **kwargs):
+        # Keep the name and the material in step: a picked material names the
+        # line, and a typed name is matched to a material when it is known
+        if kwargs.get('update_fields') is None:
+            if self.material_id and not self.material_name:
+                self.material_name = self.material.name
+            elif not self.material_id and self.material_name:
+                from .materials import material_index
+
+                self.material_id = material_index.match(self.material_name)
+        super().save(*args, **kwargs)
+
     @property
     def total_price(self):
         """Calculate total price for this line item"""
@@ -139,6 +157,10 @@ class GoodsReceipt(models.Model):
     purchase_order = models.ForeignKey(PurchaseOrder, on_delete=models.CASCADE, related_name='goods_receipts')
     receipt_date = models.DateField(default=timezone.now, help_text="Date of goods receipt")
     received_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='goods_receipts')
+    warehouse = models.ForeignKey(
+        'inventory.Warehouse', on_delete=models.SET_NULL, null=True, blank=True, related_name='goods_receipts',
+        help_text="Warehouse the goods are put away in (default: first active warehouse)"
+    )
 
     total_received_value = models.DecimalField(max_digits=12, decimal_places=2, default=0, help_text="Total value of received goods")
     quality_check_passed = models.BooleanField(default=True, help_text="Whether quality check passed")
@@ -195,8 +217,13 @@ class GoodsReceiptLineItem(models.Model):
 
     def save(self, *args, **kwargs):
         """Update the purchase order line item received quantity"""
+        adding = self._state.adding
         super().save(*args, **kwargs)
         if self.quality_status == 'accepted':
             # Update the PO line item received quantity
             self.purchase_order_item.received_quantity += self.received_quantity
             self.purchase_order_item.save(update_fields=['received_quantity'])
+            if adding:
+                # Put the goods into stock as a new lot
+                from inventory.lots import receive_goods
+                receive_goods(self)
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from inventory.models import RawMaterial
+from .materials import material_index
+
+
+@receiver(post_save, sender=RawMaterial)
+@receiver(post_delete, sender=RawMaterial)
+def invalidate_material_index(sender, instance, **kwargs):
+    material_index.invalidate()
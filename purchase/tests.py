@@ -1,3 +1,38 @@
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from inventory.models import MaterialCategory, RawMaterial
+
+from .forms import PurchaseOrderLineItemForm
+
+
+class PurchaseOrderLineItemFormTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = MaterialCategory.objects.create(name='Leather')
+        cls.materials = [
+            RawMaterial.objects.create(code=f'LTR-{n:02}', name=f'Leather {n}', category=category, unit='m', unit_price=50)
+            for n in range(5)
+        ]
+
+    def test_material_renders_only_the_selected_choice(self):
+        form = PurchaseOrderLineItemForm(initial={'material': self.materials[2].pk})
+
+        html = str(form['material'])
+
+        self.assertIn(f'data-lookup="{reverse("material_lookup")}"', html)
+        self.assertIn('Leather 2', html)
+        self.assertIn('data-price="50.00"', html)
+        self.assertNotIn('Leather 3', html)
+
+    def test_material_choice_is_validated_against_active_materials(self):
+        self.materials[1].is_active = False
+        self.materials[1].save()
+        data = {'material': self.materials[1].pk, 'quantity': '2', 'unit_price': '50'}
+
+        self.assertFalse(PurchaseOrderLineItemForm(data).is_valid())
+        data['material'] = self.materials[0].pk
+        form = PurchaseOrderLineItemForm(data)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['material_name'], 'Leather 0')
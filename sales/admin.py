@@ -1,13 +1,16 @@
 from django.contrib import admin
-from .models import Customer, SalesOrder, SalesOrderItem, Invoice, Payment, ProductPricing
+from core.admin import SearchIndexAdminMixin
+from .billing import recalculate_order_totals
+from .models import Customer, SalesOrder, SalesOrderItem, Invoice, Payment, ProductPricing, ARAgingSnapshot
 
 
 @admin.register(Customer)
-class CustomerAdmin(admin.ModelAdmin):
-    list_display = ['name', 'email', 'customer_type', 'is_active', 'total_orders', 'total_order_value']
+class CustomerAdmin(SearchIndexAdminMixin, admin.ModelAdmin):
+    list_display = ['name', 'email', 'customer_type', 'is_active', 'order_count', 'lifetime_value', 'open_balance']
     list_filter = ['customer_type', 'is_active', 'created_at']
     search_fields = ['name', 'email', 'phone']
-    readonly_fields = ['created_at', 'updated_at', 'total_orders', 'total_order_value']
+    search_doc_type = 'customer'
+    readonly_fields = ['created_at', 'updated_at', 'order_count', 'lifetime_value', 'last_order_date', 'open_balance']
     fieldsets = (
         ('Basic Information', {
             'fields': ('name', 'email', 'phone', 'address', 'city', 'state', 'postal_code', 'country')
@@ -18,6 +21,9 @@ class CustomerAdmin(admin.ModelAdmin):
         ('Status & Notes', {
             'fields': ('is_active', 'notes', 'created_by')
         }),
+        ('Metrics', {
+            'fields': ('order_count', 'lifetime_value', 'last_order_date', 'open_balance'),
+        }),
         ('Metadata', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
@@ -32,11 +38,13 @@ class SalesOrderItemInline(admin.TabularInline):
 
 
 @admin.register(SalesOrder)
-class SalesOrderAdmin(admin.ModelAdmin):
+class SalesOrderAdmin(SearchIndexAdminMixin, admin.ModelAdmin):
     list_display = ['order_number', 'customer', 'status', 'order_date', 'total_amount', 'created_by']
     list_filter = ['status', 'order_date', 'customer__customer_type']
     search_fields = ['order_number', 'customer__name', 'customer__email']
-    readonly_fields = ['created_at', 'updated_at', 'subtotal', 'total_amount']
+    search_doc_type = 'sales_order'
+    # Status moves through the order workflow, which reserves and issues stock
+    readonly_fields = ['status', 'created_at', 'updated_at', 'subtotal', 'total_amount']
     inlines = [SalesOrderItemInline]
     fieldsets = (
         ('Order Information', {
@@ -59,6 +67,11 @@ class SalesOrderAdmin(admin.ModelAdmin):
         }),
     )
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Line items do not total themselves
+        recalculate_order_totals([form.instance.pk])
+
 
 @admin.register(SalesOrderItem)
 class SalesOrderItemAdmin(admin.ModelAdmin):
@@ -67,6 +80,14 @@ class SalesOrderItemAdmin(admin.ModelAdmin):
     search_fields = ['sales_order__order_number', 'product__name']
     readonly_fields = ['line_total']
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        recalculate_order_totals([obj.sales_order_id])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        recalculate_order_totals([obj.sales_order_id])
+
 
 class PaymentInline(admin.TabularInline):
     model = Payment
@@ -75,10 +96,11 @@ class PaymentInline(admin.TabularInline):
 
 
 @admin.register(Invoice)
-class InvoiceAdmin(admin.ModelAdmin):
+class InvoiceAdmin(SearchIndexAdminMixin, admin.ModelAdmin):
     list_display = ['invoice_number', 'sales_order', 'invoice_date', 'total_amount', 'payment_status', 'balance_due']
     list_filter = ['payment_status', 'invoice_date']
     search_fields = ['invoice_number', 'sales_order__order_number', 'sales_order__customer__name']
+    search_doc_type = 'invoice'
     readonly_fields = ['created_at', 'balance_due']
     inlines = [PaymentInline]
     fieldsets = (
@@ -131,3 +153,11 @@ class ProductPricingAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+
+@admin.register(ARAgingSnapshot)
+class ARAgingSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['snapshot_date', 'customer', 'not_due', 'days_0_30', 'days_31_60', 'days_61_90', 'days_over_90', 'total_outstanding']
+    list_filter = ['snapshot_date']
+    search_fields = ['customer__name']
+    date_hierarchy = 'snapshot_date'
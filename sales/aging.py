@@ -0,0 +1,134 @@
+"""
+Accounts-receivable aging.
+
+Open invoice balances are aged by days past due into the buckets used on
+the AR reports. All buckets for all customers come from one grouped query:
+the bucket boundaries are turned into due dates up front, so each bucket is
+a ``SUM(CASE WHEN due_date ... THEN balance END)`` over rows picked by the
+(payment_status, due_date) index.
+
+The daily command flips past-due invoices to ``overdue`` with a single
+UPDATE and stores the per-customer totals as ARAgingSnapshot rows, which
+trend charts read instead of rescanning invoices.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import ARAgingSnapshot, Invoice
+
+
+# Invoices that still carry a balance
+OUTSTANDING_STATUSES = ['unpaid', 'partial', 'overdue']
+
+# (field, label, oldest days past due) from youngest to oldest bucket
+AGING_BUCKETS = [
+    ('days_0_30', '0-30 Days', 30),
+    ('days_31_60', '31-60 Days', 60),
+    ('days_61_90', '61-90 Days', 90),
+    ('days_over_90', '90+ Days', None),
+]
+
+BUCKET_FIELDS = ['not_due'] + [field for field, _label, _days in AGING_BUCKETS]
+
+SNAPSHOT_BATCH_SIZE = 1000
+
+AMOUNT = DecimalField(max_digits=14, decimal_places=2)
+
+ZERO = Value(Decimal('0.00'), output_field=AMOUNT)
+
+
+def _balance():
+    return ExpressionWrapper(F('total_amount') - F('amount_paid'), output_field=AMOUNT)
+
+
+def _bucket_sum(condition):
+    return Coalesce(Sum(Case(When(condition, then=_balance()), default=ZERO, output_field=AMOUNT)), ZERO)
+
+
+def bucket_annotations(as_of):
+    """Aggregate expressions for each aging bucket as of a date"""
+    annotations = {'not_due': _bucket_sum(Q(due_date__gt=as_of))}
+    newest = as_of
+    for field, _label, days in AGING_BUCKETS:
+        if days is None:
+            condition = Q(due_date__lte=newest)
+        else:
+            oldest = as_of - timedelta(days=days)
+            condition = Q(due_date__lte=newest, due_date__gte=oldest)
+            newest = oldest - timedelta(days=1)
+        annotations[field] = _bucket_sum(condition)
+    annotations['total_outstanding'] = Coalesce(Sum(_balance()), ZERO)
+    annotations['invoice_count'] = Count('id')
+    return annotations
+
+
+def outstanding_invoices(invoices=None):
+    """Invoices with an unpaid balance"""
+    invoices = Invoice.objects.all() if invoices is None else invoices
+    return invoices.filter(payment_status__in=OUTSTANDING_STATUSES)
+
+
+def aging_by_customer(as_of=None, invoices=None):
+    """
+    Aging buckets per customer in one grouped query.
+
+    Returns dict rows with ``customer_id``, ``customer_name``, the bucket
+    fields, ``total_outstanding`` and ``invoice_count``.
+    """
+    as_of = as_of or timezone.now().date()
+    return outstanding_invoices(invoices).values(
+        customer_id=F('sales_order__customer_id'),
+        customer_name=F('sales_order__customer__name'),
+    ).annotate(**bucket_annotations(as_of)).order_by('-total_outstanding')
+
+
+def aging_totals(as_of=None, invoices=None):
+    """Aging buckets over all customers"""
+    as_of = as_of or timezone.now().date()
+    return outstanding_invoices(invoices).aggregate(**bucket_annotations(as_of))
+
+
+def mark_overdue(as_of=None):
+    """Flip unpaid and partially paid invoices past their due date to overdue"""
+    as_of = as_of or timezone.now().date()
+    return Invoice.objects.filter(
+        payment_status__in=['unpaid', 'partial'],
+        due_date__lt=as_of,
+    ).update(payment_status='overdue')
+
+
+def take_snapshot(as_of=None):
+    """Store today's per-customer aging, replacing an earlier run for the same date"""
+    as_of = as_of or timezone.now().date()
+    rows = aging_by_customer(as_of).order_by()
+
+    with transaction.atomic():
+        ARAgingSnapshot.objects.filter(snapshot_date=as_of).delete()
+        snapshots = [
+            ARAgingSnapshot(
+                snapshot_date=as_of,
+                customer_id=row['customer_id'],
+                invoice_count=row['invoice_count'],
+                total_outstanding=row['total_outstanding'],
+                **{field: row[field] for field in BUCKET_FIELDS}
+            )
+            for row in rows.iterator(chunk_size=SNAPSHOT_BATCH_SIZE)
+        ]
+        ARAgingSnapshot.objects.bulk_create(snapshots, batch_size=SNAPSHOT_BATCH_SIZE)
+    return len(snapshots)
+
+
+def aging_trend(days=90, end_date=None):
+    """Daily aging totals over the last ``days`` days from stored snapshots"""
+    end_date = end_date or timezone.now().date()
+    return ARAgingSnapshot.objects.filter(
+        snapshot_date__gt=end_date - timedelta(days=days),
+        snapshot_date__lte=end_date,
+    ).values('snapshot_date').annotate(
+        **{field: Sum(field) for field in BUCKET_FIELDS + ['total_outstanding']}
+    ).order_by('snapshot_date')
@@ -0,0 +1,218 @@
+"""
+Sales analytics cube.
+
+SalesDailyFact holds sales pre-aggregated by (date, product, customer,
+customer_type, status). Rows with a product carry line measures; rows
+without one carry order measures, so order counts are not inflated by
+orders spanning several products.
+
+Facts are maintained incrementally: any change to an order marks its
+(order_date, customer) slice, and the marked slices are recomputed from the
+order tables once the transaction commits. A slice is one customer's
+orders on one day, so a recompute is a couple of small grouped queries.
+Slices marked in a transaction that rolls back are recomputed on the next
+commit, which is harmless because facts are always rebuilt from source.
+
+``sales_cube`` slices the facts by any dimension and period with portable
+Trunc* functions, and is what the sales reports read.
+"""
+import threading
+from collections import defaultdict
+from datetime import datetime
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncQuarter, TruncWeek, TruncYear
+from django.utils import timezone
+
+from .models import SalesDailyFact, SalesOrder, SalesOrderItem
+
+
+PERIODS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+    'quarter': TruncQuarter,
+    'year': TruncYear,
+}
+
+LINE_MEASURES = {
+    'quantity': Sum('quantity'),
+    'revenue': Sum('revenue'),
+    'discount': Sum('discount'),
+    'lines': Sum('line_count'),
+}
+
+ORDER_MEASURES = {
+    'orders': Sum('order_count'),
+    'order_total': Sum('order_total'),
+    'order_discount': Sum('discount'),
+    'customers': Count('customer', distinct=True),
+}
+
+# Slices recomputed per transaction when flushing or rebuilding
+SLICE_BATCH_SIZE = 500
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+_pending = threading.local()
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value)
+        return value.date()
+    return value
+
+
+def mark_slices(keys):
+    """Queue (order_date, customer_id) slices for recompute after commit"""
+    keys = {(_as_date(order_date), customer_id) for order_date, customer_id in keys if order_date and customer_id}
+    if not keys:
+        return
+    if not hasattr(_pending, 'keys'):
+        _pending.keys = set()
+    _pending.keys.update(keys)
+    transaction.on_commit(flush_slices)
+
+
+def mark_orders(order_ids):
+    """Queue the slices of the given orders"""
+    mark_slices(SalesOrder.objects.filter(pk__in=order_ids).values_list('order_date', 'customer_id'))
+
+
+def flush_slices():
+    """Recompute every queued slice"""
+    keys = getattr(_pending, 'keys', None)
+    if not keys:
+        return
+    _pending.keys = set()
+    refresh_slices(keys)
+
+
+def _slice_condition(keys, date_field, customer_field):
+    by_date = defaultdict(list)
+    for order_date, customer_id in keys:
+        by_date[order_date].append(customer_id)
+    return reduce(or_, (
+        Q(**{date_field: order_date, f'{customer_field}__in': customer_ids})
+        for order_date, customer_ids in by_date.items()
+    ))
+
+
+def _line_facts(items):
+    gross = ExpressionWrapper(F('unit_price') * F('quantity'), output_field=MONEY)
+    rows = items.values(
+        'product_id',
+        date=F('sales_order__order_date'),
+        customer=F('sales_order__customer_id'),
+        customer_kind=F('sales_order__customer__customer_type'),
+        order_status=F('sales_order__status'),
+    ).annotate(
+        total_quantity=Sum('quantity'),
+        total_revenue=Sum('line_total'),
+        total_gross=Sum(gross),
+        lines=Count('pk'),
+    ).order_by()
+    return [
+        SalesDailyFact(
+            date=row['date'],
+            product_id=row['product_id'],
+            customer_id=row['customer'],
+            customer_type=row['customer_kind'],
+            status=row['order_status'],
+            quantity=row['total_quantity'],
+            revenue=row['total_revenue'],
+            discount=row['total_gross'] - row['total_revenue'],
+            line_count=row['lines'],
+        )
+        for row in rows
+    ]
+
+
+def _order_facts(orders):
+    rows = orders.values(
+        'order_date', 'customer_id', 'status',
+        customer_kind=F('customer__customer_type'),
+    ).annotate(
+        orders=Count('pk'),
+        total=Sum('total_amount'),
+        discounts=Sum('discount_amount'),
+    ).order_by()
+    return [
+        SalesDailyFact(
+            date=row['order_date'],
+            product=None,
+            customer_id=row['customer_id'],
+            customer_type=row['customer_kind'],
+            status=row['status'],
+            order_count=row['orders'],
+            order_total=row['total'],
+            discount=row['discounts'],
+        )
+        for row in rows
+    ]
+
+
+def refresh_slices(keys):
+    """Rebuild the facts of the given (order_date, customer_id) slices"""
+    keys = sorted(set(keys))
+    for start in range(0, len(keys), SLICE_BATCH_SIZE):
+        chunk = keys[start:start + SLICE_BATCH_SIZE]
+        with transaction.atomic():
+            SalesDailyFact.objects.filter(_slice_condition(chunk, 'date', 'customer_id')).delete()
+            facts = _line_facts(SalesOrderItem.objects.filter(
+                _slice_condition(chunk, 'sales_order__order_date', 'sales_order__customer_id')
+            ))
+            facts += _order_facts(SalesOrder.objects.filter(
+                _slice_condition(chunk, 'order_date', 'customer_id')
+            ))
+            SalesDailyFact.objects.bulk_create(facts, batch_size=1000)
+
+
+def rebuild_facts(start_date=None, end_date=None):
+    """Rebuild all facts, optionally limited to a date range"""
+    orders = SalesOrder.objects.all()
+    facts = SalesDailyFact.objects.all()
+    if start_date:
+        orders = orders.filter(order_date__gte=start_date)
+        facts = facts.filter(date__gte=start_date)
+    if end_date:
+        orders = orders.filter(order_date__lte=end_date)
+        facts = facts.filter(date__lte=end_date)
+
+    keys = set(orders.values_list('order_date', 'customer_id').distinct())
+    facts.delete()
+    refresh_slices(keys)
+    return len(keys)
+
+
+def sales_cube(by=(), period=None, start=None, end=None, level='line', **filters):
+    """
+    Slice the sales facts.
+
+    ``by`` lists dimensions to group on (e.g. ``'product__name'``,
+    ``'customer_type'``, ``'status'``); ``period`` adds a ``period`` column
+    truncated to day/week/month/quarter/year. ``level='line'`` returns
+    quantity, revenue, discount and lines; ``level='order'`` returns orders,
+    order_total, order_discount and customers. Extra keyword arguments are
+    applied as filters on the facts.
+    """
+    facts = SalesDailyFact.objects.filter(product__isnull=(level == 'order'), **filters)
+    if start:
+        facts = facts.filter(date__gte=start)
+    if end:
+        facts = facts.filter(date__lte=end)
+
+    group = list(by)
+    if period:
+        facts = facts.annotate(period=PERIODS[period]('date'))
+        group.insert(0, 'period')
+
+    measures = ORDER_MEASURES if level == 'order' else LINE_MEASURES
+    if not group:
+        return facts.aggregate(**measures)
+    return facts.values(*group).annotate(**measures).order_by(*group)
@@ -0,0 +1,301 @@
+"""
+Available-to-promise (ATP) checks for finished products.
+
+Availability of a product on a given date is::
+
+    on hand - reserved + open production due on or before that date
+
+Open production orders are kept in memory per product as a sorted list of
+due dates with the cumulative quantity scheduled up to each date, so a lookup
+is one bisect. Products are loaded lazily and reloaded only when their
+shared version (core.versions, key ``atp:<product id>``) has moved. Every
+change to stock, reservations or open production bumps the version in the
+same transaction, so a reservation made by one worker is seen by all the
+others; a batch check costs one version query plus a reload of what
+changed.
+"""
+import threading
+from bisect import bisect_right
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from core import versions
+from inventory.models import FinishedProduct
+from manufacturing.models import ProductionOrder
+
+from .models import SalesOrderItem
+
+
+# Production orders that will still add stock
+OPEN_PRODUCTION_STATUSES = ['approved', 'in_progress']
+
+# Sales order statuses that hold a stock reservation
+RESERVED_ORDER_STATUSES = ['confirmed', 'processing']
+
+# Products updated per query by reserve_orders
+UPDATE_BATCH_SIZE = 900
+
+
+class InsufficientStock(Exception):
+    """Raised when order lines cannot be covered by available stock"""
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        names = dict(
+            FinishedProduct.objects.filter(pk__in=shortages).values_list('pk', 'name')
+        )
+        details = ', '.join(
+            f"{names.get(product_id, product_id)} (short {shortage})"
+            for product_id, shortage in shortages.items()
+        )
+        super().__init__(f"Insufficient stock: {details}")
+
+
+def version_key(product_id):
+    return f'atp:{product_id}'
+
+
+class ATPIndex:
+    """Process-wide, time-bucketed availability index"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stock = {}        # product_id -> (on_hand, reserved)
+        self._due_dates = {}    # product_id -> [planned_end_date, ...]
+        self._scheduled = {}    # product_id -> [cumulative quantity, ...]
+        self._versions = {}     # product_id -> shared version loaded
+
+    def invalidate(self, product_ids=None):
+        """
+        Mark products changed for every process, in the current transaction.
+
+        With None, only forgets what this process has loaded.
+        """
+        if product_ids is None:
+            with self._lock:
+                self._stock.clear()
+                self._due_dates.clear()
+                self._scheduled.clear()
+                self._versions.clear()
+        else:
+            versions.bump(version_key(pk) for pk in product_ids)
+
+    def _load(self, product_ids):
+        stock = {
+            pk: (on_hand, reserved)
+            for pk, on_hand, reserved in FinishedProduct.objects.filter(
+                pk__in=product_ids
+            ).values_list('pk', 'current_stock', 'reserved_stock')
+        }
+
+        buckets = defaultdict(list)
+        production = ProductionOrder.objects.filter(
+            product_id__in=product_ids,
+            status__in=OPEN_PRODUCTION_STATUSES,
+        ).values('product_id', 'planned_end_date').annotate(
+            quantity=Sum('quantity')
+        ).order_by('product_id', 'planned_end_date')
+        for row in production:
+            buckets[row['product_id']].append((row['planned_end_date'], row['quantity']))
+
+        for product_id in product_ids:
+            self._stock[product_id] = stock.get(product_id, (0, 0))
+            dates = []
+            cumulative = []
+            running = Decimal('0')
+            for due_date, quantity in buckets.get(product_id, []):
+                running += quantity
+                dates.append(due_date)
+                cumulative.append(running)
+            self._due_dates[product_id] = dates
+            self._scheduled[product_id] = cumulative
+
+    def _ensure(self, product_ids):
+        product_ids = list(product_ids)
+        # Versions first: data loaded after them is never older than they say
+        shared = versions.current(version_key(pk) for pk in product_ids)
+        with self._lock:
+            stale = {
+                pk for pk in product_ids
+                if pk not in self._stock or self._versions.get(pk) != shared[version_key(pk)]
+            }
+            if stale:
+                self._load(stale)
+                self._versions.update({pk: shared[version_key(pk)] for pk in stale})
+
+    def _scheduled_by(self, product_id, on_date):
+        position = bisect_right(self._due_dates[product_id], on_date)
+        if position == 0:
+            return Decimal('0')
+        return self._scheduled[product_id][position - 1]
+
+    def scheduled(self, product_id, on_date=None):
+        """Open production quantity due on or before the given date"""
+        on_date = on_date or timezone.now().date()
+        self._ensure([product_id])
+        return self._scheduled_by(product_id, on_date)
+
+    def available(self, product_id, on_date=None):
+        """Quantity that can still be promised on the given date"""
+        on_date = on_date or timezone.now().date()
+        self._ensure([product_id])
+        on_hand, reserved = self._stock[product_id]
+        return on_hand - reserved + self._scheduled_by(product_id, on_date)
+
+    def check(self, lines, on_date=None):
+        """
+        Check many order lines at once.
+
+        ``lines`` is an iterable of ``(product_id, quantity)`` or
+        ``(product_id, quantity, date)`` tuples. Demand for the same product
+        accumulates in date order. Returns ``{product_id: shortage}`` for the
+        products that cannot be covered; an empty dict means all lines fit.
+        """
+        default_date = on_date or timezone.now().date()
+        demand = defaultdict(list)
+        for line in lines:
+            product_id, quantity = line[0], line[1]
+            line_date = line[2] if len(line) > 2 and line[2] else default_date
+            demand[product_id].append((line_date, quantity))
+
+        self._ensure(demand.keys())
+
+        shortages = {}
+        for product_id, product_lines in demand.items():
+            on_hand, reserved = self._stock[product_id]
+            running = 0
+            worst = 0
+            for line_date, quantity in sorted(product_lines, key=lambda item: item[0]):
+                running += quantity
+                available = on_hand - reserved + self._scheduled_by(product_id, line_date)
+                worst = max(worst, running - available)
+            if worst > 0:
+                shortages[product_id] = worst
+        return shortages
+
+
+atp_index = ATPIndex()
+
+
+def check_availability(lines, on_date=None):
+    """Batch ATP check, see ATPIndex.check"""
+    return atp_index.check(lines, on_date)
+
+
+def _order_demand(order):
+    return dict(
+        order.items.values('product_id').annotate(
+            quantity=Sum('quantity')
+        ).values_list('product_id', 'quantity')
+    )
+
+
+def reserve_order(order):
+    """
+    Reserve stock for all lines of a sales order.
+
+    Each product is reserved with a conditional UPDATE so concurrent
+    confirmations cannot oversell. Stock still to come from open production
+    due by the order's required date counts towards availability. Raises
+    InsufficientStock and rolls back every reservation of the order if any
+    line cannot be covered.
+    """
+    demand = _order_demand(order)
+    if not demand:
+        return
+
+    with transaction.atomic():
+        shortages = {}
+        for product_id, quantity in demand.items():
+            scheduled = int(atp_index.scheduled(product_id, order.required_date))
+            reserved = FinishedProduct.objects.filter(
+                pk=product_id,
+                current_stock__gte=F('reserved_stock') + quantity - scheduled,
+            ).update(reserved_stock=F('reserved_stock') + quantity)
+            if not reserved:
+                shortages[product_id] = quantity - atp_index.available(product_id, order.required_date)
+        if shortages:
+            raise InsufficientStock(shortages)
+        atp_index.invalidate(demand.keys())
+
+
+def reserve_orders(orders):
+    """
+    Reserve stock for many sales orders at once; call inside a transaction.
+
+    The products of all the orders are locked and read once, orders are
+    served in the given order against what is left of each product (on hand
+    less reserved, plus open production due by the order's required date),
+    and the reservations of every order that fits are written with one
+    UPDATE per distinct quantity. Returns ``(reserved orders, [(order, {product_id: shortage}), ...])``;
+    orders that do not fit reserve nothing.
+    """
+    orders = list(orders)
+    demand = defaultdict(dict)
+    rows = SalesOrderItem.objects.filter(sales_order_id__in=[order.pk for order in orders]).values(
+        'sales_order_id', 'product_id'
+    ).annotate(quantity=Sum('quantity')).order_by()
+    for row in rows:
+        demand[row['sales_order_id']][row['product_id']] = row['quantity']
+    product_ids = {product_id for lines in demand.values() for product_id in lines}
+    if not product_ids:
+        return orders, []
+
+    atp_index._ensure(product_ids)
+    stock = {
+        pk: current - reserved
+        for pk, current, reserved in FinishedProduct.objects.select_for_update().filter(
+            pk__in=product_ids
+        ).values_list('pk', 'current_stock', 'reserved_stock')
+    }
+    today = timezone.now().date()
+    taken = defaultdict(int)
+    reserved, failed = [], []
+    for order in orders:
+        lines = demand.get(order.pk, {})
+        on_date = order.required_date or today
+        shortages = {}
+        for product_id, quantity in lines.items():
+            available = (
+                stock.get(product_id, 0) - taken[product_id]
+                + int(atp_index._scheduled_by(product_id, on_date))
+            )
+            if quantity > available:
+                shortages[product_id] = quantity - available
+        if shortages:
+            failed.append((order, shortages))
+            continue
+        for product_id, quantity in lines.items():
+            taken[product_id] += quantity
+        reserved.append(order)
+
+    # One UPDATE per distinct quantity reserved rather than per product
+    by_quantity = defaultdict(list)
+    for product_id, quantity in taken.items():
+        by_quantity[quantity].append(product_id)
+    now = timezone.now()
+    for quantity, product_ids in by_quantity.items():
+        for start in range(0, len(product_ids), UPDATE_BATCH_SIZE):
+            FinishedProduct.objects.filter(pk__in=product_ids[start:start + UPDATE_BATCH_SIZE]).update(
+                reserved_stock=F('reserved_stock') + quantity, updated_at=now,
+            )
+    if taken:
+        atp_index.invalidate(taken)
+    return reserved, failed
+
+
+def release_order(order):
+    """Release the stock reserved for a sales order"""
+    demand = _order_demand(order)
+    with transaction.atomic():
+        for product_id, quantity in demand.items():
+            FinishedProduct.objects.filter(pk=product_id).update(
+                reserved_stock=Greatest(F('reserved_stock') - quantity, 0)
+            )
+        atp_index.invalidate(demand.keys())
+
@@ -0,0 +1,164 @@
+"""
+Set-based order totals and batch invoicing.
+
+Order totals are recomputed with a single UPDATE per batch instead of summing
+line items in Python: line totals first (items do not compute their own on
+save), then each order's subtotal from them. Invoices for many delivered orders are created with
+one bulk_create per chunk. Sales tax comes from the rates in force on each
+order date (see finance.tax), applied with one UPDATE per range of dates
+sharing a rate.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+from django.utils import timezone
+
+from core import search
+from core.numbering import next_numbers
+from finance.autopost import queue as queue_posting
+from finance.tax import in_segment, tax_index
+
+from .analytics import mark_orders
+from .metrics import refresh_for_orders
+from .models import Invoice, SalesOrder, SalesOrderItem
+
+
+# Days until an invoice is due, by customer payment terms
+PAYMENT_TERM_DAYS = {
+    'cod': 0,
+    'net_15': 15,
+    'net_30': 30,
+    'net_60': 60,
+    'net_90': 90,
+}
+
+INVOICE_BATCH_SIZE = 500
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def line_total_expression():
+    """Line total as an SQL expression: price times quantity less the line discount"""
+    return Round(
+        ExpressionWrapper(
+            F('unit_price') * F('quantity') * (Value(100) - F('discount_percent')) / Value(100),
+            output_field=MONEY,
+        ),
+        2,
+    )
+
+
+def recalculate_line_totals(order_ids):
+    """Recompute line_total for every item of the given orders in one UPDATE"""
+    return SalesOrderItem.objects.filter(sales_order_id__in=order_ids).update(
+        line_total=line_total_expression()
+    )
+
+
+def apply_sales_tax(orders):
+    """
+    Set tax_amount and total_amount of the given orders from the sales tax
+    in force on each order date. Tax is charged on the subtotal less the
+    order discount.
+    """
+    updated = 0
+    for start, end, rate in tax_index.segments('sales'):
+        tax = Round(
+            ExpressionWrapper(
+                # Divide in Python: SQLite divides integral values as integers
+                (F('subtotal') - F('discount_amount')) * Value(rate / 100),
+                output_field=MONEY,
+            ),
+            2,
+        )
+        updated += orders.filter(in_segment('order_date', start, end)).update(
+            tax_amount=tax,
+            total_amount=ExpressionWrapper(
+                F('subtotal') + tax - F('discount_amount') + F('shipping_cost'),
+                output_field=MONEY,
+            ),
+        )
+    return updated
+
+
+def recalculate_order_totals(order_ids):
+    """Recompute the line totals, subtotal, tax and total_amount of the given orders"""
+    recalculate_line_totals(order_ids)
+    item_totals = SalesOrderItem.objects.filter(
+        sales_order=OuterRef('pk')
+    ).order_by().values('sales_order').annotate(
+        total=Sum('line_total')
+    ).values('total')
+    subtotal = Coalesce(Subquery(item_totals, output_field=MONEY), Value(Decimal('0.00')), output_field=MONEY)
+
+    orders = SalesOrder.objects.filter(pk__in=order_ids)
+    updated = orders.update(subtotal=subtotal)
+    apply_sales_tax(orders)
+    refresh_for_orders(order_ids)
+    mark_orders(order_ids)
+    return updated
+
+
+def invoiceable_orders(orders=None):
+    """Delivered orders that do not have an invoice yet"""
+    orders = SalesOrder.objects.all() if orders is None else orders
+    return orders.filter(status='delivered', invoice__isnull=True)
+
+
+def generate_invoices(orders, user=None, invoice_date=None):
+    """
+    Create invoices for many delivered orders in one batch.
+
+    Totals are refreshed with one UPDATE, amounts are copied from the orders
+    and invoice numbers are reserved with one counter update per chunk.
+    Returns the list of created invoices.
+    """
+    invoice_date = invoice_date or timezone.now().date()
+    order_ids = list(invoiceable_orders(orders).values_list('pk', flat=True))
+    created = []
+
+    for start in range(0, len(order_ids), INVOICE_BATCH_SIZE):
+        chunk = order_ids[start:start + INVOICE_BATCH_SIZE]
+        with transaction.atomic():
+            recalculate_order_totals(chunk)
+            rows = list(
+                SalesOrder.objects.filter(pk__in=chunk, invoice__isnull=True).values(
+                    'pk', 'subtotal', 'tax_amount', 'discount_amount',
+                    'shipping_cost', 'total_amount', 'customer__payment_terms'
+                ).order_by('pk')
+            )
+            numbers = next_numbers('invoice', len(rows), invoice_date)
+            invoices = [
+                Invoice(
+                    invoice_number=number,
+                    sales_order_id=row['pk'],
+                    invoice_date=invoice_date,
+                    due_date=invoice_date + timedelta(
+                        days=PAYMENT_TERM_DAYS.get(row['customer__payment_terms'], 0)
+                    ),
+                    subtotal=row['subtotal'],
+                    tax_amount=row['tax_amount'],
+                    discount_amount=row['discount_amount'],
+                    shipping_cost=row['shipping_cost'],
+                    total_amount=row['total_amount'],
+                    created_by=user,
+                )
+                for number, row in zip(numbers, rows)
+            ]
+            invoices = Invoice.objects.bulk_create(invoices)
+            created.extend(invoices)
+            refresh_for_orders(chunk)
+            # bulk_create sends no post_save, so queue the ledger postings
+            # and search documents here
+            queue_posting('invoice', [invoice.pk for invoice in invoices])
+            search.queue(Invoice, [invoice.pk for invoice in invoices])
+
+    return created
+
+
+def due_date_for(customer, invoice_date):
+    """Payment due date for an invoice issued to the customer on invoice_date"""
+    return invoice_date + timedelta(days=PAYMENT_TERM_DAYS.get(customer.payment_terms, 0))
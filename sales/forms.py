@@ -1,7 +1,10 @@
 from django import forms
 from django.forms import inlineformset_factory
 from .models import Customer, SalesOrder, SalesOrderItem, Invoice, Payment, ProductPricing
-from inventory.models import FinishedProduct
+from .workflow import allowed_transitions
+from inventory.models import FinishedProduct, Warehouse
+from inventory.widgets import LookupSelect
+from finance.forms import validate_open_period
 
 
 class CustomerForm(forms.ModelForm):
@@ -20,11 +23,12 @@ class CustomerForm(forms.ModelForm):
 
 
 class SalesOrderForm(forms.ModelForm):
+    # Status changes go through sales_order_update_status (see workflow)
     class Meta:
         model = SalesOrder
         fields = [
             'customer', 'order_date', 'required_date', 'ship_date',
-            'status', 'shipping_address', 'shipping_city', 'shipping_state',
+            'shipping_address', 'shipping_city', 'shipping_state',
             'shipping_postal_code', 'shipping_country', 'notes'
         ]
         widgets = {
@@ -39,7 +43,7 @@ class SalesOrderForm(forms.ModelForm):
 class SalesOrderItemForm(forms.ModelForm):
     product = forms.ModelChoiceField(
         queryset=FinishedProduct.objects.filter(is_active=True),
-        widget=forms.Select(attrs={'class': 'form-control'})
+        widget=LookupSelect('product_lookup', attrs={'class': 'form-control'}, option_data={'price': 'unit_price'})
     )
 
     class Meta:
@@ -130,10 +134,21 @@ class SalesOrderStatusUpdateForm(forms.Form):
         help_text="Optional notes about the status change"
     )
 
+    def __init__(self, *args, **kwargs):
+        current_status = kwargs.pop('current_status', None)
+        super().__init__(*args, **kwargs)
+
+        if current_status:
+            # Only offer the statuses the order may move to
+            allowed = allowed_transitions(current_status)
+            self.fields['status'].choices = [
+                choice for choice in self.fields['status'].choices if choice[0] in allowed
+            ]
+
 
 class BulkOrderProcessingForm(forms.Form):
     orders = forms.ModelMultipleChoiceField(
-        queryset=SalesOrder.objects.filter(status='confirmed'),
+        queryset=SalesOrder.objects.filter(status__in=['confirmed', 'processing', 'shipped']),
         widget=forms.CheckboxSelectMultiple,
         help_text="Select orders to process"
     )
@@ -143,4 +158,54 @@ class BulkOrderProcessingForm(forms.Form):
             ('ship', 'Mark as Shipped'),
             ('deliver', 'Mark as Delivered'),
         ]
-    )
\ No newline at end of file
+    )
+    warehouse = forms.ModelChoiceField(
+        queryset=Warehouse.objects.filter(is_active=True),
+        required=False,
+        help_text="Warehouse stock is issued from when shipping (defaults to the first active warehouse)"
+    )
+
+
+class BulkInvoiceGenerationForm(forms.Form):
+    orders = forms.ModelMultipleChoiceField(
+        queryset=SalesOrder.objects.filter(status='delivered', invoice__isnull=True).select_related('customer'),
+        widget=forms.CheckboxSelectMultiple,
+        help_text="Delivered orders without an invoice"
+    )
+    invoice_date = forms.DateField(
+        widget=forms.DateInput(attrs={'type': 'date'})
+    )
+
+
+class CustomerPaymentForm(forms.Form):
+    """Receive a payment applied to a customer's oldest open invoices first"""
+    payment_date = forms.DateField(
+        widget=forms.DateInput(attrs={'type': 'date'}),
+        validators=[validate_open_period]
+    )
+    amount = forms.DecimalField(
+        max_digits=12, decimal_places=2, min_value=0.01,
+        widget=forms.NumberInput(attrs={'step': '0.01'})
+    )
+    payment_method = forms.ChoiceField(choices=Payment._meta.get_field('payment_method').choices)
+    reference_number = forms.CharField(max_length=100, required=False)
+    notes = forms.CharField(required=False, widget=forms.Textarea(attrs={'rows': 3}))
+
+
+class BankStatementImportForm(forms.Form):
+    """Upload a bank statement CSV to apply many payments at once"""
+    csv_file = forms.FileField(
+        label="Bank Statement CSV",
+        help_text="Columns: date, amount, reference and invoice or customer_email",
+        widget=forms.FileInput(attrs={'accept': '.csv'})
+    )
+    payment_method = forms.ChoiceField(
+        choices=Payment._meta.get_field('payment_method').choices,
+        initial='bank_transfer'
+    )
+
+    def clean_csv_file(self):
+        file = self.cleaned_data['csv_file']
+        if not file.name.lower().endswith('.csv'):
+            raise forms.ValidationError("Only CSV files (.csv) are allowed")
+        return file
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from sales.metrics import rebuild_customer_metrics
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored order count, lifetime value, last order date and open balance for all customers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Customers updated per statement')
+
+    def handle(self, *args, **options):
+        updated = rebuild_customer_metrics(batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt metrics for {updated} customer(s)')
+        )
@@ -0,0 +1,25 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sales.analytics import rebuild_facts
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the pre-aggregated sales facts from sales orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help='First order date to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='end', help='Last order date to rebuild (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else None
+            end = date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError as e:
+            raise CommandError(f'Invalid date: {e}')
+
+        slices = rebuild_facts(start, end)
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt sales facts for {slices} customer-day slice(s)')
+        )
@@ -0,0 +1,38 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sales.analytics import rebuild_facts
+from sales.billing import apply_sales_tax
+from sales.metrics import rebuild_customer_metrics
+from sales.models import SalesOrder
+
+
+class Command(BaseCommand):
+    help = 'Recompute sales order tax and totals from the tax rates in force on each order date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help='First order date to reprice (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='end', help='Last order date to reprice (YYYY-MM-DD)')
+        parser.add_argument('--include-invoiced', action='store_true',
+                            help='Also reprice orders that already have an invoice')
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else None
+            end = date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError as e:
+            raise CommandError(f'Invalid date: {e}')
+
+        orders = SalesOrder.objects.all()
+        if start:
+            orders = orders.filter(order_date__gte=start)
+        if end:
+            orders = orders.filter(order_date__lte=end)
+        if not options['include_invoiced']:
+            orders = orders.filter(invoice__isnull=True)
+
+        updated = apply_sales_tax(orders)
+        rebuild_customer_metrics()
+        rebuild_facts(start, end)
+        self.stdout.write(self.style.SUCCESS(f'Repriced tax on {updated} sales order(s)'))
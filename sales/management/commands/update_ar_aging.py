@@ -0,0 +1,31 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from sales.aging import mark_overdue, take_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Mark past-due invoices as overdue and store the daily AR aging snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Aging date (YYYY-MM-DD), defaults to today')
+
+    def handle(self, *args, **options):
+        as_of = timezone.now().date()
+        if options['date']:
+            try:
+                as_of = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f"Invalid date: {options['date']}")
+
+        overdue_count = mark_overdue(as_of)
+        self.stdout.write(
+            self.style.SUCCESS(f'Marked {overdue_count} invoice(s) as overdue')
+        )
+
+        snapshot_count = take_snapshot(as_of)
+        self.stdout.write(
+            self.style.SUCCESS(f'Stored aging snapshot for {snapshot_count} customer(s) as of {as_of}')
+        )
@@ -0,0 +1,81 @@
+"""
+Stored customer metrics.
+
+Customer.order_count, lifetime_value, last_order_date and open_balance are
+recomputed for the affected customers with one UPDATE of correlated
+subqueries. Signal handlers call it whenever an order, invoice or payment is
+saved or deleted, and the bulk services (billing, payments) call it
+directly for the rows they touch. Both happen inside the same transaction
+as the write, so list pages can read and sort by the stored columns.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .aging import OUTSTANDING_STATUSES
+from .models import Customer, Invoice, SalesOrder
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def metric_expressions():
+    """Subquery expressions for each stored metric of the outer customer"""
+    orders = SalesOrder.objects.filter(customer=OuterRef('pk')).order_by().values('customer')
+    open_invoices = Invoice.objects.filter(
+        sales_order__customer=OuterRef('pk'),
+        payment_status__in=OUTSTANDING_STATUSES,
+    ).order_by().values('sales_order__customer')
+    zero = Value(Decimal('0.00'), output_field=MONEY)
+
+    return {
+        'order_count': Coalesce(Subquery(orders.annotate(count=Count('pk')).values('count')), 0),
+        'lifetime_value': Coalesce(
+            Subquery(orders.annotate(total=Sum('total_amount')).values('total'), output_field=MONEY),
+            zero,
+        ),
+        'last_order_date': Subquery(orders.annotate(latest=Max('order_date')).values('latest')),
+        'open_balance': Coalesce(
+            Subquery(
+                open_invoices.annotate(
+                    balance=Sum(ExpressionWrapper(F('total_amount') - F('amount_paid'), output_field=MONEY))
+                ).values('balance'),
+                output_field=MONEY,
+            ),
+            zero,
+        ),
+    }
+
+
+def refresh_customer_metrics(customer_ids):
+    """Recompute the stored metrics of the given customers in one UPDATE"""
+    customer_ids = {pk for pk in customer_ids if pk is not None}
+    if not customer_ids:
+        return 0
+    return Customer.objects.filter(pk__in=customer_ids).update(**metric_expressions())
+
+
+def refresh_for_orders(order_ids):
+    """Refresh the customers of the given sales orders"""
+    return refresh_customer_metrics(
+        SalesOrder.objects.filter(pk__in=order_ids).values_list('customer_id', flat=True).distinct()
+    )
+
+
+def refresh_for_invoices(invoice_ids):
+    """Refresh the customers of the given invoices"""
+    return refresh_customer_metrics(
+        Invoice.objects.filter(pk__in=invoice_ids).values_list('sales_order__customer_id', flat=True).distinct()
+    )
+
+
+def rebuild_customer_metrics(batch_size=REBUILD_BATCH_SIZE):
+    """Recompute metrics for every customer, batch_size customers per UPDATE"""
+    customer_ids = list(Customer.objects.order_by('pk').values_list('pk', flat=True))
+    updated = 0
+    for start in range(0, len(customer_ids), batch_size):
+        updated += refresh_customer_metrics(customer_ids[start:start + batch_size])
+    return updated
+
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ARAgingSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('snapshot_date', models.DateField(help_text='Date the balances were aged on')),
+                ('not_due', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('days_0_30', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('days_31_60', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('days_61_90', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('days_over_90', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_outstanding', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('invoice_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'AR Aging Snapshot',
+                'verbose_name_plural': 'AR Aging Snapshots',
+                'ordering': ['-snapshot_date', '-total_outstanding'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['payment_status', 'due_date'], name='sales_invoi_payment_2a9e84_idx'),
+        ),
+        migrations.AddField(
+            model_name='aragingsnapshot',
+            name='customer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aging_snapshots', to='sales.customer'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='aragingsnapshot',
+            unique_together={('snapshot_date', 'customer')},
+        ),
+    ]
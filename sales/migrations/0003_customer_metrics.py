@@ -0,0 +1,69 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:13
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_customer_metrics(apps, schema_editor):
+    Customer = apps.get_model('sales', 'Customer')
+    SalesOrder = apps.get_model('sales', 'SalesOrder')
+    Invoice = apps.get_model('sales', 'Invoice')
+    money = DecimalField(max_digits=14, decimal_places=2)
+    zero = Value(Decimal('0.00'), output_field=money)
+
+    orders = SalesOrder.objects.filter(customer=OuterRef('pk')).order_by().values('customer')
+    open_invoices = Invoice.objects.filter(
+        sales_order__customer=OuterRef('pk'),
+        payment_status__in=['unpaid', 'partial', 'overdue'],
+    ).order_by().values('sales_order__customer')
+
+    Customer.objects.update(
+        order_count=Coalesce(Subquery(orders.annotate(count=Count('pk')).values('count')), 0),
+        lifetime_value=Coalesce(
+            Subquery(orders.annotate(total=Sum('total_amount')).values('total'), output_field=money), zero
+        ),
+        last_order_date=Subquery(orders.annotate(latest=Max('order_date')).values('latest')),
+        open_balance=Coalesce(
+            Subquery(
+                open_invoices.annotate(
+                    balance=Sum(ExpressionWrapper(F('total_amount') - F('amount_paid'), output_field=money))
+                ).values('balance'),
+                output_field=money,
+            ),
+            zero,
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0002_ar_aging_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='last_order_date',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='lifetime_value',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='open_balance',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='order_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_customer_metrics, migrations.RunPython.noop),
+    ]
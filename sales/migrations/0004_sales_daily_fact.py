@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_finishedproduct_reserved_stock'),
+        ('sales', '0003_customer_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesDailyFact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('customer_type', models.CharField(max_length=20)),
+                ('status', models.CharField(max_length=20)),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, help_text='Sum of line totals', max_digits=14)),
+                ('discount', models.DecimalField(decimal_places=2, default=0, help_text='Line or order discounts', max_digits=14)),
+                ('line_count', models.IntegerField(default=0)),
+                ('order_count', models.IntegerField(default=0)),
+                ('order_total', models.DecimalField(decimal_places=2, default=0, help_text='Sum of order total amounts', max_digits=14)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_facts', to='sales.customer')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sales_facts', to='inventory.finishedproduct')),
+            ],
+            options={
+                'verbose_name': 'Sales Daily Fact',
+                'verbose_name_plural': 'Sales Daily Facts',
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['product', 'date'], name='sales_sales_product_6d1dda_idx'), models.Index(fields=['customer', 'date'], name='sales_sales_custome_44045f_idx')],
+                'unique_together': {('date', 'product', 'customer', 'customer_type', 'status')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 03:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0004_sales_daily_fact'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='salesorderitem',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Total for this line item, set with the order totals (sales.billing)', max_digits=12),
+        ),
+    ]
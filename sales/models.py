@@ -1,8 +1,10 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 from decimal import Decimal
 
+from core.numbering import next_number
+
 
 class Customer(models.Model):
     """Customer model for managing customer information"""
@@ -41,6 +43,12 @@ class Customer(models.Model):
         default='cod'
     )
 
+    # Stored metrics, kept current by sales.metrics
+    order_count = models.IntegerField(default=0, editable=False)
+    lifetime_value = models.DecimalField(max_digits=14, decimal_places=2, default=0, db_index=True, editable=False)
+    last_order_date = models.DateField(null=True, blank=True, editable=False)
+    open_balance = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
+
     # Status and metadata
     is_active = models.BooleanField(default=True)
     notes = models.TextField(blank=True)
@@ -58,13 +66,17 @@ class Customer(models.Model):
 
     @property
     def total_orders(self):
-        return self.sales_orders.count()
+        return self.order_count
 
     @property
     def total_order_value(self):
-        return self.sales_orders.aggregate(
-            total=models.Sum('total_amount')
-        )['total'] or Decimal('0.00')
+        return self.lifetime_value
+
+    @property
+    def average_order_value(self):
+        if self.order_count:
+            return self.lifetime_value / self.order_count
+        return Decimal('0.00')
 
 
 class SalesOrder(models.Model):
@@ -122,7 +134,10 @@ class SalesOrder(models.Model):
     def save(self, *args, **kwargs):
         # Auto-generate order number if not provided
         if not self.order_number:
-            self.order_number = f"SO-{timezone.now().strftime('%Y%m%d')}-{self.pk or '000'}"
+            with transaction.atomic():
+                self.order_number = next_number('sales_order', self.order_date)
+                super().save(*args, **kwargs)
+            return
         super().save(*args, **kwargs)
 
     @property
@@ -140,7 +155,10 @@ class SalesOrderItem(models.Model):
     discount_percent = models.DecimalField(max_digits=5, decimal_places=2, default=0, help_text="Discount percentage")
 
     # Calculated fields
-    line_total = models.DecimalField(max_digits=12, decimal_places=2, help_text="Total for this line item")
+    line_total = models.DecimalField(
+        max_digits=12, decimal_places=2, default=0,
+        help_text="Total for this line item, set with the order totals (sales.billing)"
+    )
 
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -151,12 +169,6 @@ class SalesOrderItem(models.Model):
     def __str__(self):
         return f"{self.product.name} - {self.quantity} units"
 
-    def save(self, *args, **kwargs):
-        # Calculate line total
-        discount_amount = (self.unit_price * self.quantity) * (self.discount_percent / 100)
-        self.line_total = (self.unit_price * self.quantity) - discount_amount
-        super().save(*args, **kwargs)
-
 
 class Invoice(models.Model):
     """Invoice model for billing customers"""
@@ -207,13 +219,19 @@ class Invoice(models.Model):
         ordering = ['-invoice_date']
         verbose_name = 'Invoice'
         verbose_name_plural = 'Invoices'
+        indexes = [
+            models.Index(fields=['payment_status', 'due_date']),
+        ]
 
     def __str__(self):
         return f"INV-{self.invoice_number}"
 
     def save(self, *args, **kwargs):
         if not self.invoice_number:
-            self.invoice_number = f"INV-{timezone.now().strftime('%Y%m%d')}-{self.pk or '000'}"
+            with transaction.atomic():
+                self.invoice_number = next_number('invoice', self.invoice_date)
+                super().save(*args, **kwargs)
+            return
         super().save(*args, **kwargs)
 
     @property
@@ -221,6 +239,63 @@ class Invoice(models.Model):
         return self.total_amount - self.amount_paid
 
 
+class ARAgingSnapshot(models.Model):
+    """Daily accounts-receivable aging totals per customer"""
+    snapshot_date = models.DateField(help_text="Date the balances were aged on")
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='aging_snapshots')
+
+    not_due = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    days_0_30 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    days_31_60 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    days_61_90 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    days_over_90 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_outstanding = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    invoice_count = models.IntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-snapshot_date', '-total_outstanding']
+        unique_together = ['snapshot_date', 'customer']
+        verbose_name = 'AR Aging Snapshot'
+        verbose_name_plural = 'AR Aging Snapshots'
+
+    def __str__(self):
+        return f"{self.customer.name} - {self.snapshot_date}"
+
+
+class SalesDailyFact(models.Model):
+    """Pre-aggregated sales per day, product, customer and order status"""
+    date = models.DateField()
+    product = models.ForeignKey('inventory.FinishedProduct', on_delete=models.CASCADE, null=True, blank=True, related_name='sales_facts')
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='sales_facts')
+    customer_type = models.CharField(max_length=20)
+    status = models.CharField(max_length=20)
+
+    # Line measures, on rows with a product
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, help_text="Sum of line totals")
+    discount = models.DecimalField(max_digits=14, decimal_places=2, default=0, help_text="Line or order discounts")
+    line_count = models.IntegerField(default=0)
+
+    # Order measures, on rows without a product
+    order_count = models.IntegerField(default=0)
+    order_total = models.DecimalField(max_digits=14, decimal_places=2, default=0, help_text="Sum of order total amounts")
+
+    class Meta:
+        ordering = ['-date']
+        unique_together = ['date', 'product', 'customer', 'customer_type', 'status']
+        indexes = [
+            models.Index(fields=['product', 'date']),
+            models.Index(fields=['customer', 'date']),
+        ]
+        verbose_name = 'Sales Daily Fact'
+        verbose_name_plural = 'Sales Daily Facts'
+
+    def __str__(self):
+        return f"{self.date} - {self.customer_id} - {self.product_id or 'order'} ({self.status})"
+
+
 class Payment(models.Model):
     """Payment records for invoices"""
     invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='payments')
@@ -0,0 +1,292 @@
+"""
+Payment application.
+
+A payment is matched either to one invoice or to a customer, in which case
+it is spread over the customer's open invoices oldest due date first. Many
+payments (for example a bank statement) are applied together:
+
+* the affected invoices are locked once with SELECT ... FOR UPDATE,
+* ``amount_paid`` moves with ``F('amount_paid') + amount`` so concurrent
+  cashiers never overwrite each other,
+* ``payment_status`` is recomputed by the database from the new balances,
+* Payment rows are inserted with bulk_create and posted to the ledger
+  (debit cash or bank, credit accounts receivable) by the payment posting
+  rule (see finance.autopost).
+"""
+import csv
+import io
+from collections import defaultdict, namedtuple
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Case, CharField, DateField, DecimalField, F, Q, Value, When
+from django.utils import timezone
+
+from finance.autopost import post_documents
+from finance.models import FinancialPeriod
+
+from .aging import outstanding_invoices
+from .metrics import refresh_customer_metrics
+from .models import Customer, Invoice, Payment
+
+
+# Invoices updated per UPDATE statement
+UPDATE_BATCH_SIZE = 500
+
+# Statement lines applied per transaction
+STATEMENT_BATCH_SIZE = 500
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+# One incoming payment; set invoice_id to pay a single invoice or
+# customer_id to pay that customer's open invoices oldest first
+PaymentLine = namedtuple(
+    'PaymentLine',
+    ['amount', 'payment_date', 'payment_method', 'reference_number', 'invoice_id', 'customer_id', 'notes'],
+    defaults=[None, None, ''],
+)
+
+
+class ApplicationResult:
+    """Outcome of applying one or more payments"""
+
+    def __init__(self):
+        self.payments = []
+        self.transactions = []
+        self.unapplied = []     # (line, amount not matched to any invoice)
+        self.ledger_posted = False
+
+    @property
+    def applied_total(self):
+        return sum((payment.amount for payment in self.payments), Decimal('0.00'))
+
+    @property
+    def unapplied_total(self):
+        return sum((amount for _line, amount in self.unapplied), Decimal('0.00'))
+
+
+def payment_status_expression(as_of):
+    """SQL expression for an invoice's payment status from its balance"""
+    return Case(
+        When(amount_paid__gte=F('total_amount'), then=Value('paid')),
+        When(due_date__lt=as_of, then=Value('overdue')),
+        When(amount_paid__gt=0, then=Value('partial')),
+        default=Value('unpaid'),
+        output_field=CharField(),
+    )
+
+
+def refresh_payment_status(invoice_ids, as_of=None):
+    """Recompute payment_status of the given invoices in one UPDATE"""
+    as_of = as_of or timezone.now().date()
+    return Invoice.objects.filter(pk__in=invoice_ids).update(
+        payment_status=payment_status_expression(as_of)
+    )
+
+
+def _update_invoices(applied, paid_on, method):
+    invoice_ids = list(applied)
+    for start in range(0, len(invoice_ids), UPDATE_BATCH_SIZE):
+        chunk = invoice_ids[start:start + UPDATE_BATCH_SIZE]
+        Invoice.objects.filter(pk__in=chunk).update(
+            amount_paid=Case(
+                *[When(pk=pk, then=F('amount_paid') + Value(applied[pk], output_field=MONEY)) for pk in chunk],
+                output_field=MONEY,
+            ),
+            payment_date=Case(
+                *[When(pk=pk, then=Value(paid_on[pk])) for pk in chunk],
+                output_field=DateField(),
+            ),
+            payment_method=Case(
+                *[When(pk=pk, then=Value(method[pk])) for pk in chunk],
+                output_field=CharField(),
+            ),
+        )
+        refresh_payment_status(chunk)
+
+
+def apply_payments(lines, user=None):
+    """
+    Apply many payments in one transaction.
+
+    Lines are matched in the order given, so earlier lines pay the oldest
+    invoices first. Amounts that find no open balance are reported in
+    ``result.unapplied`` and are not recorded. Ledger transactions are
+    posted when the cash, bank and receivable accounts exist.
+    """
+    lines = list(lines)
+    result = ApplicationResult()
+    invoice_ids = {line.invoice_id for line in lines if line.invoice_id}
+    customer_ids = {line.customer_id for line in lines if line.customer_id and not line.invoice_id}
+
+    with transaction.atomic():
+        rows = outstanding_invoices().filter(
+            Q(pk__in=invoice_ids) | Q(sales_order__customer_id__in=customer_ids)
+        ).select_for_update(of=('self',)).order_by(
+            'due_date', 'invoice_date', 'pk'
+        ).values(
+            'pk', 'invoice_number', 'total_amount', 'amount_paid',
+            'sales_order_id', 'sales_order__customer_id',
+        )
+
+        invoices = {}
+        open_balance = {}
+        by_customer = defaultdict(list)
+        for row in rows:
+            invoices[row['pk']] = row
+            open_balance[row['pk']] = row['total_amount'] - row['amount_paid']
+            by_customer[row['sales_order__customer_id']].append(row['pk'])
+
+        applied = defaultdict(Decimal)
+        paid_on = {}
+        method = {}
+        for line in lines:
+            remaining = line.amount
+            payment_date = line.payment_date or timezone.now().date()
+            targets = [line.invoice_id] if line.invoice_id else by_customer.get(line.customer_id, [])
+            for invoice_id in targets:
+                if remaining <= 0:
+                    break
+                amount = min(open_balance.get(invoice_id, Decimal('0.00')), remaining)
+                if amount <= 0:
+                    continue
+                open_balance[invoice_id] -= amount
+                applied[invoice_id] += amount
+                paid_on[invoice_id] = max(paid_on.get(invoice_id, payment_date), payment_date)
+                method[invoice_id] = line.payment_method
+                remaining -= amount
+                result.payments.append(Payment(
+                    invoice_id=invoice_id,
+                    payment_date=payment_date,
+                    amount=amount,
+                    payment_method=line.payment_method,
+                    reference_number=line.reference_number,
+                    notes=line.notes,
+                    created_by=user,
+                ))
+            if remaining > 0:
+                result.unapplied.append((line, remaining))
+
+        if applied:
+            _update_invoices(applied, paid_on, method)
+            refresh_customer_metrics({invoices[pk]['sales_order__customer_id'] for pk in applied})
+            result.payments = Payment.objects.bulk_create(result.payments, batch_size=UPDATE_BATCH_SIZE)
+            posting = post_documents('payment', [payment.pk for payment in result.payments])
+            result.transactions = posting.transactions
+            result.ledger_posted = bool(posting.posted)
+
+    return result
+
+
+def apply_payments_in_batches(lines, user=None, batch_size=STATEMENT_BATCH_SIZE):
+    """Apply a long list of payments in consecutive transactions of batch_size lines"""
+    lines = list(lines)
+    result = ApplicationResult()
+    for start in range(0, len(lines), batch_size):
+        batch = apply_payments(lines[start:start + batch_size], user=user)
+        result.payments.extend(batch.payments)
+        result.transactions.extend(batch.transactions)
+        result.unapplied.extend(batch.unapplied)
+        result.ledger_posted = result.ledger_posted or batch.ledger_posted
+    return result
+
+
+def apply_payment(amount, payment_method, payment_date=None, reference_number='',
+                  invoice=None, customer=None, notes='', user=None):
+    """Apply a single payment to an invoice or across a customer's open invoices"""
+    line = PaymentLine(
+        amount=amount,
+        payment_date=payment_date,
+        payment_method=payment_method,
+        reference_number=reference_number,
+        invoice_id=invoice.pk if invoice else None,
+        customer_id=customer.pk if customer else None,
+        notes=notes,
+    )
+    return apply_payments([line], user=user)
+
+
+class StatementError(Exception):
+    """Raised when a bank statement file cannot be read"""
+
+
+STATEMENT_COLUMNS = ['date', 'amount', 'reference']
+
+
+def parse_bank_statement(csv_file, payment_method='bank_transfer'):
+    """
+    Read a bank statement CSV into PaymentLines.
+
+    Required columns are ``date`` (YYYY-MM-DD), ``amount`` and ``reference``;
+    each row also needs ``invoice`` (invoice number) or ``customer_email``
+    to be matched. Returns ``(lines, errors)``; rows with errors are skipped.
+    """
+    try:
+        text = io.TextIOWrapper(csv_file, encoding='utf-8-sig')
+        reader = csv.DictReader(text)
+        fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+        missing = [column for column in STATEMENT_COLUMNS if column not in fieldnames]
+        if missing:
+            raise StatementError(f"Missing required columns: {', '.join(missing)}")
+        reader.fieldnames = fieldnames
+        # The file is decoded as it is read, so a bad byte anywhere shows up here
+        rows = list(reader)
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise StatementError(f"Could not read statement: {e}")
+
+    invoice_numbers = {row.get('invoice', '').strip() for row in rows} - {''}
+    emails = {row.get('customer_email', '').strip().lower() for row in rows} - {''}
+    invoice_ids = dict(
+        Invoice.objects.filter(invoice_number__in=invoice_numbers).values_list('invoice_number', 'pk')
+    )
+    customer_ids = {
+        email.lower(): pk
+        for email, pk in Customer.objects.filter(email__in=emails).values_list('email', 'pk')
+    }
+
+    lines = []
+    errors = []
+    dates = {}
+    for row_num, row in enumerate(rows, start=2):
+        try:
+            payment_date = date.fromisoformat(row['date'].strip())
+            amount = Decimal(row['amount'].strip().replace(',', ''))
+        except (ValueError, InvalidOperation, AttributeError):
+            errors.append(f"Row {row_num}: invalid date or amount")
+            continue
+        if amount <= 0:
+            errors.append(f"Row {row_num}: amount must be positive")
+            continue
+
+        invoice_number = (row.get('invoice') or '').strip()
+        email = (row.get('customer_email') or '').strip().lower()
+        invoice_id = invoice_ids.get(invoice_number) if invoice_number else None
+        customer_id = customer_ids.get(email) if email else None
+        if not invoice_id and not customer_id:
+            errors.append(f"Row {row_num}: no invoice or customer matches '{invoice_number or email}'")
+            continue
+
+        dates[row_num] = payment_date
+        lines.append(PaymentLine(
+            amount=amount,
+            payment_date=payment_date,
+            payment_method=payment_method,
+            reference_number=(row.get('reference') or '').strip()[:100],
+            invoice_id=invoice_id,
+            customer_id=None if invoice_id else customer_id,
+            notes='Imported from bank statement',
+        ))
+
+    # Payments cannot be posted into a closed financial period
+    closed = FinancialPeriod.closed_periods_for(dates.values())
+    if closed:
+        open_lines = []
+        for row_num, line in zip(dates, lines):
+            period = next((period for period in closed if period.contains(line.payment_date)), None)
+            if period:
+                errors.append(f"Row {row_num}: financial period {period} is closed")
+            else:
+                open_lines.append(line)
+        lines = open_lines
+    return lines, errors
@@ -0,0 +1,72 @@
+from django.db.models.signals import post_save, post_delete, post_init
+from django.dispatch import receiver
+
+from inventory.models import FinishedProduct
+from manufacturing.models import ProductionOrder
+from .analytics import mark_orders, mark_slices
+from .atp import atp_index
+from .metrics import refresh_customer_metrics, refresh_for_invoices, refresh_for_orders
+from .models import Customer, Invoice, Payment, SalesDailyFact, SalesOrder, SalesOrderItem
+
+
+@receiver(post_save, sender=FinishedProduct)
+@receiver(post_delete, sender=FinishedProduct)
+def invalidate_product_availability(sender, instance, **kwargs):
+    atp_index.invalidate([instance.pk])
+
+
+@receiver(post_save, sender=ProductionOrder)
+@receiver(post_delete, sender=ProductionOrder)
+def invalidate_scheduled_production(sender, instance, **kwargs):
+    atp_index.invalidate([instance.product_id])
+
+
+@receiver(post_init, sender=SalesOrder)
+def remember_order_customer(sender, instance, **kwargs):
+    # Lets post_save refresh the previous customer and sales facts slice
+    # when an order is reassigned or moved to another date. Read through
+    # __dict__ so deferred fields are not loaded (which would recurse)
+    instance._loaded_customer_id = instance.__dict__.get('customer_id')
+    instance._loaded_order_date = instance.__dict__.get('order_date')
+
+
+@receiver(post_save, sender=SalesOrder)
+@receiver(post_delete, sender=SalesOrder)
+def refresh_order_customer_metrics(sender, instance, **kwargs):
+    refresh_customer_metrics({instance.customer_id, instance._loaded_customer_id})
+    mark_slices([
+        (instance.order_date, instance.customer_id),
+        (instance._loaded_order_date, instance._loaded_customer_id),
+    ])
+    instance._loaded_customer_id = instance.customer_id
+    instance._loaded_order_date = instance.order_date
+
+
+@receiver(post_save, sender=SalesOrderItem)
+@receiver(post_delete, sender=SalesOrderItem)
+def mark_item_sales_facts(sender, instance, **kwargs):
+    mark_orders([instance.sales_order_id])
+
+
+@receiver(post_init, sender=Customer)
+def remember_customer_type(sender, instance, **kwargs):
+    instance._loaded_customer_type = instance.__dict__.get('customer_type')
+
+
+@receiver(post_save, sender=Customer)
+def update_fact_customer_type(sender, instance, created, **kwargs):
+    if not created and instance.customer_type != instance._loaded_customer_type:
+        SalesDailyFact.objects.filter(customer=instance).update(customer_type=instance.customer_type)
+    instance._loaded_customer_type = instance.customer_type
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+def refresh_invoice_customer_metrics(sender, instance, **kwargs):
+    refresh_for_orders([instance.sales_order_id])
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def refresh_payment_customer_metrics(sender, instance, **kwargs):
+    refresh_for_invoices([instance.invoice_id])
@@ -1,3 +1,536 @@
+import io
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from finance.models import TaxRate
+from inventory.models import CostLayer, FinishedProduct, InventoryTransaction, ProductCategory, Warehouse
+from manufacturing.models import ProductionOrder
+
+from . import aging, metrics
+from . import payments
+from .analytics import rebuild_facts, sales_cube
+from .atp import ATPIndex, reserve_order
+from .billing import generate_invoices, recalculate_order_totals
+from .forms import SalesOrderForm
+from .models import ARAgingSnapshot, Customer, Invoice, Payment, SalesDailyFact, SalesOrder, SalesOrderItem
+from .workflow import TransitionError, transition_order, transition_orders
+
+
+class SalesTestData:
+    """Products, a customer and helpers to place orders"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('sales', password='sales')
+        cls.customer = Customer.objects.create(name='Toko Sepatu', email='toko@example.com')
+        category = ProductCategory.objects.create(name='Sneakers')
+        cls.product = FinishedProduct.objects.create(
+            code='SNK-01', name='Sneaker 40 Black', category=category, size='40', color='black',
+            current_stock=10, unit_price=100,
+        )
+
+    def make_order(self, quantity, product=None, status='draft'):
+        order = SalesOrder.objects.create(
+            customer=self.customer, required_date=timezone.localdate() + timedelta(days=7),
+            status=status, created_by=self.user,
+        )
+        SalesOrderItem.objects.create(
+            sales_order=order, product=product or self.product, quantity=quantity, unit_price=100,
+        )
+        return order
+
+    def make_invoice(self, total, due_date, paid=0, status='unpaid', customer=None):
+        order = SalesOrder.objects.create(
+            customer=customer or self.customer, required_date=due_date, status='delivered', created_by=self.user,
+        )
+        return Invoice.objects.create(
+            sales_order=order, invoice_date=due_date - timedelta(days=30), due_date=due_date,
+            subtotal=total, tax_amount=0, discount_amount=0, shipping_cost=0, total_amount=total,
+            amount_paid=paid, payment_status=status, created_by=self.user,
+        )
+
+
+class ATPIndexTests(SalesTestData, TestCase):
+
+    def test_reservation_is_seen_by_other_workers(self):
+        # Two indexes stand for the caches of two worker processes
+        worker_a, worker_b = ATPIndex(), ATPIndex()
+        self.assertEqual(worker_a.available(self.product.pk), 10)
+        self.assertEqual(worker_b.available(self.product.pk), 10)
+
+        reserve_order(self.make_order(4))
+
+        self.assertEqual(worker_a.available(self.product.pk), 6)
+        self.assertEqual(worker_b.available(self.product.pk), 6)
+
+    def test_unchanged_products_are_not_reloaded(self):
+        index = ATPIndex()
+        index.available(self.product.pk)
+        # Only the version lookup runs
+        with self.assertNumQueries(1):
+            self.assertEqual(index.check([(self.product.pk, 3)]), {})
+
+
+class WorkflowTests(SalesTestData, TestCase):
+
+    def setUp(self):
+        self.warehouse = Warehouse.objects.create(name='Gudang Utama', location='Bandung')
+
+    def test_confirm_reserves_until_stock_runs_out(self):
+        first, second, third = self.make_order(6), self.make_order(6), self.make_order(4)
+
+        result = transition_orders([first, second, third], 'confirmed')
+
+        self.assertEqual(result.updated, [first.pk, third.pk])
+        self.assertEqual([number for number, _reason in result.skipped], [second.order_number])
+        self.assertIn('Insufficient stock', result.skipped[0][1])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_stock, 10)
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'draft')
+
+    def test_confirm_counts_open_production(self):
+        ProductionOrder.objects.create(
+            po_number='PRD-TEST-1', product=self.product, quantity=5, status='approved',
+            planned_start_date=timezone.localdate(), planned_end_date=timezone.localdate(),
+            created_by=self.user,
+        )
+        order = self.make_order(15)
+
+        result = transition_orders([order], 'confirmed')
+
+        self.assertEqual(result.updated, [order.pk])
+
+    def test_confirm_queries_do_not_grow_with_orders(self):
+        def confirm(count):
+            orders = [self.make_order(1) for _ in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                transition_orders(orders, 'confirmed')
+            return len(queries)
+
+        self.assertEqual(confirm(2), confirm(6))
+
+    def test_transitions_are_checked(self):
+        order = self.make_order(1)
+
+        result = transition_orders([order], 'shipped', user=self.user, warehouse=self.warehouse)
+
+        self.assertEqual(result.updated, [])
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'draft')
+        with self.assertRaises(TransitionError):
+            transition_order(order, 'delivered')
+
+    def test_ship_issues_stock_and_releases_reservation(self):
+        order = self.make_order(4)
+        transition_order(order, 'confirmed')
+
+        transition_order(order, 'shipped', user=self.user, warehouse=self.warehouse)
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.current_stock, self.product.reserved_stock), (6, 0))
+        self.assertEqual(order.ship_date, timezone.localdate())
+        issue = InventoryTransaction.objects.get(reference_number=order.order_number)
+        self.assertEqual((issue.transaction_type, issue.quantity), ('OUT', 4))
+
+    def test_shipments_are_costed_from_the_cost_layers(self):
+        CostLayer.objects.filter(material_type='finished', material_id=self.product.pk).delete()
+        CostLayer.objects.bulk_create([
+            CostLayer(material_type='finished', material_id=self.product.pk, quantity=3, unit_cost=40,
+                      received_at=timezone.now() - timedelta(days=2)),
+            CostLayer(material_type='finished', material_id=self.product.pk, quantity=7, unit_cost=50,
+                      received_at=timezone.now() - timedelta(days=1)),
+        ])
+        first, second = self.make_order(2, status='confirmed'), self.make_order(4, status='confirmed')
+
+        transition_orders([first, second], 'shipped', user=self.user, warehouse=self.warehouse)
+
+        costs = dict(InventoryTransaction.objects.filter(transaction_type='OUT').values_list(
+            'reference_number', 'total_value',
+        ))
+        self.assertEqual(costs, {first.order_number: Decimal('80'), second.order_number: Decimal('190')})
+        issue = InventoryTransaction.objects.get(reference_number=second.order_number)
+        self.assertEqual(issue.unit_price, Decimal('47.50'))
+
+    def test_cancel_releases_reservation(self):
+        order = self.make_order(4)
+        transition_order(order, 'confirmed')
+
+        transition_order(order, 'cancelled')
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_stock, 0)
+
+    def test_deliver_invoices_order(self):
+        order = self.make_order(2, status='confirmed')
+        transition_order(order, 'shipped', user=self.user, warehouse=self.warehouse)
+
+        result = transition_order(order, 'delivered', user=self.user)
+
+        self.assertEqual(len(result.invoices), 1)
+        self.assertTrue(Invoice.objects.filter(sales_order=order).exists())
+
+    def test_order_form_does_not_change_status(self):
+        self.assertNotIn('status', SalesOrderForm().fields)
+
+
+class BillingTests(SalesTestData, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        TaxRate.objects.create(
+            name='VAT', code='VAT', rate=Decimal('11'), effective_from=date(2024, 1, 1),
+            applicable_to_purchases=False,
+        )
+
+    def make_priced_order(self, order_date=date(2024, 3, 1), status='draft', customer=None):
+        order = SalesOrder.objects.create(
+            customer=customer or self.customer, order_date=order_date, required_date=order_date,
+            status=status, discount_amount=Decimal('20'), shipping_cost=Decimal('15'), created_by=self.user,
+        )
+        SalesOrderItem.objects.create(
+            sales_order=order, product=self.product, quantity=2, unit_price=Decimal('100'), discount_percent=Decimal('10'),
+        )
+        SalesOrderItem.objects.create(sales_order=order, product=self.product, quantity=1, unit_price=Decimal('50'))
+        return order
+
+    def test_order_totals_are_recomputed_with_tax(self):
+        order = self.make_priced_order()
+
+        recalculate_order_totals([order.pk])
+
+        self.assertEqual(sorted(order.items.values_list('line_total', flat=True)), [Decimal('50'), Decimal('180')])
+        order.refresh_from_db()
+        self.assertEqual(order.subtotal, Decimal('230'))
+        # 11% of the subtotal less the order discount
+        self.assertEqual(order.tax_amount, Decimal('23.10'))
+        self.assertEqual(order.total_amount, Decimal('248.10'))
+
+    def test_orders_before_a_rate_are_not_taxed_by_it(self):
+        order = self.make_priced_order(order_date=date(2023, 12, 31))
+
+        recalculate_order_totals([order.pk])
+
+        order.refresh_from_db()
+        self.assertEqual((order.tax_amount, order.total_amount), (Decimal('0'), Decimal('225')))
+
+    def test_recalculation_queries_do_not_grow_with_orders(self):
+        def queries(count):
+            ids = [self.make_priced_order().pk for _ in range(count)]
+            with CaptureQueriesContext(connection) as captured:
+                recalculate_order_totals(ids)
+            return len(captured)
+
+        self.assertEqual(queries(1), queries(10))
+
+    def test_invoices_are_generated_for_delivered_orders(self):
+        cod = Customer.objects.create(name='Toko Tunai', email='tunai@example.com', payment_terms='cod')
+        self.customer.payment_terms = 'net_30'
+        self.customer.save()
+        first = self.make_priced_order(status='delivered')
+        second = self.make_priced_order(status='delivered', customer=cod)
+        self.make_priced_order(status='shipped')
+
+        invoices = generate_invoices(SalesOrder.objects.all(), self.user, invoice_date=date(2024, 3, 10))
+
+        self.assertEqual([invoice.sales_order_id for invoice in invoices], [first.pk, second.pk])
+        by_order = {invoice.sales_order_id: Invoice.objects.get(pk=invoice.pk) for invoice in invoices}
+        self.assertEqual(by_order[first.pk].due_date, date(2024, 4, 9))
+        self.assertEqual(by_order[second.pk].due_date, date(2024, 3, 10))
+        self.assertEqual(by_order[first.pk].total_amount, Decimal('248.10'))
+        numbers = [invoice.invoice_number for invoice in invoices]
+        self.assertTrue(all(number.startswith('INV-20240310-') for number in numbers))
+        sequence = [int(number.rsplit('-', 1)[1]) for number in numbers]
+        self.assertEqual(sequence, list(range(sequence[0], sequence[0] + 2)))
+
+    def test_invoiced_orders_are_not_invoiced_again(self):
+        order = self.make_priced_order(status='delivered')
+        generate_invoices(SalesOrder.objects.all(), self.user)
+
+        self.assertEqual(generate_invoices(SalesOrder.objects.all(), self.user), [])
+        self.assertEqual(Invoice.objects.filter(sales_order=order).count(), 1)
+
+
+class AgingTests(SalesTestData, TestCase):
+
+    as_of = date(2024, 6, 30)
+
+    def setUp(self):
+        self.other = Customer.objects.create(name='Toko Lain', email='lain@example.com')
+        self.make_invoice(Decimal('100'), date(2024, 7, 5))                       # not due
+        self.make_invoice(Decimal('200'), date(2024, 6, 30))                      # due today
+        self.make_invoice(Decimal('80'), date(2024, 5, 31), paid=Decimal('30'), status='partial')  # 30 days
+        self.make_invoice(Decimal('70'), date(2024, 5, 30))                       # 31 days
+        self.make_invoice(Decimal('40'), date(2024, 4, 1), customer=self.other)   # 90 days
+        self.make_invoice(Decimal('30'), date(2024, 3, 31), customer=self.other)  # 91 days
+        self.make_invoice(Decimal('500'), date(2024, 1, 1), paid=Decimal('500'), status='paid')
+
+    def test_balances_fall_in_buckets_by_days_past_due(self):
+        totals = aging.aging_totals(self.as_of)
+
+        self.assertEqual(
+            {field: totals[field] for field in aging.BUCKET_FIELDS},
+            {'not_due': 100, 'days_0_30': 250, 'days_31_60': 70, 'days_61_90': 40, 'days_over_90': 30},
+        )
+        self.assertEqual((totals['total_outstanding'], totals['invoice_count']), (490, 6))
+
+    def test_aging_by_customer(self):
+        rows = {row['customer_id']: row for row in aging.aging_by_customer(self.as_of)}
+
+        self.assertEqual(rows[self.customer.pk]['total_outstanding'], 420)
+        self.assertEqual(rows[self.other.pk]['days_61_90'], 40)
+        self.assertEqual(rows[self.other.pk]['days_over_90'], 30)
+
+    def test_mark_overdue_flips_only_past_due_open_invoices(self):
+        self.assertEqual(aging.mark_overdue(self.as_of), 4)
+
+        self.assertEqual(
+            dict(Invoice.objects.values_list('due_date', 'payment_status')),
+            {
+                date(2024, 7, 5): 'unpaid', date(2024, 6, 30): 'unpaid', date(2024, 5, 31): 'overdue',
+                date(2024, 5, 30): 'overdue', date(2024, 4, 1): 'overdue', date(2024, 3, 31): 'overdue',
+                date(2024, 1, 1): 'paid',
+            },
+        )
+        # Overdue invoices are still outstanding
+        self.assertEqual(aging.aging_totals(self.as_of)['total_outstanding'], 490)
+
+    def test_snapshot_replaces_an_earlier_run_and_feeds_the_trend(self):
+        aging.take_snapshot(self.as_of)
+        self.make_invoice(Decimal('10'), date(2024, 6, 1), customer=self.other)
+
+        self.assertEqual(aging.take_snapshot(self.as_of), 2)
+
+        snapshot = ARAgingSnapshot.objects.get(snapshot_date=self.as_of, customer=self.other)
+        self.assertEqual((snapshot.days_0_30, snapshot.total_outstanding, snapshot.invoice_count), (10, 80, 3))
+        trend = list(aging.aging_trend(days=7, end_date=self.as_of))
+        self.assertEqual([(row['snapshot_date'], row['total_outstanding']) for row in trend], [(self.as_of, 500)])
+
+
+class PaymentTests(SalesTestData, TestCase):
+
+    def setUp(self):
+        today = timezone.localdate()
+        self.overdue = self.make_invoice(Decimal('100'), today - timedelta(days=10))
+        self.next_due = self.make_invoice(Decimal('200'), today + timedelta(days=5))
+        self.last_due = self.make_invoice(Decimal('300'), today + timedelta(days=20))
+
+    def status(self, invoice):
+        invoice.refresh_from_db()
+        return invoice.amount_paid, invoice.payment_status
+
+    def test_customer_payment_pays_the_oldest_invoices_first(self):
+        result = payments.apply_payment(Decimal('150'), 'bank_transfer', customer=self.customer)
+
+        self.assertEqual([(payment.invoice_id, payment.amount) for payment in result.payments],
+                         [(self.overdue.pk, 100), (self.next_due.pk, 50)])
+        self.assertEqual(self.status(self.overdue), (100, 'paid'))
+        self.assertEqual(self.status(self.next_due), (50, 'partial'))
+        self.assertEqual(self.status(self.last_due), (0, 'unpaid'))
+
+    def test_payment_status_is_recomputed_from_the_balance(self):
+        payments.apply_payment(Decimal('40'), 'cash', invoice=self.overdue)
+        self.assertEqual(self.status(self.overdue), (40, 'overdue'))
+
+        Invoice.objects.filter(pk=self.next_due.pk).update(amount_paid=200)
+        payments.refresh_payment_status([self.next_due.pk])
+        self.assertEqual(self.status(self.next_due), (200, 'paid'))
+
+    def test_amounts_are_added_to_the_stored_balance(self):
+        # Paid elsewhere since this worker read the invoice
+        Invoice.objects.filter(pk=self.last_due.pk).update(amount_paid=25)
+
+        payments._update_invoices({self.last_due.pk: Decimal('10')}, {self.last_due.pk: timezone.localdate()},
+                                  {self.last_due.pk: 'cash'})
+
+        self.assertEqual(self.status(self.last_due), (35, 'partial'))
+
+    def test_over_payment_is_left_unapplied(self):
+        result = payments.apply_payment(Decimal('250'), 'cash', invoice=self.overdue)
+
+        self.assertEqual(result.applied_total, 100)
+        self.assertEqual(result.unapplied_total, 150)
+        self.assertEqual(list(Payment.objects.values_list('amount', flat=True)), [100])
+
+    def test_statement_lines_are_matched_by_invoice_or_customer(self):
+        statement = io.BytesIO((
+            "Date,Amount,Reference,Invoice,Customer_Email\n"
+            f"2024-06-01,\"1,000.50\",TRX-1,{self.last_due.invoice_number},\n"
+            "2024-06-02,75,TRX-2,,TOKO@example.com\n"
+            "2024-06-03,abc,TRX-3,,toko@example.com\n"
+            "2024-06-04,10,TRX-4,INV-NONE,\n"
+        ).encode())
+
+        lines, errors = payments.parse_bank_statement(statement)
+
+        self.assertEqual(
+            [(line.amount, line.invoice_id, line.customer_id, line.reference_number) for line in lines],
+            [(Decimal('1000.50'), self.last_due.pk, None, 'TRX-1'), (Decimal('75'), None, self.customer.pk, 'TRX-2')],
+        )
+        self.assertEqual(errors, ["Row 4: invalid date or amount", "Row 5: no invoice or customer matches 'INV-NONE'"])
+
+    def test_statement_missing_columns_is_rejected(self):
+        with self.assertRaisesMessage(payments.StatementError, 'Missing required columns: reference'):
+            payments.parse_bank_statement(io.BytesIO(b"date,amount\n2024-06-01,10\n"))
+
+    def test_statement_with_a_bad_byte_after_the_first_chunk_is_rejected(self):
+        rows = "".join(f"2024-06-01,10,TRX-{n},,toko@example.com\n" for n in range(1000))
+        statement = io.BytesIO(f"date,amount,reference,invoice,customer_email\n{rows}".encode() + b"2024-06-02,\xff\n")
+
+        with self.assertRaisesMessage(payments.StatementError, 'Could not read statement'):
+            payments.parse_bank_statement(statement)
+
+
+class CustomerMetricsTests(SalesTestData, TestCase):
+
+    def metrics(self, customer=None):
+        customer = Customer.objects.get(pk=(customer or self.customer).pk)
+        return customer.order_count, customer.lifetime_value, customer.last_order_date, customer.open_balance
+
+    def make_totalled_order(self, order_date, total, customer=None):
+        order = SalesOrder.objects.create(
+            customer=customer or self.customer, order_date=order_date, required_date=order_date, created_by=self.user,
+        )
+        SalesOrderItem.objects.create(sales_order=order, product=self.product, quantity=1, unit_price=total)
+        recalculate_order_totals([order.pk])
+        order.refresh_from_db()
+        return order
+
+    def test_orders_update_the_stored_metrics(self):
+        first = self.make_totalled_order(date(2024, 3, 1), Decimal('100'))
+        self.make_totalled_order(date(2024, 5, 1), Decimal('250'))
+
+        self.assertEqual(self.metrics(), (2, 350, date(2024, 5, 1), 0))
+
+        first.delete()
+        self.assertEqual(self.metrics(), (1, 250, date(2024, 5, 1), 0))
+
+    def test_reassigned_order_refreshes_both_customers(self):
+        other = Customer.objects.create(name='Toko Lain', email='lain@example.com')
+        order = self.make_totalled_order(date(2024, 3, 1), Decimal('100'))
+
+        order.customer = other
+        order.save()
+
+        self.assertEqual(self.metrics(), (0, 0, None, 0))
+        self.assertEqual(self.metrics(other), (1, 100, date(2024, 3, 1), 0))
+
+    def test_invoices_and_payments_move_the_open_balance(self):
+        invoice = self.make_invoice(Decimal('300'), timezone.localdate() + timedelta(days=30))
+        self.assertEqual(self.metrics()[3], 300)
+
+        payments.apply_payment(Decimal('120'), 'cash', invoice=invoice)
+        self.assertEqual(self.metrics()[3], 180)
+
+        payments.apply_payment(Decimal('180'), 'cash', invoice=invoice)
+        self.assertEqual(self.metrics()[3], 0)
+
+    def test_rebuild_recomputes_every_customer(self):
+        self.make_totalled_order(date(2024, 3, 1), Decimal('100'))
+        Customer.objects.update(order_count=0, lifetime_value=0, last_order_date=None)
+
+        self.assertEqual(metrics.rebuild_customer_metrics(batch_size=1), 1)
+        self.assertEqual(self.metrics(), (1, 100, date(2024, 3, 1), 0))
+
+
+class AnalyticsTests(SalesTestData, TestCase):
+
+    def place_order(self, order_date, quantity, unit_price, customer=None, status='draft'):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = SalesOrder.objects.create(
+                customer=customer or self.customer, order_date=order_date, required_date=order_date,
+                status=status, created_by=self.user,
+            )
+            SalesOrderItem.objects.create(
+                sales_order=order, product=self.product, quantity=quantity, unit_price=unit_price,
+                discount_percent=Decimal('10'),
+            )
+            recalculate_order_totals([order.pk])
+        order.refresh_from_db()
+        return order
+
+    def slice_facts(self, order_date, customer=None):
+        return SalesDailyFact.objects.filter(date=order_date, customer=customer or self.customer)
+
+    def test_slices_are_refreshed_only_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            order = SalesOrder.objects.create(
+                customer=self.customer, order_date=date(2024, 3, 1), required_date=date(2024, 3, 1), created_by=self.user,
+            )
+            SalesOrderItem.objects.create(sales_order=order, product=self.product, quantity=2, unit_price=100)
+            recalculate_order_totals([order.pk])
+        self.assertFalse(self.slice_facts(date(2024, 3, 1)).exists())
+
+        for callback in callbacks:
+            callback()
+
+        line = self.slice_facts(date(2024, 3, 1)).get(product=self.product)
+        self.assertEqual((line.quantity, line.revenue, line.line_count), (2, 200, 1))
+        self.assertEqual(self.slice_facts(date(2024, 3, 1)).get(product=None).order_count, 1)
+
+    def test_slice_holds_line_and_order_measures(self):
+        self.place_order(date(2024, 3, 1), 2, Decimal('100'))
+        self.place_order(date(2024, 3, 1), 1, Decimal('50'))
+
+        line = self.slice_facts(date(2024, 3, 1)).get(product=self.product)
+        self.assertEqual((line.quantity, line.revenue, line.discount, line.line_count), (3, 225, 25, 2))
+        order = self.slice_facts(date(2024, 3, 1)).get(product=None)
+        self.assertEqual((order.order_count, order.order_total, order.customer_type), (2, 225, 'retail'))
+
+    def test_moved_order_refreshes_the_old_and_new_slices(self):
+        other = Customer.objects.create(name='Toko Lain', email='lain@example.com', customer_type='wholesale')
+        order = self.place_order(date(2024, 3, 1), 2, Decimal('100'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.order_date = date(2024, 4, 2)
+            order.customer = other
+            order.save()
+
+        self.assertFalse(self.slice_facts(date(2024, 3, 1)).exists())
+        moved = self.slice_facts(date(2024, 4, 2), other).get(product=None)
+        self.assertEqual((moved.order_count, moved.order_total, moved.customer_type), (1, 180, 'wholesale'))
+
+    def test_deleted_order_empties_its_slice(self):
+        order = self.place_order(date(2024, 3, 1), 2, Decimal('100'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.delete()
+
+        self.assertFalse(self.slice_facts(date(2024, 3, 1)).exists())
+
+    def test_cube_totals_by_period_and_status(self):
+        self.place_order(date(2024, 3, 1), 2, Decimal('100'))
+        self.place_order(date(2024, 3, 20), 1, Decimal('100'), status='delivered')
+        self.place_order(date(2024, 4, 5), 1, Decimal('50'), status='delivered')
+
+        self.assertEqual(sales_cube(level='order'), {
+            'orders': 3, 'order_total': Decimal('315'), 'order_discount': Decimal('0'), 'customers': 1,
+        })
+        self.assertEqual(sales_cube(), {
+            'quantity': 4, 'revenue': Decimal('315'), 'discount': Decimal('35'), 'lines': 3,
+        })
+        months = sales_cube(period='month', level='order', status='delivered')
+        self.assertEqual(
+            [(row['period'], row['orders'], row['order_total']) for row in months],
+            [(date(2024, 3, 1), 1, Decimal('90')), (date(2024, 4, 1), 1, Decimal('45'))],
+        )
+        by_status = {row['status']: row['revenue'] for row in sales_cube(by=['status'], start=date(2024, 3, 10))}
+        self.assertEqual(by_status, {'delivered': Decimal('135')})
+
+    def test_rebuild_matches_the_incremental_facts(self):
+        self.place_order(date(2024, 3, 1), 2, Decimal('100'))
+        self.place_order(date(2024, 4, 5), 1, Decimal('50'))
+        fields = ('date', 'product_id', 'quantity', 'revenue', 'order_count', 'order_total')
+        incremental = set(SalesDailyFact.objects.values_list(*fields))
+
+        SalesDailyFact.objects.all().delete()
 
-# Create your tests here.
+        self.assertEqual(rebuild_facts(), 2)
+        self.assertEqual(set(SalesDailyFact.objects.values_list(*fields)), incremental)
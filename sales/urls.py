@@ -19,16 +19,20 @@ urlpatterns = [
     path('orders/<int:pk>/update/', views.sales_order_update, name='sales_order_update'),
     path('orders/<int:pk>/update-status/', views.sales_order_update_status, name='sales_order_update_status'),
     path('orders/<int:pk>/delete/', views.sales_order_delete, name='sales_order_delete'),
+    path('api/atp/', views.atp_check, name='atp_check'),
 
     # Invoice URLs
     path('invoices/', views.invoice_list, name='invoice_list'),
     path('invoices/create/<int:order_pk>/', views.invoice_create, name='invoice_create'),
+    path('invoices/generate/', views.invoice_bulk_generate, name='invoice_bulk_generate'),
     path('invoices/<int:pk>/', views.invoice_detail, name='invoice_detail'),
     path('invoices/<int:pk>/update/', views.invoice_update, name='invoice_update'),
 
     # Payment URLs
     path('payments/', views.payment_list, name='payment_list'),
     path('payments/create/<int:invoice_pk>/', views.payment_create, name='payment_create'),
+    path('payments/import/', views.payment_import, name='payment_import'),
+    path('customers/<int:customer_pk>/payments/create/', views.customer_payment_create, name='customer_payment_create'),
     path('payments/<int:pk>/', views.payment_detail, name='payment_detail'),
 
     # Pricing URLs
@@ -42,4 +46,5 @@ urlpatterns = [
     # Reports
     path('reports/', views.sales_reports, name='sales_reports'),
     path('reports/export/csv/', views.export_sales_report_csv, name='export_sales_report_csv'),
+    path('reports/aging/', views.ar_aging_report, name='ar_aging_report'),
 ]
\ No newline at end of file
@@ -7,11 +7,21 @@ from django.db.models import Q, Sum, Count, Avg
 from django.utils import timezone
 from django.http import JsonResponse, HttpResponse
 import csv
+import json
 from decimal import Decimal
 from .models import Customer, SalesOrder, SalesOrderItem, Invoice, Payment, ProductPricing
 from .forms import (
     CustomerForm, SalesOrderForm, SalesOrderItemFormSet, InvoiceForm,
-    PaymentForm, ProductPricingForm, SalesOrderStatusUpdateForm, BulkOrderProcessingForm
+    PaymentForm, ProductPricingForm, SalesOrderStatusUpdateForm, BulkOrderProcessingForm,
+    BulkInvoiceGenerationForm, CustomerPaymentForm, BankStatementImportForm
+)
+from .analytics import sales_cube
+from .aging import aging_by_customer, aging_totals, aging_trend, outstanding_invoices
+from .payments import StatementError, apply_payment, apply_payments_in_batches, parse_bank_statement
+from .billing import due_date_for, generate_invoices, recalculate_order_totals
+from .workflow import TransitionError, transition_order, transition_orders
+from .atp import (
+    RESERVED_ORDER_STATUSES, InsufficientStock, check_availability, release_order, reserve_order
 )
 from inventory.models import FinishedProduct
 
@@ -21,20 +31,21 @@ def sales_list(request):
     """Main sales dashboard view"""
     # Get summary statistics
     total_customers = Customer.objects.filter(is_active=True).count()
-    total_orders = SalesOrder.objects.count()
-    pending_orders = SalesOrder.objects.filter(status__in=['draft', 'confirmed']).count()
-    completed_orders = SalesOrder.objects.filter(status='delivered').count()
-    total_revenue = SalesOrder.objects.filter(status='delivered').aggregate(
-        total=Sum('total_amount')
-    )['total'] or Decimal('0.00')
+    orders_by_status = {
+        row['status']: row for row in sales_cube(by=['status'], level='order')
+    }
+    total_orders = sum(row['orders'] for row in orders_by_status.values())
+    pending_orders = sum(
+        orders_by_status.get(status, {}).get('orders', 0) for status in ['draft', 'confirmed']
+    )
+    completed_orders = orders_by_status.get('delivered', {}).get('orders', 0)
+    total_revenue = orders_by_status.get('delivered', {}).get('order_total') or Decimal('0.00')
 
     # Recent orders
     recent_orders = SalesOrder.objects.select_related('customer').order_by('-created_at')[:5]
 
     # Top customers by order value
-    top_customers = Customer.objects.annotate(
-        order_value=Sum('sales_orders__total_amount')
-    ).filter(order_value__isnull=False).order_by('-order_value')[:5]
+    top_customers = Customer.objects.filter(order_count__gt=0).order_by('-lifetime_value')[:5]
 
     context = {
         'total_customers': total_customers,
@@ -49,15 +60,26 @@ def sales_list(request):
 
 
 # Customer Views
+CUSTOMER_SORTS = {
+    'value': '-lifetime_value',
+    'name': 'name',
+    'orders': '-order_count',
+    'recent': '-last_order_date',
+    'balance': '-open_balance',
+}
+
+
 @login_required
 def customer_list(request):
-    customers = Customer.objects.all().order_by('name')
+    sort = request.GET.get('sort', 'value')
+    customers = Customer.objects.order_by(CUSTOMER_SORTS.get(sort, '-lifetime_value'))
     paginator = Paginator(customers, 15)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
     context = {
         'page_obj': page_obj,
+        'sort': sort,
         'title': 'Customers'
     }
     return render(request, 'sales/customer_list.html', context)
@@ -163,12 +185,10 @@ def sales_order_create(request):
                 formset.save()
 
                 # Calculate totals
-                order.subtotal = sum(item.line_total for item in order.items.all())
-                order.total_amount = order.subtotal + order.tax_amount - order.discount_amount + order.shipping_cost
-                order.save()
+                recalculate_order_totals([order.pk])
 
-                messages.success(request, f'Sales Order {order.order_number} created successfully.')
-                return redirect('sales_order_detail', pk=order.pk)
+            messages.success(request, f'Sales Order {order.order_number} created successfully.')
+            return redirect('sales_order_detail', pk=order.pk)
     else:
         form = SalesOrderForm()
         formset = SalesOrderItemFormSet()
@@ -200,20 +220,29 @@ def sales_order_detail(request, pk):
 @login_required
 def sales_order_update(request, pk):
     order = get_object_or_404(SalesOrder, pk=pk)
+    previous_status = order.status
     if request.method == 'POST':
         form = SalesOrderForm(request.POST, instance=order)
         formset = SalesOrderItemFormSet(request.POST, instance=order)
 
         if form.is_valid() and formset.is_valid():
-            with transaction.atomic():
-                order = form.save()
-                formset.save()
-
-                # Recalculate totals
-                order.subtotal = sum(item.line_total for item in order.items.all())
-                order.total_amount = order.subtotal + order.tax_amount - order.discount_amount + order.shipping_cost
-                order.save()
-
+            try:
+                with transaction.atomic():
+                    # Release reservations for the old lines, re-reserve for the new ones
+                    if previous_status in RESERVED_ORDER_STATUSES:
+                        release_order(order)
+
+                    order = form.save()
+                    formset.save()
+
+                    # Recalculate totals
+                    recalculate_order_totals([order.pk])
+
+                    if previous_status in RESERVED_ORDER_STATUSES:
+                        reserve_order(order)
+            except InsufficientStock as e:
+                messages.error(request, str(e))
+            else:
                 messages.success(request, f'Sales Order {order.order_number} updated successfully.')
                 return redirect('sales_order_detail', pk=order.pk)
     else:
@@ -234,21 +263,21 @@ def sales_order_update_status(request, pk):
     order = get_object_or_404(SalesOrder, pk=pk)
 
     if request.method == 'POST':
-        form = SalesOrderStatusUpdateForm(request.POST)
+        form = SalesOrderStatusUpdateForm(request.POST, current_status=order.status)
         if form.is_valid():
             new_status = form.cleaned_data['status']
             notes = form.cleaned_data['notes']
 
-            # Update order status
-            order.status = new_status
-            if new_status == 'shipped' and not order.ship_date:
-                order.ship_date = timezone.now().date()
-            order.save()
+            try:
+                transition_order(order, new_status, user=request.user)
+            except TransitionError as e:
+                messages.error(request, str(e))
+                return redirect('sales_order_detail', pk=order.pk)
 
             messages.success(request, f'Order status updated to {new_status}.')
             return redirect('sales_order_detail', pk=order.pk)
     else:
-        form = SalesOrderStatusUpdateForm(initial={'status': order.status})
+        form = SalesOrderStatusUpdateForm(initial={'status': order.status}, current_status=order.status)
 
     context = {
         'form': form,
@@ -263,7 +292,10 @@ def sales_order_delete(request, pk):
     order = get_object_or_404(SalesOrder, pk=pk)
     if request.method == 'POST':
         order_number = order.order_number
-        order.delete()
+        with transaction.atomic():
+            if order.status in RESERVED_ORDER_STATUSES:
+                release_order(order)
+            order.delete()
         messages.success(request, f'Sales Order {order_number} deleted successfully.')
         return redirect('sales_order_list')
 
@@ -274,6 +306,35 @@ def sales_order_delete(request, pk):
     return render(request, 'sales/sales_order_confirm_delete.html', context)
 
 
+@login_required
+def atp_check(request):
+    """API view to check availability for many order lines in one request"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+
+    try:
+        payload = json.loads(request.body)
+        on_date = payload.get('date')
+        if on_date:
+            on_date = timezone.datetime.strptime(on_date, '%Y-%m-%d').date()
+        lines = [
+            (
+                int(line['product']),
+                int(line['quantity']),
+                timezone.datetime.strptime(line['date'], '%Y-%m-%d').date() if line.get('date') else None,
+            )
+            for line in payload.get('lines', [])
+        ]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Invalid request body'}, status=400)
+
+    shortages = check_availability(lines, on_date)
+    return JsonResponse({
+        'available': not shortages,
+        'shortages': {str(product_id): str(shortage) for product_id, shortage in shortages.items()},
+    })
+
+
 # Invoice Views
 @login_required
 def invoice_list(request):
@@ -307,8 +368,11 @@ def invoice_create(request, order_pk):
             messages.success(request, f'Invoice {invoice.invoice_number} created successfully.')
             return redirect('invoice_detail', pk=invoice.pk)
     else:
+        today = timezone.now().date()
         form = InvoiceForm(initial={
             'sales_order': order,
+            'invoice_date': today,
+            'due_date': due_date_for(order.customer, today),
             'subtotal': order.subtotal,
             'tax_amount': order.tax_amount,
             'discount_amount': order.discount_amount,
@@ -324,6 +388,29 @@ def invoice_create(request, order_pk):
     return render(request, 'sales/invoice_form.html', context)
 
 
+@login_required
+def invoice_bulk_generate(request):
+    """Generate invoices for many delivered orders at once"""
+    if request.method == 'POST':
+        form = BulkInvoiceGenerationForm(request.POST)
+        if form.is_valid():
+            invoices = generate_invoices(
+                form.cleaned_data['orders'],
+                user=request.user,
+                invoice_date=form.cleaned_data['invoice_date'],
+            )
+            messages.success(request, f'{len(invoices)} invoices generated.')
+            return redirect('invoice_list')
+    else:
+        form = BulkInvoiceGenerationForm(initial={'invoice_date': timezone.now().date()})
+
+    context = {
+        'form': form,
+        'title': 'Generate Invoices'
+    }
+    return render(request, 'sales/bulk_generate_invoices.html', context)
+
+
 @login_required
 def invoice_detail(request, pk):
     invoice = get_object_or_404(
@@ -383,21 +470,23 @@ def payment_create(request, invoice_pk):
     if request.method == 'POST':
         form = PaymentForm(request.POST)
         if form.is_valid():
-            payment = form.save(commit=False)
-            payment.invoice = invoice
-            payment.created_by = request.user
-            payment.save()
-
-            # Update invoice payment status
-            invoice.amount_paid += payment.amount
-            if invoice.amount_paid >= invoice.total_amount:
-                invoice.payment_status = 'paid'
-            elif invoice.amount_paid > 0:
-                invoice.payment_status = 'partial'
-            invoice.save()
-
-            messages.success(request, f'Payment of {payment.amount} recorded successfully.')
-            return redirect('invoice_detail', pk=invoice.pk)
+            if form.cleaned_data['amount'] > invoice.balance_due:
+                form.add_error('amount', f'Amount exceeds the balance due of {invoice.balance_due}.')
+            else:
+                result = apply_payment(
+                    amount=form.cleaned_data['amount'],
+                    payment_method=form.cleaned_data['payment_method'],
+                    payment_date=form.cleaned_data['payment_date'],
+                    reference_number=form.cleaned_data['reference_number'],
+                    notes=form.cleaned_data['notes'],
+                    invoice=invoice,
+                    user=request.user,
+                )
+                if result.payments:
+                    messages.success(request, f'Payment of {result.applied_total} recorded successfully.')
+                else:
+                    messages.error(request, 'This invoice has no outstanding balance.')
+                return redirect('invoice_detail', pk=invoice.pk)
     else:
         form = PaymentForm(initial={'invoice': invoice})
 
@@ -409,6 +498,91 @@ def payment_create(request, invoice_pk):
     return render(request, 'sales/payment_form.html', context)
 
 
+@login_required
+def customer_payment_create(request, customer_pk):
+    """Receive a payment and apply it to the customer's oldest open invoices"""
+    customer = get_object_or_404(Customer, pk=customer_pk)
+    open_invoices = outstanding_invoices().filter(
+        sales_order__customer=customer
+    ).order_by('due_date', 'invoice_date', 'pk')
+
+    if request.method == 'POST':
+        form = CustomerPaymentForm(request.POST)
+        if form.is_valid():
+            result = apply_payment(
+                amount=form.cleaned_data['amount'],
+                payment_method=form.cleaned_data['payment_method'],
+                payment_date=form.cleaned_data['payment_date'],
+                reference_number=form.cleaned_data['reference_number'],
+                notes=form.cleaned_data['notes'],
+                customer=customer,
+                user=request.user,
+            )
+            if result.payments:
+                messages.success(
+                    request,
+                    f'Payment of {result.applied_total} applied to {len(result.payments)} invoice(s).'
+                )
+            if result.unapplied_total:
+                messages.warning(
+                    request,
+                    f'{result.unapplied_total} could not be applied because no open balance remains.'
+                )
+            return redirect('customer_detail', pk=customer.pk)
+    else:
+        form = CustomerPaymentForm(initial={'payment_date': timezone.now().date()})
+
+    context = {
+        'form': form,
+        'customer': customer,
+        'open_invoices': open_invoices,
+        'title': f'Receive Payment: {customer.name}'
+    }
+    return render(request, 'sales/customer_payment_form.html', context)
+
+
+@login_required
+def payment_import(request):
+    """Apply payments from an uploaded bank statement CSV"""
+    if request.method == 'POST':
+        form = BankStatementImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                lines, error_messages = parse_bank_statement(
+                    form.cleaned_data['csv_file'], form.cleaned_data['payment_method']
+                )
+            except StatementError as e:
+                messages.error(request, str(e))
+                return redirect('payment_import')
+
+            result = apply_payments_in_batches(lines, user=request.user)
+
+            if result.payments:
+                messages.success(
+                    request,
+                    f'Applied {result.applied_total} from {len(lines)} statement line(s) '
+                    f'as {len(result.payments)} payment(s).'
+                )
+            if result.unapplied_total:
+                error_messages.append(f'{result.unapplied_total} could not be applied to any open invoice.')
+            if result.payments and not result.ledger_posted:
+                error_messages.append('Ledger accounts for cash, bank or receivables are missing; no transactions were posted.')
+            for error in error_messages[:10]:  # Show first 10 errors
+                messages.warning(request, error)
+            if len(error_messages) > 10:
+                messages.warning(request, f'... and {len(error_messages) - 10} more errors.')
+
+            return redirect('payment_list')
+    else:
+        form = BankStatementImportForm()
+
+    context = {
+        'form': form,
+        'title': 'Import Bank Statement'
+    }
+    return render(request, 'sales/payment_import.html', context)
+
+
 @login_required
 def payment_detail(request, pk):
     payment = get_object_or_404(
@@ -496,9 +670,22 @@ def bulk_process_orders(request):
             }
 
             new_status = status_map[action]
-            count = orders.update(status=new_status)
-
-            messages.success(request, f'{count} orders updated to {new_status}.')
+            try:
+                result = transition_orders(
+                    orders, new_status, user=request.user, warehouse=form.cleaned_data['warehouse']
+                )
+            except TransitionError as e:
+                messages.error(request, str(e))
+                return redirect('bulk_process_orders')
+
+            messages.success(request, f'{len(result.updated)} orders updated to {new_status}.')
+            if result.invoices:
+                messages.success(request, f'{len(result.invoices)} invoices generated for delivered orders.')
+            error_messages = [f'{number}: {reason}' for number, reason in result.skipped]
+            for error in error_messages[:10]:  # Show first 10 errors
+                messages.warning(request, error)
+            if len(error_messages) > 10:
+                messages.warning(request, f'... and {len(error_messages) - 10} more orders skipped.')
             return redirect('sales_order_list')
     else:
         form = BulkOrderProcessingForm()
@@ -511,52 +698,43 @@ def bulk_process_orders(request):
 
 
 # Reports
+def monthly_sales_summary(months=12):
+    """Delivered orders and revenue per month from the sales facts"""
+    start = timezone.now().date().replace(day=1)
+    for _ in range(months - 1):
+        start = (start - timezone.timedelta(days=1)).replace(day=1)
+
+    rows = list(sales_cube(period='month', level='order', start=start, status='delivered'))
+    for row in rows:
+        row['average'] = row['order_total'] / row['orders'] if row['orders'] else Decimal('0.00')
+    return rows
+
+
 @login_required
 def sales_reports(request):
     """Sales reporting and analytics"""
     # Summary statistics
     total_customers = Customer.objects.filter(is_active=True).count()
-    total_orders = SalesOrder.objects.count()
-    total_revenue = SalesOrder.objects.filter(status='delivered').aggregate(
-        total=Sum('total_amount')
-    )['total'] or Decimal('0.00')
+    total_orders = sales_cube(level='order')['orders'] or 0
+    total_revenue = sales_cube(level='order', status='delivered')['order_total'] or Decimal('0.00')
 
     # Monthly sales trend (last 12 months)
-    monthly_sales = SalesOrder.objects.filter(
-        status='delivered',
-        order_date__gte=timezone.now().date() - timezone.timedelta(days=365)
-    ).extra(
-        select={'month': "strftime('%%Y-%%m', order_date)"}
-    ).values('month').annotate(
-        total=Sum('total_amount'),
-        count=Count('id')
-    ).order_by('month')
+    monthly_sales = monthly_sales_summary()
 
     # Top products by sales
-    top_products = SalesOrderItem.objects.values(
-        'product__name'
-    ).annotate(
-        total_quantity=Sum('quantity'),
-        total_revenue=Sum('line_total')
-    ).order_by('-total_revenue')[:10]
+    top_products = sales_cube(by=['product__name']).order_by('-revenue')[:10]
 
     # Customer sales summary
-    customer_sales = Customer.objects.annotate(
-        order_count=Count('sales_orders'),
-        total_spent=Sum('sales_orders__total_amount')
-    ).filter(order_count__gt=0).order_by('-total_spent')[:10]
+    customer_sales = Customer.objects.filter(order_count__gt=0).order_by('-lifetime_value')[:10]
 
     # Sales by customer type
-    sales_by_type = Customer.objects.values('customer_type').annotate(
-        customer_count=Count('id'),
-        total_orders=Count('sales_orders'),
-        total_revenue=Sum('sales_orders__total_amount')
-    ).order_by('-total_revenue')
+    sales_by_type = sales_cube(by=['customer_type'], level='order').order_by('-order_total')
 
-    # Outstanding invoices
-    outstanding_invoices = Invoice.objects.filter(
-        payment_status__in=['unpaid', 'partial']
-    ).select_related('sales_order__customer').order_by('due_date')[:10]
+    # Outstanding invoices, oldest due first
+    oldest_outstanding = outstanding_invoices().select_related(
+        'sales_order__customer'
+    ).order_by('due_date')[:10]
+    receivables = aging_totals()
 
     # Payment status summary
     payment_summary = Invoice.objects.values('payment_status').annotate(
@@ -573,13 +751,38 @@ def sales_reports(request):
         'top_products': top_products,
         'customer_sales': customer_sales,
         'sales_by_type': sales_by_type,
-        'outstanding_invoices': outstanding_invoices,
+        'outstanding_invoices': oldest_outstanding,
+        'receivables': receivables,
         'payment_summary': payment_summary,
         'title': 'Sales Reports'
     }
     return render(request, 'sales/reports.html', context)
 
 
+@login_required
+def ar_aging_report(request):
+    """Accounts-receivable aging by customer"""
+    as_of = timezone.now().date()
+    customers = aging_by_customer(as_of)
+
+    search = request.GET.get('search')
+    if search:
+        customers = customers.filter(sales_order__customer__name__icontains=search)
+
+    paginator = Paginator(customers, 15)
+    page_number = request.GET.get('page')
+    page_obj = paginator.get_page(page_number)
+
+    context = {
+        'page_obj': page_obj,
+        'as_of': as_of,
+        'totals': aging_totals(as_of),
+        'trend': aging_trend(),
+        'title': 'Accounts Receivable Aging'
+    }
+    return render(request, 'sales/ar_aging.html', context)
+
+
 @login_required
 def export_sales_report_csv(request):
     """Export sales report to CSV"""
@@ -589,17 +792,7 @@ def export_sales_report_csv(request):
     writer = csv.writer(response)
     writer.writerow(['Month', 'Orders', 'Revenue'])
 
-    monthly_sales = SalesOrder.objects.filter(
-        status='delivered',
-        order_date__gte=timezone.now().date() - timezone.timedelta(days=365)
-    ).extra(
-        select={'month': "strftime('%%Y-%%m', order_date)"}
-    ).values('month').annotate(
-        total=Sum('total_amount'),
-        count=Count('id')
-    ).order_by('month')
-
-    for data in monthly_sales:
-        writer.writerow([data['month'], data['count'], f"{data['total']:.2f}"])
+    for data in monthly_sales_summary():
+        writer.writerow([data['period'].strftime('%Y-%m'), data['orders'], f"{data['order_total']:.2f}"])
 
     return response
@@ -0,0 +1,271 @@
+"""
+Sales order workflow.
+
+Orders move draft -> confirmed -> processing -> shipped -> delivered and can
+be cancelled until they ship. ``transition_orders`` moves many orders to a
+new status at once, checks each order's current status against TRANSITIONS
+and applies the side effects of the move in batch:
+
+* confirming reserves stock for the whole chunk at once (see
+  atp.reserve_orders), cancelling releases it,
+* shipping issues finished-product stock with ``F()`` updates and writes
+  the OUT inventory transactions, costed from the cost layers, with one
+  bulk_create,
+* delivering queues the orders for invoicing, which runs once the chunk has
+  committed.
+
+Orders are processed in chunks, each in its own transaction, so order and
+product rows are only locked for the duration of one chunk.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from inventory import details as material_details
+from inventory import valuation as inventory_valuation
+from inventory.models import FinishedProduct, InventoryTransaction, Warehouse
+
+from .analytics import mark_orders
+from .atp import RESERVED_ORDER_STATUSES, InsufficientStock, atp_index, reserve_orders
+from .billing import generate_invoices
+from .models import SalesOrder, SalesOrderItem
+
+
+# Statuses each status may move to
+TRANSITIONS = {
+    'draft': ['confirmed', 'cancelled'],
+    'confirmed': ['processing', 'shipped', 'cancelled'],
+    'processing': ['shipped', 'cancelled'],
+    'shipped': ['delivered'],
+    'delivered': [],
+    'cancelled': [],
+}
+
+# Orders moved per transaction
+ORDER_BATCH_SIZE = 500
+
+
+class TransitionError(Exception):
+    """Raised when orders cannot be moved to the requested status"""
+
+
+class TransitionResult:
+    """Outcome of moving orders to a new status"""
+
+    def __init__(self):
+        self.updated = []       # ids of the orders moved
+        self.skipped = []       # (order_number, reason)
+        self.invoices = []
+
+
+def allowed_transitions(status):
+    """Statuses an order in the given status may move to"""
+    return TRANSITIONS.get(status, [])
+
+
+def can_transition(from_status, to_status):
+    return to_status in allowed_transitions(from_status)
+
+
+def default_warehouse():
+    """Warehouse finished goods are shipped from when none is given"""
+    return Warehouse.objects.filter(is_active=True).order_by('pk').first()
+
+
+def _order_ids(orders):
+    if hasattr(orders, 'values_list'):
+        return list(orders.order_by('pk').values_list('pk', flat=True))
+    return sorted({getattr(order, 'pk', order) for order in orders})
+
+
+def _demand(order_ids):
+    """``{order_id: {product_id: quantity}}`` for the given orders"""
+    demand = defaultdict(dict)
+    rows = SalesOrderItem.objects.filter(sales_order_id__in=order_ids).values(
+        'sales_order_id', 'product_id'
+    ).annotate(quantity=Sum('quantity')).order_by()
+    for row in rows:
+        demand[row['sales_order_id']][row['product_id']] = row['quantity']
+    return demand
+
+
+def _adjust_stock(on_hand=None, reserved=None):
+    """Add ``{product_id: delta}`` to current_stock and reserved_stock in one UPDATE"""
+    on_hand = {pk: delta for pk, delta in (on_hand or {}).items() if delta}
+    reserved = {pk: delta for pk, delta in (reserved or {}).items() if delta}
+    product_ids = set(on_hand) | set(reserved)
+    if not product_ids:
+        return
+    FinishedProduct.objects.filter(pk__in=product_ids).update(
+        current_stock=Case(
+            *[When(pk=pk, then=F('current_stock') + Value(delta)) for pk, delta in on_hand.items()],
+            default=F('current_stock'),
+            output_field=IntegerField(),
+        ),
+        reserved_stock=Greatest(
+            Case(
+                *[When(pk=pk, then=F('reserved_stock') + Value(delta)) for pk, delta in reserved.items()],
+                default=F('reserved_stock'),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        ),
+        updated_at=timezone.now(),
+    )
+    atp_index.invalidate(product_ids)
+    material_details.invalidate('finished', on_hand)
+
+
+def _reserve(orders, result):
+    """Reserve stock for orders that do not hold a reservation yet, all in one pass"""
+    _reserved, failed = reserve_orders(order for order in orders if order.status not in RESERVED_ORDER_STATUSES)
+    for order, shortages in failed:
+        result.skipped.append((order.order_number, str(InsufficientStock(shortages))))
+    failed_ids = {order.pk for order, _shortages in failed}
+    return [order for order in orders if order.pk not in failed_ids]
+
+
+def _release(orders):
+    """Release the reservations held by the given orders"""
+    held = [order.pk for order in orders if order.status in RESERVED_ORDER_STATUSES]
+    released = defaultdict(int)
+    for lines in _demand(held).values():
+        for product_id, quantity in lines.items():
+            released[product_id] -= quantity
+    _adjust_stock(reserved=released)
+    return orders
+
+
+def _ship(orders, user, warehouse, result):
+    """
+    Issue stock for the given orders.
+
+    Orders are served in order until on-hand stock runs out; an order that
+    cannot be shipped in full is skipped.
+    """
+    demand = _demand([order.pk for order in orders])
+    product_ids = {product_id for lines in demand.values() for product_id in lines}
+    products = {
+        row['pk']: row
+        for row in FinishedProduct.objects.select_for_update().filter(
+            pk__in=product_ids
+        ).values('pk', 'name', 'current_stock')
+    }
+    remaining = {pk: row['current_stock'] for pk, row in products.items()}
+
+    shipped = []
+    issued = defaultdict(int)
+    released = defaultdict(int)
+    movements = []
+    for order in orders:
+        lines = demand.get(order.pk, {})
+        short = [pk for pk, quantity in lines.items() if remaining.get(pk, 0) < quantity]
+        if short:
+            names = ', '.join(products[pk]['name'] for pk in short)
+            result.skipped.append((order.order_number, f"Insufficient stock on hand: {names}"))
+            continue
+
+        for product_id, quantity in lines.items():
+            product = products[product_id]
+            remaining[product_id] -= quantity
+            issued[product_id] -= quantity
+            if order.status in RESERVED_ORDER_STATUSES:
+                released[product_id] -= quantity
+            movements.append(InventoryTransaction(
+                transaction_type='OUT',
+                material_type='finished',
+                material_id=product_id,
+                material_name=product['name'],
+                quantity=quantity,
+                reference_number=order.order_number,
+                notes=f"Shipped for sales order {order.order_number}",
+                warehouse=warehouse,
+                created_by=user,
+            ))
+        shipped.append(order)
+
+    _adjust_stock(on_hand=issued, reserved=released)
+    # One issue line per movement, so each records the cost of the layers it
+    # consumed rather than the selling price
+    costs = inventory_valuation.issue([('finished', movement.material_id, movement.quantity) for movement in movements])
+    for movement, cost in zip(movements, costs):
+        movement.total_value = cost
+        movement.unit_price = (cost / movement.quantity).quantize(inventory_valuation.CENT)
+    InventoryTransaction.objects.bulk_create(movements, batch_size=1000)
+    return shipped
+
+
+def transition_orders(orders, new_status, user=None, warehouse=None, invoice_date=None,
+                      batch_size=ORDER_BATCH_SIZE):
+    """
+    Move many orders to ``new_status``.
+
+    ``orders`` is a queryset or an iterable of orders or primary keys.
+    Orders whose current status does not allow the move, or whose side
+    effect fails (not enough stock), are left unchanged and reported in
+    ``result.skipped``. Shipping needs a user and a warehouse to record the
+    stock issue; the first active warehouse is used if none is given.
+    """
+    if new_status not in TRANSITIONS:
+        raise TransitionError(f"Unknown order status '{new_status}'")
+    if new_status == 'shipped':
+        warehouse = warehouse or default_warehouse()
+        if warehouse is None:
+            raise TransitionError("No active warehouse to ship from")
+        if user is None:
+            raise TransitionError("Shipping orders requires a user to record the stock issue")
+
+    order_ids = _order_ids(orders)
+    result = TransitionResult()
+    today = timezone.now().date()
+
+    for start in range(0, len(order_ids), batch_size):
+        chunk = order_ids[start:start + batch_size]
+        with transaction.atomic():
+            movable = []
+            for order in SalesOrder.objects.select_for_update().filter(pk__in=chunk).only(
+                'pk', 'order_number', 'status', 'required_date'
+            ).order_by('pk'):
+                if can_transition(order.status, new_status):
+                    movable.append(order)
+                else:
+                    result.skipped.append((
+                        order.order_number,
+                        f"Cannot move from {order.get_status_display()} to {new_status}",
+                    ))
+
+            if new_status in RESERVED_ORDER_STATUSES:
+                moved = _reserve(movable, result)
+            elif new_status == 'cancelled':
+                moved = _release(movable)
+            elif new_status == 'shipped':
+                moved = _ship(movable, user, warehouse, result)
+            else:
+                moved = movable
+
+            moved_ids = [order.pk for order in moved]
+            updates = {'status': new_status}
+            if new_status == 'shipped':
+                updates['ship_date'] = Coalesce('ship_date', Value(today))
+            SalesOrder.objects.filter(pk__in=moved_ids).update(**updates)
+            mark_orders(moved_ids)
+
+        result.updated.extend(moved_ids)
+        if new_status == 'delivered' and moved_ids:
+            result.invoices.extend(generate_invoices(
+                SalesOrder.objects.filter(pk__in=moved_ids), user=user, invoice_date=invoice_date
+            ))
+
+    return result
+
+
+def transition_order(order, new_status, user=None, warehouse=None):
+    """Move one order to ``new_status``, raising TransitionError if it cannot move"""
+    result = transition_orders([order.pk], new_status, user=user, warehouse=warehouse)
+    if result.skipped:
+        raise TransitionError(result.skipped[0][1])
+    order.refresh_from_db()
+    return result